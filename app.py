@@ -44,11 +44,12 @@ else:
     logger.info(f"Using PostgreSQL database: {db_url[:40]}...")
 
 # Production-optimized database configuration for 500+ users with proper connection pooling
-from sqlalchemy.pool import QueuePool
+# (QueuePool subclass that also reports checkout wait time to /metrics)
+from metrics_registry import InstrumentedQueuePool
 
 app.config["SQLALCHEMY_DATABASE_URI"] = db_url
 app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "poolclass": QueuePool,        # Use proper connection pooling
+    "poolclass": InstrumentedQueuePool,  # Use proper connection pooling
     "pool_size": 10,              # Base connection pool size
     "max_overflow": 20,           # Additional connections when needed
     "pool_pre_ping": True,        # Test connections before use
@@ -93,12 +94,103 @@ def create_tables_with_retry():
     
     return retry_database_operation(create_operation)
 
+# Indexes that older releases created with runtime DDL and that are now
+# duplicated by a unique constraint or a wider index declared in models.py
+SUPERSEDED_INDEXES = (
+    'idx_user_telegram_id_fast',       # duplicate of the telegram_id unique constraint
+    'idx_user_telegram_id_status',     # telegram_id is unique, status adds nothing
+    'idx_user_status_enum',            # now idx_user_status
+    'idx_user_status_active',          # partial/duplicate of idx_user_status
+    'idx_transaction_hash_unique',     # duplicate of the tx_hash unique index
+    'idx_transaction_user_type',       # prefix of idx_transaction_user_type_time
+    'idx_trading_user_status',         # prefix of idx_trading_position_user_status_token
+    'idx_trading_position_user_status',
+    'idx_user_metrics_user_updated',   # now idx_user_metrics_user
+)
+
+def apply_declared_indexes():
+    """Create indexes declared in models.py that are missing on existing tables
+    and drop the superseded runtime ones. create_all() only indexes new tables."""
+    from sqlalchemy import inspect, text
+
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    created = []
+    dropped = []
+    for table in db.metadata.tables.values():
+        if table.name not in existing_tables:
+            continue
+        if db.engine.dialect.name == 'sqlite':
+            # SQLite reflection skips expression indexes such as lower(username)
+            with db.engine.connect() as connection:
+                existing = set(connection.execute(
+                    text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :table"),
+                    {'table': table.name}).scalars())
+        else:
+            existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(db.engine)
+                created.append(index.name)
+        for name in SUPERSEDED_INDEXES:
+            if name in existing:
+                with db.engine.begin() as connection:
+                    connection.execute(text(f"DROP INDEX IF EXISTS {name}"))
+                dropped.append(name)
+
+    if created or dropped:
+        logger.info(f"Indexes created: {created or 'none'}; superseded indexes dropped: {dropped or 'none'}")
+    return created
+
+def add_missing_columns():
+    """Add nullable columns declared in models.py that are missing on existing
+    tables (create_all() never alters a table that already exists)."""
+    from sqlalchemy import inspect, text
+
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+    for table in db.metadata.tables.values():
+        if table.name not in existing_tables:
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable or column.server_default is not None:
+                continue
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            with db.engine.begin() as connection:
+                connection.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+            added.append(f"{table.name}.{column.name}")
+
+    if added:
+        logger.info(f"Columns added: {added}")
+    return added
+
+def run_schema_migrations():
+    """Create/upgrade the database schema. Run explicitly via `python db_migrate.py`."""
+    from startup_profiler import get_startup_profiler
+
+    with get_startup_profiler().phase('schema'):
+        with app.app_context():
+            result = create_tables_with_retry()
+            retry_database_operation(add_missing_columns)
+            retry_database_operation(apply_declared_indexes)
+            from user_search import ensure_search_indexes
+            retry_database_operation(ensure_search_indexes)
+            return result
+
+# Schema creation is an explicit migration step (db_migrate.py) so that every
+# process start does not pay for create_all(). Set AUTO_CREATE_SCHEMA=true to
+# restore the old create-on-import behaviour (e.g. for a fresh local database).
+AUTO_CREATE_SCHEMA = os.environ.get("AUTO_CREATE_SCHEMA", "false").lower() in ("1", "true", "yes")
+
 with app.app_context():
-    # Make sure to import the models here or their tables won't be created
+    # Make sure to import the models here so they are registered with the metadata
     import models  # noqa: F401
 
+if AUTO_CREATE_SCHEMA:
     try:
-        create_tables_with_retry()
+        run_schema_migrations()
     except Exception as e:
         logger.error(f"Error creating database tables after retries: {e}")
         # Continue running even if table creation fails initially
@@ -0,0 +1,205 @@
+"""
+Async DB Access
+===============
+Database access for the coroutine handler stack (python-telegram-bot
+Application handlers, utils/scheduler jobs, the asyncio transport).
+
+Flask-SQLAlchemy queries are blocking, so a coroutine that runs one
+directly stalls every other conversation on the loop until it returns.
+run_db() runs a synchronous function on a bounded thread pool instead:
+
+    - each call gets its own app context, and therefore its own session,
+      which is committed or rolled back by the function and removed when
+      the call returns
+    - the caller's contextvars are copied into the worker thread, so
+      request-scoped values (log context, correlation ids) carry over
+    - at most ASYNC_DB_THREADS calls run at once; the rest wait on the loop
+      without holding a thread, which keeps the database pool from being
+      exhausted by a burst of updates
+
+Functions passed to run_db should return plain values (numbers, strings,
+dicts) rather than ORM objects, which are detached once the call ends.
+
+An async driver (asyncpg/aiosqlite through sqlalchemy.ext.asyncio) would
+need every model query rewritten; the executor keeps the existing sync
+query code and gives the same guarantee to the loop.
+
+LoopLagMonitor measures event loop lag with a heartbeat and, from a
+watchdog thread, captures the loop thread's stack while it is stalled, so
+a blocking call left on the loop is logged with where it happened.
+
+Usage:
+    summary = await run_db(load_summary, telegram_id)
+
+    @db_task
+    def load_summary(telegram_id): ...
+    summary = await load_summary(telegram_id)
+
+    LoopLagMonitor(name='bot').start()      # from inside the running loop
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+
+from metrics_registry import ASYNC_DB_CALL_DURATION, EVENT_LOOP_BLOCKED, EVENT_LOOP_LAG
+
+logger = logging.getLogger(__name__)
+
+# Blocking DB calls running at once for the async stack (keep below the DB pool size)
+DB_THREADS = int(os.environ.get('ASYNC_DB_THREADS', '8'))
+
+# Loop lag reported as a blocking call, in seconds
+LOOP_LAG_THRESHOLD = float(os.environ.get('LOOP_LAG_THRESHOLD', '0.1'))
+
+# How often the heartbeat is scheduled on the loop, in seconds
+LOOP_LAG_INTERVAL = float(os.environ.get('LOOP_LAG_INTERVAL', '0.05'))
+
+# Frames of the blocked stack kept in a report
+STACK_DEPTH = 12
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """The shared DB thread pool, created on first use"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix='async-db')
+    return _executor
+
+
+def shutdown_executor(wait=True):
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
+
+
+def _call_in_app_context(function, args, kwargs):
+    from app import app, db
+
+    # Always push a fresh app context: the caller's context (copied with the
+    # contextvars) would otherwise hand this thread the caller's session
+    with app.app_context():
+        try:
+            return function(*args, **kwargs)
+        except Exception:
+            db.session.rollback()
+            raise
+
+
+async def run_db(function, *args, **kwargs):
+    """
+    Run a blocking database function off the event loop
+
+    Args:
+        function: synchronous callable doing the DB work
+        *args, **kwargs: passed to function
+
+    Returns:
+        whatever function returns; exceptions propagate to the awaiting coroutine
+    """
+    loop = asyncio.get_running_loop()
+    call = partial(contextvars.copy_context().run, _call_in_app_context, function, args, kwargs)
+    name = getattr(function, '__name__', 'call')
+    with ASYNC_DB_CALL_DURATION.labels(name).time():
+        return await loop.run_in_executor(get_executor(), call)
+
+
+def db_task(function):
+    """Decorate a sync DB function so awaiting it runs it through run_db; .sync is the original"""
+    @wraps(function)
+    async def wrapper(*args, **kwargs):
+        return await run_db(function, *args, **kwargs)
+
+    wrapper.sync = function
+    return wrapper
+
+
+class LoopLagMonitor:
+    """
+    Heartbeat on the loop plus a watchdog thread that catches it blocking
+
+    The heartbeat sleeps `interval` and records how late it woke up
+    (EVENT_LOOP_LAG). When the loop stops beating for longer than
+    `threshold`, the watchdog samples the loop thread's stack; once the loop
+    recovers the stall is logged with that stack and kept in `reports`.
+    """
+
+    def __init__(self, threshold=None, interval=None, name='bot', max_reports=50):
+        self.threshold = threshold if threshold is not None else LOOP_LAG_THRESHOLD
+        self.interval = interval if interval is not None else LOOP_LAG_INTERVAL
+        self.name = name
+        self.reports = deque(maxlen=max_reports)  # (lag_seconds, stack) per blocking call
+        self.loop = None
+        self._loop_thread = None
+        self._last_beat = 0.0
+        self._stalled_stack = None
+        self._task = None
+        self._watchdog = None
+        self._stopping = threading.Event()
+
+    def start(self, loop=None):
+        """Start monitoring; call from the loop's own thread"""
+        self.loop = loop or asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopping.clear()
+        self._task = self.loop.create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name=f"loop-watchdog-{self.name}", daemon=True)
+        self._watchdog.start()
+        logger.info(f"Loop lag monitor started for {self.name} (threshold {self.threshold * 1000:.0f}ms)")
+        return self
+
+    def stop(self):
+        self._stopping.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _heartbeat(self):
+        while not self._stopping.is_set():
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self._last_beat = now
+            EVENT_LOOP_LAG.labels(self.name).observe(lag)
+            if lag >= self.threshold:
+                self._report(lag, self._stalled_stack)
+            self._stalled_stack = None
+
+    def _watch(self):
+        poll = max(self.threshold / 2, 0.005)
+        while not self._stopping.wait(poll):
+            stalled = time.monotonic() - self._last_beat - self.interval
+            if stalled >= self.threshold and self._stalled_stack is None:
+                frame = sys._current_frames().get(self._loop_thread)
+                if frame is not None:
+                    self._stalled_stack = ''.join(traceback.format_stack(frame, limit=STACK_DEPTH))
+
+    def _report(self, lag, stack):
+        EVENT_LOOP_BLOCKED.labels(self.name).inc()
+        self.reports.append((lag, stack or ''))
+        logger.warning(f"Event loop {self.name} was blocked for {lag * 1000:.0f}ms"
+                       + (f"; blocking call:\n{stack}" if stack else ""))
+
+
+async def start_loop_monitor(application=None):
+    """python-telegram-bot post_init hook: monitor the Application's loop"""
+    monitor = LoopLagMonitor(name='application').start()
+    if application is not None:
+        application.bot_data['loop_lag_monitor'] = monitor
+    return monitor
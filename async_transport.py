@@ -0,0 +1,371 @@
+"""
+Async Transport
+===============
+Optional asyncio runtime for SimpleTelegramBot, enabled with
+BOT_TRANSPORT=asyncio.
+
+One event loop thread owns a pooled aiohttp session and the getUpdates
+long poll. Sync handlers run on a bounded thread pool (updates for the same
+chat stay in order), and every Bot API call they make is routed through
+the shared session, so sending thousands of messages concurrently costs
+sockets from one pool and a single thread rather than a thread each.
+Rate limits (429) are waited out with asyncio.sleep using Telegram's
+retry_after instead of blocking a thread.
+
+A LoopLagMonitor (async_db.py) watches the loop and logs any call that
+blocks it past LOOP_LAG_THRESHOLD.
+
+Coroutine utilities (utils/message_cleanup, utils/notifications,
+utils/engagement) run natively on the loop: pass them bot.async_api (or a
+context from runtime.context) and schedule them with submit() or
+run_coroutine().
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from types import SimpleNamespace
+
+import aiohttp
+
+from async_db import LoopLagMonitor
+from metrics_registry import DISPATCH_QUEUE_DEPTH, TELEGRAM_API_LATENCY, TELEGRAM_API_RESPONSES, UPDATES_RECEIVED
+from startup_profiler import get_startup_profiler
+
+logger = logging.getLogger(__name__)
+
+# Sync handlers running at once; further updates wait on the loop, not in threads
+HANDLER_THREADS = int(os.environ.get('ASYNC_HANDLER_THREADS', '16'))
+
+# Open connections to the Bot API shared by every sender
+HTTP_POOL_SIZE = int(os.environ.get('TELEGRAM_HTTP_POOL_SIZE', '100'))
+
+# In-flight sends for one send_many() call (Telegram allows ~30 messages/s per bot)
+SEND_CONCURRENCY = int(os.environ.get('TELEGRAM_SEND_CONCURRENCY', '25'))
+
+# How many times a call is retried after a 429 before the response is handed back
+RATE_LIMIT_RETRIES = 3
+
+_runtime = None
+
+
+class TelegramAPIError(Exception):
+    """A Bot API call returned ok=false"""
+
+
+class ApiResponse:
+    """The parts of requests.Response the bot reads, for calls routed through the loop"""
+
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+
+    def json(self):
+        return json.loads(self.text)
+
+
+def _query(params):
+    """aiohttp only accepts str/int/float query values; Telegram takes JSON for the rest"""
+    if not params:
+        return None
+    query = {}
+    for key, value in params.items():
+        if isinstance(value, bool):
+            query[key] = 'true' if value else 'false'
+        elif isinstance(value, (list, dict)):
+            query[key] = json.dumps(value)
+        else:
+            query[key] = value
+    return query
+
+
+def _retry_after(response):
+    try:
+        return float(response.json().get('parameters', {}).get('retry_after', 1))
+    except (ValueError, AttributeError):
+        return 1.0
+
+
+def _chat_id(update):
+    if 'callback_query' in update:
+        return update['callback_query'].get('message', {}).get('chat', {}).get('id')
+    return update.get('message', {}).get('chat', {}).get('id')
+
+
+class AsyncBotRuntime:
+    """Event loop, HTTP pool and handler executor behind one SimpleTelegramBot"""
+
+    def __init__(self, bot, handler_threads=None, pool_size=None, send_concurrency=None):
+        self.bot = bot
+        self.handler_threads = handler_threads or HANDLER_THREADS
+        self.pool_size = pool_size or HTTP_POOL_SIZE
+        self.send_concurrency = send_concurrency or SEND_CONCURRENCY
+        self.loop = None
+        self.session = None
+        self.executor = None
+        self.context = SimpleNamespace(bot=bot.async_api)
+        self.ready = threading.Event()
+        self._stopping = None
+        self._chat_tails = {}  # chat_id -> last dispatched task, to keep per-chat order
+        self._in_flight = set()
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+    def run(self):
+        """Run the loop in the calling thread until the bot stops polling"""
+        global _runtime
+        _runtime = self
+        try:
+            asyncio.run(self._main())
+        finally:
+            if _runtime is self:
+                _runtime = None
+            self.ready.clear()
+
+    def stop(self):
+        if self.loop is not None and self._stopping is not None:
+            self.loop.call_soon_threadsafe(self._stopping.set)
+
+    def in_loop_thread(self):
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    async def _main(self):
+        self.loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        self.executor = ThreadPoolExecutor(max_workers=self.handler_threads, thread_name_prefix='bot-handler')
+        self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.pool_size))
+        monitor = LoopLagMonitor(name='transport').start()
+        self.ready.set()
+        try:
+            # Keep pending updates: after a failover they are what users are waiting on
+            await self.request('post', 'deleteWebhook', json={'drop_pending_updates': False})
+            await self.poll()
+            if self._in_flight:
+                await asyncio.wait(set(self._in_flight), timeout=30)
+        finally:
+            monitor.stop()
+            await self.session.close()
+            self.executor.shutdown(wait=False)
+
+    # ------------------------------------------------------------------
+    # Bot API
+    # ------------------------------------------------------------------
+    async def request(self, http_method, api_method, params=None, json=None, timeout=30, retries=RATE_LIMIT_RETRIES):
+        """Call a Bot API method on the shared session, waiting out 429s"""
+        url = f"{self.bot.api_url}/{api_method}"
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            status = 'error'
+            try:
+                async with self.session.request(http_method.upper(), url, params=_query(params), json=json,
+                                                timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                    body = await response.text()
+                    status = str(response.status)
+            finally:
+                TELEGRAM_API_LATENCY.labels(method=api_method).observe(time.perf_counter() - started)
+                TELEGRAM_API_RESPONSES.labels(method=api_method, status=status).inc()
+            result = ApiResponse(response.status, body)
+            if result.status_code == 429 and attempt < retries:
+                attempt += 1
+                await asyncio.sleep(_retry_after(result))
+                continue
+            return result
+
+    def request_sync(self, http_method, api_method, timeout=30, **kwargs):
+        """Blocking request() for handler threads; the wait happens on the loop"""
+        future = asyncio.run_coroutine_threadsafe(
+            self.request(http_method, api_method, timeout=timeout, **kwargs), self.loop)
+        return future.result(timeout + RATE_LIMIT_RETRIES * 60)
+
+    async def send_message(self, chat_id, text, parse_mode="Markdown", reply_markup=None,
+                           disable_web_page_preview=False):
+        """Coroutine twin of SimpleTelegramBot.send_message, with the same result dicts"""
+        payload = self.bot.message_payload(chat_id, text, parse_mode, reply_markup, disable_web_page_preview)
+        try:
+            response = await self.request('post', 'sendMessage', json=payload, timeout=10)
+        except Exception as e:
+            logger.error(f"Error sending message to {chat_id}: {e}")
+            return {"ok": False, "error": str(e)}
+        if response.status_code == 409:
+            return {"ok": True, "result": {"message_id": 0, "duplicate_handled": True}}
+        if response.status_code != 200:
+            return {"ok": False, "error": f"HTTP {response.status_code}"}
+        return response.json()
+
+    async def send_photo(self, chat_id, photo, caption=None, parse_mode="Markdown"):
+        """Send a photo by file_id or URL; Telegram's error body is returned on failure"""
+        payload = self.bot.media_payload(chat_id, 'photo', photo, caption, parse_mode)
+        try:
+            response = await self.request('post', 'sendPhoto', json=payload, timeout=15)
+            return response.json()
+        except Exception as e:
+            logger.error(f"Error sending photo to {chat_id}: {e}")
+            return {"ok": False, "error": str(e)}
+
+    async def send_many(self, messages, parse_mode="Markdown", photo=None):
+        """Send (chat_id, text) pairs concurrently, as captions of photo if given; results keep input order"""
+        semaphore = asyncio.Semaphore(self.send_concurrency)
+
+        async def send(chat_id, text):
+            async with semaphore:
+                if photo:
+                    return await self.send_photo(chat_id, photo, caption=text, parse_mode=parse_mode)
+                return await self.send_message(chat_id, text, parse_mode=parse_mode)
+
+        return await asyncio.gather(*(send(chat_id, text) for chat_id, text in messages))
+
+    # ------------------------------------------------------------------
+    # Polling and dispatch
+    # ------------------------------------------------------------------
+    async def poll(self):
+        """Long-poll getUpdates until the bot stops, dispatching without waiting on handlers"""
+        offset = self.bot.offset
+        stopping = asyncio.ensure_future(self._stopping.wait())
+        poll_timeout = 0  # the first poll returns at once and marks polling ready
+        while self.bot.running and not self._stopping.is_set():
+            try:
+                long_poll = asyncio.ensure_future(self.request('get', 'getUpdates', params={
+                    'offset': offset,
+                    'timeout': poll_timeout,
+                    'limit': 100,
+                    'allowed_updates': ['message', 'callback_query'],
+                }, timeout=poll_timeout + 5))
+                # stop() abandons the long poll instead of waiting up to 30s for it
+                await asyncio.wait({long_poll, stopping}, return_when=asyncio.FIRST_COMPLETED)
+                if not long_poll.done():
+                    long_poll.cancel()
+                    break
+                response = long_poll.result()
+                poll_timeout = 30
+                get_startup_profiler().mark('polling_ready')
+                if response.status_code != 200:
+                    # 409: another poller briefly overlapped; anything else: back off
+                    await asyncio.sleep(0.5 if response.status_code == 409 else 2)
+                    continue
+                updates = response.json().get('result', [])
+            except asyncio.TimeoutError:
+                continue
+            except Exception as e:
+                logger.error(f"Error in async polling loop: {e}")
+                await asyncio.sleep(2)
+                continue
+
+            for update in updates:
+                offset = max(offset, update['update_id'] + 1)
+                update_type = 'callback_query' if 'callback_query' in update else (
+                    'message' if 'message' in update else 'other')
+                UPDATES_RECEIVED.labels(update_type=update_type).inc()
+                self.dispatch(update)
+            self.bot.offset = offset
+        stopping.cancel()
+
+    def dispatch(self, update):
+        """Queue an update for a handler thread, behind earlier updates of the same chat"""
+        chat_id = _chat_id(update)
+        previous = self._chat_tails.get(chat_id)
+        task = asyncio.ensure_future(self._process_after(previous, update))
+        DISPATCH_QUEUE_DEPTH.inc()
+        self._in_flight.add(task)
+        task.add_done_callback(self._in_flight.discard)
+        if chat_id is not None:
+            self._chat_tails[chat_id] = task
+            task.add_done_callback(partial(self._forget_tail, chat_id))
+        return task
+
+    def _forget_tail(self, chat_id, task):
+        if self._chat_tails.get(chat_id) is task:
+            del self._chat_tails[chat_id]
+
+    async def _process_after(self, previous, update):
+        try:
+            if previous is not None:
+                await asyncio.wait([previous])
+            await self.loop.run_in_executor(self.executor, self.bot.process_update, update)
+        except Exception as e:
+            logger.error(f"Error dispatching update {update.get('update_id')}: {e}")
+        finally:
+            DISPATCH_QUEUE_DEPTH.dec()
+
+    async def run_sync(self, function, *args):
+        """Run blocking code (database work, legacy helpers) on the handler pool"""
+        return await self.loop.run_in_executor(self.executor, function, *args)
+
+    def submit(self, coroutine):
+        """Schedule a coroutine on the loop from any thread; returns a concurrent Future"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+
+class AsyncBotAPI:
+    """
+    Coroutine Bot API facade for the async utilities
+
+    Mirrors the python-telegram-bot calls they make: results expose
+    message_id, and failures raise TelegramAPIError. Calls go through the
+    runtime's session when awaited on its loop, and through the bot's sync
+    client on a worker thread otherwise.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+
+    async def _call(self, api_method, payload):
+        runtime = self.bot.runtime
+        if runtime is not None and runtime.in_loop_thread():
+            response = await runtime.request('post', api_method, json=payload, timeout=10)
+        else:
+            response = await asyncio.to_thread(self.bot._api_request, 'post', api_method, json=payload, timeout=10)
+        data = response.json()
+        if not data.get('ok'):
+            raise TelegramAPIError(data.get('description') or f"HTTP {response.status_code}")
+        result = data.get('result')
+        return SimpleNamespace(**result) if isinstance(result, dict) else result
+
+    @staticmethod
+    def _markup(reply_markup):
+        return reply_markup.to_dict() if hasattr(reply_markup, 'to_dict') else reply_markup
+
+    async def send_message(self, chat_id, text, parse_mode="Markdown", reply_markup=None,
+                           disable_web_page_preview=False, **kwargs):
+        return await self._call('sendMessage', self.bot.message_payload(
+            chat_id, text, parse_mode, self._markup(reply_markup), disable_web_page_preview))
+
+    async def edit_message_text(self, text, chat_id=None, message_id=None, parse_mode="Markdown",
+                                reply_markup=None, **kwargs):
+        payload = {'chat_id': chat_id, 'message_id': message_id, 'text': text}
+        if parse_mode:
+            payload['parse_mode'] = parse_mode
+        if reply_markup:
+            payload['reply_markup'] = self._markup(reply_markup)
+        return await self._call('editMessageText', payload)
+
+    async def delete_message(self, chat_id, message_id):
+        return await self._call('deleteMessage', {'chat_id': chat_id, 'message_id': message_id})
+
+
+def get_async_runtime():
+    """The running AsyncBotRuntime in this process, or None"""
+    return _runtime
+
+
+def run_coroutine(coroutine, timeout=60):
+    """
+    Run a coroutine to completion from sync code
+
+    Uses the bot's loop when the async transport is running, otherwise a
+    private loop. Must not be called from the loop thread itself.
+    """
+    runtime = get_async_runtime()
+    if runtime is not None and runtime.ready.is_set():
+        if runtime.in_loop_thread():
+            raise RuntimeError("run_coroutine() would block the event loop; await the coroutine instead")
+        return runtime.submit(coroutine).result(timeout)
+    return asyncio.run(coroutine)
@@ -28,14 +28,19 @@ class MaintenanceScheduler:
         
         self.running = True
         
+        # The scheduler only enqueues; whichever worker process is free runs the
+        # job, and the dedup key keeps a slow run from piling up duplicates
+        # Close the trading day just after midnight
+        schedule.every().day.at("00:05").do(self.enqueue_job, 'maintenance.day_close').tag('maintenance')
+        
         # Schedule daily maintenance at 3 AM
-        schedule.every().day.at("03:00").do(self.run_full_maintenance)
+        schedule.every().day.at("03:00").do(self.enqueue_job, 'maintenance.full').tag('maintenance')
         
         # Schedule health checks every 6 hours
-        schedule.every(6).hours.do(self.run_health_check)
+        schedule.every(6).hours.do(self.enqueue_job, 'maintenance.health_check').tag('maintenance')
         
         # Schedule quick cleanup every 2 hours
-        schedule.every(2).hours.do(self.run_quick_cleanup)
+        schedule.every(2).hours.do(self.enqueue_job, 'maintenance.quick_cleanup').tag('maintenance')
         
         # Start scheduler thread
         self.thread = threading.Thread(target=self._run_scheduler, daemon=True)
@@ -46,6 +51,7 @@ class MaintenanceScheduler:
     def stop(self):
         """Stop the maintenance scheduler"""
         self.running = False
+        schedule.clear('maintenance')
         if self.thread:
             self.thread.join(timeout=5)
         logger.info("Database maintenance scheduler stopped")
@@ -60,6 +66,16 @@ class MaintenanceScheduler:
                 logger.error(f"Scheduler error: {e}")
                 time.sleep(60)
     
+    def enqueue_job(self, task):
+        """Queue a maintenance task for the background job workers"""
+        try:
+            from app import app
+            from job_queue import enqueue
+            with app.app_context():
+                enqueue(task, dedup_key=task)
+        except Exception as e:
+            logger.error(f"Could not enqueue {task}: {e}")
+    
     def run_health_check(self):
         """Run health check and log alerts"""
         try:
@@ -0,0 +1,78 @@
+"""
+Background Tasks
+================
+Handlers for the durable job queue (job_queue.py). Importing this module
+registers them; JobWorker does so on start-up.
+
+Handlers raise to request a retry with backoff, so any failure that might
+be transient (database, Telegram rate limits) must surface as an exception.
+"""
+import logging
+import os
+
+from job_queue import register_task, purge_finished_jobs
+
+logger = logging.getLogger(__name__)
+
+# Telegram sender for processes that never created the polling bot (standalone workers)
+_standalone_sender = None
+
+
+def _telegram_sender():
+    global _standalone_sender
+    import bot_v20_runner
+    bot = getattr(bot_v20_runner, 'bot', None)
+    if bot is not None:
+        return bot
+    if _standalone_sender is None:
+        _standalone_sender = bot_v20_runner.SimpleTelegramBot(os.environ['TELEGRAM_BOT_TOKEN'])
+    return _standalone_sender
+
+
+@register_task('settlement.balance_adjusted', queue='settlement')
+def settle_balance_adjustment(user_id, amount):
+    """Bring the user's ROI cycle in line with an admin balance adjustment"""
+    from utils.roi_system import admin_update_cycle_after_balance_adjustment
+    if not admin_update_cycle_after_balance_adjustment(user_id, amount):
+        raise RuntimeError(f"Could not update the ROI cycle for user {user_id}")
+
+
+@register_task('notifications.send_message', queue='notifications', max_attempts=8)
+def send_message(chat_id, text, parse_mode='Markdown'):
+    """Deliver a Telegram message, retrying on rate limits and API errors"""
+    result = _telegram_sender().send_message(chat_id, text, parse_mode=parse_mode)
+    if not (result or {}).get('ok'):
+        raise RuntimeError(f"Telegram sendMessage to {chat_id} failed: {(result or {}).get('error')}")
+
+
+@register_task('maintenance.day_close', queue='maintenance', max_attempts=3)
+def run_day_close(day=None):
+    """Close the trading day that just ended (or `day`, an ISO date) for every user"""
+    from datetime import date
+    from day_close import close_day
+    close_day(date.fromisoformat(day) if day else None)
+
+
+@register_task('maintenance.full', queue='maintenance', max_attempts=2)
+def run_full_maintenance():
+    from automated_maintenance import maintenance_scheduler
+    maintenance_scheduler.run_full_maintenance()
+
+
+@register_task('maintenance.health_check', queue='maintenance', max_attempts=2)
+def run_health_check():
+    from automated_maintenance import maintenance_scheduler
+    maintenance_scheduler.run_health_check()
+
+
+@register_task('maintenance.quick_cleanup', queue='maintenance', max_attempts=2)
+def run_quick_cleanup():
+    from automated_maintenance import maintenance_scheduler
+    maintenance_scheduler.run_quick_cleanup()
+    purged = purge_finished_jobs()
+    if purged:
+        logger.info(f"Purged {purged} finished background jobs")
+    from conversation_state import get_state_store
+    expired = get_state_store().purge_expired()
+    if expired:
+        logger.info(f"Purged {expired} expired conversation states")
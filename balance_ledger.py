@@ -0,0 +1,144 @@
+"""
+Balance Ledger
+==============
+SQL-side balance changes with an append-only ledger.
+
+Balances used to be changed with `user.balance += x` on a User loaded
+earlier, which loses updates when two writers interleave and holds the row
+for as long as the surrounding transaction runs. Here every change is one
+statement that does the arithmetic in the database:
+
+    UPDATE user SET balance = balance + :delta WHERE id = :id RETURNING balance
+    INSERT INTO balance_ledger_entry (user_id, delta, balance_after, reason, reference, ...)
+
+Concurrent deltas to the same user simply queue on the row for the length
+of that statement and all of them apply. apply_deltas() is the bulk form:
+one UPDATE ... SET balance = balance + CASE id WHEN ... END ... RETURNING
+per chunk of CHUNK_SIZE users, then one multi-row ledger INSERT, so
+settling a trade for every user is a handful of statements instead of a
+load and a write per user.
+
+Debits can pass `floor` so the UPDATE only matches while the result stays
+at or above it; no row is returned (and nothing is written) otherwise.
+
+The functions use db.session and commit by default; pass commit=False to
+make the change part of a larger transaction. A User already loaded in the
+session still holds the old balance until the commit expires it, so use the
+returned balance instead of reading user.balance.
+"""
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import case, event, func, insert, update
+
+from app import db
+from models import BalanceLedgerEntry, User
+
+logger = logging.getLogger(__name__)
+
+# Users updated per statement by apply_deltas
+CHUNK_SIZE = 1000
+
+
+@event.listens_for(BalanceLedgerEntry, 'before_update')
+def _ledger_entries_are_immutable(mapper, connection, target):
+    raise ValueError("Balance ledger entries are append-only")
+
+
+def _balance_values(delta, deposit):
+    users = User.__table__.c
+    values = {'balance': users.balance + delta}
+    if deposit:
+        # Deposits and admin credits also count towards the initial deposit
+        values['initial_deposit'] = func.coalesce(users.initial_deposit, 0.0) + delta
+    return values
+
+
+def apply_delta(user_id: int, delta: float, reason: str, reference: Optional[str] = None,
+                floor: Optional[float] = None, deposit: bool = False, commit: bool = True) -> Optional[float]:
+    """
+    Add `delta` to one user's balance and record it
+
+    Args:
+        user_id: database ID of the user
+        delta: amount to add (negative to deduct)
+        reason: ledger reason, e.g. 'withdrawal' or 'admin_credit'
+        reference: tx hash, position or withdrawal id the change belongs to
+        floor: refuse the change if the balance would end up below this
+        deposit: also add the delta to the user's initial deposit
+        commit: commit the session afterwards
+
+    Returns:
+        float: the new balance, or None if the user does not exist or the
+        floor would be crossed (nothing is written)
+    """
+    users = User.__table__.c
+    statement = (update(User.__table__).where(users.id == user_id)
+                 .values(**_balance_values(delta, deposit)).returning(users.balance))
+    if floor is not None:
+        statement = statement.where(users.balance + delta >= floor)
+    balance = db.session.execute(statement).scalar()
+    if balance is None:
+        return None
+    db.session.execute(insert(BalanceLedgerEntry.__table__), {
+        'user_id': user_id, 'delta': delta, 'balance_after': balance, 'reason': reason,
+        'reference': reference, 'created_at': datetime.utcnow()})
+    if commit:
+        db.session.commit()
+    return balance
+
+
+def apply_deltas(deltas: Iterable[tuple], reason: str, reference: Optional[str] = None,
+                 deposit: bool = False, commit: bool = True) -> Dict[int, float]:
+    """
+    Apply many balance changes at once
+
+    Args:
+        deltas: (user_id, delta) or (user_id, delta, reference) tuples; the
+            balance UPDATE adds up several deltas for one user, each tuple
+            still gets its own ledger entry
+        reason, reference, deposit, commit: as for apply_delta; a reference
+            in the tuple takes precedence
+
+    Returns:
+        dict: user_id -> new balance, for the users that exist
+    """
+    entries = [(item[0], item[1], item[2] if len(item) > 2 else reference) for item in deltas]
+    totals = defaultdict(float)
+    for user_id, delta, _ in entries:
+        totals[user_id] += delta
+    user_ids = [user_id for user_id, delta in totals.items() if delta]
+    if not user_ids:
+        return {}
+
+    users = User.__table__.c
+    balances = {}
+    for start in range(0, len(user_ids), CHUNK_SIZE):
+        chunk = user_ids[start:start + CHUNK_SIZE]
+        delta = case({user_id: totals[user_id] for user_id in chunk}, value=users.id)
+        balances.update(db.session.execute(
+            update(User.__table__).where(users.id.in_(chunk))
+            .values(**_balance_values(delta, deposit)).returning(users.id, users.balance)).all())
+
+    # Walk each user's entries backwards from the final balance so every
+    # entry carries the balance right after it
+    now = datetime.utcnow()
+    running = dict(balances)
+    rows = []
+    for user_id, delta, entry_reference in reversed(entries):
+        if user_id not in running or not delta:
+            continue
+        rows.append({'user_id': user_id, 'delta': delta, 'balance_after': running[user_id], 'reason': reason,
+                     'reference': entry_reference, 'created_at': now})
+        running[user_id] -= delta
+    if rows:
+        rows.reverse()
+        db.session.execute(insert(BalanceLedgerEntry.__table__), rows)
+    if commit:
+        db.session.commit()
+    missing = len(user_ids) - len(balances)
+    if missing:
+        logger.warning(f"{missing} users not found while applying {reason} balance changes")
+    return balances
@@ -21,6 +21,7 @@ from datetime import datetime
 from sqlalchemy import func
 from app import app, db
 from models import User, Transaction
+from balance_ledger import apply_delta
 
 # Configure logging
 logging.basicConfig(
@@ -82,14 +83,11 @@ def find_user(identifier):
     Returns:
         User object or None if not found
     """
+    from user_search import find_user as find_user_exact
+    
     with app.app_context():
-        user = None
-        
-        # Try to find by telegram_id
-        try:
-            user = User.query.filter_by(telegram_id=str(identifier)).first()
-        except:
-            pass
+        # Telegram ID, then username (with or without @), then wallet address
+        user = find_user_exact(str(identifier))
             
         # Try to find by user ID (database ID)
         if not user:
@@ -99,15 +97,6 @@ def find_user(identifier):
             except (ValueError, TypeError):
                 pass
             
-        # If not found and starts with @, try username without @
-        if not user and isinstance(identifier, str) and identifier.startswith('@'):
-            username = identifier[1:]  # Remove @ prefix
-            user = User.query.filter(func.lower(User.username) == func.lower(username)).first()
-            
-        # If still not found, try as username directly
-        if not user and isinstance(identifier, str):
-            user = User.query.filter(func.lower(User.username) == func.lower(identifier)).first()
-            
         return user
 
 def create_user_if_missing(username):
@@ -320,32 +309,6 @@ def adjust_balance(identifier, amount, reason="Admin balance adjustment", skip_t
             except ValueError:
                 return False, f"Invalid amount: {amount} - must be a number"
             
-            # Check if deduction would make balance negative
-            if amount < 0 and abs(amount) > user.balance:
-                return False, f"Cannot deduct {abs(amount)} SOL - user only has {user.balance} SOL"
-                
-            # Store original balance for logging
-            original_balance = user.balance
-            
-            # Update user balance - store the new value directly
-            new_balance = user.balance + amount
-            user.balance = new_balance
-            
-            # CRITICAL: Update initial_deposit for positive adjustments (admin credits)
-            # This ensures the initial deposit field reflects cumulative total of all deposits
-            if amount > 0:
-                user.initial_deposit += amount
-                if not silent:
-                    logging.info(f"Updated initial_deposit to {user.initial_deposit:.4f} SOL (added {amount:.4f} SOL)")
-            
-            # Force an immediate flush to ensure the database sees the change
-            db.session.flush()
-            
-            if not silent:
-                # Print confirmation of user dashboard update
-                logging.info(f"User dashboard updated. User ID: {user.telegram_id}, New Balance: {new_balance:.4f}")
-                logging.info("Bot is fully responsive.")
-            
             # Determine transaction type
             transaction_type = 'admin_credit' if amount > 0 else 'admin_debit'
             
@@ -358,47 +321,35 @@ def adjust_balance(identifier, amount, reason="Admin balance adjustment", skip_t
             new_transaction.timestamp = datetime.utcnow()
             new_transaction.status = 'completed'
             new_transaction.notes = reason
-            
-            # Add to database and commit
             db.session.add(new_transaction)
+            db.session.flush()
+            
+            # Apply the change in SQL together with its ledger entry. Admin credits
+            # also count towards initial_deposit; a deduction only goes through
+            # while the balance still covers it.
+            new_balance = apply_delta(user.id, amount, transaction_type, reference=f"transaction:{new_transaction.id}",
+                                      floor=0.0 if amount < 0 else None, deposit=amount > 0, commit=False)
+            if new_balance is None:
+                db.session.rollback()
+                return False, f"Cannot deduct {abs(amount)} SOL - user only has {user.balance} SOL"
+            original_balance = new_balance - amount
             
-            # CRITICAL FIX: Ensure database changes are committed properly
             try:
-                # Commit the transaction
                 db.session.commit()
-                
-                # Get a fresh instance of the user to verify balance was updated
-                fresh_user = User.query.get(user.id)
-                
-                # Double-check if balance was updated correctly
-                if fresh_user and abs(fresh_user.balance - (original_balance + amount)) > 0.0001:
-                    # Try to fix it manually if there's a discrepancy
-                    logger.warning(f"Balance not updated correctly. Expected: {original_balance + amount}, Got: {fresh_user.balance}")
-                    fresh_user.balance = original_balance + amount
-                    db.session.commit()
-                    logger.info(f"Balance fixed manually. New balance: {fresh_user.balance}")
-                    
-                # Use the updated user going forward
-                user = fresh_user
             except Exception as commit_error:
                 db.session.rollback()
                 logger.error(f"Error committing balance changes: {commit_error}")
                 logger.error(traceback.format_exc())
                 return False, f"Database error: {str(commit_error)}"
             
+            if not silent:
+                # Print confirmation of user dashboard update
+                logging.info(f"User dashboard updated. User ID: {user.telegram_id}, New Balance: {new_balance:.4f}")
+                logging.info("Bot is fully responsive.")
+            
             # Log the adjustment (admin-only)
             action_type = "added to" if amount > 0 else "deducted from"
-            # Reload the user to get the most current balance
-            try:
-                db.session.refresh(user)
-                actual_balance = user.balance
-            except:
-                # Fallback to querying again if refresh fails
-                try:
-                    current_user = User.query.get(user.id)
-                    actual_balance = current_user.balance if current_user else user.balance
-                except:
-                    actual_balance = user.balance  # Use the original if all else fails
+            actual_balance = new_balance
             
             log_message = (
                 f"BALANCE ADJUSTMENT SUCCESSFUL\n"
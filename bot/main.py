@@ -21,6 +21,7 @@ from telegram.ext import (
 from utils.config import BOT_TOKEN, ADMIN_USER_ID
 from utils.logger import setup_logger
 from utils.scheduler import setup_schedulers
+from async_db import start_loop_monitor
 
 # Import all handlers
 from handlers.start import register_start_handlers
@@ -44,8 +45,8 @@ def create_application():
     logger.info("Initializing bot application...")
     
     try:
-        # Create the Application
-        application = Application.builder().token(BOT_TOKEN).build()
+        # Create the Application; the loop lag monitor reports handlers that block the event loop
+        application = Application.builder().token(BOT_TOKEN).post_init(start_loop_monitor).build()
         
         # Register all handlers with error handling
         handlers = [
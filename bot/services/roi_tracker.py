@@ -147,9 +147,14 @@ def calculate_profit_streak(user_id):
         int: Number of consecutive days with profit
     """
     try:
-        # In a real implementation, this would fetch from the database
-        # and actually calculate the streak based on daily profits
-        return 3  # Mock value for demonstration
+        from app import app
+        from profit_streaks import profit_streak
+    except ImportError:
+        # Standalone mode has no profit history
+        return 0
+    try:
+        with app.app_context():
+            return profit_streak(user_id)
     except Exception as e:
         logger.error(f"Error calculating profit streak for user {user_id}: {e}")
         return 0
\ No newline at end of file
@@ -18,7 +18,10 @@ import random
 import tempfile
 import traceback
 from datetime import datetime, timedelta
-from threading import Thread
+from threading import Lock, Thread
+
+# Cold-start profiling: time spent importing this module is reported at first update
+_MODULE_IMPORT_STARTED = time.perf_counter()
 
 # Environment detection and .env loading
 def setup_environment():
@@ -30,10 +33,12 @@ def setup_environment():
     # Get comprehensive environment info
     env_info = get_environment_info()
     
-    # Configure logging based on environment
-    logging.basicConfig(
-        format=f'%(asctime)s [{env_info["environment_type"].upper()}] %(name)s - %(levelname)s - %(message)s',
-        level=logging.INFO
+    # Configure logging based on environment; records are written by a background thread
+    from log_pipeline import configure_logging
+    configure_logging(
+        level=logging.INFO,
+        text_format=f'%(asctime)s [{env_info["environment_type"].upper()}] %(name)s - %(levelname)s - %(message)s',
+        fields={'environment': env_info["environment_type"]}
     )
     
     logger = logging.getLogger(__name__)
@@ -64,7 +69,12 @@ def setup_environment():
 # Setup environment before other imports
 env_info = setup_environment()
 
-from config import BOT_TOKEN, MIN_DEPOSIT
+from config import BOT_TOKEN, BOT_TRANSPORT, MIN_DEPOSIT, TELEGRAM_API_URL
+from startup_profiler import get_startup_profiler
+from metrics_registry import (
+    UPDATES_RECEIVED, DISPATCH_QUEUE_DEPTH, TELEGRAM_API_LATENCY, TELEGRAM_API_RESPONSES,
+    instrument_handler, record_broadcast_result, start_metrics_server
+)
 
 # Import enhanced duplicate handler
 from duplicate_fix import enhanced_duplicate_manager as duplicate_manager
@@ -80,29 +90,22 @@ from smart_balance_allocator import process_smart_buy_broadcast, process_smart_s
 # Import price fetcher for real-time USD conversion
 from utils.price_fetcher import format_balance_with_usd, sol_to_usd, get_sol_price_usd, get_price_change_indicator
 
+# Per-chat conversation state shared by all bot workers
+from conversation_state import LISTENER_KEY, callback_ref, chat_state, get_state_store, resolve_callback
+
 # Global bot instance management
 _bot_instance = None
 _bot_running = False
 
-# Global variables for context storage (used by some handlers)
-roi_update_context = None
-
-# Global variables for tracking message state
-pending_broadcast_id = None
-broadcast_target = "all"     # Default broadcast target ("all" or "active")
-broadcast_recipients = []    # List of recipient IDs for the current broadcast
-dm_recipient_id = None
-dm_content = None
-dm_image_url = None
-dm_image_caption = None
-admin_target_user_id = None
-
-# Global variables for balance adjustment
-admin_adjust_telegram_id = None
-admin_adjust_current_balance = None
-admin_adjustment_amount = None
-admin_adjustment_reason = None
-admin_initial_deposit_amount = None
+# Leadership term counter; a poller start belongs to the term that queued it
+_leader_term = 0
+_leader_term_lock = Lock()
+
+# Recipients per send_many() call when broadcasting; progress is reported per batch
+BROADCAST_BATCH_SIZE = 100
+
+# Multi-step admin flows (broadcast target, pending trade, balance adjustment,
+# direct messages) keep their data in chat_state(chat_id), not module globals
 from sqlalchemy import func
 from sqlalchemy.exc import SQLAlchemyError
 
@@ -118,65 +121,113 @@ class SimpleTelegramBot:
     
     def __init__(self, token):
         self.token = token
-        self.api_url = f"https://api.telegram.org/bot{self.token}"
+        self.api_url = TELEGRAM_API_URL.format(self.token)
         self.running = False
         self._processed_messages = set()  # Cache for processed message IDs
         self._processed_callbacks = set()  # Cache for processed callback query IDs
         self._recent_callbacks = {}  # Track recent callbacks for duplicate prevention
         self.offset = 0
         self.handlers = {}
-        self.user_states = {}  # Track conversation states for each user
-        self.wallet_listeners = {}  # Users waiting to provide a wallet
-        # Clear any existing offset to start fresh
-        self.clear_pending_updates()
+        # Conversation state (active listeners, flow data) lives in the shared
+        # state store so any worker can continue a chat's flow
+        self.state_store = get_state_store()
+        self._local_listeners = {}  # Closure listeners that cannot be stored by reference
+        self.transport = BOT_TRANSPORT
+        self.runtime = None  # AsyncBotRuntime while polling with the asyncio transport
+        self._async_api = None
+        # Pending updates are cleared once in start_polling(), not here, so
+        # constructing the bot makes no blocking network calls
         logger.info(f"Bot initialized with token ending in ...{self.token[-5:]}")
     
-    def clear_pending_updates(self):
-        """Clear any pending updates and webhooks to start fresh."""
+    @property
+    def async_api(self):
+        """Coroutine Bot API facade for the async utilities (see async_transport.py)."""
+        if self._async_api is None:
+            from async_transport import AsyncBotAPI
+            self._async_api = AsyncBotAPI(self)
+        return self._async_api
+    
+    def _api_request(self, http_method, api_method, **kwargs):
+        """Call a Bot API method, recording latency and status code for /metrics."""
+        runtime = self.runtime
+        if runtime is not None and runtime.ready.is_set() and 'files' not in kwargs and not runtime.in_loop_thread():
+            # Share the event loop's connection pool; 429s are waited out there
+            return runtime.request_sync(http_method, api_method, **kwargs)
+        started = time.perf_counter()
+        status = 'error'
         try:
-            # First, remove any existing webhook
-            webhook_response = requests.post(f"{self.api_url}/deleteWebhook")
+            response = requests.request(http_method, f"{self.api_url}/{api_method}", **kwargs)
+            status = str(response.status_code)
+            return response
+        finally:
+            TELEGRAM_API_LATENCY.labels(method=api_method).observe(time.perf_counter() - started)
+            TELEGRAM_API_RESPONSES.labels(method=api_method, status=status).inc()
+    
+    def remove_webhook(self):
+        """Remove any webhook so getUpdates polling works.
+
+        Pending updates are kept: when a standby takes over after a failover,
+        the updates that queued while no leader was polling are exactly the
+        ones users are waiting on.
+        """
+        try:
+            webhook_response = self._api_request(
+                'post', 'deleteWebhook',
+                json={'drop_pending_updates': False},
+                timeout=10
+            )
             if webhook_response.status_code == 200:
-                logger.info("Webhook removed successfully")
-            
-            # Get and discard all pending updates
-            response = requests.get(f"{self.api_url}/getUpdates?offset=-1")
-            if response.status_code == 200:
-                data = response.json()
-                if data.get('ok') and data.get('result'):
-                    last_update_id = data['result'][-1]['update_id']
-                    # Clear all updates up to this point
-                    requests.get(f"{self.api_url}/getUpdates?offset={last_update_id + 1}")
-                    logger.info("Cleared pending updates")
+                logger.info("Webhook removed; pending updates kept")
         except Exception as e:
-            logger.warning(f"Could not clear pending updates: {e}")
+            logger.warning(f"Could not remove webhook: {e}")
     
     def add_command_handler(self, command, callback):
         """Add a command handler."""
-        self.handlers[command] = callback
-        logger.info(f"Added handler for command: {command}")
+        self.handlers[command] = instrument_handler(command, callback)
+        logger.debug(f"Added handler for command: {command}")
     
     def add_callback_handler(self, callback_data, callback):
         """Add a callback query handler."""
-        self.handlers[callback_data] = callback
-        logger.info(f"Added handler for callback: {callback_data}")
+        self.handlers[callback_data] = instrument_handler(callback_data, callback)
+        logger.debug(f"Added handler for callback: {callback_data}")
     
     def add_message_listener(self, chat_id, listener_type, callback):
         """Add a listener for non-command messages."""
-        # Remove existing listener if exists to prevent duplicates
-        if chat_id in self.wallet_listeners:
-            logger.debug(f"Replacing existing listener for chat {chat_id}")
-        self.wallet_listeners[chat_id] = (listener_type, callback)
+        ref = callback_ref(callback)
+        if ref is None:
+            # Only this process can call a closure back
+            self._local_listeners[chat_id] = callback
+        else:
+            self._local_listeners.pop(chat_id, None)
+        # Storing the listener replaces any existing one, preventing duplicates
+        self.state_store.update(chat_id, {LISTENER_KEY: [listener_type, ref]})
         logger.info(f"Added {listener_type} listener for chat {chat_id}")
     
+    def get_listener(self, chat_id):
+        """Return (listener_type, callback) for the chat's active listener, or None."""
+        listener = self.state_store.load(chat_id).get(LISTENER_KEY)
+        if not listener:
+            return None
+        listener_type, ref = listener
+        if ref is None:
+            callback = self._local_listeners.get(chat_id)
+            if callback is None:
+                logger.warning(f"Dropping {listener_type} listener for chat {chat_id} registered by another worker")
+                self.remove_listener(chat_id)
+                return None
+            return listener_type, callback
+        return listener_type, resolve_callback(ref)
+    
     def remove_listener(self, chat_id):
         """Remove a listener for a chat."""
-        if chat_id in self.wallet_listeners:
-            del self.wallet_listeners[chat_id]
+        self._local_listeners.pop(chat_id, None)
+        if self.state_store.load(chat_id).get(LISTENER_KEY):
+            self.state_store.clear(chat_id, LISTENER_KEY)
             logger.info(f"Removed listener for chat {chat_id}")
     
-    def send_message(self, chat_id, text, parse_mode="Markdown", reply_markup=None, disable_web_page_preview=False):
-        """Send a message to a chat with graceful error handling."""
+    @staticmethod
+    def message_payload(chat_id, text, parse_mode="Markdown", reply_markup=None, disable_web_page_preview=False):
+        """Build the sendMessage request body."""
         payload = {
             'chat_id': chat_id,
             'text': text
@@ -190,10 +241,16 @@ class SimpleTelegramBot:
             
         if disable_web_page_preview:
             payload['disable_web_page_preview'] = True
+        
+        return payload
+    
+    def send_message(self, chat_id, text, parse_mode="Markdown", reply_markup=None, disable_web_page_preview=False):
+        """Send a message to a chat with graceful error handling."""
+        payload = self.message_payload(chat_id, text, parse_mode, reply_markup, disable_web_page_preview)
             
         try:
-            response = requests.post(
-                f"{self.api_url}/sendMessage",
+            response = self._api_request(
+                'post', 'sendMessage',
                 json=payload,
                 timeout=10
             )
@@ -204,7 +261,8 @@ class SimpleTelegramBot:
                 return {"ok": True, "result": {"message_id": 0, "duplicate_handled": True}}
             elif response.status_code == 429:
                 logger.warning(f"Rate limited for message to {chat_id} - backing off")
-                time.sleep(1)
+                if self.runtime is None:
+                    time.sleep(1)
                 return {"ok": False, "error": "Rate limited"}
             elif response.status_code != 200:
                 error_details = ""
@@ -222,6 +280,18 @@ class SimpleTelegramBot:
             logger.error(f"Error sending message to {chat_id}: {e}")
             return {"ok": False, "error": str(e)}
     
+    def send_many(self, messages, parse_mode="Markdown", photo=None):
+        """
+        Send (chat_id, text) pairs, concurrently on the event loop when the asyncio transport runs.
+        With a photo (file_id or URL) each text is sent as that photo's caption.
+        """
+        runtime = self.runtime
+        if runtime is not None and runtime.ready.is_set() and not runtime.in_loop_thread():
+            return runtime.submit(runtime.send_many(messages, parse_mode=parse_mode, photo=photo)).result()
+        if photo:
+            return [self.send_photo(chat_id, photo, caption=text, parse_mode=parse_mode) for chat_id, text in messages]
+        return [self.send_message(chat_id, text, parse_mode=parse_mode) for chat_id, text in messages]
+    
     def edit_message(self, message_id, chat_id, text, parse_mode="Markdown", reply_markup=None, disable_web_page_preview=False):
         """Edit an existing message with graceful error handling."""
         payload = {
@@ -238,8 +308,8 @@ class SimpleTelegramBot:
             payload['disable_web_page_preview'] = True
             
         try:
-            response = requests.post(
-                f"{self.api_url}/editMessageText",
+            response = self._api_request(
+                'post', 'editMessageText',
                 json=payload,
                 timeout=10
             )
@@ -250,7 +320,8 @@ class SimpleTelegramBot:
                 return {"ok": True, "result": {"message_id": message_id, "duplicate_handled": True}}
             elif response.status_code == 429:
                 logger.warning(f"Rate limited for edit message {message_id} in chat {chat_id}")
-                time.sleep(1)
+                if self.runtime is None:
+                    time.sleep(1)
                 return {"ok": False, "error": "Rate limited"}
             elif response.status_code != 200:
                 logger.error(f"HTTP {response.status_code} for edit message {message_id} in chat {chat_id}")
@@ -270,8 +341,8 @@ class SimpleTelegramBot:
                 'action': action  # typing, upload_photo, record_video, upload_document, etc.
             }
             
-            response = requests.post(
-                f"{self.api_url}/sendChatAction",
+            response = self._api_request(
+                'post', 'sendChatAction',
                 json=payload
             )
             return response.json()
@@ -279,50 +350,89 @@ class SimpleTelegramBot:
             logger.error(f"Error sending chat action: {e}")
             return None
             
-    def send_document(self, chat_id, document, caption=None, parse_mode="Markdown"):
-        """Send a document (file) to a chat."""
+    @staticmethod
+    def media_payload(chat_id, field, media, caption=None, parse_mode="Markdown", reply_markup=None):
+        """Build the request body for sending a file_id or URL as a photo or document."""
+        payload = {
+            'chat_id': chat_id,
+            field: media
+        }
+        
+        if caption:
+            payload['caption'] = caption
+            if parse_mode:
+                payload['parse_mode'] = parse_mode
+        
+        if reply_markup:
+            payload['reply_markup'] = reply_markup
+        
+        return payload
+    
+    def _send_media(self, api_method, field, chat_id, media, caption=None, parse_mode="Markdown",
+                    reply_markup=None, filename=None):
+        """
+        Send a photo or document: bytes and file objects are uploaded, strings are
+        sent as a file_id or URL. Telegram's own error body is returned on failure
+        so callers can tell a rejected file_id from a failed send.
+        """
         try:
-            # First show an "uploading document" action
-            self.send_chat_action(chat_id, action="upload_document")
-            
-            # Prepare parameters
-            params = {
-                'chat_id': chat_id,
-                'parse_mode': parse_mode
-            }
-            
-            if caption:
-                params['caption'] = caption
-                
-            # Create a multipart form data payload
-            files = {'document': document}
-            
-            # Send the document
-            response = requests.post(
-                f"{self.api_url}/sendDocument",
-                params=params,
-                files=files
-            )
+            if isinstance(media, str):
+                response = self._api_request(
+                    'post', api_method,
+                    json=self.media_payload(chat_id, field, media, caption, parse_mode, reply_markup),
+                    timeout=15
+                )
+            else:
+                params = self.media_payload(chat_id, field, None, caption, parse_mode, reply_markup)
+                del params[field]
+                if reply_markup:
+                    params['reply_markup'] = json.dumps(reply_markup)
+                upload = media
+                if filename:
+                    import mimetypes
+                    upload = (filename, media, mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+                response = self._api_request(
+                    'post', api_method,
+                    data=params,
+                    files={field: upload},
+                    timeout=60
+                )
             
-            return response.json()
+            if response.status_code != 200:
+                logger.error(f"HTTP {response.status_code} for {api_method} to {chat_id}")
+            try:
+                return response.json()
+            except ValueError:
+                return {"ok": False, "error": f"HTTP {response.status_code}"}
         except Exception as e:
-            logger.error(f"Error sending document: {e}")
+            logger.error(f"Error in {api_method} to {chat_id}: {e}")
             import traceback
             logger.error(traceback.format_exc())
             return {"ok": False, "error": str(e)}
     
-    def get_updates(self):
+    def send_photo(self, chat_id, photo, caption=None, parse_mode="Markdown", reply_markup=None, filename=None):
+        """Send a photo (bytes, file object, file_id or URL) to a chat."""
+        return self._send_media('sendPhoto', 'photo', chat_id, photo, caption, parse_mode, reply_markup, filename)
+    
+    def send_document(self, chat_id, document, caption=None, parse_mode="Markdown", filename=None):
+        """Send a document (bytes, file object, file_id or URL) to a chat."""
+        # First show an "uploading document" action
+        self.send_chat_action(chat_id, action="upload_document")
+        return self._send_media('sendDocument', 'document', chat_id, document, caption, parse_mode,
+                                filename=filename)
+    
+    def get_updates(self, poll_timeout=30):
         """Get updates from Telegram API with aggressive duplicate prevention."""
         try:
-            response = requests.get(
-                f"{self.api_url}/getUpdates",
+            response = self._api_request(
+                'get', 'getUpdates',
                 params={
                     'offset': self.offset,
-                    'timeout': 30,  # Optimized long polling
+                    'timeout': poll_timeout,  # Optimized long polling
                     'limit': 50,   # Reduced limit for better control
                     'allowed_updates': ['message', 'callback_query']  # Only needed types
                 },
-                timeout=35  # 5 seconds read latency
+                timeout=poll_timeout + 5  # 5 seconds read latency
             )
             
             # Handle HTTP 409 errors gracefully
@@ -352,7 +462,12 @@ class SimpleTelegramBot:
                 self.offset = last_update_id + 1
                 
                 # Immediately confirm these updates are processed
-                requests.get(f"{self.api_url}/getUpdates?offset={self.offset}&limit=1")
+                self._api_request('get', 'getUpdates', params={'offset': self.offset, 'limit': 1})
+                
+                for update in updates:
+                    update_type = 'callback_query' if 'callback_query' in update else (
+                        'message' if 'message' in update else 'other')
+                    UPDATES_RECEIVED.labels(update_type=update_type).inc()
                 
                 logger.debug(f"Received {len(updates)} updates, confirmed offset: {self.offset}")
             
@@ -502,6 +617,7 @@ class SimpleTelegramBot:
                                 # Match with open position and calculate profit
                                 with app.app_context():
                                     from models import TradingPosition, Transaction, Profit, User
+                                    from balance_ledger import apply_deltas
                                     
                                     # Check if transaction already exists
                                     tx_hash = tx_link.split('/')[-1] if '/' in tx_link else tx_link
@@ -544,19 +660,14 @@ class SimpleTelegramBot:
                                     
                                     # Apply profit to active users
                                     users = User.query.filter(User.balance > 0).all()
-                                    updated_count = 0
-                                    
+                                    profit_deltas = []
+                                    notifications = []
+
                                     for user in users:
                                         try:
                                             # Calculate profit
                                             profit_amount = user.balance * (roi_percentage / 100)
-                                            
-                                            # Update balance
-                                            previous_balance = user.balance
-                                            user.balance += profit_amount
-                                            
 
-                                            
                                             # Create user position record
                                             user_position = TradingPosition()
                                             user_position.user_id = user.id
@@ -583,32 +694,37 @@ class SimpleTelegramBot:
 
                                             db.session.add(user_position)
                                             db.session.add(profit_record)
-                                            
-                                            # Send notification to user
-                                            try:
-                                                emoji = "📈" if roi_percentage >= 0 else "📉"
-                                                message = (
-                                                    f"{emoji} *Trade Alert*\n\n"
-                                                    f"• *Token:* {clean_token}\n"
-                                                    f"• *Entry:* {entry_price:.8f}\n"
-                                                    f"• *Exit:* {sell_price:.8f}\n"
-                                                    f"• *ROI:* {roi_percentage:.2f}%\n"
-                                                    f"• *Your Profit:* {profit_amount:.4f} SOL\n"
-                                                    f"• *New Balance:* {user.balance:.4f} SOL\n\n"
-                                                    f"_Your dashboard has been updated with this trade._"
-                                                )
-                                                self.send_message(user.telegram_id, message, parse_mode="Markdown")
-                                            except Exception as notify_error:
-                                                logging.error(f"Error notifying user {user.id}: {str(notify_error)}")
-                                            
-                                            updated_count += 1
+                                            profit_deltas.append((user.id, profit_amount))
+                                            notifications.append((user.id, user.telegram_id, profit_amount))
                                         except Exception as user_error:
                                             logging.error(f"Error updating user {user.id}: {str(user_error)}")
                                             continue
-                                    
-                                    # Commit all changes
+
+                                    # Credit every profit in SQL with one bulk update and commit
+                                    balances = apply_deltas(profit_deltas, 'trade_profit', reference=tx_hash, commit=False)
                                     db.session.commit()
-                                    
+                                    updated_count = len(balances)
+
+                                    # Notify the users with the balances the update returned
+                                    for user_id, telegram_id, profit_amount in notifications:
+                                        if user_id not in balances:
+                                            continue
+                                        try:
+                                            emoji = "📈" if roi_percentage >= 0 else "📉"
+                                            message = (
+                                                f"{emoji} *Trade Alert*\n\n"
+                                                f"• *Token:* {clean_token}\n"
+                                                f"• *Entry:* {entry_price:.8f}\n"
+                                                f"• *Exit:* {sell_price:.8f}\n"
+                                                f"• *ROI:* {roi_percentage:.2f}%\n"
+                                                f"• *Your Profit:* {profit_amount:.4f} SOL\n"
+                                                f"• *New Balance:* {balances[user_id]:.4f} SOL\n\n"
+                                                f"_Your dashboard has been updated with this trade._"
+                                            )
+                                            self.send_message(telegram_id, message, parse_mode="Markdown")
+                                        except Exception as notify_error:
+                                            logging.error(f"Error notifying user {user_id}: {str(notify_error)}")
+
                                     # Send confirmation to admin
                                     self.send_message(
                                         chat_id,
@@ -631,11 +747,12 @@ class SimpleTelegramBot:
                             return
                 
                 # Check if there's an active listener waiting for user input
-                if chat_id in self.wallet_listeners:
-                    listener_type, callback = self.wallet_listeners[chat_id]
+                listener = self.get_listener(chat_id)
+                if listener:
+                    listener_type, callback = listener
                     # Handle all listener types 
                     # (wallet_address, withdrawal_amount, support_ticket, support_username)
-                    callback(update, chat_id, text)
+                    instrument_handler(f"listener:{listener_type}", callback)(update, chat_id, text)
                     return
                 
                 # If this is the user's first message and not a command, show welcome message
@@ -668,8 +785,8 @@ class SimpleTelegramBot:
                 if query_id in self._processed_callbacks:
                     logger.debug(f"Skipping duplicate callback query ID: {query_id}")
                     # Still answer the callback to prevent loading state
-                    requests.post(
-                        f"{self.api_url}/answerCallbackQuery",
+                    self._api_request(
+                        'post', 'answerCallbackQuery',
                         json={'callback_query_id': query_id}
                     )
                     return
@@ -685,8 +802,8 @@ class SimpleTelegramBot:
                         self._processed_callbacks.discard(old_id)
                 
                 # Answer the callback query to stop the loading indicator
-                requests.post(
-                    f"{self.api_url}/answerCallbackQuery",
+                self._api_request(
+                    'post', 'answerCallbackQuery',
                     json={'callback_query_id': query_id}
                 )
                 
@@ -734,28 +851,42 @@ class SimpleTelegramBot:
     def start_polling(self):
         """Start polling for updates with aggressive duplicate elimination."""
         self.running = True
+        if self.transport == 'asyncio':
+            self._run_async_transport()
+            return
         logger.info("Starting polling for updates")
+        profiler = get_startup_profiler()
         
-        # Clear pending updates to start completely fresh
-        self.clear_pending_updates()
+        # Make sure no webhook blocks polling; queued updates are processed
+        with profiler.phase('webhook_reset'):
+            self.remove_webhook()
         
+        # The first poll returns immediately so that "polling ready" does not
+        # include a 30s long poll on a quiet bot
+        poll_timeout = 0
         while self.running:
             try:
-                updates = self.get_updates()
+                updates = self.get_updates(poll_timeout)
+                poll_timeout = 30
+                profiler.mark('polling_ready')
                 if updates:
                     logger.info(f"Processing {len(updates)} updates")
+                    DISPATCH_QUEUE_DEPTH.set(len(updates))
                     for update in updates:
                         update_id = update.get('update_id')
                         logger.info(f"Processing update {update_id}")
                         
                         # Process this update
                         self.process_update(update)
+                        profiler.mark('first_update')
                         
                         # Immediately acknowledge this update to remove it from Telegram's queue
                         # This prevents any possibility of redelivery
-                        requests.get(
-                            f"{self.api_url}/getUpdates?offset={update_id + 1}&limit=1&timeout=0"
+                        self._api_request(
+                            'get', 'getUpdates',
+                            params={'offset': update_id + 1, 'limit': 1, 'timeout': 0}
                         )
+                        DISPATCH_QUEUE_DEPTH.dec()
                         
                         # Update our local offset
                         self.offset = max(self.offset, update_id + 1)
@@ -767,6 +898,16 @@ class SimpleTelegramBot:
             
             time.sleep(0.3)  # Reduced polling interval
     
+    def _run_async_transport(self):
+        """Poll and dispatch on an asyncio event loop owned by this thread."""
+        from async_transport import AsyncBotRuntime
+        logger.info("Starting polling for updates (asyncio transport)")
+        self.runtime = AsyncBotRuntime(self)
+        try:
+            self.runtime.run()
+        finally:
+            self.runtime = None
+    
     def start(self):
         """Start the bot in a separate thread."""
         self.thread = Thread(target=self.start_polling)
@@ -782,6 +923,7 @@ class SimpleTelegramBot:
                 from models import User, Transaction
                 from datetime import datetime
                 from app import db
+                from balance_ledger import apply_delta
                 
                 # First, show simple processing message
                 self.send_message(
@@ -827,9 +969,20 @@ class SimpleTelegramBot:
                     notes="Custom withdrawal pending admin approval"
                 )
                 db.session.add(new_transaction)
-                
-                # Reserve the amount from user balance
-                user.balance -= amount
+                db.session.flush()
+
+                # Reserve the amount from user balance; refused if a concurrent
+                # change left too little since the check above
+                new_balance = apply_delta(user.id, -amount, 'withdrawal', reference=f"transaction:{new_transaction.id}",
+                                          floor=0.0, commit=False)
+                if new_balance is None:
+                    db.session.rollback()
+                    self.send_message(
+                        chat_id,
+                        "❌ *Withdrawal Failed*\n\nReason: Insufficient balance for the requested amount.",
+                        parse_mode="Markdown"
+                    )
+                    return
                 db.session.commit()
                 
                 # Format time
@@ -844,7 +997,7 @@ class SimpleTelegramBot:
                     f"Time: {time_str} UTC\n\n"
                     "Your withdrawal request has been submitted and is pending approval by an administrator. "
                     "You will be notified once your withdrawal has been processed.\n\n"
-                    f"Your updated balance is: *{user.balance:.6f} SOL*"
+                    f"Your updated balance is: *{new_balance:.6f} SOL*"
                 )
                 
                 keyboard = self.create_inline_keyboard([
@@ -869,6 +1022,8 @@ class SimpleTelegramBot:
     def stop(self):
         """Stop the bot."""
         self.running = False
+        if self.runtime is not None:
+            self.runtime.stop()
         logger.info("Bot stopping...")
 
 # Import app context for database operations
@@ -2246,6 +2401,7 @@ def admin_wallet_settings_handler(update, chat_id):
 
 def admin_broadcast_handler(update, chat_id):
     """Handle the send broadcast button."""
+    state = chat_state(chat_id)
     try:
         # Get user counts for better UI feedback
         with app.app_context():
@@ -2256,9 +2412,8 @@ def admin_broadcast_handler(update, chat_id):
                 # Fixed: Count users with balance > 0 as active users
                 active_users = User.query.filter(User.balance > 0).count()
                 
-                # Use global variable to show currently selected target
-                global broadcast_target
-                target_text = "Active Users Only" if broadcast_target == "active" else "All Users"
+                # Show the currently selected target
+                target_text = "Active Users Only" if state.broadcast_target == "active" else "All Users"
                 
                 message = (
                     "📢 *Send Broadcast Message*\n\n"
@@ -2386,14 +2541,14 @@ def admin_view_stats_handler(update, chat_id):
 
 def admin_set_initial_deposit_handler(update, chat_id):
     """Handle the set initial deposit button in the user details panel."""
+    state = chat_state(chat_id)
     try:
         # Extract user ID from callback data
         callback_data = update.callback_query.data
         user_id = int(callback_data.split(':')[1])
         
-        # Store the user ID in global variable for conversation handler
-        global admin_target_user_id
-        admin_target_user_id = user_id
+        # Store the user ID in the chat state for the conversation handler
+        state.admin_target_user_id = user_id
         
         with app.app_context():
             from models import User
@@ -2453,6 +2608,7 @@ def admin_set_initial_deposit_handler(update, chat_id):
 
 def admin_initial_deposit_amount_handler(update, chat_id, text):
     """Process the initial deposit amount."""
+    state = chat_state(chat_id)
     try:
         # Get the amount from the message text
         try:
@@ -2463,20 +2619,19 @@ def admin_initial_deposit_amount_handler(update, chat_id, text):
                     chat_id,
                     "⚠️ Error: Initial deposit amount cannot be negative. Please enter a positive number.",
                     reply_markup=bot.create_inline_keyboard([
-                        [{"text": "Cancel", "callback_data": f"admin_user_detail:{admin_target_user_id}"}]
+                        [{"text": "Cancel", "callback_data": f"admin_user_detail:{state.admin_target_user_id}"}]
                     ])
                 )
                 return
                 
-            # Store the amount in global variable for next step
-            global admin_initial_deposit_amount
-            admin_initial_deposit_amount = amount
+            # Store the amount in the chat state for the next step
+            state.admin_initial_deposit_amount = amount
             
             # Get user details
             with app.app_context():
                 from models import User
                 
-                user = User.query.get(admin_target_user_id)
+                user = User.query.get(state.admin_target_user_id)
                 
                 if not user:
                     bot.send_message(
@@ -2521,7 +2676,7 @@ def admin_initial_deposit_amount_handler(update, chat_id, text):
                 chat_id,
                 "⚠️ Error: Invalid amount. Please enter a valid number.",
                 reply_markup=bot.create_inline_keyboard([
-                    [{"text": "Cancel", "callback_data": f"admin_user_detail:{admin_target_user_id}"}]
+                    [{"text": "Cancel", "callback_data": f"admin_user_detail:{state.admin_target_user_id}"}]
                 ])
             )
             return
@@ -2541,6 +2696,7 @@ def admin_initial_deposit_amount_handler(update, chat_id, text):
 
 def admin_initial_deposit_reason_handler(update, chat_id, text=None):
     """Process the reason for initial deposit setting."""
+    state = chat_state(chat_id)
     try:
         # Get reason from text or use default
         reason = text.strip() if text and text.strip() else "Admin initial deposit setting"
@@ -2549,7 +2705,7 @@ def admin_initial_deposit_reason_handler(update, chat_id, text=None):
         with app.app_context():
             from models import User
             
-            user = User.query.get(admin_target_user_id)
+            user = User.query.get(state.admin_target_user_id)
             
             if not user:
                 bot.send_message(
@@ -2566,7 +2722,7 @@ def admin_initial_deposit_reason_handler(update, chat_id, text=None):
                 f"📝 *Confirm Initial Deposit Setting*\n\n"
                 f"User: @{user.username or 'No username'} (ID: {user.telegram_id})\n"
                 f"Current Initial Deposit: {user.initial_deposit:.4f} SOL\n"
-                f"New Initial Deposit: {admin_initial_deposit_amount:.4f} SOL\n"
+                f"New Initial Deposit: {state.admin_initial_deposit_amount:.4f} SOL\n"
                 f"Reason: {reason}\n\n"
                 "Are you sure you want to update this user's initial deposit?"
             )
@@ -2599,6 +2755,7 @@ def admin_initial_deposit_reason_handler(update, chat_id, text=None):
 
 def admin_confirm_initial_deposit_handler(update, chat_id):
     """Confirm and process the initial deposit setting."""
+    state = chat_state(chat_id)
     try:
         # Extract reason from callback data if present
         callback_data = update.callback_query.data
@@ -2612,7 +2769,7 @@ def admin_confirm_initial_deposit_handler(update, chat_id):
         with app.app_context():
             from models import User
             
-            user = User.query.get(admin_target_user_id)
+            user = User.query.get(state.admin_target_user_id)
             
             if not user:
                 bot.send_message(
@@ -2622,14 +2779,13 @@ def admin_confirm_initial_deposit_handler(update, chat_id):
                         [{"text": "Return to Admin Panel", "callback_data": "admin_back"}]
                     ])
                 )
-                # Reset global variables
-                admin_target_user_id = None
-                admin_initial_deposit_amount = None
+                # Clear the chat state
+                state.clear('admin_target_user_id', 'admin_initial_deposit_amount')
                 return
             
             # Use the non-blocking initial deposit setter
             identifier = user.telegram_id
-            amount = admin_initial_deposit_amount
+            amount = state.admin_initial_deposit_amount
             
             success, message = balance_manager.set_initial_deposit(identifier, amount, reason)
             
@@ -2637,7 +2793,7 @@ def admin_confirm_initial_deposit_handler(update, chat_id):
                 # Show success message to admin
                 with app.app_context():
                     # Refresh user from database to get updated initial deposit
-                    fresh_user = User.query.get(admin_target_user_id)
+                    fresh_user = User.query.get(state.admin_target_user_id)
                     
                     if fresh_user:
                         success_message = (
@@ -2680,9 +2836,8 @@ def admin_confirm_initial_deposit_handler(update, chat_id):
                     reply_markup=keyboard
                 )
             
-            # Reset global variables
-            admin_target_user_id = None
-            admin_initial_deposit_amount = None
+            # Clear the chat state
+            state.clear('admin_target_user_id', 'admin_initial_deposit_amount')
             
     except Exception as e:
         # Log the error
@@ -2704,9 +2859,8 @@ def admin_confirm_initial_deposit_handler(update, chat_id):
         except Exception as inner_e:
             logging.error(f"Error sending error message: {inner_e}")
             
-        # Reset global variables
-        admin_target_user_id = None
-        admin_initial_deposit_amount = None
+        # Clear the chat state
+        state.clear('admin_target_user_id', 'admin_initial_deposit_amount')
 
 def admin_adjust_balance_handler(update, chat_id):
     """Handle the adjust balance button with completely safe text formatting."""
@@ -2750,6 +2904,7 @@ def admin_adjust_balance_handler(update, chat_id):
 
 def admin_adjust_balance_user_id_handler(update, chat_id, message_text):
     """Process the user ID for balance adjustment."""
+    state = chat_state(chat_id)
     try:
         # Extract the actual text from the message if it's not already a string
         if isinstance(message_text, str):
@@ -2791,56 +2946,14 @@ def admin_adjust_balance_user_id_handler(update, chat_id, message_text):
             
             logging.info(f"Searching for user with input: '{search_input}'")
             
-            # Method 1: Try as telegram_id (string) - database stores as VARCHAR
+            # Exact telegram_id, username (with or without @) or wallet, all indexed
             try:
-                user = User.query.filter_by(telegram_id=search_input).first()
+                from user_search import find_user
+                user = find_user(search_input)
                 if user:
-                    logging.info(f"Found user by telegram_id (string): {user.telegram_id}")
+                    logging.info(f"Found user {user.telegram_id} for input '{search_input}'")
             except Exception as e:
-                logging.error(f"Error searching by telegram_id (string): {e}")
-            
-            # Method 2: Try casting database field to string for comparison (fallback)
-            if not user and search_input.isdigit():
-                try:
-                    from sqlalchemy import cast, String
-                    user = User.query.filter(cast(User.telegram_id, String) == search_input).first()
-                    if user:
-                        logging.info(f"Found user by telegram_id (cast): {user.telegram_id}")
-                except Exception as e:
-                    logging.error(f"Error searching by telegram_id (cast): {e}")
-            
-            # Method 3: Try by username (with @ prefix)
-            if not user and search_input.startswith('@'):
-                try:
-                    username = search_input[1:]  # Remove @ prefix
-                    user = User.query.filter(func.lower(User.username) == func.lower(username)).first()
-                    if user:
-                        logging.info(f"Found user by username (with @): {user.username}")
-                except Exception as e:
-                    logging.error(f"Error searching by username (with @): {e}")
-            
-            # Method 4: Try username without @ prefix
-            if not user:
-                try:
-                    user = User.query.filter(func.lower(User.username) == func.lower(search_input)).first()
-                    if user:
-                        logging.info(f"Found user by username (without @): {user.username}")
-                except Exception as e:
-                    logging.error(f"Error searching by username (without @): {e}")
-            
-            # Method 5: Last resort - search all users and check partial matches
-            if not user:
-                try:
-                    # Check if it might be a partial telegram_id or username
-                    all_users = User.query.all()
-                    for u in all_users:
-                        if (str(u.telegram_id) == search_input or 
-                            (u.username and u.username.lower() == search_input.lower())):
-                            user = u
-                            logging.info(f"Found user via full scan: {u.telegram_id}")
-                            break
-                except Exception as e:
-                    logging.error(f"Error in full user scan: {e}")
+                logging.error(f"Error searching for user: {e}")
             
             if not user:
                 error_msg = (
@@ -2855,14 +2968,12 @@ def admin_adjust_balance_user_id_handler(update, chat_id, message_text):
                 bot.send_message(chat_id, error_msg)
                 return
             
-            # Store user info in global variables
-            global admin_target_user_id
-            admin_target_user_id = user.id
+            # Store user info in the chat state
+            state.admin_target_user_id = user.id
             
             # Also store user telegram_id and current balance for later reference
-            global admin_adjust_telegram_id, admin_adjust_current_balance
-            admin_adjust_telegram_id = user.telegram_id
-            admin_adjust_current_balance = user.balance
+            state.admin_adjust_telegram_id = user.telegram_id
+            state.admin_adjust_current_balance = user.balance
             
             # Create a safe message without complex Markdown formatting
             if user.username:
@@ -2907,6 +3018,7 @@ def admin_adjust_balance_user_id_handler(update, chat_id, message_text):
 
 def admin_adjust_balance_amount_handler(update, chat_id, text):
     """Process the balance adjustment amount."""
+    state = chat_state(chat_id)
     try:
         # Check for cancellation
         if text.lower() == 'cancel':
@@ -2924,27 +3036,23 @@ def admin_adjust_balance_amount_handler(update, chat_id, text):
         try:
             adjustment = float(text.strip())
             
-            # Store the adjustment amount in global variable
-            global admin_adjustment_amount
-            admin_adjustment_amount = adjustment
+            # Store the adjustment amount in the chat state
+            state.admin_adjustment_amount = adjustment
             
             # Set a default reason and proceed directly to confirmation
-            global admin_adjustment_reason
-            admin_adjustment_reason = "Bonus"  # Set a simple default reason
+            state.admin_adjustment_reason = "Bonus"  # Set a simple default reason
             
             # Create confirmation message with plain text formatting
-            global admin_adjust_telegram_id, admin_adjust_current_balance
-            
-            new_balance = (admin_adjust_current_balance or 0.0) + adjustment
+            new_balance = (state.admin_adjust_current_balance or 0.0) + adjustment
             action = "add" if adjustment > 0 else "deduct"
             
             confirmation_message = (
                 "CONFIRM BALANCE ADJUSTMENT\n\n"
-                f"User ID: {admin_adjust_telegram_id or 'Unknown'}\n"
-                f"Current Balance: {admin_adjust_current_balance or 0.0:.4f} SOL\n"
+                f"User ID: {state.admin_adjust_telegram_id or 'Unknown'}\n"
+                f"Current Balance: {state.admin_adjust_current_balance or 0.0:.4f} SOL\n"
                 f"Adjustment: {action} {abs(adjustment):.4f} SOL\n"
                 f"New Balance: {new_balance:.4f} SOL\n"
-                f"Reason: {admin_adjustment_reason or 'Admin adjustment'}\n\n"
+                f"Reason: {state.admin_adjustment_reason or 'Admin adjustment'}\n\n"
                 "Are you sure you want to proceed?"
             )
             
@@ -2979,6 +3087,7 @@ def admin_adjust_balance_amount_handler(update, chat_id, text):
 
 def admin_adjust_balance_reason_handler(update, chat_id, text):
     """Process the reason for balance adjustment and confirm."""
+    state = chat_state(chat_id)
     try:
         # Check for cancellation
         if text.lower() == 'cancel':
@@ -2992,26 +3101,22 @@ def admin_adjust_balance_reason_handler(update, chat_id, text):
             bot.remove_listener(chat_id)
             return
         
-        # Store the reason in global variable
-        global admin_adjustment_reason
-        admin_adjustment_reason = text.strip()
-        
-        # Access other required globals
-        global admin_target_user_id, admin_adjust_telegram_id, admin_adjust_current_balance, admin_adjustment_amount
+        # Store the reason in the chat state
+        state.admin_adjustment_reason = text.strip()
         
         # Create confirmation message with null safety checks
-        plus_minus = '➕' if admin_adjustment_amount and admin_adjustment_amount > 0 else '➖'
-        adjustment_abs = abs(admin_adjustment_amount) if admin_adjustment_amount is not None else 0
-        current_balance = admin_adjust_current_balance if admin_adjust_current_balance is not None else 0
-        new_balance = current_balance + (admin_adjustment_amount or 0)
+        plus_minus = '➕' if state.admin_adjustment_amount and state.admin_adjustment_amount > 0 else '➖'
+        adjustment_abs = abs(state.admin_adjustment_amount) if state.admin_adjustment_amount is not None else 0
+        current_balance = state.admin_adjust_current_balance if state.admin_adjust_current_balance is not None else 0
+        new_balance = current_balance + (state.admin_adjustment_amount or 0)
         
         confirmation_message = (
             "⚠️ *Confirm Balance Adjustment*\n\n"
-            f"User ID: `{admin_adjust_telegram_id or 'Unknown'}`\n"
+            f"User ID: `{state.admin_adjust_telegram_id or 'Unknown'}`\n"
             f"Current Balance: {current_balance:.4f} SOL\n"
             f"Adjustment: {plus_minus} {adjustment_abs:.4f} SOL\n"
             f"New Balance: {new_balance:.4f} SOL\n"
-            f"Reason: _{admin_adjustment_reason or 'Not specified'}_\n\n"
+            f"Reason: _{state.admin_adjustment_reason or 'Not specified'}_\n\n"
             "Are you sure you want to proceed with this adjustment?"
         )
         
@@ -3040,17 +3145,14 @@ def admin_adjust_balance_reason_handler(update, chat_id, text):
 
 def admin_confirm_adjustment_handler(update, chat_id):
     """Fixed balance adjustment handler with complete message sequence restoration."""
+    state = chat_state(chat_id)
     import logging
     
     try:
-        # Capture all global variables locally
-        global admin_target_user_id, admin_adjust_telegram_id, admin_adjust_current_balance
-        global admin_adjustment_amount, admin_adjustment_reason
-        
         logging.info("Admin confirm adjustment handler called")
         
         # Check if we already have data to process
-        if admin_target_user_id is None or admin_adjustment_amount is None:
+        if state.admin_target_user_id is None or state.admin_adjustment_amount is None:
             logging.warning("Missing adjustment data in confirm handler")
             bot.send_message(
                 chat_id,
@@ -3061,11 +3163,11 @@ def admin_confirm_adjustment_handler(update, chat_id):
             )
             return
             
-        # Store values locally before resetting globals
-        tg_id = admin_adjust_telegram_id
-        amount = admin_adjustment_amount
-        reason = admin_adjustment_reason or "Admin adjustment"
-        current_balance = admin_adjust_current_balance or 0
+        # Store values locally before clearing the chat state
+        tg_id = state.admin_adjust_telegram_id
+        amount = state.admin_adjustment_amount
+        reason = state.admin_adjustment_reason or "Admin adjustment"
+        current_balance = state.admin_adjust_current_balance or 0
         
         logging.info(f"Processing adjustment: User {tg_id}, Amount {amount}, Reason {reason}")
         
@@ -3078,12 +3180,8 @@ def admin_confirm_adjustment_handler(update, chat_id):
             ])
         )
         
-        # Reset globals to prevent duplicate processing
-        admin_target_user_id = None
-        admin_adjust_telegram_id = None
-        admin_adjust_current_balance = None
-        admin_adjustment_amount = None
-        admin_adjustment_reason = None
+        # Clear the chat state to prevent duplicate processing
+        state.clear('admin_target_user_id', 'admin_adjust_telegram_id', 'admin_adjust_current_balance', 'admin_adjustment_amount', 'admin_adjustment_reason')
         
         # Process the adjustment
         try:
@@ -3158,12 +3256,8 @@ def admin_confirm_adjustment_handler(update, chat_id):
         import traceback
         logging.error(traceback.format_exc())
         
-        # Reset globals if there's an error
-        admin_target_user_id = None
-        admin_adjust_telegram_id = None
-        admin_adjust_current_balance = None
-        admin_adjustment_amount = None
-        admin_adjustment_reason = None
+        # Clear the chat state if there's an error
+        state.clear('admin_target_user_id', 'admin_adjust_telegram_id', 'admin_adjust_current_balance', 'admin_adjustment_amount', 'admin_adjustment_reason')
         
         try:
             bot.send_message(
@@ -3569,34 +3663,31 @@ def admin_search_user_handler(update, chat_id):
 
 def admin_search_query_handler(update, chat_id, text):
     """Handle the search query for finding users."""
+    state = chat_state(chat_id)
     try:
         with app.app_context():
             from models import User, UserStatus, Transaction, Profit, ReferralCode
             from sqlalchemy import func, or_
             
+            from user_search import find_user, search_users
+            
             # Process the search query
             search_query = text.strip()
             
-            # Try to find user by telegram ID first
-            user = User.query.filter_by(telegram_id=search_query).first()
-            
-            # If not found, try by username (with or without @ prefix)
-            if not user and search_query.startswith('@'):
-                username = search_query[1:]  # Remove @ prefix
-                user = User.query.filter_by(username=username).first()
-            elif not user:
-                # Try with username anyway (in case they forgot the @)
-                user = User.query.filter_by(username=search_query).first()
+            # Exact telegram ID, username (with or without @) or wallet address
+            user = find_user(search_query)
             
             if not user:
-                # Try partial username match
-                users = User.query.filter(User.username.ilike(f"%{search_query}%")).limit(5).all()
+                # Ranked partial and fuzzy matches across ids, names and wallets
+                users = search_users(search_query, limit=5)
                 
                 if users:
                     message = f"🔍 Found {len(users)} users matching '{search_query}':\n\n"
                     
                     for idx, u in enumerate(users, 1):
-                        message += f"{idx}. ID: `{u.telegram_id}` - @{u.username or 'No Username'}\n"
+                        name = " ".join(part for part in (u.first_name, u.last_name) if part)
+                        message += f"{idx}. ID: `{u.telegram_id}` - @{u.username or 'No Username'}"
+                        message += f" ({name})\n" if name else "\n"
                     
                     message += "\nPlease search again with a specific Telegram ID or username."
                     
@@ -3714,8 +3805,7 @@ def admin_search_query_handler(update, chat_id, text):
             )
             
             # Store the user ID for use in subsequent actions
-            global admin_target_user_id
-            admin_target_user_id = user.id
+            state.admin_target_user_id = user.id
             
     except Exception as e:
         import logging
@@ -4375,15 +4465,13 @@ def admin_exit_handler(update, chat_id):
             logging.error(f"Error sending error message: {inner_e}")
 
 # Broadcast message handlers
-# Define global variable to track broadcast target
-broadcast_target = "all"  # Default to all users
 
 def admin_broadcast_active(update, chat_id):
     """Handle sending broadcast to active users only."""
+    state = chat_state(chat_id)
     try:
-        # Set global variable to filter users
-        global broadcast_target
-        broadcast_target = "active"
+        # Remember the target audience for this chat
+        state.broadcast_target = "active"
         
         # Get current active user count
         with app.app_context():
@@ -4422,10 +4510,10 @@ def admin_broadcast_active(update, chat_id):
 
 def admin_broadcast_all(update, chat_id):
     """Handle sending broadcast to all users."""
+    state = chat_state(chat_id)
     try:
-        # Set global variable to filter users
-        global broadcast_target
-        broadcast_target = "all"
+        # Remember the target audience for this chat
+        state.broadcast_target = "all"
         
         message = (
             "📊 *Broadcast Target Selected*\n\n"
@@ -4459,10 +4547,10 @@ def admin_broadcast_all(update, chat_id):
 
 def admin_broadcast_text_handler(update, chat_id):
     """Handle the text broadcast option."""
+    state = chat_state(chat_id)
     try:
-        # Use global broadcast target
-        global broadcast_target
-        target_text = "active users only" if broadcast_target == "active" else "all users"
+        # Use the chat's broadcast target
+        target_text = "active users only" if state.broadcast_target == "active" else "all users"
         
         message = (
             f"📝 *Text Broadcast to {target_text}*\n\n"
@@ -4496,10 +4584,10 @@ def admin_broadcast_text_handler(update, chat_id):
 
 def admin_broadcast_text_message_handler(update, chat_id, text):
     """Handle the incoming text message for broadcast."""
+    state = chat_state(chat_id)
     try:
         # Preview the broadcast message with correct target audience
-        global broadcast_target
-        target_text = "active users only" if broadcast_target == "active" else "all users"
+        target_text = "active users only" if state.broadcast_target == "active" else "all users"
         
         preview_message = (
             "🔍 *Broadcast Preview*\n\n"
@@ -4528,9 +4616,8 @@ def admin_broadcast_text_message_handler(update, chat_id, text):
             db.session.add(new_message)
             db.session.commit()
             
-            # Store the message ID in a global variable or session
-            global pending_broadcast_id
-            pending_broadcast_id = new_message.id
+            # Store the message ID in the chat state
+            state.pending_broadcast_id = new_message.id
         
         bot.send_message(
             chat_id,
@@ -4582,6 +4669,7 @@ def admin_broadcast_image_handler(update, chat_id):
 
 def admin_broadcast_image_message_handler(update, chat_id, text):
     """Handle the incoming image URL and caption for broadcast."""
+    state = chat_state(chat_id)
     try:
         # Split the text into URL and caption
         lines = text.strip().split('\n')
@@ -4593,8 +4681,7 @@ def admin_broadcast_image_message_handler(update, chat_id, text):
         caption = '\n'.join(lines[1:])
         
         # Preview the broadcast message with correct target audience
-        global broadcast_target
-        target_text = "active users only" if broadcast_target == "active" else "all users"
+        target_text = "active users only" if state.broadcast_target == "active" else "all users"
         
         preview_message = (
             "🔍 *Image Broadcast Preview*\n\n"
@@ -4630,9 +4717,8 @@ def admin_broadcast_image_message_handler(update, chat_id, text):
             db.session.add(new_message)
             db.session.commit()
             
-            # Store the message ID in a global variable or session
-            global pending_broadcast_id
-            pending_broadcast_id = new_message.id
+            # Store the message ID in the chat state
+            state.pending_broadcast_id = new_message.id
         
         # Send a sample of the image
         bot.send_message(
@@ -4658,6 +4744,7 @@ def admin_broadcast_image_message_handler(update, chat_id, text):
 
 def admin_broadcast_announcement_handler(update, chat_id):
     """Handle the announcement broadcast option."""
+    state = chat_state(chat_id)
     try:
         # Get user counts for better UI feedback
         with app.app_context():
@@ -4667,10 +4754,9 @@ def admin_broadcast_announcement_handler(update, chat_id):
                 total_users = User.query.count()
                 active_users = User.query.filter_by(status=UserStatus.ACTIVE).count()
                 
-                # Use global variable to show currently selected target
-                global broadcast_target
-                target_text = "Active Users Only" if broadcast_target == "active" else "All Users"
-                target_count = active_users if broadcast_target == "active" else total_users
+                # Show the currently selected target
+                target_text = "Active Users Only" if state.broadcast_target == "active" else "All Users"
+                target_count = active_users if state.broadcast_target == "active" else total_users
                 
                 user_info = (
                     f"*Current Target:* {target_text} ({target_count} users)\n"
@@ -4796,7 +4882,9 @@ def live_positions_handler(update, chat_id):
                         f"Closed: {time_str}\n\n\n\n"
                     )
                 
-                # Display LIVE SNIPE trades
+                # Display LIVE SNIPE trades, marked to market from the revaluation snapshot
+                from utils.position_revaluation import get_position_snapshot
+                marks = get_position_snapshot()
                 for position in live_positions:
                     time_str = position.buy_timestamp.strftime("%b %d – %H:%M UTC") if hasattr(position, 'buy_timestamp') and position.buy_timestamp else position.timestamp.strftime("%b %d – %H:%M UTC")
                     
@@ -4805,6 +4893,13 @@ def live_positions_handler(update, chat_id):
                     amount = position.amount or 0
                     spent_sol = amount * entry_price if entry_price > 0 else 0
                     
+                    mark_line = ""
+                    mark = marks.get(position.id)
+                    if mark:
+                        mark_price, unrealized_sol, unrealized_pct = mark
+                        mark_emoji = "🟢" if unrealized_sol >= 0 else "🔴"
+                        mark_line = (f"Now @: {mark_price:.6f} | Unrealized: {mark_emoji} "
+                                     f"{unrealized_pct:+.2f}% ({unrealized_sol:+.3f} SOL)\n")
 
                     
                     # Get TX link with embedded text format
@@ -4820,6 +4915,7 @@ def live_positions_handler(update, chat_id):
                         f"🟡 *LIVE SNIPE - ${position.token_name}*\n\n"
                         f"Buy @: {entry_price:.6f} | Qty: {amount:,.0f} {position.token_name}\n"
                         f"Spent: {spent_sol:.2f} SOL\n"
+                        f"{mark_line}"
                         f"{tx_display}\n"
                         f"Status: Holding\n"
                         f"Opened: {time_str}\n\n\n\n"
@@ -5130,6 +5226,7 @@ def admin_trade_post_handler(update, chat_id):
 
 def admin_broadcast_trade_handler(update, chat_id):
     """Handle admin broadcasting of trade information with enhanced buy/sell format and time control."""
+    state = chat_state(chat_id)
     try:
         # Check for admin privileges
         if not is_admin(update['callback_query']['from']['id']):
@@ -5154,9 +5251,8 @@ def admin_broadcast_trade_handler(update, chat_id):
             "After entering the trade, you'll choose when it should appear to have executed."
         )
         
-        # Set the global state to listen for the broadcast text
-        global broadcast_target
-        broadcast_target = "active"  # Send only to active users
+        # Set the chat state to listen for the broadcast text
+        state.broadcast_target = "active"  # Send only to active users
         
         # Add listener for the admin's next message (trade input)
         bot.add_message_listener(chat_id, "enhanced_trade_input", admin_enhanced_trade_input_handler)
@@ -5177,13 +5273,13 @@ def admin_broadcast_trade_handler(update, chat_id):
 
 def admin_broadcast_trade_input_handler(update, chat_id, text):
     """Handle trade input and show time selection options."""
+    state = chat_state(chat_id)
     try:
         # Remove the message listener
         bot.remove_listener(chat_id)
         
         # Store the trade data temporarily
-        global admin_pending_trade_data
-        admin_pending_trade_data = {
+        state.admin_pending_trade_data = {
             'trade_text': text,
             'admin_id': str(update.get('message', {}).get('from', {}).get('id', 'admin'))
         }
@@ -5228,17 +5324,17 @@ def admin_broadcast_trade_input_handler(update, chat_id, text):
 
 def time_selection_handler(update, chat_id):
     """Handle time selection for trade broadcasts."""
+    state = chat_state(chat_id)
     try:
         callback_data = update['callback_query']['data']
         
         # Get the stored trade data
-        global admin_pending_trade_data
-        if 'admin_pending_trade_data' not in globals() or not admin_pending_trade_data:
+        if not state.admin_pending_trade_data:
             bot.send_message(chat_id, "❌ Trade data not found. Please start over.")
             return
         
-        trade_text = admin_pending_trade_data['trade_text']
-        admin_id = admin_pending_trade_data['admin_id']
+        trade_text = state.admin_pending_trade_data['trade_text']
+        admin_id = state.admin_pending_trade_data['admin_id']
         
         # Calculate the custom timestamp based on selection
         from datetime import datetime, timedelta
@@ -5295,7 +5391,7 @@ def time_selection_handler(update, chat_id):
             bot.send_message(chat_id, "❌ Failed to process trade broadcast.")
         
         # Clear the pending trade data
-        admin_pending_trade_data = None
+        state.admin_pending_trade_data = None
         
     except Exception as e:
         import logging
@@ -5306,18 +5402,18 @@ def time_selection_handler(update, chat_id):
 
 def custom_time_input_handler(update, chat_id, text):
     """Handle custom time input for trade broadcasts."""
+    state = chat_state(chat_id)
     try:
         # Remove the message listener
         bot.remove_listener(chat_id)
         
         # Get the stored trade data
-        global admin_pending_trade_data
-        if 'admin_pending_trade_data' not in globals() or not admin_pending_trade_data:
+        if not state.admin_pending_trade_data:
             bot.send_message(chat_id, "❌ Trade data not found. Please start over.")
             return
         
-        trade_text = admin_pending_trade_data['trade_text']
-        admin_id = admin_pending_trade_data['admin_id']
+        trade_text = state.admin_pending_trade_data['trade_text']
+        admin_id = state.admin_pending_trade_data['admin_id']
         
         # Parse the custom time input
         from datetime import datetime
@@ -5353,7 +5449,7 @@ def custom_time_input_handler(update, chat_id, text):
             bot.send_message(chat_id, "❌ Failed to process trade broadcast.")
         
         # Clear the pending trade data
-        admin_pending_trade_data = None
+        state.admin_pending_trade_data = None
         
     except Exception as e:
         import logging
@@ -5444,6 +5540,7 @@ def process_trade_broadcast_with_timestamp(trade_text, admin_id, custom_timestam
                 
                 # Process SELL orders with custom timestamp
                 from models import User, TradingPosition, Transaction, Profit
+                from balance_ledger import apply_deltas
                 
                 # Find matching BUY positions
                 open_positions = TradingPosition.query.filter_by(
@@ -5452,6 +5549,7 @@ def process_trade_broadcast_with_timestamp(trade_text, admin_id, custom_timestam
                 ).all()
                 
                 processed_count = 0
+                profit_deltas = []
                 
                 for position in open_positions:
                     try:
@@ -5470,7 +5568,7 @@ def process_trade_broadcast_with_timestamp(trade_text, admin_id, custom_timestam
                         # Update user balance
                         user = User.query.get(position.user_id)
                         if user:
-                            user.balance += profit_amount
+                            profit_deltas.append((user.id, profit_amount, f"position:{position.id}"))
                             
                             # Create profit record with custom date
                             profit_record = Profit(
@@ -5502,6 +5600,7 @@ def process_trade_broadcast_with_timestamp(trade_text, admin_id, custom_timestam
                         logging.error(f"Error processing sell for position {position.id}: {e}")
                         continue
                 
+                apply_deltas(profit_deltas, 'trade_profit', commit=False)
                 db.session.commit()
                 return processed_count > 0
             
@@ -5516,6 +5615,7 @@ def process_trade_broadcast_with_timestamp(trade_text, admin_id, custom_timestam
         
 def admin_enhanced_trade_input_handler(update, chat_id, text):
     """Handle enhanced buy/sell trade input with time control"""
+    state = chat_state(chat_id)
     try:
         # Remove the message listener
         bot.remove_listener(chat_id)
@@ -5547,8 +5647,7 @@ def admin_enhanced_trade_input_handler(update, chat_id, text):
             return
         
         # Store trade data for time selection
-        global enhanced_trade_data
-        enhanced_trade_data = {
+        state.enhanced_trade_data = {
             'trade_data': trade_data,
             'admin_id': admin_id,
             'original_text': text.strip()
@@ -5593,17 +5692,17 @@ def admin_enhanced_trade_input_handler(update, chat_id, text):
 
 def enhanced_time_selection_handler(update, chat_id):
     """Handle enhanced time selection for buy/sell trade broadcasts"""
+    state = chat_state(chat_id)
     try:
         callback_data = update['callback_query']['data']
         
         # Get the stored trade data
-        global enhanced_trade_data
-        if 'enhanced_trade_data' not in globals() or not enhanced_trade_data:
+        if not state.enhanced_trade_data:
             bot.send_message(chat_id, "❌ Trade data not found. Please start over.")
             return
         
-        trade_data = enhanced_trade_data['trade_data']
-        admin_id = enhanced_trade_data['admin_id']
+        trade_data = state.enhanced_trade_data['trade_data']
+        admin_id = state.enhanced_trade_data['admin_id']
         
         # Calculate the custom timestamp based on selection
         from datetime import datetime, timedelta
@@ -5668,7 +5767,7 @@ def enhanced_time_selection_handler(update, chat_id):
             bot.send_message(chat_id, "❌ Failed to process trade broadcast.")
         
         # Clear the pending trade data
-        enhanced_trade_data = None
+        state.enhanced_trade_data = None
         
         # Return to admin panel
         admin_panel_handler(update, chat_id)
@@ -5682,18 +5781,18 @@ def enhanced_time_selection_handler(update, chat_id):
 
 def enhanced_custom_time_input_handler(update, chat_id, text):
     """Handle custom time input for enhanced trade broadcasts"""
+    state = chat_state(chat_id)
     try:
         # Remove the message listener
         bot.remove_listener(chat_id)
         
         # Get the stored trade data
-        global enhanced_trade_data
-        if 'enhanced_trade_data' not in globals() or not enhanced_trade_data:
+        if not state.enhanced_trade_data:
             bot.send_message(chat_id, "❌ Trade data not found. Please start over.")
             return
         
-        trade_data = enhanced_trade_data['trade_data']
-        admin_id = enhanced_trade_data['admin_id']
+        trade_data = state.enhanced_trade_data['trade_data']
+        admin_id = state.enhanced_trade_data['admin_id']
         
         from datetime import datetime
         
@@ -5732,7 +5831,7 @@ def enhanced_custom_time_input_handler(update, chat_id, text):
             bot.send_message(chat_id, "❌ Failed to process trade broadcast.")
         
         # Clear the pending trade data
-        enhanced_trade_data = None
+        state.enhanced_trade_data = None
         
         # Return to admin panel
         admin_panel_handler(update, chat_id)
@@ -6093,6 +6192,7 @@ def admin_dm_text_handler(update, chat_id):
 
 def admin_dm_recipient_handler(update, chat_id, text):
     """Handle the recipient ID for direct message."""
+    state = chat_state(chat_id)
     try:
         recipient_id = text.strip()
         
@@ -6113,8 +6213,7 @@ def admin_dm_recipient_handler(update, chat_id, text):
                 return
             
             # Store the recipient ID
-            global dm_recipient_id
-            dm_recipient_id = recipient_id
+            state.dm_recipient_id = recipient_id
             
             # Prompt for the message content
             message = (
@@ -6147,10 +6246,10 @@ def admin_dm_recipient_handler(update, chat_id, text):
 
 def admin_dm_content_handler(update, chat_id, text):
     """Handle the content for direct message."""
+    state = chat_state(chat_id)
     try:
         # Get the stored recipient ID
-        global dm_recipient_id
-        recipient_id = dm_recipient_id
+        recipient_id = state.dm_recipient_id
         
         # Preview the message
         preview_message = (
@@ -6168,8 +6267,7 @@ def admin_dm_content_handler(update, chat_id, text):
         ])
         
         # Store the message for later sending
-        global dm_content
-        dm_content = text
+        state.dm_content = text
         
         bot.send_message(
             chat_id,
@@ -6216,6 +6314,7 @@ def admin_dm_image_handler(update, chat_id):
 
 def admin_dm_image_recipient_handler(update, chat_id, text):
     """Handle the recipient ID for image direct message."""
+    state = chat_state(chat_id)
     try:
         recipient_id = text.strip()
         
@@ -6236,8 +6335,7 @@ def admin_dm_image_recipient_handler(update, chat_id, text):
                 return
             
             # Store the recipient ID
-            global dm_recipient_id
-            dm_recipient_id = recipient_id
+            state.dm_recipient_id = recipient_id
             
             # Prompt for the image URL and caption
             message = (
@@ -6270,6 +6368,7 @@ def admin_dm_image_recipient_handler(update, chat_id, text):
 
 def admin_dm_image_content_handler(update, chat_id, text):
     """Handle the image URL and caption for direct message."""
+    state = chat_state(chat_id)
     try:
         # Split the text into URL and caption
         lines = text.strip().split('\n')
@@ -6281,8 +6380,7 @@ def admin_dm_image_content_handler(update, chat_id, text):
         caption = '\n'.join(lines[1:])
         
         # Get the stored recipient ID
-        global dm_recipient_id
-        recipient_id = dm_recipient_id
+        recipient_id = state.dm_recipient_id
         
         # Preview the message
         preview_message = (
@@ -6301,9 +6399,8 @@ def admin_dm_image_content_handler(update, chat_id, text):
         ])
         
         # Store the message for later sending
-        global dm_image_url, dm_image_caption
-        dm_image_url = image_url
-        dm_image_caption = caption
+        state.dm_image_url = image_url
+        state.dm_image_caption = caption
         
         # Send a sample of the image
         bot.send_message(
@@ -6361,15 +6458,9 @@ def admin_search_user_query_handler(update, chat_id, text):
         
         # Search for users
         with app.app_context():
-            from models import User
-            from sqlalchemy import or_
+            from user_search import search_users
             
-            users = User.query.filter(
-                or_(
-                    User.username.ilike(f"%{search_query}%"),
-                    User.telegram_id.ilike(f"%{search_query}%")
-                )
-            ).limit(5).all()
+            users = search_users(search_query, limit=5)
             
             if not users:
                 bot.send_message(
@@ -6413,34 +6504,33 @@ def admin_search_user_query_handler(update, chat_id, text):
         
 def admin_send_broadcast_handler(update, chat_id):
     """Handle sending a broadcast message to users based on target selection."""
+    state = chat_state(chat_id)
     try:
         # Get the pending broadcast message
-        global pending_broadcast_id, broadcast_target
-        
         # For debugging
         import logging
-        logging.info(f"Preparing to send broadcast. pending_broadcast_id={pending_broadcast_id}, broadcast_target={broadcast_target}")
+        logging.info(f"Preparing to send broadcast. pending_broadcast_id={state.pending_broadcast_id}, broadcast_target={state.broadcast_target}")
         
         with app.app_context():
             from models import BroadcastMessage, User
             import json
             
             # If no pending_broadcast_id is set, try to find the most recent pending message
-            if not pending_broadcast_id:
+            if not state.pending_broadcast_id:
                 latest_pending = BroadcastMessage.query.filter_by(
                     status="pending", 
                     created_by=str(chat_id)
                 ).order_by(BroadcastMessage.created_at.desc()).first()
                 
                 if latest_pending:
-                    pending_broadcast_id = latest_pending.id
-                    logging.info(f"Found latest pending broadcast message: {pending_broadcast_id}")
+                    state.pending_broadcast_id = latest_pending.id
+                    logging.info(f"Found latest pending broadcast message: {state.pending_broadcast_id}")
                 else:
                     bot.send_message(chat_id, "No pending broadcast message found. Please create a new broadcast.")
                     return
             
             # Get the message
-            message = BroadcastMessage.query.get(pending_broadcast_id)
+            message = BroadcastMessage.query.get(state.pending_broadcast_id)
             if not message:
                 bot.send_message(chat_id, "Broadcast message not found. Please create a new broadcast.")
                 return
@@ -6452,7 +6542,7 @@ def admin_send_broadcast_handler(update, chat_id):
             from datetime import datetime
             
             # Filter users based on broadcast target
-            if broadcast_target == "active":
+            if state.broadcast_target == "active":
                 users = User.query.filter_by(status=UserStatus.ACTIVE).all()
                 target_description = "active users"
             else:
@@ -6477,109 +6567,73 @@ def admin_send_broadcast_handler(update, chat_id):
                 f"📣 Preparing to send broadcast to {total_users} {target_description}..."
             )
             
-            # Process the message based on its type
+            # Work out the text every recipient gets
             sent_count = 0
             failed_count = 0
+            broadcast_text = None
+            broadcast_photo = None
             
             if message.message_type == "text":
-                # Simple text broadcast
-                content = message.content
-                
-                for user in users:
-                    try:
-                        # Skip users with no telegram_id
-                        if not user.telegram_id:
-                            logging.warning(f"User ID {user.id} has no telegram_id, skipping")
-                            continue
-                            
-                        bot.send_message(
-                            user.telegram_id,
-                            content,
-                            parse_mode="Markdown"
-                        )
-                        sent_count += 1
-                        
-                        # Update progress every 10 users
-                        if sent_count % 10 == 0:
-                            bot.edit_message(
-                                progress_message['message_id'],
-                                chat_id,
-                                f"📣 Sending broadcast... {sent_count}/{total_users} completed."
-                            )
-                    except Exception as e:
-                        logging.error(f"Error sending broadcast to user {user.telegram_id}: {e}")
-                        failed_count += 1
+                broadcast_text = message.content
             
             elif message.message_type == "image":
                 # Image with caption
                 try:
                     content = json.loads(message.content)
-                    image_url = content.get("image_url")
-                    caption = content.get("caption")
-                    
-                    for user in users:
-                        try:
-                            # Skip users with no telegram_id
-                            if not user.telegram_id:
-                                logging.warning(f"User ID {user.id} has no telegram_id, skipping")
-                                continue
-                                
-                            # In a real implementation, we would use bot.send_photo
-                            # However, for our simplified version we'll simulate it
-                            bot.send_message(
-                                user.telegram_id,
-                                f"[Image]({image_url})\n\n{caption}",
-                                parse_mode="Markdown"
-                            )
-                            sent_count += 1
-                            
-                            # Update progress every 10 users
-                            if sent_count % 10 == 0:
-                                bot.edit_message(
-                                    progress_message['message_id'],
-                                    chat_id,
-                                    f"📣 Sending broadcast... {sent_count}/{total_users} completed."
-                                )
-                        except Exception as e:
-                            logging.error(f"Error sending broadcast to user {user.telegram_id}: {e}")
-                            failed_count += 1
                 except json.JSONDecodeError:
                     bot.send_message(chat_id, "Error processing image broadcast: Invalid format")
                     return
+                broadcast_photo = content.get('image_url')
+                broadcast_text = content.get('caption') or ''
             
             elif message.message_type == "announcement":
                 # Formatted announcement
                 try:
                     content = json.loads(message.content)
-                    formatted_text = content.get("formatted_text")
-                    
-                    for user in users:
-                        try:
-                            # Skip users with no telegram_id
-                            if not user.telegram_id:
-                                logging.warning(f"User ID {user.id} has no telegram_id, skipping")
-                                continue
-                                
-                            bot.send_message(
-                                user.telegram_id,
-                                formatted_text,
-                                parse_mode="Markdown"
-                            )
-                            sent_count += 1
-                            
-                            # Update progress every 10 users
-                            if sent_count % 10 == 0:
-                                bot.edit_message(
-                                    progress_message['message_id'],
-                                    chat_id,
-                                    f"📣 Sending broadcast... {sent_count}/{total_users} completed."
-                                )
-                        except Exception as e:
-                            logging.error(f"Error sending broadcast to user {user.telegram_id}: {e}")
-                            failed_count += 1
                 except json.JSONDecodeError:
                     bot.send_message(chat_id, "Error processing announcement broadcast: Invalid format")
                     return
+                broadcast_text = content.get("formatted_text")
+            
+            recipients = []
+            for user in users:
+                # Skip users with no telegram_id
+                if not user.telegram_id:
+                    logging.warning(f"User ID {user.id} has no telegram_id, skipping")
+                    continue
+                recipients.append(user.telegram_id)
+            
+            progress_message_id = ((progress_message or {}).get('result') or {}).get('message_id')
+            if broadcast_photo and recipients:
+                # Telegram fetches the image once; everyone else gets the file_id it returned
+                from media_cache import get_media_cache, media_key
+                media_cache = get_media_cache()
+                first_result = media_cache.send(bot, recipients[0], 'image_url', broadcast_photo, caption=broadcast_text)
+                if record_broadcast_result(first_result):
+                    sent_count += 1
+                else:
+                    failed_count += 1
+                recipients = recipients[1:]
+                broadcast_photo = media_cache.file_id(media_key('image_url', broadcast_photo)) or broadcast_photo
+            
+            if broadcast_text or broadcast_photo:
+                # Each batch is sent concurrently on the asyncio transport, sequentially otherwise
+                for start in range(0, len(recipients), BROADCAST_BATCH_SIZE):
+                    batch = recipients[start:start + BROADCAST_BATCH_SIZE]
+                    results = bot.send_many([(recipient, broadcast_text) for recipient in batch], parse_mode="Markdown",
+                                            photo=broadcast_photo)
+                    for result in results:
+                        if record_broadcast_result(result):
+                            sent_count += 1
+                        else:
+                            failed_count += 1
+                    
+                    if progress_message_id:
+                        bot.edit_message(
+                            progress_message_id,
+                            chat_id,
+                            f"📣 Sending broadcast... {sent_count + failed_count}/{total_users} completed."
+                        )
             
             # Update the message status
             message.status = "sent"
@@ -6589,7 +6643,7 @@ def admin_send_broadcast_handler(update, chat_id):
             db.session.commit()
             
             # Clear the pending broadcast ID
-            pending_broadcast_id = None
+            state.pending_broadcast_id = None
             
             # Determine success rate
             success_rate = (sent_count / total_users * 100) if total_users > 0 else 0
@@ -6639,18 +6693,18 @@ def admin_send_broadcast_handler(update, chat_id):
 
 def admin_send_direct_message_handler(update, chat_id):
     """Handle sending a direct message to a specific user."""
+    state = chat_state(chat_id)
     try:
         # Get the stored recipient ID and message content
-        global dm_recipient_id, dm_content
-        if not dm_recipient_id or not dm_content:
+        if not state.dm_recipient_id or not state.dm_content:
             bot.send_message(chat_id, "Message information is missing. Please create a new direct message.")
             return
             
         # Send the message to the recipient
         try:
             bot.send_message(
-                dm_recipient_id,
-                dm_content,
+                state.dm_recipient_id,
+                state.dm_content,
                 parse_mode="Markdown"
             )
             
@@ -6660,9 +6714,9 @@ def admin_send_direct_message_handler(update, chat_id):
                 
                 # Save the message to the database
                 new_message = AdminMessage(
-                    content=dm_content,
+                    content=state.dm_content,
                     message_type="text",
-                    recipient_id=dm_recipient_id,
+                    recipient_id=state.dm_recipient_id,
                     sent_by=chat_id,
                     status="sent"
                 )
@@ -6670,8 +6724,7 @@ def admin_send_direct_message_handler(update, chat_id):
                 db.session.commit()
             
             # Clear the stored data
-            dm_recipient_id = None
-            dm_content = None
+            state.clear('dm_recipient_id', 'dm_content')
             
             # Send confirmation message
             bot.send_message(
@@ -6685,7 +6738,7 @@ def admin_send_direct_message_handler(update, chat_id):
             )
             
         except Exception as e:
-            logging.error(f"Error sending direct message to user {dm_recipient_id}: {e}")
+            logging.error(f"Error sending direct message to user {state.dm_recipient_id}: {e}")
             bot.send_message(chat_id, f"Error sending message: {str(e)}")
             
     except Exception as e:
@@ -6697,10 +6750,10 @@ def admin_send_direct_message_handler(update, chat_id):
 
 def admin_send_direct_message_image_handler(update, chat_id):
     """Handle sending an image direct message to a specific user."""
+    state = chat_state(chat_id)
     try:
         # Get the stored recipient ID and image data
-        global dm_recipient_id, dm_image_url, dm_image_caption
-        if not dm_recipient_id or not dm_image_url or not dm_image_caption:
+        if not state.dm_recipient_id or not state.dm_image_url or not state.dm_image_caption:
             bot.send_message(chat_id, "Message information is missing. Please create a new image message.")
             return
             
@@ -6709,8 +6762,8 @@ def admin_send_direct_message_image_handler(update, chat_id):
             # In a real implementation, we would use bot.send_photo
             # However, for our simplified version we'll simulate it
             bot.send_message(
-                dm_recipient_id,
-                f"[Image]({dm_image_url})\n\n{dm_image_caption}",
+                state.dm_recipient_id,
+                f"[Image]({state.dm_image_url})\n\n{state.dm_image_caption}",
                 parse_mode="Markdown"
             )
             
@@ -6721,14 +6774,14 @@ def admin_send_direct_message_image_handler(update, chat_id):
                 
                 # Save the message to the database
                 message_data = json.dumps({
-                    "image_url": dm_image_url,
-                    "caption": dm_image_caption
+                    "image_url": state.dm_image_url,
+                    "caption": state.dm_image_caption
                 })
                 
                 new_message = AdminMessage(
                     content=message_data,
                     message_type="image",
-                    recipient_id=dm_recipient_id,
+                    recipient_id=state.dm_recipient_id,
                     sent_by=chat_id,
                     status="sent"
                 )
@@ -6736,9 +6789,7 @@ def admin_send_direct_message_image_handler(update, chat_id):
                 db.session.commit()
             
             # Clear the stored data
-            dm_recipient_id = None
-            dm_image_url = None
-            dm_image_caption = None
+            state.clear('dm_recipient_id', 'dm_image_url', 'dm_image_caption')
             
             # Send confirmation message
             bot.send_message(
@@ -6752,7 +6803,7 @@ def admin_send_direct_message_image_handler(update, chat_id):
             )
             
         except Exception as e:
-            logging.error(f"Error sending image message to user {dm_recipient_id}: {e}")
+            logging.error(f"Error sending image message to user {state.dm_recipient_id}: {e}")
             bot.send_message(chat_id, f"Error sending image message: {str(e)}")
             
     except Exception as e:
@@ -6781,81 +6832,9 @@ def admin_back_handler(update, chat_id):
         except Exception as inner_e:
             logging.error(f"Error sending error message: {inner_e}")
 
-def run_polling():
-    """Start the bot polling loop."""
-    global _bot_instance, _bot_running, bot
-    
-    # Import the comprehensive duplicate prevention system
-    from duplicate_instance_prevention import prevent_duplicate_startup, setup_signal_handlers, check_and_kill_duplicate_processes
-    import threading
-    
-    # Check if we're running in the main thread
-    is_main_thread = threading.current_thread() is threading.main_thread()
-    
-    # Prevent multiple instances using comprehensive protection
-    try:
-        # First, check and terminate any existing duplicates
-        duplicates_killed = check_and_kill_duplicate_processes()
-        if duplicates_killed > 0:
-            logger.info(f"Terminated {duplicates_killed} duplicate bot processes")
-            time.sleep(3)  # Wait for processes to fully terminate
-        
-        # Now try to acquire the lock
-        instance_manager = prevent_duplicate_startup()
-        
-        # Only set up signal handlers if we're in the main thread
-        if is_main_thread:
-            setup_signal_handlers(instance_manager)
-            logger.info("Signal handlers set up (main thread)")
-        else:
-            logger.info("Skipping signal handlers setup (background thread)")
-            
-    except RuntimeError as e:
-        logger.warning(f"Could not start bot: {e}")
-        logger.info("Attempting cleanup and retry...")
-        
-        # Try to clean up stale locks and retry once
-        try:
-            from duplicate_instance_prevention import BotInstanceManager
-            cleanup_manager = BotInstanceManager()
-            cleanup_manager.cleanup_stale_locks()
-            time.sleep(2)
-            
-            # Retry acquiring lock after cleanup
-            instance_manager = prevent_duplicate_startup()
-            
-            # Only set up signal handlers if we're in the main thread
-            if is_main_thread:
-                setup_signal_handlers(instance_manager)
-                logger.info("Signal handlers set up after cleanup (main thread)")
-            else:
-                logger.info("Skipping signal handlers setup after cleanup (background thread)")
-                
-            logger.info("Successfully acquired lock after cleanup")
-        except RuntimeError:
-            logger.error("Failed to start bot even after cleanup - another instance may be legitimately running")
-            return
-    
-    # Additional check for global flag
-    if _bot_running:
-        logger.warning("Bot is already running globally, skipping duplicate start")
-        return
-    
-    # Get bot token directly from environment variable (not cached import)
-    token = os.environ.get('TELEGRAM_BOT_TOKEN')
-    
-    if not token:
-        logger.error("No Telegram bot token provided. Set the TELEGRAM_BOT_TOKEN environment variable.")
-        return
-    
-    logger.info(f"Starting bot with token: {token[:10]}...")
-    
-    # Set running flag immediately to prevent duplicates
-    _bot_running = True
-    
-    # Initialize global variables for admin trade broadcasting
-    global admin_pending_trade_data
-    admin_pending_trade_data = None
+def create_bot(token):
+    """Create the bot instance and register every command and callback handler."""
+    global _bot_instance, bot
     
     bot = SimpleTelegramBot(token)
     _bot_instance = bot
@@ -7177,9 +7156,218 @@ def run_polling():
     bot.add_callback_handler("stoploss_20", lambda u, c: set_stop_loss_percentage(u, c, 20.0))
     bot.add_callback_handler("stoploss_30", lambda u, c: set_stop_loss_percentage(u, c, 30.0))
     
+    return bot
+
+def run_polling():
+    """Start the bot polling loop."""
+    global _bot_instance, _bot_running, bot
+    
+    # Import the comprehensive duplicate prevention system
+    from duplicate_instance_prevention import prevent_duplicate_startup, setup_signal_handlers, check_and_kill_duplicate_processes
+    import threading
+    
+    profiler = get_startup_profiler()
+    lock_started = time.perf_counter()
+    
+    # Check if we're running in the main thread
+    is_main_thread = threading.current_thread() is threading.main_thread()
+    
+    # Prevent multiple instances using comprehensive protection
+    try:
+        # The flock is authoritative, so try it first; the (slow) process table
+        # scan only runs when another instance actually holds the lock
+        try:
+            instance_manager = prevent_duplicate_startup()
+        except RuntimeError:
+            duplicates_killed = check_and_kill_duplicate_processes()
+            if duplicates_killed > 0:
+                # terminate() already waits for each process to exit
+                logger.info(f"Terminated {duplicates_killed} duplicate bot processes")
+            instance_manager = prevent_duplicate_startup()
+        
+        # Only set up signal handlers if we're in the main thread
+        if is_main_thread:
+            setup_signal_handlers(instance_manager)
+            logger.info("Signal handlers set up (main thread)")
+        else:
+            logger.info("Skipping signal handlers setup (background thread)")
+            
+    except RuntimeError as e:
+        logger.warning(f"Could not start bot: {e}")
+        logger.info("Attempting cleanup and retry...")
+        
+        # Try to clean up stale locks and retry once
+        try:
+            from duplicate_instance_prevention import BotInstanceManager
+            cleanup_manager = BotInstanceManager()
+            cleanup_manager.cleanup_stale_locks()
+            time.sleep(2)
+            
+            # Retry acquiring lock after cleanup
+            instance_manager = prevent_duplicate_startup()
+            
+            # Only set up signal handlers if we're in the main thread
+            if is_main_thread:
+                setup_signal_handlers(instance_manager)
+                logger.info("Signal handlers set up after cleanup (main thread)")
+            else:
+                logger.info("Skipping signal handlers setup after cleanup (background thread)")
+                
+            logger.info("Successfully acquired lock after cleanup")
+        except RuntimeError:
+            logger.error("Failed to start bot even after cleanup - another instance may be legitimately running")
+            profiler.record('lock', time.perf_counter() - lock_started)
+            return
+    
+    profiler.record('lock', time.perf_counter() - lock_started)
+    
+    # Additional check for global flag
+    if _bot_running:
+        logger.warning("Bot is already running globally, skipping duplicate start")
+        return
+    
+    # Get bot token directly from environment variable (not cached import)
+    token = os.environ.get('TELEGRAM_BOT_TOKEN')
+    
+    if not token:
+        logger.error("No Telegram bot token provided. Set the TELEGRAM_BOT_TOKEN environment variable.")
+        return
+    
+    logger.info(f"Starting bot with token: {token[:10]}...")
+    
+    # Set running flag immediately to prevent duplicates
+    _bot_running = True
+    
+    # Standalone processes expose /metrics themselves when METRICS_PORT is set
+    try:
+        start_metrics_server()
+    except OSError as e:
+        logger.warning(f"Could not start metrics endpoint: {e}")
+    
+    init_started = time.perf_counter()
+    create_bot(token)
+    profiler.record('bot_init', time.perf_counter() - init_started)
+    
+    # Background jobs (settlement, notifications, maintenance) run in this process too
+    from job_queue import start_job_worker
+    start_job_worker()
+    
     # Start the bot
     bot.start_polling()
 
+def start_leader_duties():
+    """Leader-only work: Telegram getUpdates polling plus the singleton background jobs"""
+    global _leader_term
+    from utils.deposit_monitor import start_deposit_monitor, is_monitor_running
+    from automated_maintenance import start_maintenance_scheduler
+    from utils.position_revaluation import start_revaluation_loop
+    
+    if not is_monitor_running():
+        if start_deposit_monitor():
+            logger.info("✅ Deposit monitor started")
+        else:
+            logger.warning("⚠️  Failed to start deposit monitor")
+    
+    try:
+        start_maintenance_scheduler()
+        logger.info("✅ Database maintenance scheduler started")
+    except Exception as e:
+        logger.warning(f"⚠️  Failed to start maintenance scheduler: {e}")
+    
+    if start_revaluation_loop():
+        logger.info("✅ Position revaluation started")
+    
+    # Election callbacks run on the elector's thread and must return well within
+    # a lease, so waiting out the previous term's poller happens on its own thread
+    with _leader_term_lock:
+        _leader_term += 1
+        term = _leader_term
+    Thread(target=_start_poller_after_previous, args=(term,), daemon=True).start()
+
+def _start_poller_after_previous(term):
+    """Start polling once a poller from an earlier term has finished its in-flight long poll"""
+    global _bot_running
+    previous = getattr(bot, 'thread', None)
+    # Two pollers would consume the same update stream
+    while previous is not None and previous.is_alive():
+        previous.join(timeout=1)
+        if term != _leader_term:
+            return
+    
+    with _leader_term_lock:
+        # Leadership was lost (or won again) while waiting
+        if term != _leader_term:
+            return
+        _bot_running = True
+        bot.start()
+    logger.info("🤖 Leader: polling Telegram for updates")
+
+def stop_leader_duties():
+    """Hand polling and the singleton jobs back when leadership is lost"""
+    global _bot_running, _leader_term
+    from utils.deposit_monitor import stop_deposit_monitor, is_monitor_running
+    from automated_maintenance import stop_maintenance_scheduler
+    from utils.position_revaluation import stop_revaluation_loop
+    
+    with _leader_term_lock:
+        # Cancels a poller start still waiting on the previous term's poller
+        _leader_term += 1
+        if bot is not None:
+            bot.running = False
+        _bot_running = False
+    
+    if is_monitor_running():
+        stop_deposit_monitor()
+    stop_maintenance_scheduler()
+    stop_revaluation_loop()
+    logger.info("Worker: stopped polling and singleton jobs")
+
+def run_cluster_node():
+    """
+    Run this process as one node of a (possibly multi-node) deployment.
+    
+    Every node can send messages, serves /metrics and works the background
+    job queues; the node elected leader via the database also polls
+    getUpdates and runs the singleton jobs. Nodes may run on any number of hosts; a restart or crash hands
+    leadership to a standby within one lease period.
+    """
+    import signal
+    import threading
+    from leader_election import get_leader_elector
+    
+    token = os.environ.get('TELEGRAM_BOT_TOKEN')
+    if not token:
+        logger.error("No Telegram bot token provided. Set the TELEGRAM_BOT_TOKEN environment variable.")
+        return
+    
+    try:
+        start_metrics_server()
+    except OSError as e:
+        logger.warning(f"Could not start metrics endpoint: {e}")
+    
+    init_started = time.perf_counter()
+    create_bot(token)
+    get_startup_profiler().record('bot_init', time.perf_counter() - init_started)
+    
+    # Every node, leader or not, works the background job queues
+    from job_queue import start_job_worker
+    start_job_worker()
+    
+    elector = get_leader_elector()
+    elector.on_elected(start_leader_duties)
+    elector.on_demoted(stop_leader_duties)
+    
+    if threading.current_thread() is threading.main_thread():
+        def handle_shutdown(signum, frame):
+            logger.info(f"Received signal {signum}, resigning leadership and shutting down...")
+            elector.stop()
+        
+        signal.signal(signal.SIGINT, handle_shutdown)
+        signal.signal(signal.SIGTERM, handle_shutdown)
+    
+    logger.info(f"Node {elector.node_id} joining leader election (lease {elector.lease_seconds:.0f}s)")
+    elector.run()
+
 # Helper functions for dashboard interface
 def get_user_roi_metrics(user_id):
     """Get ROI metrics for a user - simplified implementation"""
@@ -7819,6 +8007,7 @@ def withdraw_profit_only_handler(update, chat_id):
             from models import User, Transaction, Profit
             from datetime import datetime
             from sqlalchemy import func
+            from balance_ledger import apply_delta
             
             # Get user and profits
             user = User.query.filter_by(telegram_id=str(chat_id)).first()
@@ -7878,11 +8067,16 @@ def withdraw_profit_only_handler(update, chat_id):
                 notes="Profit withdrawal pending admin approval"
             )
             db.session.add(new_transaction)
-            
-            # Reserve the amount from user's balance but don't subtract yet
-            previous_balance = user.balance
-            user.balance -= total_profit_amount
-            user.balance = max(0, user.balance)  # Ensure we don't go negative
+            db.session.flush()
+            
+            # Reserve the amount from user's balance, never taking it below zero
+            reserved = min(total_profit_amount, user.balance)
+            remaining_balance = apply_delta(user.id, -reserved, 'withdrawal',
+                                            reference=f"transaction:{new_transaction.id}", floor=0.0, commit=False)
+            if remaining_balance is None:
+                db.session.rollback()
+                bot.send_message(chat_id, "❌ Your balance changed while processing. Please try again.")
+                return
             db.session.commit()
             
             # Format time
@@ -7897,7 +8091,7 @@ def withdraw_profit_only_handler(update, chat_id):
                 f"Time: {time_str} UTC\n\n"
                 "Your withdrawal request has been submitted and is pending approval by an administrator. "
                 "You will be notified once your withdrawal has been processed.\n\n"
-                f"Remaining balance: *{user.balance:.6f} SOL*"
+                f"Remaining balance: *{remaining_balance:.6f} SOL*"
             )
             
             keyboard = bot.create_inline_keyboard([
@@ -8875,6 +9069,7 @@ def admin_manage_roi_handler(update, chat_id):
 
 def admin_update_roi_parameter(update, chat_id, param_type):
     """Handle updating a specific ROI parameter."""
+    state = chat_state(chat_id)
     try:
         with app.app_context():
             from models import SystemSettings
@@ -8887,7 +9082,7 @@ def admin_update_roi_parameter(update, chat_id, param_type):
                 current_setting = SystemSettings.query.filter_by(setting_name=setting_name).first()
                 current_value = float(current_setting.setting_value) if current_setting else SIMULATED_DAILY_ROI_MIN
                 input_guidance = "Enter the new minimum daily ROI percentage (0.1-5.0%)"
-                value_validator = lambda x: 0.1 <= x <= 5.0
+                value_bounds = (0.1, 5.0)
                 error_message = "Value must be between 0.1% and 5.0%"
             elif param_type == "max":
                 setting_name = "daily_roi_max"
@@ -8895,7 +9090,7 @@ def admin_update_roi_parameter(update, chat_id, param_type):
                 current_setting = SystemSettings.query.filter_by(setting_name=setting_name).first()
                 current_value = float(current_setting.setting_value) if current_setting else SIMULATED_DAILY_ROI_MAX
                 input_guidance = "Enter the new maximum daily ROI percentage (0.5-10.0%)"
-                value_validator = lambda x: 0.5 <= x <= 10.0
+                value_bounds = (0.5, 10.0)
                 error_message = "Value must be between 0.5% and 10.0%"
             elif param_type == "loss":
                 setting_name = "loss_probability"
@@ -8903,7 +9098,7 @@ def admin_update_roi_parameter(update, chat_id, param_type):
                 current_setting = SystemSettings.query.filter_by(setting_name=setting_name).first()
                 current_value = float(current_setting.setting_value) if current_setting else SIMULATED_LOSS_PROBABILITY
                 input_guidance = "Enter the probability of loss days (0.0-0.5 as decimal, e.g., 0.2 for 20%)"
-                value_validator = lambda x: 0.0 <= x <= 0.5
+                value_bounds = (0.0, 0.5)
                 error_message = "Value must be between 0.0 and 0.5 (0-50%)"
                 
             message = (
@@ -8927,14 +9122,13 @@ def admin_update_roi_parameter(update, chat_id, param_type):
             roi_context = {
                 "setting_name": setting_name,
                 "display_name": display_name,
-                "validator": value_validator,
+                "bounds": value_bounds,
                 "error_message": error_message,
                 "param_type": param_type
             }
             
-            # Since we can't use a real context like in python-telegram-bot, we'll use a global variable
-            global roi_update_context
-            roi_update_context = roi_context
+            # Keep the context in the chat state so whichever worker gets the reply can use it
+            state.roi_update_context = roi_context
             
             # Add listener for the next message
             bot.add_message_listener(chat_id, 'roi_parameter', roi_parameter_message_handler)
@@ -8948,12 +9142,13 @@ def admin_update_roi_parameter(update, chat_id, param_type):
 
 def roi_parameter_message_handler(update, chat_id, text):
     """Handle the ROI parameter input."""
+    state = chat_state(chat_id)
     try:
         # Remove the listener since we received input
         bot.remove_listener(chat_id)
         
-        # Get context from global variable
-        global roi_update_context
+        # Get context from the chat state
+        roi_update_context = state.roi_update_context
         if not roi_update_context:
             bot.send_message(
                 chat_id,
@@ -8965,14 +9160,14 @@ def roi_parameter_message_handler(update, chat_id, text):
         # Extract context variables
         setting_name = roi_update_context["setting_name"]
         display_name = roi_update_context["display_name"]
-        validator = roi_update_context["validator"]
+        min_value, max_value = roi_update_context["bounds"]
         error_message = roi_update_context["error_message"]
         param_type = roi_update_context["param_type"]
         
         # Validate input
         try:
             new_value = float(text.strip())
-            if not validator(new_value):
+            if not min_value <= new_value <= max_value:
                 raise ValueError(error_message)
         except ValueError as ve:
             bot.send_message(
@@ -9022,7 +9217,7 @@ def roi_parameter_message_handler(update, chat_id, text):
             )
             
             # Clear the context
-            roi_update_context = None
+            state.roi_update_context = None
             
     except Exception as e:
         import logging
@@ -9368,9 +9563,7 @@ def admin_view_wallet_qr_handler(update, chat_id):
     try:
         with app.app_context():
             from models import SystemSettings
-            import qrcode
-            import io
-            from PIL import Image, ImageDraw, ImageFont
+            from media_cache import get_media_cache, render_qr_png
             
             # Get the deposit wallet address
             deposit_wallet_setting = SystemSettings.query.filter_by(setting_name="deposit_wallet").first()
@@ -9397,41 +9590,21 @@ def admin_view_wallet_qr_handler(update, chat_id):
             
             wallet_address = deposit_wallet_setting.setting_value
             
-            # Generate QR code
-            qr = qrcode.QRCode(
-                version=1,
-                error_correction=qrcode.constants.ERROR_CORRECT_L,
-                box_size=10,
-                border=4,
-            )
-            qr.add_data(wallet_address)
-            qr.make(fit=True)
-            
-            # Create QR code image
-            img = qr.make_image(fill_color="black", back_color="white")
-            
-            # Add caption with wallet address
-            # Create a new image with space for the caption
-            canvas = Image.new('RGB', (img.size[0], img.size[1] + 50), color=(255, 255, 255))
-            canvas.paste(img, (0, 0))
-            
-            # Add the caption
-            draw = ImageDraw.Draw(canvas)
-            draw.text((10, img.size[1] + 10), f"Wallet Address: {wallet_address[:10]}...{wallet_address[-5:]}", fill=(0, 0, 0))
-            
-            # Save to buffer
-            buffer = io.BytesIO()
-            canvas.save(buffer, format="PNG")
-            buffer.seek(0)
-            
-            # Send QR code
+            # The QR is rendered and uploaded once per wallet address, then resent by file_id
             bot.send_chat_action(chat_id, action="upload_photo")
-            bot.send_document(
-                chat_id, 
-                buffer, 
-                caption=f"📱 *QR Code for Deposit Wallet*\n\n`{wallet_address}`", 
-                parse_mode="Markdown"
+            result = get_media_cache().send(
+                bot,
+                chat_id,
+                'wallet_qr',
+                wallet_address,
+                render=lambda: render_qr_png(wallet_address, f"Wallet Address: {wallet_address[:10]}...{wallet_address[-5:]}"),
+                caption=f"📱 *QR Code for Deposit Wallet*\n\n`{wallet_address}`",
+                parse_mode="Markdown",
+                as_document=True,
+                filename='wallet_qr.png'
             )
+            if not result.get('ok'):
+                raise RuntimeError(f"image upload failed: {result.get('description') or result.get('error')}")
             
             # Send options keyboard
             keyboard = bot.create_inline_keyboard([
@@ -9734,9 +9907,8 @@ def view_my_deposits_handler(update, chat_id):
 def referral_qr_code_handler(update, chat_id):
     """Generate and send a QR code for the user's referral link."""
     try:
-        import qrcode
-        import io
         import referral_module
+        from media_cache import get_media_cache, render_qr_png
         
         with app.app_context():
             # Create referral manager if not exists
@@ -9750,23 +9922,6 @@ def referral_qr_code_handler(update, chat_id):
             user_id = str(update['callback_query']['from']['id'])
             referral_link = f"https://t.me/ThriveQuantbot?start=ref_{user_id}"
             
-            # Generate QR code
-            qr = qrcode.QRCode(
-                version=1,
-                error_correction=qrcode.constants.ERROR_CORRECT_L,
-                box_size=10,
-                border=4,
-            )
-            qr.add_data(referral_link)
-            qr.make(fit=True)
-            
-            img = qr.make_image(fill_color="black", back_color="white")
-            
-            # Save QR code to bytes buffer
-            buffer = io.BytesIO()
-            img.save(buffer)
-            buffer.seek(0)
-            
             # Create caption for the image
             caption = (
                 f"🔗 *Your Referral QR Code*\n\n"
@@ -9775,36 +9930,24 @@ def referral_qr_code_handler(update, chat_id):
                 f"💡 *Pro Tip:* Save this image and share it on social media or in chat groups!"
             )
             
-            # Send the QR code as photo with caption
+            # Send the QR code as photo with caption; later taps reuse Telegram's file_id
             bot.send_chat_action(chat_id, "upload_photo")
-            
-            # Send using requests with the buffer directly (no temporary file needed)
-            import requests
-            import os
-            
-            token = os.environ.get('TELEGRAM_BOT_TOKEN', '')
-            if not token:
-                bot.send_message(chat_id, "❌ Error: Bot token not found. Please contact support.")
-                return
-                
-            # Send photo with caption using buffer
-            url = f"https://api.telegram.org/bot{token}/sendPhoto"
-            data = {
-                'chat_id': chat_id,
-                'caption': caption,
-                'parse_mode': 'Markdown',
-            }
-            
-            # Reset buffer position
-            buffer.seek(0)
-            files = {'photo': ('qr_code.png', buffer, 'image/png')}
-            response = requests.post(url, data=data, files=files)
+            result = get_media_cache().send(
+                bot,
+                chat_id,
+                'referral_qr',
+                referral_link,
+                render=lambda: render_qr_png(referral_link),
+                caption=caption,
+                parse_mode='Markdown',
+                filename='qr_code.png'
+            )
             
             # Check response
-            if response.ok:
+            if result.get('ok'):
                 logger.info(f"QR code sent successfully to user {user_id}")
             else:
-                logger.error(f"Failed to send QR code: {response.status_code} - {response.text}")
+                logger.error(f"Failed to send QR code: {result.get('error_code') or result.get('error')} - {result.get('description', '')}")
                 bot.send_message(chat_id, f"❌ Error sending QR code. Please try again.")
                 return
             
@@ -11462,11 +11605,8 @@ def handle_custom_liquidity_input(update, chat_id):
             ])
         )
         
-        # Store the user's current setting state
-        global user_input_states
-        if 'user_input_states' not in globals():
-            user_input_states = {}
-        user_input_states[chat_id] = {'type': 'custom_liquidity', 'step': 'waiting_input'}
+        # Remember which setting the next text message is for
+        chat_state(chat_id).custom_setting_input = 'custom_liquidity'
         
     except Exception as e:
         bot.send_message(chat_id, "Error setting up custom liquidity input. Please try again.")
@@ -11489,10 +11629,7 @@ def handle_custom_market_cap_input(update, chat_id):
             ])
         )
         
-        global user_input_states
-        if 'user_input_states' not in globals():
-            user_input_states = {}
-        user_input_states[chat_id] = {'type': 'custom_market_cap', 'step': 'waiting_input'}
+        chat_state(chat_id).custom_setting_input = 'custom_market_cap'
         
     except Exception as e:
         bot.send_message(chat_id, "Error setting up custom market cap input. Please try again.")
@@ -11514,26 +11651,18 @@ def handle_custom_trading_percentage_input(update, chat_id):
             ])
         )
         
-        global user_input_states
-        if 'user_input_states' not in globals():
-            user_input_states = {}
-        user_input_states[chat_id] = {'type': 'custom_trading_pct', 'step': 'waiting_input'}
+        chat_state(chat_id).custom_setting_input = 'custom_trading_pct'
         
     except Exception as e:
         bot.send_message(chat_id, "Error setting up custom percentage input. Please try again.")
 
 def process_custom_user_input(update, chat_id, text):
     """Process custom user text input for auto trading settings."""
+    state = chat_state(chat_id)
     try:
-        global user_input_states
-        if 'user_input_states' not in globals():
-            user_input_states = {}
-            
-        if chat_id not in user_input_states:
+        input_type = state.custom_setting_input
+        if not input_type:
             return False
-            
-        input_state = user_input_states[chat_id]
-        input_type = input_state.get('type')
         
         with app.app_context():
             from models import User
@@ -11562,7 +11691,7 @@ def process_custom_user_input(update, chat_id, text):
                                 [{"text": "🏠 Main Menu", "callback_data": "auto_trading_settings"}]
                             ])
                         )
-                        del user_input_states[chat_id]
+                        state.clear('custom_setting_input')
                         return True
                     else:
                         bot.send_message(chat_id, "❌ Please enter a value between 1 and 1000 SOL.")
@@ -11593,7 +11722,7 @@ def process_custom_user_input(update, chat_id, text):
                                     [{"text": "🏠 Main Menu", "callback_data": "auto_trading_settings"}]
                                 ])
                             )
-                            del user_input_states[chat_id]
+                            state.clear('custom_setting_input')
                             return True
                         else:
                             bot.send_message(chat_id, "❌ Invalid range. Ensure minimum < maximum and both between $1,000 - $50,000,000.")
@@ -11623,7 +11752,7 @@ def process_custom_user_input(update, chat_id, text):
                                 [{"text": "🏠 Main Menu", "callback_data": "auto_trading_settings"}]
                             ])
                         )
-                        del user_input_states[chat_id]
+                        state.clear('custom_setting_input')
                         return True
                     else:
                         bot.send_message(chat_id, "❌ Please enter a percentage between 5% and 95%.")
@@ -13529,6 +13658,7 @@ def admin_deny_withdrawal_handler(update, chat_id):
         with app.app_context():
             from models import User, Transaction
             from datetime import datetime
+            from balance_ledger import apply_delta
             
             # Get the withdrawal transaction
             withdrawal = Transaction.query.get(withdrawal_id)
@@ -13547,7 +13677,8 @@ def admin_deny_withdrawal_handler(update, chat_id):
             withdrawal.notes = f"{withdrawal.notes or ''}; Denied by admin on {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')}"
             
             # Return funds to user's balance
-            user.balance += withdrawal.amount
+            apply_delta(user.id, withdrawal.amount, 'withdrawal_refund', reference=f"transaction:{withdrawal.id}",
+                        commit=False)
             
             db.session.commit()
             
@@ -13718,49 +13849,26 @@ def main():
         
         logger.info(f"✅ Bot token found (ending in ...{BOT_TOKEN[-5:]})")
         
-        # Check database connectivity
+        # Check database connectivity (a cheap round trip, not a full table count)
         try:
-            with app.app_context():
-                from models import User
-                user_count = User.query.count()
-                logger.info(f"✅ Database connected successfully ({user_count} users)")
+            from sqlalchemy import text
+            with get_startup_profiler().phase('db_check'):
+                with app.app_context():
+                    db.session.execute(text("SELECT 1"))
+            logger.info("✅ Database connected successfully")
         except Exception as e:
             logger.error(f"❌ Database connection failed: {e}")
             if env_info['environment_type'] == 'aws':
                 logger.error("Please check your DATABASE_URL in the .env file")
             sys.exit(1)
         
-        # Prevent duplicate instance
-        from duplicate_instance_prevention import get_global_instance_manager
-        instance_manager = get_global_instance_manager()
-        if not instance_manager.acquire_lock():
-            logger.warning("🔒 Another bot instance is already running, exiting")
-            sys.exit(1)
-        
-        # Start monitoring systems
-        from utils.deposit_monitor import start_deposit_monitor, is_monitor_running
-        from automated_maintenance import start_maintenance_scheduler
-        
-        if not is_monitor_running():
-            if start_deposit_monitor():
-                logger.info("✅ Deposit monitor started")
-            else:
-                logger.warning("⚠️  Failed to start deposit monitor")
-        
-        try:
-            start_maintenance_scheduler()
-            logger.info("✅ Database maintenance scheduler started")
-        except Exception as e:
-            logger.warning(f"⚠️  Failed to start maintenance scheduler: {e}")
-        
-        # Start the bot
-        logger.info("🤖 Starting bot polling...")
+        # Leader election replaces the host-local lock file: any number of
+        # nodes may start, and only the elected leader polls and runs the
+        # deposit monitor, maintenance scheduler and revaluation loop
+        logger.info("🤖 Starting bot node...")
         logger.info("Press Ctrl+C to stop the bot")
         
-        # Set running flag
-        _bot_running = True
-        
-        run_polling()
+        run_cluster_node()
         
     except KeyboardInterrupt:
         logger.info("🛑 Bot stopped by user (Ctrl+C)")
@@ -13772,14 +13880,15 @@ def main():
         _bot_running = False
         sys.exit(1)
     finally:
-        # Cleanup
+        # Hand leadership to a standby now rather than after the lease expires
         try:
-            from duplicate_instance_prevention import get_global_instance_manager
-            instance_manager = get_global_instance_manager()
-            instance_manager.release_lock()
-        except:
+            from leader_election import get_leader_elector
+            get_leader_elector().resign()
+        except Exception:
             pass
 
+get_startup_profiler().record('import', time.perf_counter() - _MODULE_IMPORT_STARTED)
+
 # Entry point for AWS execution
 if __name__ == '__main__':
     main()
@@ -208,24 +208,13 @@ def clear_telegram_cache():
     
     logger.info("Clearing Telegram cache and temporary data...")
     
-    # Clear any global variables that might hold user data
+    # Clear in-flight conversation state (admin flows, message listeners)
     try:
-        # Reset admin adjustment globals
-        import bot_v20_runner
-        if hasattr(bot_v20_runner, 'admin_target_user_id'):
-            bot_v20_runner.admin_target_user_id = None
-        if hasattr(bot_v20_runner, 'admin_adjust_telegram_id'):
-            bot_v20_runner.admin_adjust_telegram_id = None
-        if hasattr(bot_v20_runner, 'admin_adjust_current_balance'):
-            bot_v20_runner.admin_adjust_current_balance = None
-        if hasattr(bot_v20_runner, 'admin_adjustment_amount'):
-            bot_v20_runner.admin_adjustment_amount = None
-        if hasattr(bot_v20_runner, 'admin_adjustment_reason'):
-            bot_v20_runner.admin_adjustment_reason = None
-            
-        logger.info("✅ Cleared bot global variables")
+        from conversation_state import get_state_store
+        cleared = get_state_store().clear_all()
+        logger.info(f"✅ Cleared conversation state for {cleared} chats")
     except Exception as e:
-        logger.warning(f"Could not clear bot globals: {e}")
+        logger.warning(f"Could not clear conversation state: {e}")
     
     # Clear any cached user data files
     try:
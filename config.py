@@ -39,7 +39,12 @@ DEFAULT_WALLET = "2pWHfMgpLtcnJpeFRzuRqXxAxBs2qjhU46xkdb5dCSzD"  # Default depos
 SUPPORT_USERNAME = "thrivebotadmin"  # Default support username
 
 # API endpoints
-TELEGRAM_API_URL = "https://api.telegram.org/bot{}"  # Will be formatted with token
+# TELEGRAM_API_BASE can point at a local stand-in (see fake_telegram_api.py) for load tests
+TELEGRAM_API_BASE = os.environ.get('TELEGRAM_API_BASE', 'https://api.telegram.org').rstrip('/')
+TELEGRAM_API_URL = TELEGRAM_API_BASE + "/bot{}"  # Will be formatted with token
+
+# 'threads' (requests, one poller thread) or 'asyncio' (see async_transport.py)
+BOT_TRANSPORT = os.environ.get('BOT_TRANSPORT', 'threads')
 
 # ROI Configuration
 SIMULATED_DAILY_ROI_MIN = 0.5  # Minimum daily ROI percentage
@@ -0,0 +1,495 @@
+"""
+Conversation State
+==================
+Per-chat conversation state kept outside the bot process, so any worker
+can handle the next update of a multi-step flow and in-flight flows
+survive a restart or a leader failover.
+
+Each chat has one record: a small dict (the active message listener plus
+whatever the flow needs, e.g. the broadcast target or a pending trade)
+serialised as compact JSON and stored with a TTL. Backends:
+
+    memory                  process-local dict (single process, tests)
+    database (default)      conversation_state table on the app database;
+                            the table is UNLOGGED on PostgreSQL
+    sqlite:///path/state.db separate SQLite file shared by workers on one host
+    postgresql://...        separate PostgreSQL database
+    redis://host:6379/0     Redis or any server speaking its protocol
+                            (requires the redis package)
+
+Select one with STATE_STORE_URL. Every store keeps a small local
+read-through cache; writes go straight to the backend and refresh it, so
+another worker sees a change at most STATE_CACHE_SECONDS late.
+
+Usage:
+    state = chat_state(chat_id)
+    state.broadcast_target = 'active'
+    target = state.broadcast_target or 'all'
+    state.clear('broadcast_target')
+"""
+import importlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, delete, select, update
+
+logger = logging.getLogger(__name__)
+
+# Seconds an untouched conversation record lives; every write renews it
+STATE_TTL_SECONDS = int(os.environ.get('CONVERSATION_STATE_TTL', '3600'))
+
+# How long a record read from the backend is served from the local cache
+STATE_CACHE_SECONDS = float(os.environ.get('STATE_CACHE_SECONDS', '1.0'))
+
+# Records kept in each process's local cache
+STATE_CACHE_SIZE = 2048
+
+# Record key holding the active message listener as [listener_type, callback_ref]
+LISTENER_KEY = 'listener'
+
+# Times update() re-reads and retries when another worker changed the record first
+STATE_UPDATE_ATTEMPTS = int(os.environ.get('STATE_UPDATE_ATTEMPTS', '10'))
+
+
+def encode_record(record):
+    """Serialise a record compactly; empty values are dropped"""
+    compact = {key: value for key, value in record.items() if value is not None}
+    if not compact:
+        return None
+    return json.dumps(compact, separators=(',', ':'), default=str)
+
+
+def decode_record(blob):
+    if not blob:
+        return {}
+    if isinstance(blob, bytes):
+        blob = blob.decode('utf-8')
+    return json.loads(blob)
+
+
+class StateStore:
+    """
+    Base class for conversation state backends
+
+    Subclasses implement _read, _write, _delete, _delete_all and
+    _compare_and_write on serialised records; caching, TTLs and merging
+    live here.
+    """
+
+    def __init__(self, ttl=None, cache_seconds=None, cache_size=STATE_CACHE_SIZE):
+        self.ttl = STATE_TTL_SECONDS if ttl is None else ttl
+        self.cache_seconds = STATE_CACHE_SECONDS if cache_seconds is None else cache_seconds
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # chat_id -> (fetched_at, blob)
+        self._lock = threading.RLock()
+
+    def _read(self, chat_id):
+        raise NotImplementedError
+
+    def _write(self, chat_id, blob, ttl):
+        raise NotImplementedError
+
+    def _delete(self, chat_id):
+        raise NotImplementedError
+
+    def _delete_all(self):
+        raise NotImplementedError
+
+    def _compare_and_write(self, chat_id, expected, blob, ttl):
+        """
+        Replace the record with blob (delete it when blob is None) only if it
+        still holds expected (None: no live record); returns whether it did
+        """
+        raise NotImplementedError
+
+    def purge_expired(self):
+        """Drop expired records; backends with native expiry have nothing to do"""
+        return 0
+
+    def clear_all(self):
+        """Drop every chat's record; returns how many were removed"""
+        with self._lock:
+            removed = self._delete_all()
+            self._cache.clear()
+        return removed
+
+    def _cached(self, chat_id):
+        if self.cache_seconds <= 0:
+            return None
+        with self._lock:
+            entry = self._cache.get(chat_id)
+            if entry is None:
+                return None
+            fetched_at, blob = entry
+            if time.monotonic() - fetched_at > self.cache_seconds:
+                del self._cache[chat_id]
+                return None
+            self._cache.move_to_end(chat_id)
+            return entry
+
+    def _remember(self, chat_id, blob):
+        if self.cache_seconds <= 0:
+            return
+        with self._lock:
+            self._cache[chat_id] = (time.monotonic(), blob)
+            self._cache.move_to_end(chat_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def invalidate(self, chat_id=None):
+        """Forget cached records (all of them when chat_id is None)"""
+        with self._lock:
+            if chat_id is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(chat_id, None)
+
+    def load(self, chat_id):
+        """Return a fresh copy of the chat's record ({} when there is none)"""
+        entry = self._cached(chat_id)
+        if entry is not None:
+            return decode_record(entry[1])
+        blob = self._read(chat_id)
+        self._remember(chat_id, blob)
+        return decode_record(blob)
+
+    def save(self, chat_id, record):
+        """Replace the chat's record, renewing its TTL; an empty record is deleted"""
+        blob = encode_record(record)
+        with self._lock:
+            if blob is None:
+                self._delete(chat_id)
+            else:
+                self._write(chat_id, blob, self.ttl)
+            self._remember(chat_id, blob)
+
+    def update(self, chat_id, values):
+        """
+        Merge values into the chat's record; a None value removes that key
+
+        The merge is a compare-and-set against the backend, not the local
+        cache: if another worker changed the record between the read and the
+        write, the write is refused and the merge is redone on its version.
+        """
+        for _ in range(STATE_UPDATE_ATTEMPTS):
+            current = self._read(chat_id)
+            record = decode_record(current)
+            record.update(values)
+            blob = encode_record(record)
+            with self._lock:
+                if self._compare_and_write(chat_id, current, blob, self.ttl):
+                    self._remember(chat_id, blob)
+                    return record
+        raise RuntimeError(f"Conversation state for chat {chat_id} kept changing; update not applied")
+
+    def clear(self, chat_id, *keys):
+        """Remove the given keys from the chat's record, or the whole record"""
+        if keys:
+            self.update(chat_id, dict.fromkeys(keys))
+        else:
+            self.save(chat_id, {})
+
+
+class MemoryStateStore(StateStore):
+    """Process-local store; state is lost on restart and not shared"""
+
+    def __init__(self, ttl=None):
+        super().__init__(ttl=ttl, cache_seconds=0)
+        self._records = {}  # chat_id -> (expires_at, blob)
+
+    def _read(self, chat_id):
+        entry = self._records.get(chat_id)
+        if entry is None:
+            return None
+        expires_at, blob = entry
+        if expires_at <= time.monotonic():
+            self._records.pop(chat_id, None)
+            return None
+        return blob
+
+    def _write(self, chat_id, blob, ttl):
+        self._records[chat_id] = (time.monotonic() + ttl, blob)
+
+    def _delete(self, chat_id):
+        self._records.pop(chat_id, None)
+
+    def _delete_all(self):
+        removed = len(self._records)
+        self._records.clear()
+        return removed
+
+    def _compare_and_write(self, chat_id, expected, blob, ttl):
+        # Callers hold self._lock, and nothing outside this process shares the dict
+        if self._read(chat_id) != expected:
+            return False
+        if blob is None:
+            self._delete(chat_id)
+        else:
+            self._write(chat_id, blob, ttl)
+        return True
+
+    def purge_expired(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = [chat_id for chat_id, (expires_at, _) in self._records.items() if expires_at <= now]
+            for chat_id in expired:
+                del self._records[chat_id]
+        return len(expired)
+
+
+class SqlStateStore(StateStore):
+    """
+    Store on the conversation_state table
+
+    Uses the app database unless given its own URL (a shared SQLite file or
+    a separate PostgreSQL database), in which case the table is created there.
+    """
+
+    def __init__(self, url=None, engine=None, ttl=None, cache_seconds=None):
+        super().__init__(ttl=ttl, cache_seconds=cache_seconds)
+        from models import ConversationState
+        self.table = ConversationState.__table__
+        self._engine = engine
+        if url:
+            self._engine = create_engine(url, pool_pre_ping=True)
+            self.table.create(self._engine, checkfirst=True)
+
+    @property
+    def engine(self):
+        if self._engine is not None:
+            return self._engine
+        from app import app, db
+        with app.app_context():
+            return db.engine
+
+    def _upsert(self, dialect, where=None):
+        """Insert or replace a record; with where, only rows matching it are replaced"""
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        statement = dialect_insert(self.table)
+        return statement.on_conflict_do_update(
+            index_elements=['chat_id'],
+            set_={
+                'data': statement.excluded.data,
+                'expires_at': statement.excluded.expires_at,
+                'updated_at': statement.excluded.updated_at,
+            },
+            where=where)
+
+    def _read(self, chat_id):
+        with self.engine.connect() as connection:
+            return connection.execute(
+                select(self.table.c.data)
+                .where(self.table.c.chat_id == chat_id, self.table.c.expires_at > datetime.utcnow())
+            ).scalar()
+
+    def _write(self, chat_id, blob, ttl):
+        now = datetime.utcnow()
+        with self.engine.begin() as connection:
+            connection.execute(self._upsert(connection.dialect.name), {
+                'chat_id': chat_id,
+                'data': blob,
+                'expires_at': now + timedelta(seconds=ttl),
+                'updated_at': now,
+            })
+
+    def _delete(self, chat_id):
+        with self.engine.begin() as connection:
+            connection.execute(delete(self.table).where(self.table.c.chat_id == chat_id))
+
+    def _delete_all(self):
+        with self.engine.begin() as connection:
+            return connection.execute(delete(self.table)).rowcount
+
+    def _compare_and_write(self, chat_id, expected, blob, ttl):
+        now = datetime.utcnow()
+        table = self.table
+        with self.engine.begin() as connection:
+            if expected is None:
+                if blob is None:
+                    return True
+                # A missing row is inserted; an expired one counts as missing and is replaced
+                statement = self._upsert(connection.dialect.name, where=table.c.expires_at <= now)
+                return connection.execute(statement, {
+                    'chat_id': chat_id,
+                    'data': blob,
+                    'expires_at': now + timedelta(seconds=ttl),
+                    'updated_at': now,
+                }).rowcount == 1
+            matches = (table.c.chat_id == chat_id, table.c.data == expected, table.c.expires_at > now)
+            if blob is None:
+                return connection.execute(delete(table).where(*matches)).rowcount == 1
+            return connection.execute(
+                update(table).where(*matches)
+                .values(data=blob, expires_at=now + timedelta(seconds=ttl), updated_at=now)
+            ).rowcount == 1
+
+    def purge_expired(self):
+        with self.engine.begin() as connection:
+            return connection.execute(
+                delete(self.table).where(self.table.c.expires_at <= datetime.utcnow())
+            ).rowcount
+
+
+class RedisStateStore(StateStore):
+    """Store on Redis (or a compatible server); expiry is left to the server"""
+
+    KEY_PREFIX = 'conversation:'
+
+    # Server-side compare-and-set: ARGV is expected, new record ('' for none) and TTL
+    COMPARE_AND_WRITE_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if (current or '') ~= ARGV[1] then
+    return 0
+end
+if ARGV[2] == '' then
+    redis.call('DEL', KEYS[1])
+else
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+end
+return 1
+"""
+
+    def __init__(self, url=None, client=None, ttl=None, cache_seconds=None):
+        super().__init__(ttl=ttl, cache_seconds=cache_seconds)
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError("STATE_STORE_URL points at Redis but the redis package is not installed")
+            client = redis.Redis.from_url(url)
+        self.client = client
+
+    def _key(self, chat_id):
+        return f"{self.KEY_PREFIX}{chat_id}"
+
+    def _read(self, chat_id):
+        return self.client.get(self._key(chat_id))
+
+    def _write(self, chat_id, blob, ttl):
+        self.client.set(self._key(chat_id), blob, ex=int(ttl))
+
+    def _delete(self, chat_id):
+        self.client.delete(self._key(chat_id))
+
+    def _delete_all(self):
+        keys = list(self.client.scan_iter(match=f"{self.KEY_PREFIX}*"))
+        if keys:
+            self.client.delete(*keys)
+        return len(keys)
+
+    def _compare_and_write(self, chat_id, expected, blob, ttl):
+        return bool(self.client.eval(self.COMPARE_AND_WRITE_SCRIPT, 1, self._key(chat_id),
+                                     expected or '', blob or '', max(int(ttl), 1)))
+
+
+def create_state_store(url=None):
+    """Build the store described by url (defaults to STATE_STORE_URL)"""
+    url = url or os.environ.get('STATE_STORE_URL', 'database')
+    if url == 'memory':
+        return MemoryStateStore()
+    if url == 'database':
+        return SqlStateStore()
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisStateStore(url)
+    return SqlStateStore(url)
+
+
+_state_store = None
+_state_store_lock = threading.Lock()
+
+
+def get_state_store():
+    """Get the process-wide conversation state store"""
+    global _state_store
+    if _state_store is None:
+        with _state_store_lock:
+            if _state_store is None:
+                _state_store = create_state_store()
+                logger.info(f"Conversation state store: {type(_state_store).__name__}")
+    return _state_store
+
+
+def set_state_store(store):
+    """Swap the process-wide store (tests, or a custom backend)"""
+    global _state_store
+    _state_store = store
+
+
+class ChatState:
+    """
+    Attribute-style view of one chat's record
+
+    Reading a missing attribute gives None; assigning writes through to the
+    store, and assigning None removes the key.
+    """
+
+    def __init__(self, chat_id, store=None):
+        object.__setattr__(self, '_chat_id', chat_id)
+        object.__setattr__(self, '_store', store or get_state_store())
+
+    def __getattr__(self, key):
+        if key.startswith('__'):
+            raise AttributeError(key)
+        return self._store.load(self._chat_id).get(key)
+
+    def __setattr__(self, key, value):
+        self._store.update(self._chat_id, {key: value})
+
+    def update(self, **values):
+        self._store.update(self._chat_id, values)
+
+    def clear(self, *keys):
+        self._store.clear(self._chat_id, *keys)
+
+
+def chat_state(chat_id):
+    return ChatState(chat_id)
+
+
+def _module_name(module_name):
+    """Name a worker can import: scripts run directly report '__main__'"""
+    if module_name != '__main__':
+        return module_name
+    main = sys.modules['__main__']
+    spec = getattr(main, '__spec__', None)
+    if spec is not None and spec.name:
+        return spec.name
+    return os.path.splitext(os.path.basename(getattr(main, '__file__', '') or '__main__'))[0]
+
+
+def callback_ref(callback):
+    """
+    Importable 'module:qualname' reference to a module-level function
+
+    Returns None for closures and lambdas, which cannot be looked up again
+    in another process.
+    """
+    qualname = getattr(callback, '__qualname__', '')
+    if not qualname or '<' in qualname:
+        return None
+    return f"{_module_name(callback.__module__)}:{qualname}"
+
+
+def resolve_callback(ref):
+    """Look up a function from a callback_ref() reference"""
+    module_name, qualname = ref.split(':', 1)
+    module = sys.modules.get(module_name)
+    if module is None:
+        main = sys.modules.get('__main__')
+        if main is not None and _module_name('__main__') == module_name:
+            module = main
+        else:
+            module = importlib.import_module(module_name)
+    target = module
+    for part in qualname.split('.'):
+        target = getattr(target, part)
+    return target
@@ -11,7 +11,7 @@ import logging
 import asyncio
 from datetime import datetime, timedelta
 from contextlib import contextmanager
-from sqlalchemy import create_engine, text, event, Index
+from sqlalchemy import create_engine, text, event
 from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import sessionmaker, scoped_session
 from sqlalchemy.pool import QueuePool
@@ -117,59 +117,13 @@ class DatabasePerformanceOptimizer:
             session.close()
     
     def create_performance_indexes(self):
-        """Create indexes for frequently queried columns"""
-        indexes_to_create = [
-            # User table optimizations
-            Index('idx_user_telegram_id_status', 'user.telegram_id', 'user.status'),
-            Index('idx_user_status_active', 'user.status'),
-            Index('idx_user_last_activity', 'user.last_activity'),
-            
-            # Transaction table optimizations (most critical)
-            Index('idx_transaction_user_timestamp', 'transaction.user_id', 'transaction.timestamp'),
-            Index('idx_transaction_type_status', 'transaction.transaction_type', 'transaction.status'),
-            Index('idx_transaction_processed_at', 'transaction.processed_at'),
-            
-            # Trading position optimizations
-            Index('idx_trading_position_user_status', 'trading_position.user_id', 'trading_position.status'),
-            Index('idx_trading_position_timestamp', 'trading_position.timestamp'),
-            Index('idx_trading_position_token', 'trading_position.token_name'),
-            
-            # Profit table optimizations
-            Index('idx_profit_user_date', 'profit.user_id', 'profit.date'),
-            Index('idx_profit_date', 'profit.date'),
-            
-            # Daily snapshot optimizations
-            Index('idx_daily_snapshot_user_date', 'daily_snapshot.user_id', 'daily_snapshot.date'),
-            
-            # User metrics optimizations
-            Index('idx_user_metrics_user_updated', 'user_metrics.user_id', 'user_metrics.last_updated'),
-            
-            # Trading cycle optimizations
-            Index('idx_trading_cycle_user_status', 'trading_cycle.user_id', 'trading_cycle.status'),
-        ]
-        
-        created_count = 0
-        with self.get_db_session() as session:
-            for index in indexes_to_create:
-                try:
-                    # Check if index already exists
-                    result = session.execute(text(f"""
-                        SELECT 1 FROM pg_indexes 
-                        WHERE indexname = '{index.name}'
-                    """))
-                    
-                    if not result.fetchone():
-                        # Create index without CONCURRENTLY for compatibility
-                        column_names = ', '.join([str(col) for col in index.columns])
-                        session.execute(text(f"CREATE INDEX IF NOT EXISTS {index.name} ON {index.table.name} ({column_names})"))
-                        created_count += 1
-                        logger.info(f"Created index: {index.name}")
-                    
-                except Exception as e:
-                    logger.warning(f"Could not create index {index.name}: {e}")
-        
-        logger.info(f"Database indexing complete. Created {created_count} new indexes.")
-        return created_count
+        """Ensure the indexes declared in models.py exist (applied via db_migrate.py)"""
+        from app import app, apply_declared_indexes
+
+        with app.app_context():
+            created = apply_declared_indexes()
+        logger.info(f"Database indexing complete. Created {len(created)} new indexes.")
+        return len(created)
     
     def get_optimized_user_query(self, telegram_id):
         """Optimized user lookup by telegram_id"""
@@ -317,9 +271,6 @@ def initialize_performance_optimizer(database_url=None):
     if performance_optimizer is None:
         performance_optimizer = DatabasePerformanceOptimizer(database_url)
         
-        # Create indexes on startup
-        performance_optimizer.create_performance_indexes()
-        
         # Optimize table statistics
         performance_optimizer.optimize_table_statistics()
         
@@ -0,0 +1,223 @@
+"""
+End-of-Day Close
+================
+Closes a trading day for every user in a few set-based statements instead
+of per-user end_of_day_processing calls:
+
+    1. one grouped query reads each user's balance, the day's net P/L
+       (Profit table), completed trade and win counts (Transaction table)
+       and the day's DailySnapshot, if any
+    2. DailySnapshot rows for the day are updated or inserted in bulk
+    3. UserMetrics streaks are closed (profit_streaks.close_streak_day)
+    4. milestone and goal progress is updated in bulk, with one
+       MilestoneTracker insert for everything reached
+    5. the next day's snapshots are pre-created with one INSERT ... SELECT,
+       so dashboards only ever read them
+
+Everything runs in one transaction; rerunning a close rewrites the same
+values and records no new milestones.
+
+Scheduled as the maintenance.day_close background job shortly after
+midnight UTC; it closes the day that just ended.
+"""
+import logging
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import and_, bindparam, case, exists, func, insert, literal, select, update
+
+from app import db
+from models import DailySnapshot, MilestoneTracker, Profit, Transaction, User, UserMetrics
+from profit_streaks import close_streak_day
+
+logger = logging.getLogger(__name__)
+
+TRADE_TYPES = ('trade_profit', 'trade_loss')
+
+
+def daily_activity(day: date, user_ids: Optional[Iterable[int]] = None):
+    """
+    One row per user: (user_id, balance, net_pl, trades, wins, snapshot_id,
+    starting_balance, snapshot_trades, snapshot_wins) for `day`
+    """
+    users = User.__table__.c
+    profits = Profit.__table__.c
+    transactions = Transaction.__table__.c
+    snapshots = DailySnapshot.__table__.c
+    day_start = datetime.combine(day, datetime.min.time())
+    day_end = day_start + timedelta(days=1)
+
+    pl = (select(profits.user_id, func.sum(profits.amount).label('net_pl'))
+          .where(profits.date == day)
+          .group_by(profits.user_id)
+          .subquery('pl'))
+    trades = (select(transactions.user_id,
+                     func.count().label('trades'),
+                     func.sum(case((transactions.transaction_type == 'trade_profit', 1), else_=0)).label('wins'))
+              .where(transactions.transaction_type.in_(TRADE_TYPES))
+              .where(transactions.status == 'completed')
+              .where(transactions.timestamp >= day_start)
+              .where(transactions.timestamp < day_end)
+              .group_by(transactions.user_id)
+              .subquery('trades'))
+    # Older code could create duplicate snapshots; the first one is authoritative
+    first_snapshot = (select(snapshots.user_id, func.min(snapshots.id).label('snapshot_id'))
+                      .where(snapshots.date == day)
+                      .group_by(snapshots.user_id)
+                      .subquery('first_snapshot'))
+    snapshot = DailySnapshot.__table__.alias('snapshot')
+
+    query = (
+        select(users.id, func.coalesce(users.balance, 0.0), func.coalesce(pl.c.net_pl, 0.0),
+               func.coalesce(trades.c.trades, 0), func.coalesce(trades.c.wins, 0),
+               snapshot.c.id, snapshot.c.starting_balance,
+               func.coalesce(snapshot.c.trades_count, 0), func.coalesce(snapshot.c.winning_trades, 0))
+        .select_from(User.__table__)
+        .outerjoin(pl, pl.c.user_id == users.id)
+        .outerjoin(trades, trades.c.user_id == users.id)
+        .outerjoin(first_snapshot, first_snapshot.c.user_id == users.id)
+        .outerjoin(snapshot, snapshot.c.id == first_snapshot.c.snapshot_id)
+    )
+    if user_ids is not None:
+        query = query.where(users.id.in_(list(user_ids)))
+    return db.session.execute(query).all()
+
+
+def _write_snapshots(day: date, rows) -> int:
+    updates = []
+    inserts = []
+    for (user_id, balance, net_pl, trades, wins, snapshot_id,
+         starting_balance, snapshot_trades, snapshot_wins) in rows:
+        if starting_balance is None:
+            # No snapshot was opened for the day: back the start out of the day's P/L
+            starting_balance = balance - net_pl
+        profit_amount = balance - starting_balance
+        values = {
+            'ending_balance': balance,
+            'profit_amount': profit_amount,
+            'profit_percentage': profit_amount / starting_balance * 100 if starting_balance > 0 else 0.0,
+            # Per-trade snapshot updates may have counted trades the ledger doesn't show
+            'trades': max(trades, snapshot_trades),
+            'wins': max(wins, snapshot_wins),
+        }
+        if snapshot_id is not None:
+            updates.append(dict(values, snapshot_id=snapshot_id))
+        else:
+            inserts.append({'user_id': user_id, 'date': day, 'starting_balance': starting_balance,
+                            'ending_balance': values['ending_balance'], 'profit_amount': values['profit_amount'],
+                            'profit_percentage': values['profit_percentage'],
+                            'trades_count': values['trades'], 'winning_trades': values['wins']})
+
+    table = DailySnapshot.__table__
+    if updates:
+        db.session.execute(
+            update(table)
+            .where(table.c.id == bindparam('snapshot_id'))
+            .values(ending_balance=bindparam('ending_balance'), profit_amount=bindparam('profit_amount'),
+                    profit_percentage=bindparam('profit_percentage'), trades_count=bindparam('trades'),
+                    winning_trades=bindparam('wins')),
+            updates
+        )
+    if inserts:
+        db.session.execute(insert(table), inserts)
+    return len(updates) + len(inserts)
+
+
+def _update_progress(user_ids: Optional[Iterable[int]], now: datetime) -> int:
+    """Milestone and goal progress for every user with metrics; returns milestones reached"""
+    users = User.__table__.c
+    metrics = UserMetrics.__table__.c
+    query = (select(metrics.id, metrics.user_id, metrics.next_milestone, metrics.current_goal,
+                    func.coalesce(users.balance, 0.0), func.coalesce(users.initial_deposit, 0.0))
+             .join(User.__table__, users.id == metrics.user_id)
+             .order_by(metrics.id))
+    if user_ids is not None:
+        query = query.where(metrics.user_id.in_(list(user_ids)))
+
+    seen = set()
+    updates = []
+    reached = []
+    for metrics_id, user_id, next_milestone, current_goal, balance, initial_deposit in db.session.execute(query):
+        if user_id in seen:
+            continue
+        seen.add(user_id)
+        step = max(initial_deposit * 0.1, 0.05)
+        next_milestone = next_milestone or step
+        profit = balance - initial_deposit
+        milestone_progress = min(100, profit / next_milestone * 100) if next_milestone > 0 else 0
+        if profit >= next_milestone > 0:
+            next_milestone = profit + step
+            reached.append({'user_id': user_id, 'milestone_type': 'profit_amount', 'value': profit,
+                            'achieved_at': now, 'acknowledged': False})
+
+        current_goal = current_goal or initial_deposit * 2
+        goal_progress = min(100, balance / current_goal * 100) if current_goal > 0 else 0
+        if balance >= current_goal > 0:
+            current_goal = balance * 2
+            reached.append({'user_id': user_id, 'milestone_type': 'goal_reached', 'value': balance,
+                            'achieved_at': now, 'acknowledged': False})
+
+        updates.append({'metrics_id': metrics_id, 'milestone': next_milestone,
+                        'milestone_pct': milestone_progress, 'goal': current_goal, 'goal_pct': goal_progress})
+
+    table = UserMetrics.__table__
+    if updates:
+        db.session.execute(
+            update(table)
+            .where(table.c.id == bindparam('metrics_id'))
+            .values(next_milestone=bindparam('milestone'), milestone_progress=bindparam('milestone_pct'),
+                    current_goal=bindparam('goal'), goal_progress=bindparam('goal_pct')),
+            updates
+        )
+    if reached:
+        db.session.execute(insert(MilestoneTracker.__table__), reached)
+    return len(reached)
+
+
+def open_snapshots(day: date, user_ids: Optional[Iterable[int]] = None) -> int:
+    """Create `day`'s snapshot, starting at the current balance, for every user without one"""
+    users = User.__table__.c
+    snapshots = DailySnapshot.__table__
+    existing = exists().where(and_(snapshots.c.user_id == users.id, snapshots.c.date == day))
+    source = (select(users.id, literal(day, snapshots.c.date.type), func.coalesce(users.balance, 0.0),
+                     literal(0), literal(0))
+              .where(~existing))
+    if user_ids is not None:
+        source = source.where(users.id.in_(list(user_ids)))
+    result = db.session.execute(insert(snapshots).from_select(
+        ['user_id', 'date', 'starting_balance', 'trades_count', 'winning_trades'], source))
+    return max(result.rowcount or 0, 0)
+
+
+def close_day(day: Optional[date] = None, user_ids: Optional[Iterable[int]] = None) -> Dict:
+    """
+    Close `day` for every user (or only user_ids) in one transaction
+
+    Args:
+        day: the day being closed (default: yesterday, UTC)
+        user_ids: restrict the close to these users (default: everyone)
+
+    Returns:
+        dict with users, snapshots, milestones and next_day_snapshots counts
+    """
+    day = day or datetime.utcnow().date() - timedelta(days=1)
+    if user_ids is not None:
+        user_ids = list(user_ids)
+    started = time.perf_counter()
+    now = datetime.utcnow()
+    try:
+        rows = daily_activity(day, user_ids)
+        snapshots = _write_snapshots(day, rows)
+        close_streak_day(day, user_ids, commit=False)
+        milestones = _update_progress(user_ids, now)
+        opened = open_snapshots(day + timedelta(days=1), user_ids)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    result = {'users': len(rows), 'snapshots': snapshots, 'milestones': milestones, 'next_day_snapshots': opened}
+    logger.info(f"Closed {day} for {len(rows)} users: {snapshots} snapshots, {milestones} milestones, "
+                f"{opened} snapshots opened for the next day in {time.perf_counter() - started:.2f}s")
+    return result
@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+"""
+Database Migration Step
+=======================
+Explicit schema setup for deployments. Tables are no longer created when
+`app` is imported, so run this once per deploy before starting the bot:
+
+    python db_migrate.py
+"""
+
+import sys
+import logging
+
+from app import run_schema_migrations
+
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    """Apply the schema and report the result"""
+    try:
+        run_schema_migrations()
+        logger.info("Database migration complete")
+        return 0
+    except Exception as e:
+        logger.error(f"Database migration failed: {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
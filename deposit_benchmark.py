@@ -0,0 +1,143 @@
+"""
+Deposit Benchmark
+=================
+Measures burst deposit ingestion. N deposits spread over U users are
+credited by S concurrent scanners that all see every deposit (the worst
+case of overlapping scans), either in batches through credit_deposits() or
+one at a time through credit_deposit(). Afterwards every signature is
+checked to be recorded once and every balance to equal the user's deposits.
+
+Usage:
+    python deposit_benchmark.py --deposits 5000 --users 500 --scanners 4
+    python deposit_benchmark.py --deposits 2000 --scanners 4 --single
+"""
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+
+from sqlalchemy import delete, func, select
+
+from app import app, db
+from deposit_crediting import credit_deposit, credit_deposits
+from models import BalanceLedgerEntry, SenderWallet, Transaction, User, UserStatus
+
+logger = logging.getLogger(__name__)
+
+# telegram_id / tx_hash prefix of the rows the benchmark creates and removes
+BENCHMARK_PREFIX = 'bench-deposit-'
+
+
+def reset_benchmark_rows():
+    users = User.__table__
+    user_ids = select(users.c.id).where(users.c.telegram_id.like(f"{BENCHMARK_PREFIX}%")).scalar_subquery()
+    with db.engine.begin() as connection:
+        connection.execute(delete(BalanceLedgerEntry.__table__)
+                           .where(BalanceLedgerEntry.__table__.c.user_id.in_(user_ids)))
+        connection.execute(delete(Transaction.__table__).where(Transaction.__table__.c.user_id.in_(user_ids)))
+        connection.execute(delete(SenderWallet.__table__).where(SenderWallet.__table__.c.user_id.in_(user_ids)))
+        connection.execute(delete(users).where(users.c.telegram_id.like(f"{BENCHMARK_PREFIX}%")))
+
+
+def _create_users(count):
+    db.session.add_all([User(telegram_id=f"{BENCHMARK_PREFIX}{i}", username=f"bench_depositor_{i}",
+                             status=UserStatus.DEPOSITING, balance=0.0, initial_deposit=0.0)
+                        for i in range(count)])
+    db.session.commit()
+    users = User.__table__.c
+    return [user_id for (user_id,) in db.session.execute(
+        select(users.id).where(users.telegram_id.like(f"{BENCHMARK_PREFIX}%")).order_by(users.id))]
+
+
+def _scan(deposits, batch, single, credited):
+    with app.app_context():
+        if single:
+            for user_id, amount, signature in deposits:
+                if credit_deposit(user_id, amount, signature) is not None:
+                    credited.append(signature)
+        else:
+            for start in range(0, len(deposits), batch):
+                credited.extend(signature for _, _, signature
+                                in credit_deposits(deposits[start:start + batch]))
+        db.session.remove()
+
+
+def run_benchmark(deposits=2000, users=200, scanners=4, batch=100, single=False, seed=7):
+    """
+    Credit `deposits` deposits over `users` users with `scanners` overlapping scanners
+
+    Returns:
+        dict: throughput figures plus exactly-once checks
+    """
+    rng = random.Random(seed)
+    with app.app_context():
+        reset_benchmark_rows()
+        user_ids = _create_users(users)
+        burst = [(rng.choice(user_ids), round(rng.uniform(0.1, 5.0), 6), f"{BENCHMARK_PREFIX}sig-{i}")
+                 for i in range(deposits)]
+        expected = defaultdict(float)
+        for user_id, amount, _ in burst:
+            expected[user_id] += amount
+
+        credited = []
+        runners = []
+        for i in range(scanners):
+            order = list(burst)
+            rng.shuffle(order)  # scanners see the same deposits in different orders
+            runners.append(threading.Thread(target=_scan, args=(order, batch, single, credited)))
+        started = time.perf_counter()
+        for runner in runners:
+            runner.start()
+        for runner in runners:
+            runner.join()
+        seconds = time.perf_counter() - started
+
+        transactions = Transaction.__table__.c
+        recorded = db.session.execute(
+            select(func.count(), func.count(func.distinct(transactions.tx_hash)))
+            .where(transactions.tx_hash.like(f"{BENCHMARK_PREFIX}%"))).one()
+        balances = dict(db.session.execute(select(User.id, User.balance).where(User.id.in_(user_ids))).all())
+        wrong_balances = sum(1 for user_id in user_ids if abs(balances[user_id] - expected[user_id]) > 1e-6)
+        still_depositing = db.session.execute(
+            select(func.count()).where(User.id.in_(list(expected))).where(User.status == UserStatus.DEPOSITING)
+        ).scalar()
+        db.session.remove()
+        reset_benchmark_rows()
+
+    return {
+        'deposits': deposits,
+        'users': users,
+        'scanners': scanners,
+        'mode': 'single' if single else f"batch of {batch}",
+        'seconds': round(seconds, 3),
+        'deposits_per_second': round(deposits / seconds, 1) if seconds else None,
+        'credited': len(credited),
+        'duplicate_credits': len(credited) - len(set(credited)),
+        'recorded': recorded[0],
+        'distinct_recorded': recorded[1],
+        'wrong_balances': wrong_balances,
+        'still_depositing': still_depositing,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Burst deposit ingestion benchmark")
+    parser.add_argument('--deposits', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--scanners', type=int, default=4, help="concurrent scanners crediting every deposit")
+    parser.add_argument('--batch', type=int, default=100, help="deposits per credit_deposits() call")
+    parser.add_argument('--single', action='store_true', help="credit one deposit per call instead")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    result = run_benchmark(args.deposits, args.users, args.scanners, args.batch, args.single)
+    print(json.dumps(result, indent=2))
+    ok = result['credited'] == args.deposits and result['distinct_recorded'] == result['recorded'] == args.deposits
+    return 0 if ok and not result['wrong_balances'] else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
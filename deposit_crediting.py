@@ -0,0 +1,199 @@
+"""
+Deposit Crediting
+=================
+Idempotent, single-transaction crediting of on-chain deposits.
+
+A deposit is identified by its transaction signature, which is unique in
+transaction.tx_hash. Crediting it is one statement group in one
+transaction:
+
+    INSERT INTO transaction ... ON CONFLICT (tx_hash) DO NOTHING RETURNING
+    UPDATE user SET balance = balance + :amount, ... RETURNING balance
+    INSERT INTO balance_ledger_entry ...
+    UPDATE user SET status = ... (DEPOSITING users become ACTIVE)
+    UPDATE sender_wallet SET last_used = :now
+
+The balance is only touched when the INSERT actually returned a row, so
+running the same deposit twice, or from several scanners at once, credits
+it exactly once: a concurrent insert of the same signature waits on the
+unique index and then does nothing. There is no separate duplicate-check
+query, no ORM load of the user and no second commit for the wallet
+timestamp.
+
+credit_deposits() does the same for a batch (a whole scan) in one
+transaction: one multi-row INSERT ... RETURNING, then the bulk
+balance_ledger.apply_deltas() and one UPDATE per table for the deposits
+that were new. As with credit_deposit, only the wallet a deposit came from
+is touched when its sender address is known. Amounts for the same user are added up in SQL, so a burst
+of deposits to one account needs no read-modify-write.
+
+deposit_benchmark.py measures burst ingestion.
+"""
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, insert, literal, or_, tuple_, update
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from balance_ledger import apply_delta, apply_deltas
+from models import SenderWallet, Transaction, User, UserStatus
+
+logger = logging.getLogger(__name__)
+
+
+def _insert_new_deposits():
+    """INSERT into transaction that skips signatures already recorded, returning the new rows"""
+    table = Transaction.__table__
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+    return (dialect_insert(table)
+            .on_conflict_do_nothing(index_elements=['tx_hash'])
+            .returning(table.c.tx_hash, table.c.user_id, table.c.amount))
+
+
+def _deposit_row(user_id, amount, tx_signature, now):
+    return {'user_id': user_id, 'transaction_type': 'deposit', 'amount': amount, 'status': 'completed',
+            'tx_hash': tx_signature, 'timestamp': now, 'processed_at': now}
+
+
+def _activate_depositors():
+    """UPDATE that moves DEPOSITING users to ACTIVE and leaves other statuses alone"""
+    users = User.__table__.c
+    return update(User.__table__).values(
+        status=case((users.status == UserStatus.DEPOSITING, literal(UserStatus.ACTIVE, users.status.type)),
+                    else_=users.status))
+
+
+def credit_deposit(user_id: int, amount: float, tx_signature: str,
+                   sender_address: Optional[str] = None) -> Optional[Dict]:
+    """
+    Credit one deposit exactly once
+
+    Args:
+        user_id: database ID of the user
+        amount: SOL received
+        tx_signature: on-chain signature (the idempotency key)
+        sender_address: wallet the deposit came from; its last_used is
+            touched (every wallet of the user when not given)
+
+    Returns:
+        dict with the new 'balance' and the user's 'telegram_id', or None if
+        the signature was already credited
+
+    Raises:
+        LookupError: the user does not exist (nothing is written)
+    """
+    now = datetime.utcnow()
+    statement = _insert_new_deposits()
+    try:
+        if statement is not None:
+            inserted = db.session.execute(statement, _deposit_row(user_id, amount, tx_signature, now)).first()
+        else:
+            inserted = db.session.execute(
+                insert(Transaction.__table__).returning(Transaction.__table__.c.tx_hash),
+                _deposit_row(user_id, amount, tx_signature, now)).first()
+        if inserted is None:
+            db.session.rollback()
+            return None
+
+        balance = apply_delta(user_id, amount, 'deposit', reference=tx_signature, deposit=True, commit=False)
+        if balance is None:
+            db.session.rollback()
+            raise LookupError(f"User {user_id} not found for deposit {tx_signature}")
+        users = User.__table__.c
+        telegram_id = db.session.execute(
+            _activate_depositors().where(users.id == user_id).returning(users.telegram_id)).scalar()
+
+        wallets = SenderWallet.__table__.c
+        touch = update(SenderWallet.__table__).where(wallets.user_id == user_id).values(last_used=now)
+        if sender_address:
+            touch = touch.where(wallets.wallet_address == sender_address)
+        db.session.execute(touch)
+        db.session.commit()
+    except IntegrityError:
+        # Only reachable without ON CONFLICT support: another scanner recorded it first
+        db.session.rollback()
+        return None
+    except Exception:
+        db.session.rollback()
+        raise
+    return {'balance': balance, 'telegram_id': telegram_id}
+
+
+def credit_deposits(deposits: Iterable[Tuple]) -> List[Tuple[int, float, str]]:
+    """
+    Credit a batch of (user_id, amount, tx_signature[, sender_address]) deposits in one transaction
+
+    Deposits whose signature is already recorded (or repeated in the batch)
+    are skipped, as are deposits for users that do not exist. The sender
+    address, when given, picks the wallet whose last_used is touched, as in
+    credit_deposit.
+
+    Returns:
+        list: the (user_id, amount, tx_signature) deposits credited by this call
+    """
+    now = datetime.utcnow()
+    rows = {}
+    senders = {}
+    for user_id, amount, tx_signature, *sender in deposits:
+        if tx_signature not in rows:
+            rows[tx_signature] = _deposit_row(user_id, amount, tx_signature, now)
+            senders[tx_signature] = sender[0] if sender else None
+    if not rows:
+        return []
+
+    statement = _insert_new_deposits()
+    if statement is None:
+        credited = []
+        for row in rows.values():
+            try:
+                if credit_deposit(row['user_id'], row['amount'], row['tx_hash'],
+                                  senders[row['tx_hash']]) is not None:
+                    credited.append((row['user_id'], row['amount'], row['tx_hash']))
+            except LookupError as e:
+                logger.warning(str(e))
+        return credited
+
+    users = User.__table__.c
+    try:
+        existing_users = {user_id for (user_id,) in db.session.execute(
+            db.select(users.id).where(users.id.in_({row['user_id'] for row in rows.values()})))}
+        for row in rows.values():
+            if row['user_id'] not in existing_users:
+                logger.warning(f"User {row['user_id']} not found for deposit {row['tx_hash']}")
+        new_rows = [row for row in rows.values() if row['user_id'] in existing_users]
+        if not new_rows:
+            db.session.rollback()
+            return []
+
+        inserted = db.session.execute(statement, new_rows).all()
+        if not inserted:
+            db.session.rollback()
+            return []
+
+        credited_users = list(apply_deltas([(user_id, amount, tx_hash) for tx_hash, user_id, amount in inserted],
+                                           'deposit', deposit=True, commit=False))
+        db.session.execute(_activate_depositors().where(users.id.in_(credited_users)))
+        wallets = SenderWallet.__table__.c
+        from_wallets = {(user_id, senders[tx_hash]) for tx_hash, user_id, _ in inserted if senders[tx_hash]}
+        from_users = {user_id for tx_hash, user_id, _ in inserted if not senders[tx_hash]}
+        touched = []
+        if from_wallets:
+            touched.append(tuple_(wallets.user_id, wallets.wallet_address).in_(from_wallets))
+        if from_users:
+            touched.append(wallets.user_id.in_(from_users))
+        db.session.execute(update(SenderWallet.__table__).where(or_(*touched)).values(last_used=now))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    by_signature = {tx_hash: (user_id, amount, tx_hash) for tx_hash, user_id, amount in inserted}
+    return [by_signature[signature] for signature in rows if signature in by_signature]
@@ -88,13 +88,15 @@ def find_user(identifier, use_app_context=True):
     def _find_user():
         # Always use the app context to ensure correct database access
         with app.app_context():
-            # Try to find by telegram_id
+            from user_search import find_user as find_user_exact
+            
+            # Try to find by telegram_id, username or wallet address
             try:
-                user = User.query.filter_by(telegram_id=str(identifier)).first()
+                user = find_user_exact(str(identifier))
                 if user:
                     return user
             except Exception as e:
-                logger.error(f"Error finding user by telegram_id: {e}")
+                logger.error(f"Error finding user: {e}")
                 
             # Try to find by user ID (database ID)
             try:
@@ -104,14 +106,6 @@ def find_user(identifier, use_app_context=True):
                     return user
             except (ValueError, TypeError) as e:
                 logger.error(f"Error finding user by ID: {e}")
-                
-            # Try to find by username
-            if isinstance(identifier, str):
-                # Remove @ prefix if present
-                clean_username = identifier[1:] if identifier.startswith('@') else identifier
-                user = User.query.filter(func.lower(User.username) == func.lower(clean_username)).first()
-                if user:
-                    return user
                     
             return None
     
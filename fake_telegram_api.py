@@ -0,0 +1,325 @@
+#!/usr/bin/env python
+"""
+Fake Telegram Bot API Server
+============================
+Local stand-in for api.telegram.org used for load testing SimpleTelegramBot.
+Point the bot at it with TELEGRAM_API_BASE=http://127.0.0.1:<port>.
+
+Supported methods: getUpdates (long polling with offsets), sendMessage,
+editMessageText, answerCallbackQuery, sendDocument, sendPhoto,
+sendChatAction and deleteWebhook. Latency, 429 (rate limit) and 409
+(getUpdates conflict) responses can be injected to exercise back-off paths.
+
+Usage:
+    server = FakeTelegramServer(latency_ms=20, rate_limit_rate=0.01)
+    server.start()
+    server.enqueue_update({...})
+    ...
+    server.stop()
+
+Or standalone: python fake_telegram_api.py --port 8081 --latency-ms 20
+"""
+
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+logger = logging.getLogger(__name__)
+
+# Methods that count as a reply to a user (used for latency measurement)
+REPLY_METHODS = ('sendMessage', 'editMessageText', 'sendDocument', 'sendPhoto')
+
+# Methods subject to injected 429 responses
+RATE_LIMITED_METHODS = REPLY_METHODS + ('answerCallbackQuery',)
+
+
+class FakeTelegramServer:
+    """In-process fake of the Telegram Bot API"""
+
+    def __init__(self, host='127.0.0.1', port=0, latency_ms=0, latency_jitter_ms=0,
+                 rate_limit_rate=0.0, conflict_rate=0.0, seed=None):
+        self.host = host
+        self.port = port
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.rate_limit_rate = rate_limit_rate
+        self.conflict_rate = conflict_rate
+        self.random = random.Random(seed)
+
+        self.updates = deque()              # pending updates, ordered by update_id
+        self.next_update_id = 1
+        self.next_message_id = 1
+        self.condition = threading.Condition()
+
+        self.sent = defaultdict(list)       # chat_id -> [(timestamp, method, payload)]
+        self.reply_listeners = []           # callables(chat_id, method, payload, timestamp)
+        self.stats = defaultdict(int)       # "<method>:<status>" -> count
+        self.stats_lock = threading.Lock()
+        self.file_ids = set()               # file_ids handed out for uploaded photos/documents
+        self.uploads = 0                    # sendPhoto/sendDocument calls that carried a new file or URL
+
+        self.httpd = None
+        self.thread = None
+
+    # ------------------------------------------------------------------
+    # Update injection
+    # ------------------------------------------------------------------
+    def enqueue_update(self, update):
+        """Queue an update for delivery; assigns and returns its update_id"""
+        with self.condition:
+            update = dict(update)
+            update['update_id'] = self.next_update_id
+            self.next_update_id += 1
+            self.updates.append(update)
+            self.condition.notify_all()
+        return update['update_id']
+
+    def message_update(self, chat_id, text, username=None):
+        """Queue a text message from a private chat"""
+        user = {'id': chat_id, 'is_bot': False, 'first_name': f"User{chat_id}",
+                'username': username or f"user{chat_id}"}
+        return self.enqueue_update({
+            'message': {
+                'message_id': self._new_message_id(),
+                'from': user,
+                'chat': {'id': chat_id, 'type': 'private'},
+                'date': int(time.time()),
+                'text': text,
+            }
+        })
+
+    def callback_update(self, chat_id, data, message_id=None):
+        """Queue an inline keyboard tap"""
+        user = {'id': chat_id, 'is_bot': False, 'first_name': f"User{chat_id}",
+                'username': f"user{chat_id}"}
+        return self.enqueue_update({
+            'callback_query': {
+                'id': f"{chat_id}-{self.next_update_id}",
+                'from': user,
+                'message': {
+                    'message_id': message_id or self._new_message_id(),
+                    'chat': {'id': chat_id, 'type': 'private'},
+                    'date': int(time.time()),
+                },
+                'data': data,
+            }
+        })
+
+    def pending_count(self):
+        with self.condition:
+            return len(self.updates)
+
+    def _new_message_id(self):
+        with self.condition:
+            message_id = self.next_message_id
+            self.next_message_id += 1
+        return message_id
+
+    # ------------------------------------------------------------------
+    # Bot API methods
+    # ------------------------------------------------------------------
+    def get_updates(self, params):
+        offset = int(params.get('offset', 0) or 0)
+        limit = int(params.get('limit', 100) or 100)
+        timeout = float(params.get('timeout', 0) or 0)
+        deadline = time.time() + timeout
+
+        with self.condition:
+            # Confirm (drop) everything below the offset
+            while self.updates and offset > 0 and self.updates[0]['update_id'] < offset:
+                self.updates.popleft()
+            while not self.updates and time.time() < deadline:
+                self.condition.wait(deadline - time.time())
+                while self.updates and offset > 0 and self.updates[0]['update_id'] < offset:
+                    self.updates.popleft()
+            return list(self.updates)[:limit]
+
+    def delete_webhook(self, params):
+        if str(params.get('drop_pending_updates', '')).lower() in ('true', '1'):
+            with self.condition:
+                self.updates.clear()
+        return True
+
+    def record_reply(self, method, params):
+        chat_id = params.get('chat_id')
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            pass
+        timestamp = time.time()
+        self.sent[chat_id].append((timestamp, method, params))
+        for listener in list(self.reply_listeners):
+            listener(chat_id, method, params, timestamp)
+
+        message_id = params.get('message_id') or self._new_message_id()
+        message = {
+            'message_id': int(message_id),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'date': int(timestamp),
+            'text': params.get('text', ''),
+        }
+        if method == 'sendPhoto':
+            message['photo'] = [{'file_id': params['file_id'], 'width': 90, 'height': 90},
+                                {'file_id': params['file_id'], 'width': 320, 'height': 320}]
+        elif method == 'sendDocument':
+            message['document'] = {'file_id': params['file_id']}
+        return message
+
+    def resolve_file(self, method, params):
+        """Accept a known file_id, or register a new upload; returns False for an unknown file_id"""
+        field = 'photo' if method == 'sendPhoto' else 'document'
+        media = params.get(field)
+        if media and not str(media).startswith(('http://', 'https://')):
+            if media not in self.file_ids:
+                return False
+            params['file_id'] = media
+            return True
+        # Multipart file parts aren't parsed, so an absent field means an upload
+        with self.stats_lock:
+            self.uploads += 1
+            file_id = f"fake-file-{len(self.file_ids) + 1}"
+            self.file_ids.add(file_id)
+        params['file_id'] = file_id
+        return True
+
+    def dispatch(self, method, params):
+        """Return (status_code, body) for a Bot API call"""
+        if self.latency_ms or self.latency_jitter_ms:
+            delay = self.latency_ms + self.random.uniform(0, self.latency_jitter_ms)
+            time.sleep(delay / 1000.0)
+
+        if method == 'getUpdates' and self.conflict_rate and self.random.random() < self.conflict_rate:
+            return 409, {'ok': False, 'error_code': 409,
+                         'description': 'Conflict: terminated by other getUpdates request'}
+        if method in RATE_LIMITED_METHODS and self.rate_limit_rate and self.random.random() < self.rate_limit_rate:
+            return 429, {'ok': False, 'error_code': 429,
+                         'description': 'Too Many Requests: retry after 1',
+                         'parameters': {'retry_after': 1}}
+
+        if method == 'getUpdates':
+            return 200, {'ok': True, 'result': self.get_updates(params)}
+        if method == 'deleteWebhook':
+            return 200, {'ok': True, 'result': self.delete_webhook(params)}
+        if method in ('sendPhoto', 'sendDocument') and not self.resolve_file(method, params):
+            return 400, {'ok': False, 'error_code': 400,
+                         'description': 'Bad Request: wrong file identifier/HTTP URL specified'}
+        if method in REPLY_METHODS:
+            return 200, {'ok': True, 'result': self.record_reply(method, params)}
+        if method in ('answerCallbackQuery', 'sendChatAction'):
+            return 200, {'ok': True, 'result': True}
+        if method == 'getMe':
+            return 200, {'ok': True, 'result': {'id': 1, 'is_bot': True, 'username': 'fake_bot'}}
+        return 404, {'ok': False, 'error_code': 404, 'description': 'Not Found: method not found'}
+
+    def _count(self, method, status):
+        with self.stats_lock:
+            self.stats[f"{method}:{status}"] += 1
+
+    # ------------------------------------------------------------------
+    # HTTP plumbing
+    # ------------------------------------------------------------------
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _params(self):
+                parsed = urlparse(self.path)
+                params = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                content_type = self.headers.get('Content-Type', '')
+                if body and 'application/json' in content_type:
+                    params.update(json.loads(body.decode('utf-8')))
+                elif body and 'application/x-www-form-urlencoded' in content_type:
+                    params.update({k: v[-1] for k, v in parse_qs(body.decode('utf-8')).items()})
+                elif body and 'multipart/form-data' in content_type:
+                    params.update(_parse_multipart_fields(body, content_type))
+                return parsed.path, params
+
+            def _handle(self):
+                path, params = self._params()
+                method = path.rstrip('/').rsplit('/', 1)[-1]
+                status, payload = server.dispatch(method, params)
+                server._count(method, status)
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = _handle
+            do_POST = _handle
+
+            def log_message(self, format, *args):
+                return
+
+        return Handler
+
+    def start(self):
+        """Start serving in a background thread; returns the base URL"""
+        self.httpd = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        logger.info(f"Fake Telegram API listening on {self.base_url}")
+        return self.base_url
+
+    def stop(self):
+        if self.httpd:
+            with self.condition:
+                self.condition.notify_all()
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+
+def _parse_multipart_fields(body, content_type):
+    """Extract simple text fields from a multipart body (file parts are skipped)"""
+    boundary = content_type.split('boundary=')[-1].strip('"').encode('utf-8')
+    fields = {}
+    for part in body.split(b'--' + boundary):
+        header, _, value = part.partition(b'\r\n\r\n')
+        if b'filename=' in header or b'name="' not in header:
+            continue
+        name = header.split(b'name="', 1)[1].split(b'"', 1)[0].decode('utf-8')
+        fields[name] = value.rstrip(b'\r\n').decode('utf-8', errors='replace')
+    return fields
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local fake Telegram Bot API server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="fraction of sends answered with 429")
+    parser.add_argument('--conflict-rate', type=float, default=0.0, help="fraction of getUpdates answered with 409")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = FakeTelegramServer(args.host, args.port, args.latency_ms, args.jitter_ms,
+                                args.rate_limit_rate, args.conflict_rate)
+    server.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,7 @@ from telegram.ext import ContextTypes, ConversationHandler
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy import desc, func
 from app import db, app
+from balance_ledger import apply_delta
 from models import User, UserStatus, Transaction, Profit, ReferralCode, TradingCycle, CycleStatus
 from utils.roi_system import admin_start_new_cycle, admin_adjust_roi, admin_pause_cycle, admin_resume_cycle, get_cycle_history
 from config import ADMIN_USER_ID
@@ -665,7 +666,8 @@ async def admin_deny_withdrawal_callback(update: Update, context: ContextTypes.D
             withdrawal.notes = f"Denied by admin on {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')}"
             
             # Return the funds to the user's balance
-            user.balance += withdrawal.amount
+            apply_delta(user.id, withdrawal.amount, 'withdrawal_refund', reference=f"transaction:{withdrawal.id}",
+                        commit=False)
             
             db.session.commit()
             
@@ -1132,10 +1134,6 @@ async def admin_confirm_adjustment_callback(update: Update, context: ContextType
                 await query.edit_message_text(text="Error: User not found.")
                 return
             
-            # Update user balance
-            old_balance = user.balance
-            user.balance += amount
-            
             # Create transaction record
             transaction_type = 'admin_credit' if amount > 0 else 'admin_debit'
             new_transaction = Transaction()
@@ -1146,6 +1144,19 @@ async def admin_confirm_adjustment_callback(update: Update, context: ContextType
             new_transaction.notes = reason
             
             db.session.add(new_transaction)
+            db.session.flush()
+            
+            # Update user balance in SQL; as in balance_manager, a deduction
+            # only goes through while the balance still covers it
+            new_balance = apply_delta(user.id, amount, transaction_type,
+                                      reference=f"transaction:{new_transaction.id}",
+                                      floor=0.0 if amount < 0 else None, commit=False)
+            if new_balance is None:
+                db.session.rollback()
+                await query.edit_message_text(
+                    text=f"Error: Cannot deduct {abs(amount)} SOL - user only has {user.balance} SOL.")
+                return
+            old_balance = new_balance - amount
             db.session.commit()
             
             # Start auto trading if this is a positive balance adjustment
@@ -1161,7 +1172,7 @@ async def admin_confirm_adjustment_callback(update: Update, context: ContextType
                     logger.error(f"Failed to start auto trading history for user {user.id}: {trading_error}")
                     # Don't fail the balance adjustment process if auto trading fails
             
-            result_message = f"✅ Balance updated. New user balance: {user.balance:.2f} SOL ({old_balance:.2f} → {user.balance:.2f})."  
+            result_message = f"✅ Balance updated. New user balance: {new_balance:.2f} SOL ({old_balance:.2f} → {new_balance:.2f})."  
             
             # Balance adjustment notification removed as requested
             
@@ -1,6 +1,5 @@
 import logging
 import io
-import qrcode
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from sqlalchemy.exc import SQLAlchemyError
@@ -409,7 +408,8 @@ async def referral_qr_code_callback(update: Update, context: ContextTypes.DEFAUL
             bot_username = context.bot.username or "thrivesolanabot"
             referral_link = f"https://t.me/{bot_username}?start=ref_{user.id}"
             
-            # Generate QR code
+            # Generate QR code (qrcode/PIL are only loaded when a QR is requested)
+            import qrcode
             qr = qrcode.QRCode(
                 version=1,
                 error_correction=qrcode.constants.ERROR_CORRECT_L,
@@ -0,0 +1,436 @@
+"""
+Job Queue
+=========
+Durable background job queue on the background_job table.
+
+Producers call enqueue(); any number of worker processes run JobWorker,
+which claims due jobs with SELECT ... FOR UPDATE SKIP LOCKED so workers
+never wait on, or double-claim, each other's rows. Jobs carry a priority,
+are retried with exponential backoff up to max_attempts, can be
+deduplicated with a dedup_key while pending, and every queue has a
+cluster-wide concurrency limit. SQLite (tests) does not render FOR UPDATE;
+its single writer serializes claims instead.
+
+Task handlers are registered with @register_task (see background_tasks.py)
+and receive the job payload as keyword arguments.
+
+Usage:
+    python job_queue.py                       # run a worker for every queue
+    python job_queue.py --queues settlement   # only some queues
+"""
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import zlib
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, delete, func, insert, select, text, update
+
+from app import app, db
+from metrics_registry import JOB_DURATION, JOBS_PROCESSED
+from models import BackgroundJob
+
+logger = logging.getLogger(__name__)
+
+# Cluster-wide number of jobs allowed to run at once, per queue
+QUEUE_CONCURRENCY = {
+    'settlement': 4,
+    'notifications': 8,
+    'deposits': 1,
+    'maintenance': 1,
+    'default': 4,
+}
+
+# Retry delay is RETRY_BASE_SECONDS * 2^(attempt-1), capped, with ±20% jitter
+RETRY_BASE_SECONDS = 5
+RETRY_MAX_SECONDS = 3600
+
+# A running job not finished within this many seconds is assumed lost and requeued
+VISIBILITY_TIMEOUT_SECONDS = 900
+
+# Finished jobs kept for inspection before purge_finished_jobs() removes them
+FINISHED_RETENTION_DAYS = 7
+
+PENDING_STATUSES = ('queued', 'running')
+
+# Must match the predicate of idx_background_job_pending_dedup for ON CONFLICT to use it
+PENDING_PREDICATE = "status IN ('queued', 'running')"
+
+TaskSpec = namedtuple('TaskSpec', ['func', 'queue', 'max_attempts'])
+ClaimedJob = namedtuple('ClaimedJob', ['id', 'queue', 'task', 'payload', 'attempts', 'max_attempts'])
+
+_tasks = {}
+
+
+def register_task(name, queue='default', max_attempts=5):
+    """Decorator registering `func(**payload)` as the handler for task `name`"""
+    def decorator(func):
+        _tasks[name] = TaskSpec(func, queue, max_attempts)
+        return func
+    return decorator
+
+
+def _queue_lock_key(queue):
+    return zlib.crc32(f"job_queue:{queue}".encode('utf-8'))
+
+
+def _job_row(task, payload=None, priority=0, dedup_key=None, delay=0, queue=None, max_attempts=None):
+    spec = _tasks.get(task)
+    now = datetime.utcnow()
+    return {
+        'queue': queue or (spec.queue if spec else 'default'),
+        'task': task,
+        'payload': json.dumps(payload or {}, default=str),
+        'priority': priority,
+        'status': 'queued',
+        'attempts': 0,
+        'max_attempts': max_attempts or (spec.max_attempts if spec else 5),
+        'dedup_key': dedup_key,
+        'run_at': now + timedelta(seconds=delay),
+        'created_at': now,
+    }
+
+
+def _insert_skipping_pending_duplicates():
+    """INSERT that silently skips rows whose dedup_key matches a queued/running job"""
+    table = BackgroundJob.__table__
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return insert(table)
+    return dialect_insert(table).on_conflict_do_nothing(
+        index_elements=['dedup_key'], index_where=text(PENDING_PREDICATE))
+
+
+def enqueue(task, payload=None, priority=0, dedup_key=None, delay=0, queue=None, max_attempts=None, commit=True):
+    """
+    Add one job to the queue
+
+    Args:
+        task: registered task name
+        payload: dict passed to the handler as keyword arguments (JSON-serialised)
+        priority: higher values are claimed first
+        dedup_key: skip the enqueue while a queued/running job has the same key
+        delay: seconds before the job becomes claimable
+        queue: overrides the task's registered queue
+        commit: commit the session; pass False to enqueue atomically with the caller's own changes
+
+    Returns:
+        int: the new job id, or None when deduplicated
+    """
+    row = _job_row(task, payload, priority, dedup_key, delay, queue, max_attempts)
+    job_id = db.session.execute(
+        _insert_skipping_pending_duplicates().values(**row).returning(BackgroundJob.__table__.c.id)
+    ).scalar()
+    if commit:
+        db.session.commit()
+    if job_id is None:
+        logger.debug(f"Skipped {task}: a job with dedup key {dedup_key} is already pending")
+    return job_id
+
+
+def enqueue_many(jobs, commit=True):
+    """Bulk enqueue; `jobs` is a list of enqueue() keyword dicts. Returns the number submitted."""
+    rows = [_job_row(**job) for job in jobs]
+    if rows:
+        db.session.execute(_insert_skipping_pending_duplicates(), rows)
+        if commit:
+            db.session.commit()
+    return len(rows)
+
+
+def claim_jobs(queue, worker_id, limit, concurrency=None):
+    """
+    Atomically claim up to `limit` due jobs from `queue` for `worker_id`
+
+    With `concurrency`, claims never push the queue's running jobs past that
+    number across all workers (PostgreSQL serialises these claims per queue
+    with a transaction-scoped advisory lock).
+    """
+    table = BackgroundJob.__table__
+    jobs = table.c
+    now = datetime.utcnow()
+    with db.engine.begin() as connection:
+        if concurrency is not None:
+            if connection.dialect.name == 'postgresql':
+                connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': _queue_lock_key(queue)})
+            running = connection.execute(
+                select(func.count()).select_from(table).where(jobs.queue == queue, jobs.status == 'running')
+            ).scalar()
+            limit = min(limit, concurrency - running)
+        if limit <= 0:
+            return []
+
+        due = (
+            select(jobs.id)
+            .where(jobs.queue == queue, jobs.status == 'queued', jobs.run_at <= now)
+            .order_by(jobs.priority.desc(), jobs.run_at, jobs.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        rows = connection.execute(
+            update(table)
+            .where(jobs.id.in_(due.scalar_subquery()), jobs.status == 'queued')
+            .values(status='running', locked_by=worker_id, locked_at=now, attempts=jobs.attempts + 1)
+            .returning(jobs.id, jobs.task, jobs.payload, jobs.attempts, jobs.max_attempts)
+        ).all()
+    return [ClaimedJob(row.id, queue, row.task, row.payload, row.attempts, row.max_attempts) for row in rows]
+
+
+def retry_delay(attempts):
+    """Backoff before retry number `attempts` (1-based)"""
+    delay = min(RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0), RETRY_MAX_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def complete_jobs(job_ids, worker_id):
+    """Mark jobs done in one statement (workers batch their completions per poll)"""
+    if not job_ids:
+        return
+    table = BackgroundJob.__table__
+    with db.engine.begin() as connection:
+        connection.execute(
+            update(table)
+            .where(table.c.id.in_(job_ids), table.c.status == 'running', table.c.locked_by == worker_id)
+            .values(status='done', finished_at=datetime.utcnow(), last_error=None)
+        )
+
+
+def fail_job(job, worker_id, error):
+    """Schedule a retry with backoff, or mark the job failed once attempts are exhausted"""
+    table = BackgroundJob.__table__
+    now = datetime.utcnow()
+    exhausted = job.attempts >= job.max_attempts
+    values = dict(status='failed', finished_at=now) if exhausted else dict(
+        status='queued', run_at=now + timedelta(seconds=retry_delay(job.attempts)), locked_by=None)
+    with db.engine.begin() as connection:
+        connection.execute(
+            update(table)
+            .where(table.c.id == job.id, table.c.status == 'running', table.c.locked_by == worker_id)
+            .values(last_error=str(error)[:2000], **values)
+        )
+    return not exhausted
+
+
+def requeue_stale_jobs(timeout=VISIBILITY_TIMEOUT_SECONDS):
+    """Return jobs whose worker vanished mid-run to the queue (or fail them if out of attempts)"""
+    table = BackgroundJob.__table__
+    jobs = table.c
+    now = datetime.utcnow()
+    with db.engine.begin() as connection:
+        result = connection.execute(
+            update(table)
+            .where(jobs.status == 'running', jobs.locked_at < now - timedelta(seconds=timeout))
+            .values(
+                status=case((jobs.attempts >= jobs.max_attempts, 'failed'), else_='queued'),
+                finished_at=case((jobs.attempts >= jobs.max_attempts, now), else_=None),
+                run_at=now,
+                locked_by=None,
+                last_error='Worker did not finish the job within the visibility timeout',
+            )
+        )
+    if result.rowcount:
+        logger.warning(f"Requeued {result.rowcount} stale background jobs")
+    return result.rowcount
+
+
+def purge_finished_jobs(days=FINISHED_RETENTION_DAYS):
+    """Delete done/failed jobs finished more than `days` ago"""
+    table = BackgroundJob.__table__
+    with db.engine.begin() as connection:
+        result = connection.execute(
+            delete(table).where(table.c.status.in_(('done', 'failed')),
+                                table.c.finished_at < datetime.utcnow() - timedelta(days=days))
+        )
+    return result.rowcount
+
+
+def queue_depths():
+    """{(queue, status): count} for pending jobs, for dashboards and health checks"""
+    table = BackgroundJob.__table__
+    with db.engine.connect() as connection:
+        rows = connection.execute(
+            select(table.c.queue, table.c.status, func.count())
+            .where(table.c.status.in_(PENDING_STATUSES))
+            .group_by(table.c.queue, table.c.status)
+        ).all()
+    return {(queue, status): count for queue, status, count in rows}
+
+
+class JobWorker:
+    """Claims and runs jobs from a set of queues on a local thread pool"""
+
+    def __init__(self, queues=None, worker_id=None, threads_per_queue=None, poll_interval=1.0,
+                 reap_interval=60.0):
+        import background_tasks  # noqa: F401  (registers the task handlers)
+
+        self.queues = list(queues or QUEUE_CONCURRENCY)
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{id(self):x}"
+        self.slots = {queue: threads_per_queue or QUEUE_CONCURRENCY.get(queue, 1) for queue in self.queues}
+        self.poll_interval = poll_interval
+        self.reap_interval = reap_interval
+        self._in_flight = {queue: 0 for queue in self.queues}
+        self._completed = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=sum(self.slots.values()),
+                                            thread_name_prefix='job-worker')
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._last_reap = 0.0
+
+    def flush_completions(self):
+        """Record finished jobs as done; one UPDATE for everything finished since the last poll"""
+        with self._lock:
+            completed, self._completed = self._completed, []
+        try:
+            complete_jobs(completed, self.worker_id)
+        except Exception:
+            with self._lock:
+                self._completed.extend(completed)
+            raise
+
+    def run_once(self):
+        """Claim whatever the free local slots allow; returns the number of jobs claimed"""
+        self.flush_completions()
+        claimed = 0
+        for queue in self.queues:
+            with self._lock:
+                free = self.slots[queue] - self._in_flight[queue]
+            if free <= 0:
+                continue
+            for job in claim_jobs(queue, self.worker_id, free, QUEUE_CONCURRENCY.get(queue)):
+                with self._lock:
+                    self._in_flight[queue] += 1
+                self._executor.submit(self._execute, job)
+                claimed += 1
+        return claimed
+
+    def _execute(self, job):
+        started = time.perf_counter()
+        with app.app_context():
+            try:
+                try:
+                    spec = _tasks.get(job.task)
+                    if spec is None:
+                        raise LookupError(f"No handler registered for task {job.task}")
+                    spec.func(**json.loads(job.payload or '{}'))
+                finally:
+                    db.session.remove()
+                with self._lock:
+                    self._completed.append(job.id)
+                JOBS_PROCESSED.labels(job.queue, 'done').inc()
+            except Exception as e:
+                retrying = fail_job(job, self.worker_id, repr(e))
+                JOBS_PROCESSED.labels(job.queue, 'retry' if retrying else 'failed').inc()
+                logger.error(f"Job {job.id} ({job.task}) attempt {job.attempts}/{job.max_attempts} failed: {e}")
+            finally:
+                JOB_DURATION.labels(job.queue).observe(time.perf_counter() - started)
+                with self._lock:
+                    self._in_flight[job.queue] -= 1
+
+    def in_flight(self):
+        with self._lock:
+            return sum(self._in_flight.values())
+
+    def run(self):
+        """Poll until stop() is called (blocking)"""
+        logger.info(f"Job worker {self.worker_id} serving queues {', '.join(self.queues)}")
+        with app.app_context():
+            self._poll()
+
+    def _poll(self):
+        while not self._stop_event.is_set():
+            try:
+                if time.monotonic() - self._last_reap >= self.reap_interval:
+                    self._last_reap = time.monotonic()
+                    requeue_stale_jobs()
+                claimed = self.run_once()
+            except Exception as e:
+                logger.error(f"Job worker poll failed: {e}")
+                claimed = 0
+            if not claimed:
+                self._stop_event.wait(self.poll_interval)
+
+    def drain(self, timeout=60.0):
+        """Run until no due job is left and nothing is in flight; returns False on timeout"""
+        deadline = time.monotonic() + timeout
+        with app.app_context():
+            while time.monotonic() < deadline:
+                claimed = self.run_once()
+                if not claimed and not self.in_flight() and not self._has_due_jobs():
+                    self.flush_completions()
+                    return True
+                if not claimed:
+                    time.sleep(0.01)
+        return False
+
+    def _has_due_jobs(self):
+        table = BackgroundJob.__table__
+        with db.engine.connect() as connection:
+            return connection.execute(
+                select(table.c.id)
+                .where(table.c.queue.in_(self.queues), table.c.status == 'queued',
+                       table.c.run_at <= datetime.utcnow())
+                .limit(1)
+            ).first() is not None
+
+    def start(self):
+        """Poll in a daemon thread"""
+        if self._thread and self._thread.is_alive():
+            return False
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self.run, name='job-worker-poll', daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self, wait=True):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+        self._executor.shutdown(wait=wait)
+        try:
+            with app.app_context():
+                self.flush_completions()
+        except Exception as e:
+            logger.error(f"Could not record completed jobs on shutdown: {e}")
+
+
+# Global worker for this process
+_job_worker = None
+
+
+def start_job_worker(queues=None):
+    """Start (once) the process-wide job worker"""
+    global _job_worker
+    if _job_worker is None:
+        _job_worker = JobWorker(queues)
+    _job_worker.start()
+    return _job_worker
+
+
+if __name__ == '__main__':
+    import argparse
+    import signal
+
+    parser = argparse.ArgumentParser(description="Run a background job worker")
+    parser.add_argument('--queues', help="comma-separated queues (default: all)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    worker = JobWorker(args.queues.split(',') if args.queues else None)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        worker.stop()
@@ -0,0 +1,136 @@
+"""
+Job Queue Benchmark
+===================
+Measures background job throughput. N no-op jobs are bulk-enqueued and then
+drained by W workers (threads in this process, or separate processes with
+--processes). Afterwards every job is checked to have run exactly once.
+
+Usage:
+    python job_queue_benchmark.py --jobs 5000 --workers 4
+    python job_queue_benchmark.py --jobs 5000 --workers 4 --processes --work-ms 5
+"""
+import argparse
+import collections
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+
+from sqlalchemy import delete, func, select
+
+from app import app, db
+from job_queue import JobWorker, enqueue_many, register_task
+from models import BackgroundJob
+
+logger = logging.getLogger(__name__)
+
+# Not in QUEUE_CONCURRENCY, so claims take the plain SKIP LOCKED path with no cluster cap
+BENCHMARK_QUEUE = 'benchmark'
+
+_executions = collections.Counter()
+_executions_lock = threading.Lock()
+
+
+@register_task('benchmark.noop', queue=BENCHMARK_QUEUE)
+def noop_job(n, work_ms=0):
+    if work_ms:
+        time.sleep(work_ms / 1000.0)
+    with _executions_lock:
+        _executions[n] += 1
+
+
+def reset_benchmark_jobs():
+    table = BackgroundJob.__table__
+    with db.engine.begin() as connection:
+        connection.execute(delete(table).where(table.c.queue == BENCHMARK_QUEUE))
+
+
+def _drain_in_process(threads, timeout):
+    """Worker process entry point: fresh connections, drain, exit"""
+    with app.app_context():
+        db.engine.dispose(close=False)
+    worker = JobWorker([BENCHMARK_QUEUE], worker_id=f"bench-{os.getpid()}", threads_per_queue=threads)
+    try:
+        worker.drain(timeout)
+    finally:
+        worker.stop()
+
+
+def run_benchmark(jobs=2000, workers=4, threads=4, processes=False, work_ms=0, timeout=300):
+    """
+    Enqueue `jobs` no-op jobs and drain them with `workers` workers of `threads` threads each
+
+    Returns:
+        dict: throughput figures plus exactly-once checks
+    """
+    with app.app_context():
+        reset_benchmark_jobs()
+        _executions.clear()
+
+        started = time.perf_counter()
+        enqueue_many([{'task': 'benchmark.noop', 'payload': {'n': i, 'work_ms': work_ms}, 'priority': i % 3}
+                      for i in range(jobs)])
+        enqueue_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        if processes:
+            context = multiprocessing.get_context('fork')
+            runners = [context.Process(target=_drain_in_process, args=(threads, timeout)) for _ in range(workers)]
+        else:
+            pool = [JobWorker([BENCHMARK_QUEUE], worker_id=f"bench-thread-{i}", threads_per_queue=threads)
+                    for i in range(workers)]
+            runners = [threading.Thread(target=worker.drain, args=(timeout,)) for worker in pool]
+        for runner in runners:
+            runner.start()
+        for runner in runners:
+            runner.join()
+        drain_seconds = time.perf_counter() - started
+        if not processes:
+            for worker in pool:
+                worker.stop()
+
+        table = BackgroundJob.__table__
+        with db.engine.connect() as connection:
+            by_status = {status: (count, max_attempts) for status, count, max_attempts in connection.execute(
+                select(table.c.status, func.count(), func.max(table.c.attempts))
+                .where(table.c.queue == BENCHMARK_QUEUE)
+                .group_by(table.c.status)
+            )}
+        reset_benchmark_jobs()
+
+    done, max_attempts = by_status.get('done', (0, 0))
+    return {
+        'jobs': jobs,
+        'workers': workers,
+        'threads_per_worker': threads,
+        'mode': 'processes' if processes else 'threads',
+        'enqueue_per_second': round(jobs / enqueue_seconds, 1) if enqueue_seconds else None,
+        'processed_per_second': round(done / drain_seconds, 1) if drain_seconds else None,
+        'drain_seconds': round(drain_seconds, 3),
+        'done': done,
+        'not_done': {status: count for status, (count, _) in by_status.items() if status != 'done'},
+        'max_attempts': max_attempts,
+        # Handler invocations are only visible in-process
+        'duplicate_executions': None if processes else sum(count - 1 for count in _executions.values()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Background job queue throughput benchmark")
+    parser.add_argument('--jobs', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4, help="executor threads per worker")
+    parser.add_argument('--processes', action='store_true', help="run each worker in its own process")
+    parser.add_argument('--work-ms', type=float, default=0, help="simulated work per job")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    result = run_benchmark(args.jobs, args.workers, args.threads, args.processes, args.work_ms)
+    print(json.dumps(result, indent=2))
+    return 0 if result['done'] == args.jobs else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
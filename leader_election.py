@@ -0,0 +1,296 @@
+"""
+Leader Election
+===============
+Database-backed leader election so several bot nodes can run side by side.
+
+Exactly one node (the leader) owns Telegram getUpdates polling and the
+singleton background jobs (deposit scan, maintenance, revaluation); every
+other node runs as a worker on standby and takes over when the leader goes
+away.
+
+On PostgreSQL leadership is a session-level advisory lock held on a
+dedicated connection, so a crashed leader loses it as soon as its
+connection drops. The leader also renews a leader_lease row every few
+seconds; a standby that sees the lease lapse while the lock is still held
+terminates the hung leader's session to free it. Other databases (SQLite in
+tests) use the lease row alone, so failover there takes one lease period.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, insert, or_, select, text, update
+from sqlalchemy.exc import IntegrityError
+
+from app import app, db
+from metrics_registry import LEADER_STATUS
+from models import LeaderLease
+
+logger = logging.getLogger(__name__)
+
+# Seconds a lease stays valid without renewal; bounds failover for a hung leader
+LEASE_SECONDS = float(os.environ.get('LEADER_LEASE_SECONDS', '15'))
+
+# Role owning Telegram polling and the singleton jobs
+BOT_ROLE = 'bot'
+
+
+def default_node_id():
+    """host:pid, unique per running bot process"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def advisory_lock_key(name):
+    """Stable key for pg_try_advisory_lock (fits in the low 32 bits of the bigint key)"""
+    return zlib.crc32(f"leader:{name}".encode('utf-8'))
+
+
+class LeaderElector:
+    """Campaigns for one named role and reports leadership changes to callbacks"""
+
+    def __init__(self, name=BOT_ROLE, node_id=None, lease_seconds=LEASE_SECONDS, engine=None):
+        self.name = name
+        self.node_id = node_id or default_node_id()
+        self.lease_seconds = lease_seconds
+        # Renew three times per lease; standbys campaign at the same pace
+        self.renew_interval = max(lease_seconds / 3.0, 0.05)
+        self.is_leader = False
+        self._engine = engine
+        self._lock_connection = None
+        self._last_renewed = None
+        self._elected_callbacks = []
+        self._demoted_callbacks = []
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            with app.app_context():
+                self._engine = db.engine
+        return self._engine
+
+    @property
+    def uses_advisory_lock(self):
+        return self.engine.dialect.name == 'postgresql'
+
+    def on_elected(self, callback):
+        """Call `callback()` whenever this node becomes the leader"""
+        self._elected_callbacks.append(callback)
+
+    def on_demoted(self, callback):
+        """Call `callback()` whenever this node stops being the leader"""
+        self._demoted_callbacks.append(callback)
+
+    # ------------------------------------------------------------------
+    # Lease row
+    # ------------------------------------------------------------------
+    def _claim_lease(self, backend_pid=None, force=False):
+        """Take the lease if it is free, expired or already ours (or unconditionally with force)"""
+        lease = LeaderLease.__table__
+        now = datetime.utcnow()
+        values = dict(holder=self.node_id, backend_pid=backend_pid, acquired_at=now, renewed_at=now,
+                      expires_at=now + timedelta(seconds=self.lease_seconds))
+        conditions = [lease.c.name == self.name]
+        if not force:
+            conditions.append(or_(lease.c.holder == self.node_id, lease.c.expires_at < now))
+        try:
+            with self.engine.begin() as connection:
+                if connection.execute(update(lease).where(*conditions).values(**values)).rowcount:
+                    return True
+                connection.execute(insert(lease).values(name=self.name, **values))
+            return True
+        except IntegrityError:
+            # Another node holds an unexpired lease (or inserted the row first)
+            return False
+
+    def _renew_lease(self):
+        lease = LeaderLease.__table__
+        now = datetime.utcnow()
+        with self.engine.begin() as connection:
+            renewed = connection.execute(
+                update(lease)
+                .where(lease.c.name == self.name, lease.c.holder == self.node_id)
+                .values(renewed_at=now, expires_at=now + timedelta(seconds=self.lease_seconds))
+            ).rowcount
+        return renewed == 1
+
+    def _drop_lease(self):
+        lease = LeaderLease.__table__
+        with self.engine.begin() as connection:
+            connection.execute(delete(lease).where(lease.c.name == self.name, lease.c.holder == self.node_id))
+
+    def current_lease(self):
+        """The lease row for this role as a mapping, or None"""
+        lease = LeaderLease.__table__
+        with self.engine.connect() as connection:
+            row = connection.execute(select(lease).where(lease.c.name == self.name)).mappings().first()
+        return dict(row) if row else None
+
+    # ------------------------------------------------------------------
+    # PostgreSQL advisory lock
+    # ------------------------------------------------------------------
+    def _try_advisory_lock(self):
+        """Return this session's backend pid if the lock was taken, else None"""
+        connection = self.engine.connect().execution_options(isolation_level='AUTOCOMMIT')
+        try:
+            acquired = connection.execute(text("SELECT pg_try_advisory_lock(:key)"),
+                                          {'key': advisory_lock_key(self.name)}).scalar()
+            backend_pid = connection.execute(text("SELECT pg_backend_pid()")).scalar() if acquired else None
+        except Exception:
+            connection.close()
+            raise
+        if not acquired:
+            connection.close()
+            return None
+        self._lock_connection = connection
+        return backend_pid
+
+    def _release_advisory_lock(self):
+        connection, self._lock_connection = self._lock_connection, None
+        if connection is None:
+            return
+        try:
+            connection.execute(text("SELECT pg_advisory_unlock(:key)"), {'key': advisory_lock_key(self.name)})
+        except Exception as e:
+            logger.debug(f"Advisory unlock failed, dropping the session instead: {e}")
+        finally:
+            # Never hand a session that may still hold the lock back to the pool
+            connection.invalidate()
+            connection.close()
+
+    def _fence_expired_leader(self):
+        """Terminate the lock holder's session once its lease has lapsed (a hung leader)"""
+        lease = self.current_lease()
+        if not lease or not lease['backend_pid'] or lease['expires_at'] >= datetime.utcnow():
+            return
+        with self.engine.begin() as connection:
+            holder_pid = connection.execute(text(
+                "SELECT pid FROM pg_locks WHERE locktype = 'advisory' AND classid = 0 "
+                "AND objid = :key AND objsubid = 1 AND granted"
+            ), {'key': advisory_lock_key(self.name)}).scalar()
+            # Only fence the session the stale lease names; a different holder is a
+            # fresh leader that has not written its lease yet
+            if holder_pid is not None and holder_pid == lease['backend_pid']:
+                logger.warning(f"Leader {lease['holder']} stopped renewing its '{self.name}' lease; "
+                               f"terminating its session {holder_pid}")
+                connection.execute(text("SELECT pg_terminate_backend(:pid)"), {'pid': holder_pid})
+
+    # ------------------------------------------------------------------
+    # Election
+    # ------------------------------------------------------------------
+    def try_acquire(self):
+        """Try to become the leader; returns True on success"""
+        if self.uses_advisory_lock:
+            backend_pid = self._try_advisory_lock()
+            if backend_pid is None:
+                self._fence_expired_leader()
+                return False
+            # Holding the lock makes us the only possible leader, so overwrite any stale lease
+            if not self._claim_lease(backend_pid, force=True):
+                self._release_advisory_lock()
+                return False
+        elif not self._claim_lease():
+            return False
+        self._last_renewed = time.monotonic()
+        return True
+
+    def renew(self):
+        """Extend the lease; returns False when leadership has been lost"""
+        # Paused for longer than a lease (GC, suspended VM): another node may have taken over
+        if self._last_renewed is None or time.monotonic() - self._last_renewed > self.lease_seconds:
+            return False
+        if self._lock_connection is not None:
+            self._lock_connection.execute(text("SELECT 1"))
+        if not self._renew_lease():
+            return False
+        self._last_renewed = time.monotonic()
+        return True
+
+    def release(self):
+        """Give up the role immediately so a standby can take over on its next round"""
+        try:
+            self._drop_lease()
+        except Exception as e:
+            logger.warning(f"Could not drop '{self.name}' lease: {e}")
+        self._release_advisory_lock()
+
+    def step(self):
+        """Run one election round; returns whether this node is now the leader"""
+        try:
+            holds = self.renew() if self.is_leader else self.try_acquire()
+        except Exception as e:
+            logger.error(f"Leader election round for '{self.name}' failed: {e}")
+            holds = False
+
+        if holds and not self.is_leader:
+            logger.info(f"Node {self.node_id} elected leader for '{self.name}'")
+            self._transition(True)
+        elif not holds:
+            if self.is_leader:
+                logger.warning(f"Node {self.node_id} lost leadership for '{self.name}'")
+                self.release()
+                self._transition(False)
+            elif self._lock_connection is not None:
+                self._release_advisory_lock()
+        return self.is_leader
+
+    def resign(self):
+        """Step down gracefully, running the demotion callbacks"""
+        if self.is_leader:
+            logger.info(f"Node {self.node_id} resigning leadership for '{self.name}'")
+            self.release()
+            self._transition(False)
+
+    def _transition(self, leader):
+        self.is_leader = leader
+        LEADER_STATUS.labels(self.name).set(1 if leader else 0)
+        for callback in (self._elected_callbacks if leader else self._demoted_callbacks):
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Leadership callback {getattr(callback, '__name__', callback)} failed: {e}")
+
+    def run(self):
+        """Campaign until stop() is called, then resign (blocking)"""
+        self._stop_event.clear()
+        LEADER_STATUS.labels(self.name).set(0)
+        while not self._stop_event.is_set():
+            self.step()
+            self._stop_event.wait(self.renew_interval)
+        self.resign()
+
+    def start(self):
+        """Campaign in a daemon thread"""
+        if self._thread and self._thread.is_alive():
+            return False
+        self._thread = threading.Thread(target=self.run, name=f"leader-{self.name}", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self, timeout=10):
+        """Stop campaigning; the leader resigns so failover does not wait for lease expiry"""
+        self._stop_event.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=timeout)
+
+
+# Global elector for the bot role
+_leader_elector = None
+
+
+def get_leader_elector():
+    """Get or create the elector for the bot role"""
+    global _leader_elector
+    if _leader_elector is None:
+        _leader_elector = LeaderElector()
+    return _leader_elector
+
+
+def is_leader():
+    """True when this process currently owns polling and the singleton jobs"""
+    return _leader_elector is not None and _leader_elector.is_leader
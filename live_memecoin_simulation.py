@@ -6,12 +6,12 @@ import os
 import json
 import random
 import logging
-import requests
 import time
 from datetime import datetime, timedelta
 from sqlalchemy import func
 from app import app, db
 from models import User, Transaction, Profit
+from utils.memecoin_feed import get_memecoin_feed
 
 # Configure logging
 logging.basicConfig(
@@ -44,13 +44,6 @@ MAX_LOSS_PERCENT = 0.15  # 15% maximum loss
 # Chance of a profitable trade (0.0 to 1.0)
 PROFIT_CHANCE = 0.75  # 75% chance of profit
 
-# Memecoin data sources
-PUMP_FUN_API = "https://api.pump.fun/memecoins/newest"
-BIRDEYE_API = "https://public-api.birdeye.so/public/tokenlist"
-BIRDEYE_HEADERS = {
-    "x-api-key": "5d769ab4e8c54786af47f06b1ca8d9f3"
-}
-
 def find_user_by_username(username):
     """Find a user by their Telegram username"""
     with app.app_context():
@@ -63,74 +56,26 @@ def find_user_by_username(username):
         return user
 
 def fetch_recent_memecoins():
-    """Fetch recent memecoin data from pump.fun or fallback to birdeye"""
-    try:
-        # Attempt to fetch from pump.fun
-        response = requests.get(PUMP_FUN_API, timeout=10)
-        if response.status_code == 200:
-            logger.info("Successfully fetched data from pump.fun")
-            data = response.json()
-            
-            # Process and return the token data
-            tokens = []
-            for token in data[:50]:  # Get top 50 tokens
-                try:
-                    # Extract key data
-                    token_data = {
-                        'symbol': token.get('symbol', 'UNKNOWN'),
-                        'name': token.get('name', 'Unknown Memecoin'),
-                        'address': token.get('mint', ''),
-                        'price': float(token.get('price', 0)) if token.get('price') else random.uniform(0.00001, 0.1),
-                        'market_cap': float(token.get('marketCap', 0)) if token.get('marketCap') else random.uniform(10000, 1000000),
-                        'volume_24h': float(token.get('volume24h', 0)) if token.get('volume24h') else random.uniform(1000, 100000),
-                        'image': token.get('image', ''),
-                        'source': 'pump.fun'
-                    }
-                    tokens.append(token_data)
-                except Exception as e:
-                    logger.error(f"Error processing token from pump.fun: {e}")
-                    continue
-            
-            # If we got tokens, return them
-            if tokens:
-                return tokens
+    """Recent memecoins from the shared feed (pump.fun, then birdeye), or fallback data"""
+    feed = get_memecoin_feed()
+    if not feed.tokens():
+        # One-off run: fill the buffer now instead of waiting for the background thread
+        feed.refresh()
     
-    except Exception as e:
-        logger.warning(f"Error fetching from pump.fun: {e}")
-    
-    # Fallback to Birdeye API
-    try:
-        response = requests.get(BIRDEYE_API, headers=BIRDEYE_HEADERS, timeout=10)
-        if response.status_code == 200:
-            logger.info("Successfully fetched data from Birdeye (fallback)")
-            data = response.json()
-            
-            # Process and return the token data
-            tokens = []
-            for token in data.get('data', [])[:50]:  # Get top 50 tokens
-                try:
-                    if 'memecoin' in token.get('tags', []).lower() or random.random() < 0.3:  # Only memecoin tokens or 30% chance
-                        token_data = {
-                            'symbol': token.get('symbol', 'UNKNOWN'),
-                            'name': token.get('name', 'Unknown Token'),
-                            'address': token.get('address', ''),
-                            'price': float(token.get('price', 0)) if token.get('price') else random.uniform(0.00001, 0.1),
-                            'market_cap': float(token.get('marketCap', 0)) if token.get('marketCap') else random.uniform(10000, 1000000),
-                            'volume_24h': float(token.get('volume', 0)) if token.get('volume') else random.uniform(1000, 100000),
-                            'image': token.get('logoURI', ''),
-                            'source': 'birdeye'
-                        }
-                        tokens.append(token_data)
-                except Exception as e:
-                    logger.error(f"Error processing token from Birdeye: {e}")
-                    continue
-            
-            # If we got tokens, return them
-            if tokens:
-                return tokens
-    
-    except Exception as e:
-        logger.warning(f"Error fetching from Birdeye: {e}")
+    tokens = []
+    for token in feed.tokens()[-50:]:  # 50 most recently seen tokens
+        tokens.append({
+            'symbol': token.get('symbol') or 'UNKNOWN',
+            'name': token.get('name') or 'Unknown Memecoin',
+            'address': token.get('address', ''),
+            'price': float(token['price']) if token.get('price') else random.uniform(0.00001, 0.1),
+            'market_cap': float(token['marketCap']) if token.get('marketCap') else random.uniform(10000, 1000000),
+            'volume_24h': float(token['volume']) if token.get('volume') else random.uniform(1000, 100000),
+            'image': '',
+            'source': 'pump.fun' if token.get('source') == 'pump_fun' else token.get('source')
+        })
+    if tokens:
+        return tokens
     
     # If all else fails, use fallback data
     logger.warning("Using fallback token data")
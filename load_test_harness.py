@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+"""
+End-to-End Load Test Harness
+============================
+Drives SimpleTelegramBot against the local fake Bot API server
+(fake_telegram_api.py) with N simulated users tapping through the
+/start, dashboard, deposit and withdraw flows, then reports throughput,
+reply latency percentiles and database queries per update.
+
+Everything runs on one machine. When DATABASE_URL is not set, a throwaway
+SQLite database is used, so the harness never touches production data.
+
+Usage:
+    python load_test_harness.py --users 50 --rounds 2 --latency-ms 20
+    python load_test_harness.py --users 200 --rate-limit-rate 0.02 --output report.json
+    python load_test_harness.py --users 200 --transport asyncio
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import logging
+import argparse
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Each step is (update kind, payload); a round walks the full flow once
+USER_FLOW = [
+    ('message', '/start'),
+    ('callback', 'view_dashboard'),
+    ('callback', 'deposit'),
+    ('callback', 'view_dashboard'),
+    ('callback', 'withdraw_profit'),
+]
+
+# Simulated users start at this telegram id so they never clash with real ids
+SIMULATED_USER_BASE_ID = 7_000_000_000
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class QueryCounter:
+    """Counts SQL statements executed through any SQLAlchemy engine"""
+
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def install(self):
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+        event.listen(Engine, 'before_cursor_execute', self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        with self.lock:
+            self.count += 1
+
+
+class SimulatedUser:
+    """A user that walks USER_FLOW and times each reply"""
+
+    def __init__(self, harness, chat_id):
+        self.harness = harness
+        self.chat_id = chat_id
+        self.reply_event = threading.Event()
+        self.latencies = []
+        self.timeouts = 0
+        self.sent = 0
+
+    def on_reply(self, timestamp):
+        self.reply_event.set()
+
+    def run(self, rounds, think_time, reply_timeout):
+        server = self.harness.server
+        for _ in range(rounds):
+            for kind, payload in USER_FLOW:
+                self.reply_event.clear()
+                started = time.time()
+                if kind == 'message':
+                    server.message_update(self.chat_id, payload)
+                else:
+                    server.callback_update(self.chat_id, payload)
+                self.sent += 1
+
+                if self.reply_event.wait(reply_timeout):
+                    self.latencies.append(time.time() - started)
+                else:
+                    self.timeouts += 1
+
+                # Stay outside the bot's per-user rate limit window
+                time.sleep(think_time * random.uniform(1.0, 1.2))
+
+
+class LoadTestHarness:
+    """Starts the fake API and the bot in-process and runs the simulation"""
+
+    def __init__(self, users=20, rounds=1, think_time=1.1, reply_timeout=10.0,
+                 latency_ms=0, jitter_ms=0, rate_limit_rate=0.0, conflict_rate=0.0, seed=1,
+                 transport='threads'):
+        from fake_telegram_api import FakeTelegramServer
+
+        self.users = users
+        self.rounds = rounds
+        self.think_time = think_time
+        self.reply_timeout = reply_timeout
+        self.transport = transport
+        self.server = FakeTelegramServer(latency_ms=latency_ms, latency_jitter_ms=jitter_ms,
+                                         rate_limit_rate=rate_limit_rate,
+                                         conflict_rate=conflict_rate, seed=seed)
+        self.query_counter = QueryCounter()
+        self.simulated_users = {}
+        self.bot = None
+        random.seed(seed)
+
+    def _route_reply(self, chat_id, method, params, timestamp):
+        user = self.simulated_users.get(chat_id)
+        if user:
+            user.on_reply(timestamp)
+
+    def start_bot(self):
+        """Point the bot at the fake API and start polling in a background thread"""
+        base_url = self.server.start()
+        self.server.reply_listeners.append(self._route_reply)
+
+        os.environ['TELEGRAM_API_BASE'] = base_url
+        os.environ.setdefault('TELEGRAM_BOT_TOKEN', '123456:LOAD-TEST-TOKEN')
+        if not os.environ.get('DATABASE_URL'):
+            db_path = os.path.join(tempfile.mkdtemp(prefix='bot_loadtest_'), 'loadtest.db')
+            os.environ['DATABASE_URL'] = f"sqlite:///{db_path}"
+            logger.info(f"Using throwaway SQLite database at {db_path}")
+
+        from app import run_schema_migrations
+        run_schema_migrations()
+
+        import bot_v20_runner
+        token = os.environ['TELEGRAM_BOT_TOKEN']
+        self.bot = bot_v20_runner.create_bot(token)
+        # config may have been imported before TELEGRAM_API_BASE was set
+        self.bot.api_url = f"{base_url}/bot{token}"
+        self.bot.transport = self.transport
+        self.bot.start()
+
+        # Wait for the first getUpdates so the startup webhook reset cannot drop our traffic
+        deadline = time.time() + 10
+        while time.time() < deadline and not any(
+                key.startswith('getUpdates:') for key in self.server.stats):
+            time.sleep(0.05)
+
+        self.query_counter.install()
+
+    def run(self):
+        """Run all simulated users and return the report dictionary"""
+        if self.bot is None:
+            self.start_bot()
+
+        for index in range(self.users):
+            chat_id = SIMULATED_USER_BASE_ID + index
+            self.simulated_users[chat_id] = SimulatedUser(self, chat_id)
+
+        queries_before = self.query_counter.count
+        started = time.time()
+        threads = []
+        for user in self.simulated_users.values():
+            thread = threading.Thread(target=user.run,
+                                      args=(self.rounds, self.think_time, self.reply_timeout),
+                                      daemon=True)
+            threads.append(thread)
+            thread.start()
+            # Ramp users in over ~1s instead of one thundering herd
+            time.sleep(min(0.02, 1.0 / max(self.users, 1)))
+
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - started
+
+        return self.build_report(elapsed, self.query_counter.count - queries_before)
+
+    def build_report(self, elapsed, queries):
+        latencies = [value for user in self.simulated_users.values() for value in user.latencies]
+        sent = sum(user.sent for user in self.simulated_users.values())
+        timeouts = sum(user.timeouts for user in self.simulated_users.values())
+
+        def ms(value):
+            return round(value * 1000, 1) if value is not None else None
+
+        return {
+            'transport': self.transport,
+            'users': self.users,
+            'rounds': self.rounds,
+            'updates_sent': sent,
+            'updates_answered': len(latencies),
+            'timeouts': timeouts,
+            'elapsed_seconds': round(elapsed, 3),
+            'throughput_updates_per_second': round(len(latencies) / elapsed, 2) if elapsed else None,
+            'latency_ms': {
+                'p50': ms(percentile(latencies, 50)),
+                'p90': ms(percentile(latencies, 90)),
+                'p99': ms(percentile(latencies, 99)),
+                'max': ms(max(latencies)) if latencies else None,
+            },
+            'db_queries': queries,
+            'db_queries_per_update': round(queries / sent, 2) if sent else None,
+            'api_calls': dict(sorted(self.server.stats.items())),
+        }
+
+    def stop(self):
+        if self.bot:
+            self.bot.stop()
+        self.server.stop()
+
+
+def print_report(report):
+    print("=" * 60)
+    print("LOAD TEST REPORT")
+    print("=" * 60)
+    print(f"Transport: {report['transport']}  Users: {report['users']}  Rounds: {report['rounds']}")
+    print(f"Updates sent/answered/timed out: {report['updates_sent']}/"
+          f"{report['updates_answered']}/{report['timeouts']}")
+    print(f"Elapsed: {report['elapsed_seconds']}s  "
+          f"Throughput: {report['throughput_updates_per_second']} updates/s")
+    latency = report['latency_ms']
+    print(f"Reply latency ms: p50={latency['p50']} p90={latency['p90']} "
+          f"p99={latency['p99']} max={latency['max']}")
+    print(f"DB queries: {report['db_queries']} ({report['db_queries_per_update']} per update)")
+    print("API calls:")
+    for key, count in report['api_calls'].items():
+        print(f"  {key:<32} {count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test SimpleTelegramBot against a fake Bot API")
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--rounds', type=int, default=1, help="times each user walks the flow")
+    parser.add_argument('--think-time', type=float, default=1.1,
+                        help="seconds between a user's taps (bot rate limits below 1s)")
+    parser.add_argument('--reply-timeout', type=float, default=10.0)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    parser.add_argument('--conflict-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--transport', choices=['threads', 'asyncio'], default='threads',
+                        help="bot transport to drive (see async_transport.py)")
+    parser.add_argument('--output', help="write the JSON report to this path")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    harness = LoadTestHarness(args.users, args.rounds, args.think_time, args.reply_timeout,
+                              args.latency_ms, args.jitter_ms, args.rate_limit_rate,
+                              args.conflict_rate, args.seed, args.transport)
+    try:
+        report = harness.run()
+    finally:
+        harness.stop()
+
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+    return 0 if report['updates_answered'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,317 @@
+"""
+Logging Pipeline
+================
+Non-blocking, structured logging for the bot processes.
+
+Handlers and loops only enqueue records; one background thread formats
+and writes them. On the calling thread a record costs a level check, the
+sampling filter and a queue put:
+
+    caller --> SamplingFilter --> bounded queue --> QueueListener thread
+                                                      |-> stderr
+                                                      '-> LOG_FILE (size-rotated)
+
+Records are written as one JSON object per line (LOG_FORMAT=json, the
+default) or in the classic text format (LOG_FORMAT=text).
+
+Sampling only applies below WARNING:
+
+    call sites      each logging call site may emit LOG_SAMPLE_BURST records
+                    per LOG_SAMPLE_WINDOW seconds; past that only every
+                    LOG_SAMPLE_EVERY-th record is written, carrying a
+                    "suppressed" count of the records skipped since the last
+    rate limits     LOG_RATE_LIMITS="utils.solana=20,bot_v20_runner=200" caps a
+                    logger (and its children) at N records per second
+
+Records dropped by sampling, rate limits or a full queue are counted in the
+log_records_dropped_total metric instead of blocking the caller.
+
+Usage:
+    from log_pipeline import configure_logging
+    configure_logging(level=logging.INFO)
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from metrics_registry import LOG_RECORDS_DROPPED
+
+# Output format: 'json' (one object per line) or 'text'
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')
+
+# Optional log file, rotated by size
+LOG_FILE = os.environ.get('LOG_FILE')
+LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.environ.get('LOG_BACKUP_COUNT', '5'))
+
+# Records waiting for the writer thread; beyond this new records are dropped
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', '10000'))
+
+# Per-call-site sampling of repetitive INFO/DEBUG records
+LOG_SAMPLE_BURST = int(os.environ.get('LOG_SAMPLE_BURST', '20'))
+LOG_SAMPLE_EVERY = int(os.environ.get('LOG_SAMPLE_EVERY', '100'))
+LOG_SAMPLE_WINDOW = float(os.environ.get('LOG_SAMPLE_WINDOW', '10'))
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else was passed through extra=
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+
+def parse_rate_limits(spec):
+    """'name=rate,name=rate' -> {logger name: records per second}"""
+    limits = {}
+    for item in (spec or '').split(','):
+        name, _, rate = item.strip().partition('=')
+        if name and rate:
+            limits[name.strip()] = float(rate)
+    return limits
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record; static fields and extra= fields are included as keys"""
+
+    def __init__(self, fields=None):
+        super().__init__()
+        self.fields = dict(fields or {})
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'thread': record.threadName,
+        }
+        entry.update(self.fields)
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """The classic line format, noting how many similar records were sampled out"""
+
+    def format(self, record):
+        line = super().format(record)
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            line += f" [{suppressed} similar suppressed]"
+        return line
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Per-call-site sampling and per-logger rate limits for records below WARNING
+
+    Counters are updated without a lock: under concurrency a few records more
+    or fewer may pass, which is fine for sampling and keeps the hot path cheap.
+    """
+
+    def __init__(self, burst=None, every=None, window=None, rate_limits=None):
+        super().__init__()
+        self.burst = LOG_SAMPLE_BURST if burst is None else burst
+        self.every = max(1, LOG_SAMPLE_EVERY if every is None else every)
+        self.window = LOG_SAMPLE_WINDOW if window is None else window
+        if rate_limits is None:
+            rate_limits = parse_rate_limits(os.environ.get('LOG_RATE_LIMITS'))
+        self.rate_limits = rate_limits
+        self._sites = {}     # (logger, path, line) -> [window_start, seen, suppressed]
+        self._buckets = {}   # limited logger name -> [tokens, refilled_at]
+        self._limit_for = {}  # logger name -> limited ancestor name or None
+
+    def _limited_name(self, name):
+        try:
+            return self._limit_for[name]
+        except KeyError:
+            pass
+        limited = None
+        candidate = name
+        while candidate:
+            if candidate in self.rate_limits:
+                limited = candidate
+                break
+            candidate = candidate.rpartition('.')[0]
+        self._limit_for[name] = limited
+        return limited
+
+    def _take_token(self, name, now):
+        rate = self.rate_limits[name]
+        bucket = self._buckets.get(name)
+        if bucket is None:
+            bucket = self._buckets[name] = [rate, now]
+        tokens = min(rate, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        if tokens < 1:
+            bucket[0] = tokens
+            return False
+        bucket[0] = tokens - 1
+        return True
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        now = time.monotonic()
+
+        if self.rate_limits:
+            limited = self._limited_name(record.name)
+            if limited is not None and not self._take_token(limited, now):
+                LOG_RECORDS_DROPPED.labels(reason='rate_limited').inc()
+                return False
+
+        site = (record.name, record.pathname, record.lineno)
+        entry = self._sites.get(site)
+        if entry is None or now - entry[0] >= self.window:
+            if entry is not None and entry[2]:
+                record.suppressed = entry[2]
+            self._sites[site] = [now, 1, 0]
+            return True
+
+        entry[1] += 1
+        if entry[1] <= self.burst or (entry[1] - self.burst) % self.every == 0:
+            if entry[2]:
+                record.suppressed = entry[2]
+                entry[2] = 0
+            return True
+        entry[2] += 1
+        LOG_RECORDS_DROPPED.labels(reason='sampled').inc()
+        return False
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Hands records to the writer thread without formatting them or ever blocking"""
+
+    def prepare(self, record):
+        # The listener runs in this process, so the record needs no pickling;
+        # only freeze the message in case its args are mutated later
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.labels(reason='queue_full').inc()
+
+
+class LogPipeline:
+    """The queue, the root handler feeding it and the listener draining it"""
+
+    def __init__(self, handlers, sampling_filter, queue_size):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.handler = NonBlockingQueueHandler(self.queue)
+        self.handler.addFilter(sampling_filter)
+        self.handlers = handlers
+        self.listener = QueueListener(self.queue, *handlers, respect_handler_level=True)
+
+    def start(self):
+        self.listener.start()
+
+    def flush(self, timeout=5):
+        """Wait until the writer thread has caught up (tests, shutdown)"""
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.005)
+        for handler in self.handlers:
+            handler.flush()
+
+    def stop(self):
+        """Detach from the root logger, write what is queued and close the outputs"""
+        logging.getLogger().removeHandler(self.handler)
+        if self.listener._thread is not None:
+            self.flush()
+            self.listener.stop()
+        for handler in self.handlers:
+            handler.close()
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def build_handlers(fmt=None, log_file=None, max_bytes=None, backup_count=None, text_format=TEXT_FORMAT,
+                   fields=None, stream=None):
+    """Output handlers for the writer thread: stderr plus an optional rotating file"""
+    fmt = fmt or LOG_FORMAT
+    formatter = JsonFormatter(fields) if fmt == 'json' else TextFormatter(text_format)
+    handlers = []
+    if stream is not False:
+        handlers.append(logging.StreamHandler(stream or sys.stderr))
+    log_file = log_file or LOG_FILE
+    if log_file:
+        handlers.append(RotatingFileHandler(
+            log_file,
+            maxBytes=LOG_MAX_BYTES if max_bytes is None else max_bytes,
+            backupCount=LOG_BACKUP_COUNT if backup_count is None else backup_count,
+            encoding='utf-8',
+            delay=True,
+        ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def configure_logging(level=logging.INFO, fmt=None, log_file=None, text_format=TEXT_FORMAT, fields=None,
+                      sampling_filter=None, stream=None, force=False):
+    """
+    Route the root logger through the pipeline
+
+    fields are added to every JSON record (e.g. the deployment environment);
+    text_format is used when LOG_FORMAT=text.
+
+    Like logging.basicConfig, does nothing when the root logger already has
+    handlers (e.g. a test configured logging first) unless force=True.
+    Returns the active LogPipeline, or None when left unconfigured.
+    """
+    global _pipeline
+    with _pipeline_lock:
+        root = logging.getLogger()
+        if _pipeline is not None and not force:
+            return _pipeline
+        if root.handlers and not force:
+            return None
+
+        if _pipeline is not None:
+            _pipeline.stop()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+
+        pipeline = LogPipeline(
+            build_handlers(fmt, log_file, text_format=text_format, fields=fields, stream=stream),
+            sampling_filter or SamplingFilter(),
+            LOG_QUEUE_SIZE,
+        )
+        root.addHandler(pipeline.handler)
+        root.setLevel(level)
+        pipeline.start()
+        if _pipeline is None:
+            atexit.register(shutdown_logging)
+        _pipeline = pipeline
+        return pipeline
+
+
+def get_log_pipeline():
+    return _pipeline
+
+
+def shutdown_logging():
+    """Write out queued records and stop the writer thread"""
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is not None:
+            _pipeline.stop()
+            _pipeline = None
@@ -11,11 +11,9 @@ from database_monitoring import DatabaseMonitor
 from environment_detector import should_auto_start, get_environment_info, is_replit_environment
 from duplicate_instance_prevention import get_global_instance_manager
 
-# Configure logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+# Configure logging; records are written by a background thread (see log_pipeline.py)
+from log_pipeline import configure_logging
+configure_logging(level=logging.INFO, force=True)
 
 logger = logging.getLogger(__name__)
 
@@ -85,6 +83,12 @@ def health():
         "maintenance_scheduler": "active"
     })
 
+@app.route('/metrics')
+def metrics():
+    """Prometheus-style metrics for the bot hot paths"""
+    from metrics_registry import REGISTRY, CONTENT_TYPE
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
 @app.route('/database/health')
 def database_health():
     """Detailed database health endpoint"""
@@ -190,7 +194,15 @@ def start_bot_thread():
         return False
     
     logger.info(f"Starting bot with token: {token[:10]}...")
-    
+
+    # Replit remixes have no separate deploy step, so apply the schema here
+    if is_replit_environment():
+        try:
+            from app import run_schema_migrations
+            run_schema_migrations()
+        except Exception as e:
+            logger.error(f"Schema migration failed: {e}")
+
     try:
         # Start the bot in a separate subprocess
         import subprocess
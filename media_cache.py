@@ -0,0 +1,253 @@
+"""
+Media Cache
+===========
+Avoids regenerating and re-uploading the same images. Telegram returns a
+file_id for every photo or document it receives, and sending that file_id
+again costs neither an upload nor any image work on our side.
+
+Images are keyed by a hash of what they show (the referral link, the
+deposit wallet address or the broadcast image URL):
+
+    file_id     memory dict in front of the media_file table, so every
+                worker reuses an upload made by any other
+    PNG bytes   on-disk LRU (MEDIA_CACHE_DIR, MEDIA_CACHE_MAX_FILES) for
+                generated images, used when a file_id has to be re-uploaded
+
+A file_id Telegram no longer accepts is dropped and the image uploaded again.
+
+Usage:
+    get_media_cache().send(bot, chat_id, 'referral_qr', referral_link,
+                           render=lambda: render_qr_png(referral_link),
+                           caption="Your referral QR code")
+"""
+import hashlib
+import io
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy import delete, select
+
+logger = logging.getLogger(__name__)
+
+# Directory holding generated PNGs
+MEDIA_CACHE_DIR = os.environ.get('MEDIA_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'bot_media_cache'))
+
+# Generated PNGs kept on disk; the least recently used are removed first
+MEDIA_CACHE_MAX_FILES = int(os.environ.get('MEDIA_CACHE_MAX_FILES', '500'))
+
+# file_ids kept in each process's memory
+FILE_ID_CACHE_SIZE = 4096
+
+
+def media_key(kind, source):
+    """Cache key for an image of the given kind built from source"""
+    return hashlib.sha256(f"{kind}:{source}".encode('utf-8')).hexdigest()
+
+
+def render_qr_png(data, caption=None):
+    """PNG bytes of a QR code for data, optionally with a caption strip below it"""
+    import qrcode
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=10,
+        border=4,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+    image = qr.make_image(fill_color="black", back_color="white")
+
+    if caption:
+        from PIL import Image, ImageDraw
+        canvas = Image.new('RGB', (image.size[0], image.size[1] + 50), color=(255, 255, 255))
+        # qrcode wraps the PIL image; paste needs the image itself
+        canvas.paste(image.get_image(), (0, 0))
+        ImageDraw.Draw(canvas).text((10, image.size[1] + 10), caption, fill=(0, 0, 0))
+        image = canvas
+
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def uploaded_file_id(result):
+    """file_id from a sendPhoto/sendDocument result dict, or None"""
+    message = (result or {}).get('result') or {}
+    photos = message.get('photo')
+    if photos:
+        # Telegram lists every size it made; the largest is last
+        return photos[-1].get('file_id')
+    document = message.get('document') or {}
+    return document.get('file_id')
+
+
+def is_stale_file_id(result):
+    """True when Telegram rejected the file_id itself rather than the send"""
+    return (result or {}).get('error_code') == 400
+
+
+class MediaCache:
+    """file_id store plus an on-disk LRU of generated PNGs"""
+
+    def __init__(self, directory=None, max_files=None, engine=None):
+        self.directory = directory or MEDIA_CACHE_DIR
+        self.max_files = MEDIA_CACHE_MAX_FILES if max_files is None else max_files
+        self._engine = engine
+        self._file_ids = OrderedDict()  # cache_key -> file_id
+        self._lock = threading.Lock()
+        from models import MediaFile
+        self.table = MediaFile.__table__
+
+    @property
+    def engine(self):
+        if self._engine is not None:
+            return self._engine
+        from app import app, db
+        with app.app_context():
+            return db.engine
+
+    # ------------------------------------------------------------------
+    # file_ids
+    # ------------------------------------------------------------------
+    def file_id(self, key):
+        """The file_id stored for key, or None"""
+        with self._lock:
+            file_id = self._file_ids.get(key)
+            if file_id is not None:
+                self._file_ids.move_to_end(key)
+                return file_id
+        with self.engine.connect() as connection:
+            file_id = connection.execute(
+                select(self.table.c.file_id).where(self.table.c.cache_key == key)
+            ).scalar()
+        if file_id is not None:
+            self._remember_locally(key, file_id)
+        return file_id
+
+    def remember(self, key, kind, file_id):
+        """Store the file_id Telegram returned for an upload"""
+        with self.engine.begin() as connection:
+            if connection.dialect.name == 'postgresql':
+                from sqlalchemy.dialects.postgresql import insert as dialect_insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert as dialect_insert
+            statement = dialect_insert(self.table)
+            connection.execute(statement.on_conflict_do_update(
+                index_elements=['cache_key'],
+                set_={'file_id': statement.excluded.file_id, 'updated_at': statement.excluded.updated_at},
+            ), {'cache_key': key, 'kind': kind, 'file_id': file_id, 'updated_at': datetime.utcnow()})
+        self._remember_locally(key, file_id)
+
+    def forget(self, key):
+        """Drop a file_id Telegram no longer accepts"""
+        with self._lock:
+            self._file_ids.pop(key, None)
+        with self.engine.begin() as connection:
+            connection.execute(delete(self.table).where(self.table.c.cache_key == key))
+
+    def _remember_locally(self, key, file_id):
+        with self._lock:
+            self._file_ids[key] = file_id
+            self._file_ids.move_to_end(key)
+            while len(self._file_ids) > FILE_ID_CACHE_SIZE:
+                self._file_ids.popitem(last=False)
+
+    # ------------------------------------------------------------------
+    # Generated PNGs
+    # ------------------------------------------------------------------
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.png")
+
+    def png(self, key, render):
+        """PNG bytes for key from disk, calling render() and storing the result on a miss"""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as handle:
+                data = handle.read()
+            # Reading doesn't reliably bump atime, so mark the hit on mtime
+            os.utime(path)
+            return data
+        except FileNotFoundError:
+            pass
+
+        data = render()
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            partial = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(partial, 'wb') as handle:
+                handle.write(data)
+            os.replace(partial, path)
+            self._evict()
+        except OSError as e:
+            logger.warning(f"Could not cache generated image {key[:12]}: {e}")
+        return data
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.png'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                entries.append((os.stat(path).st_mtime, path))
+            except FileNotFoundError:
+                continue
+        if len(entries) <= self.max_files:
+            return
+        entries.sort()
+        for _, path in entries[:len(entries) - self.max_files]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    # ------------------------------------------------------------------
+    # Sending
+    # ------------------------------------------------------------------
+    def send(self, bot, chat_id, kind, source, render=None, caption=None, parse_mode="Markdown",
+             as_document=False, filename='image.png'):
+        """
+        Send the image for (kind, source) to chat_id
+
+        Reuses the stored file_id when there is one. Otherwise uploads the PNG
+        from render() (through the disk LRU), or lets Telegram fetch source
+        as a URL when there is no renderer, and stores the new file_id.
+        """
+        key = media_key(kind, source)
+
+        def deliver(media):
+            if as_document:
+                return bot.send_document(chat_id, media, caption=caption, parse_mode=parse_mode, filename=filename)
+            return bot.send_photo(chat_id, media, caption=caption, parse_mode=parse_mode, filename=filename)
+
+        file_id = self.file_id(key)
+        if file_id is not None:
+            result = deliver(file_id)
+            if not is_stale_file_id(result):
+                return result
+            logger.info(f"Telegram rejected cached {kind} file_id, uploading again")
+            self.forget(key)
+
+        result = deliver(self.png(key, render) if render else source)
+        new_file_id = uploaded_file_id(result)
+        if new_file_id:
+            self.remember(key, kind, new_file_id)
+        return result
+
+
+_media_cache = None
+_media_cache_lock = threading.Lock()
+
+
+def get_media_cache():
+    """Get the process-wide media cache"""
+    global _media_cache
+    if _media_cache is None:
+        with _media_cache_lock:
+            if _media_cache is None:
+                _media_cache = MediaCache()
+    return _media_cache
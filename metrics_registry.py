@@ -0,0 +1,408 @@
+"""
+Metrics Registry
+================
+Lightweight Prometheus-style metrics for the bot hot paths. Counters,
+gauges and histograms are kept in process memory and rendered in the
+Prometheus text exposition format at /metrics.
+
+Instrumentation is lock-light: label children are looked up without a lock
+(a lock is only taken the first time a label combination is created), and
+each series updates under its own uncontended lock, so it is safe to leave on
+in production.
+"""
+
+import os
+import time
+import bisect
+import logging
+import threading
+from functools import wraps
+
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = []
+    for name, value in pairs:
+        value = str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        escaped.append(f'{name}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Base class handling label children"""
+
+    metric_type = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._children_lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *labelvalues, **labelkwargs):
+        """Return the child series for the given label values"""
+        if labelkwargs:
+            labelvalues = tuple(str(labelkwargs[name]) for name in self.labelnames)
+        else:
+            labelvalues = tuple(str(value) for value in labelvalues)
+
+        child = self._children.get(labelvalues)
+        if child is None:
+            if len(labelvalues) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._children_lock:
+                child = self._children.get(labelvalues)
+                if child is None:
+                    child = self._new_child()
+                    self._children[labelvalues] = child
+        return child
+
+    def _unlabelled(self):
+        return self._children[()]
+
+    def collect(self):
+        """Return exposition lines for this metric"""
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}",
+        ]
+        for labelvalues, child in list(self._children.items()):
+            lines.extend(self._collect_child(labelvalues, child))
+        return lines
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter"""
+
+    metric_type = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._unlabelled().inc(amount)
+
+    def _collect_child(self, labelvalues, child):
+        labels = _format_labels(self.labelnames, labelvalues)
+        return [f"{self.name}{labels} {_format_value(child.value)}"]
+
+
+class _GaugeChild:
+    def __init__(self):
+        self.value = 0.0
+        self.function = None
+        self.lock = threading.Lock()
+
+    def set(self, value):
+        self.value = float(value)
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self.lock:
+            self.value -= amount
+
+    def set_function(self, function):
+        """Evaluate `function` at scrape time instead of storing a value"""
+        self.function = function
+
+    def get(self):
+        if self.function is not None:
+            try:
+                return float(self.function())
+            except Exception as e:
+                logger.debug(f"Gauge callback failed: {e}")
+                return float('nan')
+        return self.value
+
+
+class Gauge(_Metric):
+    """Value that can go up and down"""
+
+    metric_type = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._unlabelled().set(value)
+
+    def inc(self, amount=1):
+        self._unlabelled().inc(amount)
+
+    def dec(self, amount=1):
+        self._unlabelled().dec(amount)
+
+    def set_function(self, function):
+        self._unlabelled().set_function(function)
+
+    def _collect_child(self, labelvalues, child):
+        labels = _format_labels(self.labelnames, labelvalues)
+        return [f"{self.name}{labels} {_format_value(child.get())}"]
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self):
+        return _Timer(self)
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.counts), self.sum
+
+
+class _Timer:
+    """Context manager that observes elapsed seconds"""
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.child.observe(time.perf_counter() - self.started)
+        return False
+
+
+class Histogram(_Metric):
+    """Bucketed distribution of observed values (usually seconds)"""
+
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._unlabelled().observe(value)
+
+    def time(self):
+        return self._unlabelled().time()
+
+    def _collect_child(self, labelvalues, child):
+        counts, total = child.snapshot()
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, labelvalues, ('le', _format_value(bound)))
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, labelvalues)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics = {}
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} already registered")
+            self._metrics[metric.name] = metric
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self):
+        """Render all metrics in the Prometheus text format"""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Bot hot-path metrics
+UPDATES_RECEIVED = Counter(
+    'bot_updates_received_total', 'Telegram updates received by the polling loop', ['update_type'])
+DISPATCH_QUEUE_DEPTH = Gauge(
+    'bot_dispatch_queue_depth', 'Updates fetched but not yet dispatched to a handler')
+HANDLER_LATENCY = Histogram(
+    'bot_handler_duration_seconds', 'Handler execution time by command/callback name', ['handler'])
+HANDLER_ERRORS = Counter(
+    'bot_handler_errors_total', 'Handler invocations that raised', ['handler'])
+TELEGRAM_API_LATENCY = Histogram(
+    'telegram_api_request_duration_seconds', 'Outbound Telegram Bot API latency', ['method'])
+TELEGRAM_API_RESPONSES = Counter(
+    'telegram_api_responses_total', 'Outbound Telegram Bot API responses by status code', ['method', 'status'])
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    'db_pool_checkout_wait_seconds', 'Time spent waiting for a connection from the pool',
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0))
+DB_POOL_CHECKED_OUT = Gauge(
+    'db_pool_connections_checked_out', 'Connections currently checked out of the pool')
+DEPOSIT_SCAN_DURATION = Histogram(
+    'deposit_scan_duration_seconds', 'Duration of a full deposit scan cycle')
+BROADCAST_MESSAGES = Counter(
+    'broadcast_messages_total', 'Broadcast deliveries by result', ['result'])
+RISK_PASS_DURATION = Histogram(
+    'risk_pass_duration_seconds', 'Duration of a global stop-loss/take-profit pass')
+LEADER_STATUS = Gauge(
+    'bot_leader', 'Whether this node holds the role (1) or serves as a worker (0)', ['role'])
+JOBS_PROCESSED = Counter(
+    'background_jobs_processed_total', 'Background job executions by queue and outcome', ['queue', 'result'])
+JOB_DURATION = Histogram(
+    'background_job_duration_seconds', 'Background job handler run time', ['queue'])
+ROI_RUN_DURATION = Histogram(
+    'roi_run_duration_seconds', 'Duration of a daily ROI cycle run',
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0))
+ASYNC_DB_CALL_DURATION = Histogram(
+    'async_db_call_duration_seconds', 'Blocking DB calls run off the event loop, including executor wait',
+    ['call'])
+EVENT_LOOP_LAG = Histogram(
+    'event_loop_lag_seconds', 'How late the event loop heartbeat woke up', ['loop'],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+EVENT_LOOP_BLOCKED = Counter(
+    'event_loop_blocked_total', 'Event loop stalls longer than the lag threshold', ['loop'])
+LOG_RECORDS_DROPPED = Counter(
+    'log_records_dropped_total', 'Log records not written, by reason (sampled, rate_limited, queue_full)',
+    ['reason'])
+SOLANA_RPC_DURATION = Histogram(
+    'solana_rpc_request_duration_seconds', 'Solana JSON-RPC latency including hedged retries', ['method'])
+SOLANA_RPC_FAILURES = Counter(
+    'solana_rpc_endpoint_failures_total', 'Solana RPC requests an endpoint failed to answer', ['endpoint'])
+DEPOSIT_SUBSCRIPTION_EVENTS = Counter(
+    'deposit_subscription_events_total', 'Deposit websocket events (notification, catch_up, reconnect)', ['event'])
+
+
+def instrument_handler(name, callback):
+    """Wrap a bot handler so each call is timed under `name`"""
+    latency = HANDLER_LATENCY.labels(handler=name)
+
+    @wraps(callback)
+    def instrumented(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return callback(*args, **kwargs)
+        except Exception:
+            HANDLER_ERRORS.labels(handler=name).inc()
+            raise
+        finally:
+            latency.observe(time.perf_counter() - started)
+
+    return instrumented
+
+
+def record_broadcast_result(response):
+    """Count a broadcast delivery from a SimpleTelegramBot response dict"""
+    ok = bool(response and response.get('ok'))
+    BROADCAST_MESSAGES.labels(result='sent' if ok else 'failed').inc()
+    return ok
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records checkout wait time and connections in use"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_WAIT.observe(time.perf_counter() - started)
+            DB_POOL_CHECKED_OUT.set(self.checkedout())
+
+    def _do_return_conn(self, record):
+        super()._do_return_conn(record)
+        DB_POOL_CHECKED_OUT.set(self.checkedout())
+
+
+_metrics_server = None
+
+
+def start_metrics_server(port=None, host='0.0.0.0'):
+    """
+    Serve /metrics from a background thread. Used by the standalone bot
+    process, which does not run the Flask app. Port defaults to METRICS_PORT.
+    """
+    global _metrics_server
+    if _metrics_server is not None:
+        return _metrics_server
+
+    port = port if port is not None else os.environ.get('METRICS_PORT')
+    if not port:
+        return None
+
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = REGISTRY.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            return
+
+    _metrics_server = ThreadingHTTPServer((host, int(port)), MetricsHandler)
+    thread = threading.Thread(target=_metrics_server.serve_forever, daemon=True)
+    thread.start()
+    logger.info(f"Metrics endpoint listening on {host}:{port}/metrics")
+    return _metrics_server
@@ -1,6 +1,6 @@
 from datetime import datetime
 from app import db
-from sqlalchemy import Enum, ForeignKey
+from sqlalchemy import DDL, Enum, ForeignKey, event
 import enum
 import random
 import string
@@ -49,6 +49,14 @@ class User(db.Model):
     referral_code = db.relationship('ReferralCode', backref='owner', lazy=True, foreign_keys='ReferralCode.user_id')
     referrer = db.relationship('ReferralCode', foreign_keys=[referrer_code_id])
     
+    # Indexes for admin status filters, referral lookups and exact username search
+    # (fuzzy search uses the pg_trgm indexes created by user_search.ensure_search_indexes)
+    __table_args__ = (
+        db.Index('idx_user_status', 'status'),
+        db.Index('idx_user_referrer_code', 'referrer_code_id'),
+        db.Index('idx_user_username_lower', db.func.lower(username)),
+    )
+    
     def __repr__(self):
         return f'<User {self.telegram_id}>'
 
@@ -69,7 +77,7 @@ class Transaction(db.Model):
     
     # Create indexes for common query patterns
     __table_args__ = (
-        db.Index('idx_transaction_user_type', 'user_id', 'transaction_type'),
+        db.Index('idx_transaction_user_type_time', 'user_id', 'transaction_type', 'timestamp'),
         db.Index('idx_transaction_status', 'status'),
     )
     
@@ -84,6 +92,10 @@ class Profit(db.Model):
     percentage = db.Column(db.Float, nullable=False)
     date = db.Column(db.Date, nullable=False)
     
+    __table_args__ = (
+        db.Index('idx_profit_user_date', 'user_id', 'date'),
+    )
+    
     def __repr__(self):
         return f'<Profit {self.amount} SOL ({self.percentage}%)>'
 
@@ -125,6 +137,18 @@ class TradingPosition(db.Model):
     price_usd_entry = db.Column(db.Float, nullable=True)  # USD price at entry
     price_usd_exit = db.Column(db.Float, nullable=True)  # USD price at exit
     
+    # Mark-to-market (maintained by utils/position_revaluation.py for open positions)
+    unrealized_pnl = db.Column(db.Float, nullable=True)  # amount * (current_price - entry_price)
+    price_updated_at = db.Column(db.DateTime, nullable=True)  # When current_price was last revalued
+    
+    # Indexes for per-user position lists, open-position sweeps and tx hash lookups
+    __table_args__ = (
+        db.Index('idx_trading_position_user_status_token', 'user_id', 'status', 'token_name'),
+        db.Index('idx_trading_position_status_token', 'status', 'token_name'),
+        db.Index('idx_trading_position_buy_tx_hash', 'buy_tx_hash'),
+        db.Index('idx_trading_position_sell_tx_hash', 'sell_tx_hash'),
+    )
+    
     def __repr__(self):
         return f'<TradingPosition {self.token_name} {self.amount}>'
 
@@ -155,6 +179,10 @@ class ReferralCode(db.Model):
     # Users who signed up with this code
     referred_users = db.relationship('User', foreign_keys='User.referrer_code_id', backref='referred_by')
     
+    __table_args__ = (
+        db.Index('idx_referral_code_user', 'user_id', 'is_active'),
+    )
+    
     def __repr__(self):
         return f'<ReferralCode {self.code}>'
     
@@ -178,6 +206,10 @@ class SenderWallet(db.Model):
     # Relationship to user
     user = db.relationship('User', backref='sender_wallets')
     
+    __table_args__ = (
+        db.Index('idx_sender_wallet_user', 'user_id'),
+    )
+    
     def __repr__(self):
         return f'<SenderWallet {self.wallet_address[:10]}... - User {self.user_id}>'
 
@@ -196,6 +228,10 @@ class ReferralReward(db.Model):
     referrer = db.relationship('User', foreign_keys=[referrer_id], backref='referral_rewards_received')
     referred = db.relationship('User', foreign_keys=[referred_id], backref='referral_rewards_generated')
     
+    __table_args__ = (
+        db.Index('idx_referral_reward_referrer', 'referrer_id', 'timestamp'),
+    )
+    
     def __repr__(self):
         return f'<ReferralReward {self.amount} SOL - Referrer {self.referrer_id} - Referred {self.referred_id}>'
 
@@ -236,6 +272,10 @@ class TradingCycle(db.Model):
     # Relationship to user
     user = db.relationship('User', backref='trading_cycles')
     
+    __table_args__ = (
+        db.Index('idx_trading_cycle_user_status', 'user_id', 'status'),
+    )
+    
     def __repr__(self):
         return f'<TradingCycle {self.id} - User {self.user_id} - {self.status.value}>'
     
@@ -271,6 +311,44 @@ class TradingCycle(db.Model):
         return self.progress_percentage >= expected_progress
 
 
+class DailyRoiCredit(db.Model):
+    """One daily ROI credit per user and date, so reruns never pay twice (see utils/roi_cycle_engine.py)"""
+    __tablename__ = 'daily_roi_credit'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    cycle_id = db.Column(db.Integer, db.ForeignKey('trading_cycle.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    amount = db.Column(db.Float, nullable=False)
+    percentage = db.Column(db.Float, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'date', name='uq_daily_roi_credit_user_date'),
+    )
+
+    def __repr__(self):
+        return f'<DailyRoiCredit {self.date} - User {self.user_id}: {self.amount} SOL>'
+
+
+class BalanceLedgerEntry(db.Model):
+    """Append-only record of every balance change applied through balance_ledger.py"""
+    __tablename__ = 'balance_ledger_entry'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    delta = db.Column(db.Float, nullable=False)
+    balance_after = db.Column(db.Float, nullable=False)
+    reason = db.Column(db.String(32), nullable=False)  # deposit, trade_profit, admin_credit, withdrawal, ...
+    reference = db.Column(db.String(128), nullable=True)  # tx hash, position or withdrawal id
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        db.Index('idx_balance_ledger_user_time', 'user_id', 'created_at'),
+    )
+
+    def __repr__(self):
+        return f'<BalanceLedgerEntry {self.reason} - User {self.user_id}: {self.delta:+} SOL>'
+
+
 class BroadcastMessage(db.Model):
     """Model for tracking broadcast messages sent by admins"""
     id = db.Column(db.Integer, primary_key=True)
@@ -313,6 +391,82 @@ class SystemSettings(db.Model):
         return f'<SystemSettings {self.setting_name}>'
 
 
+class LeaderLease(db.Model):
+    """Which bot node currently owns a cluster-wide singleton role (see leader_election.py)"""
+    __tablename__ = 'leader_lease'
+    name = db.Column(db.String(64), primary_key=True)  # Role name, e.g. 'bot'
+    holder = db.Column(db.String(128), nullable=False)  # host:pid of the leader node
+    backend_pid = db.Column(db.Integer, nullable=True)  # PostgreSQL session holding the advisory lock
+    acquired_at = db.Column(db.DateTime, default=datetime.utcnow)
+    renewed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<LeaderLease {self.name} held by {self.holder}>'
+
+
+class BackgroundJob(db.Model):
+    """Durable unit of background work, claimed by workers with FOR UPDATE SKIP LOCKED (see job_queue.py)"""
+    __tablename__ = 'background_job'
+    id = db.Column(db.Integer, primary_key=True)
+    queue = db.Column(db.String(64), nullable=False, default='default')  # settlement, notifications, deposits, maintenance
+    task = db.Column(db.String(128), nullable=False)  # Registered handler name
+    payload = db.Column(db.Text, nullable=True)  # JSON arguments for the handler
+    priority = db.Column(db.Integer, nullable=False, default=0)  # Higher runs first
+    status = db.Column(db.String(16), nullable=False, default='queued')  # queued, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    dedup_key = db.Column(db.String(191), nullable=True)  # At most one queued/running job per key
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # Not claimable before this
+    locked_by = db.Column(db.String(128), nullable=True)  # Worker that claimed the job
+    locked_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    # Claim scans follow (queue, status, priority, run_at); dedup only covers pending jobs
+    __table_args__ = (
+        db.Index('idx_background_job_claim', 'queue', 'status', 'priority', 'run_at'),
+        db.Index('idx_background_job_pending_dedup', 'dedup_key', unique=True,
+                 postgresql_where=db.text("status IN ('queued', 'running')"),
+                 sqlite_where=db.text("status IN ('queued', 'running')")),
+    )
+
+    def __repr__(self):
+        return f'<BackgroundJob {self.id} {self.task} {self.status}>'
+
+
+class ConversationState(db.Model):
+    """Per-chat conversation state shared by every bot worker (see conversation_state.py)"""
+    __tablename__ = 'conversation_state'
+    chat_id = db.Column(db.BigInteger, primary_key=True, autoincrement=False)
+    data = db.Column(db.Text, nullable=False)  # Compact JSON record of the chat's in-flight flow
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ConversationState {self.chat_id}>'
+
+
+# Conversation state is short-lived and rebuildable, so on PostgreSQL skip the WAL for it
+event.listen(
+    ConversationState.__table__, 'after_create',
+    DDL('ALTER TABLE conversation_state SET UNLOGGED').execute_if(dialect='postgresql')
+)
+
+
+class MediaFile(db.Model):
+    """Telegram file_id of an uploaded image, keyed by a hash of its content (see media_cache.py)"""
+    __tablename__ = 'media_file'
+    cache_key = db.Column(db.String(64), primary_key=True)  # sha256 of "<kind>:<source>"
+    kind = db.Column(db.String(32), nullable=False)  # referral_qr, wallet_qr, image_url
+    file_id = db.Column(db.String(255), nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<MediaFile {self.kind} {self.cache_key[:12]}>'
+
+
 class UserMetrics(db.Model):
     """Real-time performance metrics for dashboard"""
     id = db.Column(db.Integer, primary_key=True)
@@ -330,6 +484,10 @@ class UserMetrics(db.Model):
     # Relationship to user
     user = db.relationship('User', backref='metrics')
     
+    __table_args__ = (
+        db.Index('idx_user_metrics_user', 'user_id'),
+    )
+    
     def __repr__(self):
         return f'<UserMetrics {self.user_id} - Streak: {self.current_streak}>'
 
@@ -349,6 +507,10 @@ class DailySnapshot(db.Model):
     # Relationship to user
     user = db.relationship('User', backref='daily_snapshots')
     
+    __table_args__ = (
+        db.Index('idx_daily_snapshot_user_date', 'user_id', 'date'),
+    )
+    
     def __repr__(self):
         return f'<DailySnapshot {self.date} - User {self.user_id}>'
 
@@ -97,25 +97,20 @@ def _process_balance_adjustment(identifier, amount, reason, skip_trading, silent
                 )
                 
                 db.session.add(transaction)
+                
+                # Settle the user's trading cycle for a positive adjustment, unless
+                # skipped. The job commits together with the balance change and
+                # runs on any job worker process, with retries.
+                if amount > 0 and not skip_trading:
+                    from job_queue import enqueue
+                    enqueue('settlement.balance_adjusted', {'user_id': user.id, 'amount': amount}, commit=False)
+                
                 db.session.commit()
                 
                 # Log the adjustment
                 if not silent:
                     logger.info(f"Balance adjusted for {user.username} (ID: {user.id}): {current_balance} → {new_balance} ({reason})")
                 
-                # Start trading if a positive adjustment and not skipped
-                if amount > 0 and not skip_trading:
-                    # Importing here to avoid circular imports
-                    from utils.trading import process_new_deposit
-                    
-                    # Start trading in background to avoid blocking
-                    trading_thread = threading.Thread(
-                        target=_start_trading_in_background,
-                        args=(user.id, amount),
-                        daemon=True
-                    )
-                    trading_thread.start()
-                
                 return True, f"Balance adjusted to {new_balance}"
                 
             except Exception as e:
@@ -128,21 +123,3 @@ def _process_balance_adjustment(identifier, amount, reason, skip_trading, silent
         logger.error(f"Error in balance adjustment: {e}")
         logger.error(traceback.format_exc())
         return False, f"Error in balance adjustment: {str(e)}"
-
-def _start_trading_in_background(user_id, amount):
-    """Start trading for a user with the given amount"""
-    from app import app
-    
-    try:
-        with app.app_context():
-            logger.info(f"Starting trading for user {user_id} with amount {amount}")
-            
-            # Import here to avoid circular imports
-            from utils.trading import process_new_deposit
-            
-            # Process the deposit as if it were a new deposit
-            process_new_deposit(user_id, amount)
-            
-    except Exception as e:
-        logger.error(f"Error starting trading for user {user_id}: {e}")
-        logger.error(traceback.format_exc())
\ No newline at end of file
@@ -115,131 +115,46 @@ def end_of_day_processing(user_id):
     """
     Process end-of-day calculations and updates for a user
     
+    Runs the batch close (day_close.close_day) for this one user and the
+    current day; the nightly job closes every user at once.
+    
     Args:
         user_id (int): User ID
         
     Returns:
         bool: Whether processing was successful
     """
+    from day_close import close_day
+
     try:
-        snapshot = ensure_daily_snapshot(user_id)
-        if not snapshot:
-            return False
-            
-        user = User.query.get(user_id)
-        if not user:
-            return False
-        
-        # Update ending balance and calculate profit
-        snapshot.ending_balance = user.balance
-        snapshot.profit_amount = snapshot.ending_balance - snapshot.starting_balance
-        
-        if snapshot.starting_balance > 0:
-            snapshot.profit_percentage = (snapshot.profit_amount / snapshot.starting_balance) * 100
-        else:
-            snapshot.profit_percentage = 0
-        
-        # Create profit record for the day if profit exists
-        if snapshot.profit_amount != 0:
-            daily_profit = Profit()
-            daily_profit.user_id = user_id
-            daily_profit.amount = snapshot.profit_amount
-            daily_profit.percentage = snapshot.profit_percentage
-            daily_profit.date = snapshot.date
-            db.session.add(daily_profit)
-        
-        # Update streak information
-        update_streak(user_id, snapshot.profit_amount > 0)
-        
-        # Update milestone progress
-        update_milestone_progress(user_id)
-        
-        # Update goal progress
-        update_goal_progress(user_id)
-        
-        db.session.commit()
-        return True
-        
+        return close_day(datetime.utcnow().date(), [user_id])['users'] == 1
     except Exception as e:
-        db.session.rollback()
         print(f"Error in end_of_day_processing: {e}")
         return False
 
 
-def update_streak(user_id, is_profitable_day):
+def update_streak(user_id, is_profitable_day=None):
     """
-    Update the user's streak based on daily net P/L (profits minus losses)
+    Close today's streak for the user from the day's net P/L in the Profit table
+    
+    The first call of a day extends yesterday's stored streak (or recomputes it
+    from history with one gaps-and-islands query); later calls that day are
+    no-ops. See profit_streaks.close_streak_day.
     
     Args:
         user_id (int): User ID
-        is_profitable_day (bool): Whether today had net positive P/L
+        is_profitable_day (bool): Unused; kept for existing callers
         
     Returns:
         int: The updated streak count
     """
-    # Get or create user metrics
-    metrics = UserMetrics.query.filter_by(user_id=user_id).first()
-    if not metrics:
-        metrics = UserMetrics()
-        metrics.user_id = user_id
-        metrics.current_streak = 0
-        metrics.best_streak = 0
-        db.session.add(metrics)
-    
-    today = datetime.utcnow().date()
-    
-    # Check if this is a new day
-    if metrics.last_streak_update != today:
-        # Calculate actual net P/L for today to determine if profitable
-        today_start = datetime.combine(today, datetime.min.time())
-        today_end = datetime.combine(today, datetime.max.time())
-        
-        # Get today's profits
-        from sqlalchemy import func
-        today_profits = db.session.query(func.sum(Transaction.amount)).filter(
-            Transaction.user_id == user_id,
-            Transaction.transaction_type == 'trade_profit',
-            Transaction.timestamp >= today_start,
-            Transaction.timestamp <= today_end,
-            Transaction.status == 'completed'
-        ).scalar() or 0
-        
-        # Get today's losses
-        today_losses = db.session.query(func.sum(Transaction.amount)).filter(
-            Transaction.user_id == user_id,
-            Transaction.transaction_type == 'trade_loss',
-            Transaction.timestamp >= today_start,
-            Transaction.timestamp <= today_end,
-            Transaction.status == 'completed'
-        ).scalar() or 0
-        
-        # Also check Profit table
-        today_profit_table = db.session.query(func.sum(Profit.amount)).filter_by(
-            user_id=user_id, 
-            date=today
-        ).scalar() or 0
-        
-        # Calculate net P/L (profits minus losses)
-        net_pl = today_profits - abs(today_losses)
-        
-        # Use the higher value between calculated net P/L and Profit table
-        actual_net_pl = max(net_pl, today_profit_table)
-        
-        # Update streak based on actual net P/L, not just the passed parameter
-        if actual_net_pl > 0:
-            # Increment streak for profitable day (net positive P/L)
-            metrics.current_streak += 1
-            # Update best streak if current is better
-            if metrics.current_streak > metrics.best_streak:
-                metrics.best_streak = metrics.current_streak
-        else:
-            # Reset streak on non-profitable day (net zero or negative P/L)
-            metrics.current_streak = 0
-        
-        metrics.last_streak_update = today
-        db.session.commit()
-    
-    return metrics.current_streak
+    from profit_streaks import close_streak_day
+
+    updated = close_streak_day(datetime.utcnow().date(), [user_id])
+    if user_id in updated:
+        return updated[user_id]
+    metrics = UserMetrics.query.filter_by(user_id=user_id).order_by(UserMetrics.id).first()
+    return metrics.current_streak if metrics else 0
 
 
 def update_milestone_progress(user_id):
@@ -451,16 +366,13 @@ def get_performance_data(user_id):
     if not user:
         return None
     
-    # Ensure metrics exist
-    metrics = UserMetrics.query.filter_by(user_id=user_id).first()
+    # Metrics and snapshots are written by the end-of-day close (day_close.py);
+    # until a user's first close, show the defaults without writing anything
+    metrics = UserMetrics.query.filter_by(user_id=user_id).order_by(UserMetrics.id).first()
     if not metrics:
-        metrics = UserMetrics()
-        metrics.user_id = user_id
-        db.session.add(metrics)
-        db.session.commit()
-    
-    # Ensure daily snapshot exists
-    snapshot = ensure_daily_snapshot(user_id)
+        metrics = UserMetrics(user_id=user_id, current_streak=0, best_streak=0, next_milestone=10.0,
+                              milestone_progress=0.0, current_goal=100.0, goal_progress=0.0,
+                              trading_mode='autopilot')
     
     # Calculate days active (capped at 30)
     days_active = min(30, (datetime.utcnow().date() - user.created_at.date()).days + 1) if hasattr(user, 'created_at') else 1
@@ -0,0 +1,188 @@
+"""
+Profit Streaks
+==============
+Consecutive green days (daily P/L > 0 in the Profit table), computed with a
+single gaps-and-islands query instead of one query per day walked back.
+
+Within each user's green days ordered by date, day_number - row_number is
+constant along an unbroken run, so grouping on it yields one row per streak
+("island"). The current streak is the island ending on the day asked about;
+the best streak is the longest island. The same query serves one user or
+every user at once.
+
+UserMetrics.current_streak / best_streak hold the result as of the last
+closed day (last_streak_update). close_streak_day extends them by one day
+for users closed through the day before and recomputes the rest from
+history, all in a handful of set-based statements.
+
+Usage:
+    streak = profit_streak(user.id)                # live, one query
+    close_streak_day(date(2026, 3, 1))             # day close, all users
+"""
+import logging
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import Integer, bindparam, case, cast, func, insert, select, update
+
+from app import db
+from models import Profit, User, UserMetrics
+
+logger = logging.getLogger(__name__)
+
+
+def _day_number(column):
+    """Whole days since a fixed epoch, so consecutive dates differ by exactly 1"""
+    if db.engine.dialect.name == 'postgresql':
+        return cast(func.extract('epoch', column) / 86400, Integer)
+    return cast(func.julianday(column), Integer)
+
+
+def _streak_query(as_of: date, user_ids: Optional[Iterable[int]] = None):
+    """(user_id, current_streak, best_streak) for every user with a green day up to as_of"""
+    profits = Profit.__table__.c
+    daily = (
+        select(profits.user_id, profits.date)
+        .where(profits.date <= as_of)
+        .group_by(profits.user_id, profits.date)
+        .having(func.sum(profits.amount) > 0)
+    )
+    if user_ids is not None:
+        daily = daily.where(profits.user_id.in_(list(user_ids)))
+    daily = daily.subquery('daily')
+
+    islands = select(
+        daily.c.user_id,
+        daily.c.date,
+        (_day_number(daily.c.date)
+         - func.row_number().over(partition_by=daily.c.user_id, order_by=daily.c.date)).label('island'),
+    ).subquery('islands')
+
+    runs = (
+        select(islands.c.user_id,
+               func.max(islands.c.date).label('last_day'),
+               func.count().label('length'))
+        .group_by(islands.c.user_id, islands.c.island)
+        .subquery('runs')
+    )
+
+    return (
+        select(runs.c.user_id,
+               func.max(case((runs.c.last_day == as_of, runs.c.length), else_=0)),
+               func.max(runs.c.length))
+        .group_by(runs.c.user_id)
+    )
+
+
+def compute_streaks(as_of: Optional[date] = None,
+                    user_ids: Optional[Iterable[int]] = None) -> Dict[int, Tuple[int, int]]:
+    """
+    Current and best streak for each user, in one query
+
+    Args:
+        as_of: the day the current streak must end on (default: today, UTC)
+        user_ids: restrict to these users (default: everyone)
+
+    Returns:
+        dict: user_id -> (current_streak, best_streak); users without any
+        green day are absent
+    """
+    as_of = as_of or datetime.utcnow().date()
+    rows = db.session.execute(_streak_query(as_of, user_ids)).all()
+    return {user_id: (int(current), int(best)) for user_id, current, best in rows}
+
+
+def profit_streak(user_id: int, as_of: Optional[date] = None) -> int:
+    """Consecutive green days ending on as_of (today by default)"""
+    return compute_streaks(as_of, [user_id]).get(user_id, (0, 0))[0]
+
+
+def daily_pl(day: date, user_ids: Optional[Iterable[int]] = None) -> Dict[int, float]:
+    """Net Profit-table P/L of `day` per user, in one grouped query"""
+    profits = Profit.__table__.c
+    query = (select(profits.user_id, func.sum(profits.amount))
+             .where(profits.date == day)
+             .group_by(profits.user_id))
+    if user_ids is not None:
+        query = query.where(profits.user_id.in_(list(user_ids)))
+    return {user_id: total or 0.0 for user_id, total in db.session.execute(query)}
+
+
+def close_streak_day(day: Optional[date] = None, user_ids: Optional[Iterable[int]] = None,
+                     commit: bool = True) -> Dict[int, int]:
+    """
+    Bring UserMetrics streaks up to date through `day`
+
+    Users already closed through the previous day are extended by one day
+    from that day's P/L; users already closed through `day` are left alone;
+    everyone else (no metrics row, or missed days) is recomputed from history.
+
+    Args:
+        day: the day being closed (default: today, UTC)
+        user_ids: restrict to these users (default: every user)
+        commit: commit the session; pass False to close atomically with the caller's own changes
+
+    Returns:
+        dict: user_id -> current streak for every user that was updated
+    """
+    day = day or datetime.utcnow().date()
+    previous = day - timedelta(days=1)
+    # Closing for everyone reads whole tables rather than binding every id
+    everyone = user_ids is None
+    if everyone:
+        user_ids = db.session.execute(select(User.id)).scalars().all()
+    else:
+        user_ids = list(user_ids)
+    if not user_ids:
+        return {}
+
+    metrics = UserMetrics.__table__.c
+    query = (select(metrics.id, metrics.user_id, metrics.current_streak, metrics.best_streak,
+                    metrics.last_streak_update)
+             .order_by(metrics.id))
+    if not everyone:
+        query = query.where(metrics.user_id.in_(user_ids))
+    stored = {}
+    for metrics_id, user_id, current, best, updated in db.session.execute(query):
+        # Older code could create more than one row per user; the first one is authoritative
+        stored.setdefault(user_id, (metrics_id, current or 0, best or 0,
+                                    updated.date() if isinstance(updated, datetime) else updated))
+
+    extend = [user_id for user_id in user_ids if user_id in stored and stored[user_id][3] == previous]
+    recompute = [user_id for user_id in user_ids
+                 if user_id not in stored or stored[user_id][3] not in (previous, day)]
+
+    results = {}
+    pl = daily_pl(day, None if everyone else extend) if extend else {}
+    for user_id in extend:
+        _, current, best, _ = stored[user_id]
+        current = current + 1 if pl.get(user_id, 0.0) > 0 else 0
+        results[user_id] = (current, max(best, current))
+    if recompute:
+        history = compute_streaks(day, None if everyone else recompute)
+        for user_id in recompute:
+            current, best = history.get(user_id, (0, 0))
+            results[user_id] = (current, max(best, stored[user_id][2] if user_id in stored else 0))
+
+    closed_at = datetime.combine(day, datetime.min.time())
+    updates = [{'metrics_id': stored[user_id][0], 'current': current, 'best': best, 'closed_at': closed_at}
+               for user_id, (current, best) in results.items() if user_id in stored]
+    inserts = [{'user_id': user_id, 'current_streak': current, 'best_streak': best,
+                'last_streak_update': closed_at, 'last_updated': datetime.utcnow()}
+               for user_id, (current, best) in results.items() if user_id not in stored]
+    table = UserMetrics.__table__
+    if updates:
+        db.session.execute(
+            update(table)
+            .where(table.c.id == bindparam('metrics_id'))
+            .values(current_streak=bindparam('current'), best_streak=bindparam('best'),
+                    last_streak_update=bindparam('closed_at')),
+            updates
+        )
+    if inserts:
+        db.session.execute(insert(table), inserts)
+    if commit:
+        db.session.commit()
+
+    logger.info(f"Closed streaks for {day}: {len(extend)} extended, {len(recompute)} recomputed")
+    return {user_id: current for user_id, (current, _) in results.items()}
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+"""
+Query Benchmark Suite
+=====================
+Times the database hot paths behind the user dashboard, the referral
+screen and the admin user search against whatever DATABASE_URL points at
+(normally a local database seeded with synthetic_data_generator.py).
+
+Each benchmark is run for a seeded sample of users and reports latency
+percentiles and SQL statements per call. Results can be saved as a
+baseline and later runs compared against it, so a regression in either
+latency or query count is flagged (non-zero exit code).
+
+Usage:
+    python query_benchmark_suite.py --save-baseline
+    python query_benchmark_suite.py --compare --tolerance 0.25
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import logging
+import argparse
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASELINE_PATH = os.environ.get('QUERY_BASELINE_PATH', 'query_benchmark_baselines.json')
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class StatementCounter:
+    """Counts SQL statements on one engine while installed"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        with self.lock:
+            self.count += 1
+
+    def __enter__(self):
+        from sqlalchemy import event
+        event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        from sqlalchemy import event
+        event.remove(self.engine, 'before_cursor_execute', self._on_execute)
+        return False
+
+
+# ----------------------------------------------------------------------
+# Hot paths. Each takes a sample tuple (user_id, telegram_id, username)
+# and performs the same reads as the corresponding bot screen.
+# ----------------------------------------------------------------------
+def bench_performance_data(sample):
+    from performance_tracking import get_performance_data
+    return get_performance_data(sample[0])
+
+
+def bench_dashboard_queries(sample):
+    """The reads dashboard_command does before rendering"""
+    from models import User
+    from performance_tracking import get_performance_data, get_days_with_balance
+    user = User.query.filter_by(telegram_id=sample[1]).first()
+    data = get_performance_data(user.id)
+    return data, get_days_with_balance(user.id)
+
+
+def bench_referral_stats(sample):
+    from app import app
+    from referral_module import ReferralManager
+    return ReferralManager(app.app_context, 'benchmark_bot').get_referral_stats(sample[1])
+
+
+def bench_admin_search(sample):
+    """Exact match, then ranked partial matches, as the admin search does"""
+    from user_search import find_user, search_users
+    username = sample[2] or ''
+    fragment = username[len(username) // 3:len(username) // 3 + 4] or username
+    user = find_user(fragment)
+    if not user:
+        return search_users(fragment, limit=5)
+    return [user]
+
+
+# name -> (function, sample population)
+BENCHMARKS = {
+    'performance_data': (bench_performance_data, 'users'),
+    'dashboard_queries': (bench_dashboard_queries, 'users'),
+    'referral_stats': (bench_referral_stats, 'referrers'),
+    'admin_search': (bench_admin_search, 'users'),
+}
+
+
+class QueryBenchmarkSuite:
+    """Runs the benchmarks and compares results with stored baselines"""
+
+    def __init__(self, sample_size=50, iterations=3, seed=42, baseline_path=DEFAULT_BASELINE_PATH):
+        self.sample_size = sample_size
+        self.iterations = iterations
+        self.seed = seed
+        self.baseline_path = baseline_path
+
+    def _sample_users(self, population='users'):
+        from app import db
+        from models import User, ReferralCode
+        query = db.session.query(User.id)
+        if population == 'referrers':
+            query = query.join(ReferralCode, ReferralCode.user_id == User.id).distinct()
+        user_ids = [row[0] for row in query.order_by(User.id).all()]
+        if not user_ids:
+            raise RuntimeError("No users in database; seed it with synthetic_data_generator.py first")
+        chosen = random.Random(self.seed).sample(user_ids, min(self.sample_size, len(user_ids)))
+        rows = db.session.query(User.id, User.telegram_id, User.username).filter(User.id.in_(chosen)).all()
+        return [tuple(row) for row in rows]
+
+    def profile_key(self):
+        """Baselines are only comparable for the same dialect and data size"""
+        from app import db
+        from models import User, Transaction
+        users = db.session.query(db.func.count(User.id)).scalar()
+        transactions = db.session.query(db.func.count(Transaction.id)).scalar()
+        return f"{db.engine.dialect.name}:users={users}:transactions={transactions}"
+
+    def run(self, names=None):
+        """Run the selected benchmarks and return {name: stats}"""
+        from app import app, db
+
+        results = {}
+        with app.app_context():
+            for name in names or BENCHMARKS:
+                func, population = BENCHMARKS[name]
+                samples = self._sample_users(population)
+                # One warm-up pass so lazily created rows (metrics, snapshots) exist
+                for sample in samples:
+                    func(sample)
+                db.session.remove()
+
+                timings = []
+                with StatementCounter(db.engine) as counter:
+                    for _ in range(self.iterations):
+                        for sample in samples:
+                            started = time.perf_counter()
+                            func(sample)
+                            timings.append(time.perf_counter() - started)
+                    db.session.remove()
+
+                calls = len(timings)
+                results[name] = {
+                    'calls': calls,
+                    'p50_ms': round(percentile(timings, 50) * 1000, 3),
+                    'p95_ms': round(percentile(timings, 95) * 1000, 3),
+                    'mean_ms': round(sum(timings) / calls * 1000, 3),
+                    'queries_per_call': round(counter.count / calls, 2),
+                }
+                logger.info(f"{name}: {results[name]}")
+            results['_profile'] = self.profile_key()
+        return results
+
+    def load_baselines(self):
+        if not os.path.exists(self.baseline_path):
+            return {}
+        with open(self.baseline_path) as baseline_file:
+            return json.load(baseline_file)
+
+    def save_baseline(self, results):
+        baselines = self.load_baselines()
+        entry = {name: stats for name, stats in results.items() if not name.startswith('_')}
+        baselines[results['_profile']] = entry
+        with open(self.baseline_path, 'w') as baseline_file:
+            json.dump(baselines, baseline_file, indent=2, sort_keys=True)
+        logger.info(f"Saved baseline for {results['_profile']} to {self.baseline_path}")
+
+    def compare(self, results, tolerance=0.25):
+        """Return a list of regression descriptions (empty when none)"""
+        baselines = self.load_baselines()
+        baseline = baselines.get(results['_profile'])
+        if not baseline:
+            # Profiles include the row counts, so a different data size is not
+            # comparable; report it instead of passing silently
+            stored = ', '.join(sorted(baselines)) or 'none'
+            logger.error(f"No baseline stored for {results['_profile']} (stored profiles: {stored})")
+            return [f"no baseline for profile {results['_profile']} (stored: {stored})"]
+
+        regressions = []
+        for name, stats in results.items():
+            if name.startswith('_') or name not in baseline:
+                continue
+            before = baseline[name]
+            if stats['queries_per_call'] > before['queries_per_call']:
+                regressions.append(f"{name}: queries/call {before['queries_per_call']} -> {stats['queries_per_call']}")
+            if stats['p50_ms'] > before['p50_ms'] * (1 + tolerance):
+                regressions.append(f"{name}: p50 {before['p50_ms']}ms -> {stats['p50_ms']}ms")
+        return regressions
+
+
+def print_results(results, baseline=None):
+    print("=" * 78)
+    print(f"QUERY BENCHMARKS  ({results['_profile']})")
+    print("=" * 78)
+    print(f"{'benchmark':<20}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}{'queries':>10}{'base p50':>12}")
+    for name, stats in results.items():
+        if name.startswith('_'):
+            continue
+        base = (baseline or {}).get(name, {}).get('p50_ms', '-')
+        print(f"{name:<20}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['mean_ms']:>10}"
+              f"{stats['queries_per_call']:>10}{base:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dashboard, referral and admin search queries")
+    parser.add_argument('--sample-size', type=int, default=50, help="users sampled per benchmark")
+    parser.add_argument('--iterations', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--only', action='append', choices=sorted(BENCHMARKS), help="run only these benchmarks")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE_PATH, help="baseline JSON file")
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--compare', action='store_true', help="fail on regression against the baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed p50 slowdown fraction")
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s', level=logging.WARNING)
+
+    suite = QueryBenchmarkSuite(args.sample_size, args.iterations, args.seed, args.baseline)
+    results = suite.run(args.only)
+    print_results(results, suite.load_baselines().get(results['_profile']))
+
+    if args.save_baseline:
+        suite.save_baseline(results)
+    if args.compare:
+        regressions = suite.compare(results, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
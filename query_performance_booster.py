@@ -1,7 +1,8 @@
 """
 Query Performance Booster - Direct SQL Optimization
 ==================================================
-Creates essential indexes and optimized query functions for AWS database performance.
+Optimized query functions for AWS database performance. Indexes are declared
+in models.py and applied by db_migrate.py.
 """
 
 import os
@@ -29,49 +30,18 @@ class QueryPerformanceBooster:
             connection.close()
     
     def create_essential_indexes(self):
-        """Create the most critical indexes for bot performance"""
-        
-        essential_indexes = [
-            # User table - most critical
-            'CREATE INDEX IF NOT EXISTS idx_user_telegram_id_fast ON "user" (telegram_id)',
-            'CREATE INDEX IF NOT EXISTS idx_user_status_active ON "user" (status) WHERE status = \'active\'',
-            'CREATE INDEX IF NOT EXISTS idx_user_balance_nonzero ON "user" (balance) WHERE balance > 0',
-            
-            # Transaction table - extremely critical for performance
-            'CREATE INDEX IF NOT EXISTS idx_transaction_user_time ON transaction (user_id, timestamp DESC)',
-            'CREATE INDEX IF NOT EXISTS idx_transaction_type_status ON transaction (transaction_type, status)',
-            'CREATE INDEX IF NOT EXISTS idx_transaction_hash_unique ON transaction (tx_hash) WHERE tx_hash IS NOT NULL',
-            
-            # Trading positions - critical for dashboard
-            'CREATE INDEX IF NOT EXISTS idx_trading_user_status ON trading_position (user_id, status)',
-            'CREATE INDEX IF NOT EXISTS idx_trading_timestamp ON trading_position (timestamp DESC)',
-            
-            # Profit table - dashboard performance
-            'CREATE INDEX IF NOT EXISTS idx_profit_user_date ON profit (user_id, date DESC)',
-            'CREATE INDEX IF NOT EXISTS idx_profit_date_recent ON profit (date) WHERE date >= CURRENT_DATE - INTERVAL \'30 days\'',
-            
-            # User metrics - real-time dashboard
-            'CREATE INDEX IF NOT EXISTS idx_user_metrics_user ON user_metrics (user_id)',
-            
-            # Daily snapshots - performance tracking
-            'CREATE INDEX IF NOT EXISTS idx_daily_snapshot_user_date ON daily_snapshot (user_id, date DESC)',
-        ]
-        
-        created = 0
-        with self.get_connection() as conn:
-            for index_sql in essential_indexes:
-                try:
-                    conn.execute(text(index_sql))
-                    conn.commit()
-                    created += 1
-                    index_name = index_sql.split('idx_')[1].split(' ')[0] if 'idx_' in index_sql else 'unknown'
-                    logger.info(f"Created index: idx_{index_name}")
-                    self.indexes_created.append(index_name)
-                except Exception as e:
-                    logger.warning(f"Index creation skipped (may exist): {str(e)[:100]}")
-        
-        logger.info(f"Essential indexes setup complete. Created {created} indexes.")
-        return created
+        """Ensure the indexes declared in models.py exist.
+
+        Indexes are no longer created here with raw DDL; they are declared on
+        the models and applied by the migration step (db_migrate.py).
+        """
+        from app import app, apply_declared_indexes
+
+        with app.app_context():
+            created = apply_declared_indexes()
+        self.indexes_created.extend(created)
+        logger.info(f"Essential indexes setup complete. Created {len(created)} indexes.")
+        return len(created)
     
     def optimize_user_lookup(self, telegram_id):
         """Ultra-fast user lookup by telegram_id"""
@@ -260,7 +230,6 @@ def get_query_booster():
     global query_booster
     if query_booster is None:
         query_booster = QueryPerformanceBooster()
-        query_booster.create_essential_indexes()
         query_booster.update_table_statistics()
     return query_booster
 
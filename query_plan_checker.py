@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+"""
+Query Plan Checker
+==================
+Runs EXPLAIN on the fingerprints of the bot's hot queries and reports any
+that would read a hot table with a full (sequential) scan instead of an
+index. Works on SQLite (EXPLAIN QUERY PLAN) and PostgreSQL (EXPLAIN JSON
+with enable_seqscan off, so a Seq Scan only appears when no index fits).
+
+Usage:
+    python query_plan_checker.py            # exit code 1 on any full scan
+"""
+
+import sys
+import logging
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# name -> (SQL, parameters). The SQL mirrors what the ORM issues on the hot
+# paths (dashboard, referral screen, admin views, deposit and trade matching).
+HOT_QUERIES = {
+    'user_by_telegram_id': (
+        'SELECT id FROM "user" WHERE telegram_id = :telegram_id',
+        {'telegram_id': '99000000001'}),
+    'users_by_status': (
+        'SELECT id FROM "user" WHERE status = :status',
+        {'status': 'ACTIVE'}),
+    'users_by_referrer_code': (
+        'SELECT telegram_id, username, joined_at, balance, initial_deposit FROM "user" '
+        'WHERE referrer_code_id = :code_id',
+        {'code_id': 1}),
+    'referral_code_by_user': (
+        'SELECT id, code FROM referral_code WHERE user_id = :user_id AND is_active = :active',
+        {'user_id': 1, 'active': True}),
+    'transaction_sum_by_type_since': (
+        'SELECT SUM(amount) FROM "transaction" WHERE user_id = :user_id '
+        'AND transaction_type = :tx_type AND timestamp >= :since',
+        {'user_id': 1, 'tx_type': 'trade_profit', 'since': datetime.utcnow() - timedelta(days=1)}),
+    'recent_trades': (
+        'SELECT id, amount FROM "transaction" WHERE user_id = :user_id '
+        'AND transaction_type IN (\'trade_profit\', \'trade_loss\') ORDER BY timestamp DESC LIMIT 5',
+        {'user_id': 1}),
+    'transaction_by_tx_hash': (
+        'SELECT id FROM "transaction" WHERE tx_hash = :tx_hash',
+        {'tx_hash': 'synthetic_1'}),
+    'profit_sum_today': (
+        'SELECT SUM(amount) FROM profit WHERE user_id = :user_id AND date = :day',
+        {'user_id': 1, 'day': date.today()}),
+    'positions_by_user_status_token': (
+        'SELECT id FROM trading_position WHERE user_id = :user_id AND status = :status AND token_name = :token',
+        {'user_id': 1, 'status': 'open', 'token': 'BONK'}),
+    'open_positions': (
+        'SELECT id, token_name, current_price FROM trading_position WHERE status = :status',
+        {'status': 'open'}),
+    'position_by_buy_tx_hash': (
+        'SELECT id FROM trading_position WHERE buy_tx_hash = :tx_hash',
+        {'tx_hash': 'abc'}),
+    'position_by_sell_tx_hash': (
+        'SELECT id FROM trading_position WHERE sell_tx_hash = :tx_hash',
+        {'tx_hash': 'abc'}),
+    'sender_wallets_by_user': (
+        'SELECT wallet_address FROM sender_wallet WHERE user_id = :user_id',
+        {'user_id': 1}),
+    'daily_snapshot_by_user_date': (
+        'SELECT id FROM daily_snapshot WHERE user_id = :user_id AND date = :day',
+        {'user_id': 1, 'day': date.today()}),
+    'user_metrics_by_user': (
+        'SELECT id FROM user_metrics WHERE user_id = :user_id',
+        {'user_id': 1}),
+    'background_job_claim': (
+        'SELECT id FROM background_job WHERE queue = :queue AND status = :status AND run_at <= :now '
+        'ORDER BY priority DESC, run_at, id LIMIT 4',
+        {'queue': 'settlement', 'status': 'queued', 'now': datetime.utcnow()}),
+}
+
+
+def explain(connection, sql, params):
+    """Return a list of (table, access) pairs, access being 'index' or 'full_scan'"""
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        rows = connection.execute(text(f"EXPLAIN QUERY PLAN {sql}"), params).fetchall()
+        accesses = []
+        for row in rows:
+            detail = row[-1]
+            words = detail.split()
+            if words and words[0] in ('SCAN', 'SEARCH') and len(words) > 1:
+                # An AUTOMATIC index is built per query from a full scan
+                full_scan = ('AUTOMATIC' in detail or
+                             (words[0] == 'SCAN' and 'INDEX' not in detail))
+                accesses.append((words[1].strip('"'), 'full_scan' if full_scan else 'index'))
+        return accesses
+
+    if dialect == 'postgresql':
+        connection.execute(text("SET LOCAL enable_seqscan = off"))
+        plan = connection.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"), params).scalar()
+        accesses = []
+
+        def walk(node):
+            relation = node.get('Relation Name')
+            if relation:
+                accesses.append((relation, 'full_scan' if node['Node Type'] == 'Seq Scan' else 'index'))
+            for child in node.get('Plans', []):
+                walk(child)
+
+        walk(plan[0]['Plan'])
+        return accesses
+
+    raise ValueError(f"EXPLAIN checks are not implemented for {dialect}")
+
+
+def find_full_scans(engine, queries=None):
+    """Return {query name: [tables read with a full scan]} for every regressed fingerprint"""
+    regressions = {}
+    for name, (sql, params) in (queries or HOT_QUERIES).items():
+        with engine.begin() as connection:
+            scans = [table for table, access in explain(connection, sql, params) if access == 'full_scan']
+        if scans:
+            regressions[name] = scans
+    return regressions
+
+
+def main():
+    from app import app, db
+
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s', level=logging.INFO)
+    with app.app_context():
+        regressions = find_full_scans(db.engine)
+    for name, tables in regressions.items():
+        logger.error(f"{name}: full scan on {', '.join(tables)}")
+    if not regressions:
+        logger.info(f"All {len(HOT_QUERIES)} hot queries use an index")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,3 +1,5 @@
 #!/bin/bash
+echo "Applying database schema..."
+python db_migrate.py
 echo "Starting Telegram bot..."
 python bot_v20_runner.py
\ No newline at end of file
@@ -13,15 +13,121 @@ Key Features:
 
 import random
 import logging
+import zlib
 from datetime import datetime
+from sqlalchemy import case, func, insert, select, update
 from app import app, db
+from balance_ledger import apply_deltas
 from models import User, TradingPosition, Transaction, UserStatus
 
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; the list-based path gives identical results
+    np = None
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def calculate_smart_allocation(user_balance, entry_price, add_randomization=True):
+# Balance tiers, highest first: (minimum balance, low allocation, high allocation, risk level)
+# Whales get modest exposure, micro holders go heavier (still leaving a buffer)
+ALLOCATION_TIERS = (
+    (10.0, 0.05, 0.15, "conservative"),
+    (5.0, 0.08, 0.25, "moderate"),
+    (2.0, 0.15, 0.35, "aggressive"),
+    (0.5, 0.25, 0.50, "very_aggressive"),
+    (0.0, 0.40, 0.70, "ultra_aggressive"),
+)
+
+# Never allocate more than 70% of a balance, for safety and realism
+MAX_ALLOCATION = 0.70
+
+# ±5% variance applied on top of the tier draw so no two trades are identical
+RANDOMIZATION_SPREAD = 0.05
+
+# Positions closed per UPDATE ... RETURNING statement in a SELL broadcast
+SELL_CHUNK_SIZE = 1000
+
+
+def _tier_index(balance):
+    for index, (minimum, _, _, _) in enumerate(ALLOCATION_TIERS):
+        if balance >= minimum:
+            return index
+    return len(ALLOCATION_TIERS) - 1
+
+
+def calculate_smart_allocations(balances, entry_price, add_randomization=True, rng=None):
+    """
+    Calculate allocations for a whole population of balances in one pass
+
+    Both random draws per user come from `rng` in a fixed order, so the same
+    seed and balances always produce the same allocations whether or not
+    NumPy is installed.
+
+    Args:
+        balances (list): SOL balances, one per user
+        entry_price (float): Token entry price
+        add_randomization (bool): Whether to add the ±5% variance
+        rng (random.Random): Source of randomness (defaults to the global generator)
+
+    Returns:
+        dict: parallel lists 'spendable_sol', 'token_quantity',
+              'allocation_percent' and 'risk_level'
+    """
+    rng = rng or random
+    count = len(balances)
+    tier_draws = [rng.random() for _ in range(count)]
+    variance_draws = [rng.random() for _ in range(count)] if add_randomization else None
+
+    if np is not None:
+        balance = np.asarray(balances, dtype=float)
+        tier = np.select([balance >= minimum for minimum, _, _, _ in ALLOCATION_TIERS],
+                         list(range(len(ALLOCATION_TIERS))), default=len(ALLOCATION_TIERS) - 1)
+        low = np.asarray([t[1] for t in ALLOCATION_TIERS])[tier]
+        high = np.asarray([t[2] for t in ALLOCATION_TIERS])[tier]
+        alloc = low + (high - low) * np.asarray(tier_draws, dtype=float)
+        if add_randomization:
+            alloc = alloc * (1 - RANDOMIZATION_SPREAD + 2 * RANDOMIZATION_SPREAD * np.asarray(variance_draws))
+            alloc = np.minimum(alloc, MAX_ALLOCATION)
+        funded = balance > 0
+        alloc = np.where(funded, alloc, 0.0)
+        spendable = np.where(funded, np.round(balance * alloc, 4), 0.0)
+        quantity = np.floor(spendable / entry_price).astype(int) if entry_price > 0 else np.zeros(count, dtype=int)
+        levels = [ALLOCATION_TIERS[i][3] if ok else 'none' for i, ok in zip(tier.tolist(), funded.tolist())]
+        return {
+            'spendable_sol': spendable.tolist(),
+            'token_quantity': quantity.tolist(),
+            'allocation_percent': (alloc * 100).tolist(),
+            'risk_level': levels,
+        }
+
+    spendable, quantity, percent, levels = [], [], [], []
+    for i, balance in enumerate(balances):
+        if balance <= 0:
+            spendable.append(0.0)
+            quantity.append(0)
+            percent.append(0.0)
+            levels.append('none')
+            continue
+        _, low, high, level = ALLOCATION_TIERS[_tier_index(balance)]
+        alloc = low + (high - low) * tier_draws[i]
+        if add_randomization:
+            alloc *= 1 - RANDOMIZATION_SPREAD + 2 * RANDOMIZATION_SPREAD * variance_draws[i]
+            alloc = min(alloc, MAX_ALLOCATION)
+        spend = round(balance * alloc, 4)
+        spendable.append(spend)
+        quantity.append(int(spend / entry_price) if entry_price > 0 else 0)
+        percent.append(alloc * 100)
+        levels.append(level)
+    return {
+        'spendable_sol': spendable,
+        'token_quantity': quantity,
+        'allocation_percent': percent,
+        'risk_level': levels,
+    }
+
+
+def calculate_smart_allocation(user_balance, entry_price, add_randomization=True, rng=None):
     """
     Calculate how much SOL a user should spend based on their balance
     
@@ -29,6 +135,7 @@ def calculate_smart_allocation(user_balance, entry_price, add_randomization=True
         user_balance (float): User's current SOL balance
         entry_price (float): Token entry price
         add_randomization (bool): Whether to add slight randomization
+        rng (random.Random): Source of randomness (defaults to the global generator)
         
     Returns:
         dict: {
@@ -39,60 +146,8 @@ def calculate_smart_allocation(user_balance, entry_price, add_randomization=True
         }
     """
     try:
-        if user_balance <= 0:
-            return {
-                'spendable_sol': 0.0,
-                'token_quantity': 0,
-                'allocation_percent': 0.0,
-                'risk_level': 'none'
-            }
-        
-        # Define realistic allocation strategy based on balance tiers
-        # Using more conservative percentages to keep alerts believable
-        if user_balance >= 10:
-            # Whales: Very conservative 5-15% allocation
-            alloc_percent = random.uniform(0.05, 0.15)
-            risk_level = "conservative"
-        elif user_balance >= 5:
-            # Medium holders: Conservative 8-25% allocation
-            alloc_percent = random.uniform(0.08, 0.25)
-            risk_level = "moderate"
-        elif user_balance >= 2:
-            # Small holders: Moderate 15-35% allocation
-            alloc_percent = random.uniform(0.15, 0.35)
-            risk_level = "aggressive"
-        elif user_balance >= 0.5:
-            # Tiny holders: Higher 25-50% allocation
-            alloc_percent = random.uniform(0.25, 0.50)
-            risk_level = "very_aggressive"
-        else:
-            # Micro holders: Maximum 40-70% allocation (still leaving buffer)
-            alloc_percent = random.uniform(0.40, 0.70)
-            risk_level = "ultra_aggressive"
-        
-        # Add slight randomization to make each trade unique
-        if add_randomization:
-            randomization_factor = random.uniform(0.95, 1.05)  # ±5% variance
-            alloc_percent *= randomization_factor
-            
-            # Ensure we don't exceed 70% allocation for safety and realism
-            alloc_percent = min(alloc_percent, 0.70)
-        
-        # Calculate spendable amount
-        spendable_sol = round(user_balance * alloc_percent, 4)
-        
-        # Calculate token quantity
-        if entry_price > 0:
-            token_quantity = int(spendable_sol / entry_price)
-        else:
-            token_quantity = 0
-        
-        return {
-            'spendable_sol': spendable_sol,
-            'token_quantity': token_quantity,
-            'allocation_percent': alloc_percent * 100,  # Convert to percentage
-            'risk_level': risk_level
-        }
+        allocations = calculate_smart_allocations([user_balance], entry_price, add_randomization, rng)
+        return {key: values[0] for key, values in allocations.items()}
         
     except Exception as e:
         logger.error(f"Error calculating smart allocation: {e}")
@@ -104,10 +159,67 @@ def calculate_smart_allocation(user_balance, entry_price, add_randomization=True
         }
 
 
+def broadcast_seed(token_symbol, tx_link):
+    """Stable RNG seed for a broadcast, so re-running it reproduces every allocation"""
+    return zlib.crc32(f"{token_symbol}:{tx_link}".encode('utf-8'))
+
+
+def _eligible_balances(condition):
+    """(user_id, balance) rows matching `condition`, in a stable order for the seeded RNG"""
+    users = User.__table__.c
+    return db.session.connection().execute(
+        select(users.id, users.balance).where(condition).order_by(users.id)
+    ).all()
+
+
+def _latest_holding_positions(token_symbol, target_users):
+    """
+    Every holder's most recent 'holding' position in `token_symbol`, in one query
+
+    PostgreSQL uses DISTINCT ON; other databases use a ROW_NUMBER() window.
+
+    Returns:
+        list: (position_id, user_id, entry_price, amount) rows ordered by user_id
+    """
+    positions = TradingPosition.__table__.c
+    users = User.__table__.c
+    conditions = [positions.token_name == token_symbol, positions.status == "holding"]
+    if target_users == "active":
+        conditions.append(positions.user_id.in_(select(users.id).where(users.status == UserStatus.ACTIVE)))
+
+    if db.engine.dialect.name == 'postgresql':
+        query = (
+            select(positions.id, positions.user_id, positions.entry_price, positions.amount)
+            .where(*conditions)
+            .distinct(positions.user_id)
+            .order_by(positions.user_id, positions.timestamp.desc(), positions.id.desc())
+        )
+    else:
+        ranked = (
+            select(
+                positions.id, positions.user_id, positions.entry_price, positions.amount,
+                func.row_number().over(
+                    partition_by=positions.user_id,
+                    order_by=(positions.timestamp.desc(), positions.id.desc()),
+                ).label('position_rank'),
+            )
+            .where(*conditions)
+            .subquery()
+        )
+        query = (
+            select(ranked.c.id, ranked.c.user_id, ranked.c.entry_price, ranked.c.amount)
+            .where(ranked.c.position_rank == 1)
+            .order_by(ranked.c.user_id)
+        )
+    return db.session.connection().execute(query).all()
+
 
-def process_smart_buy_broadcast(token_symbol, entry_price, admin_amount, tx_link, target_users="active"):
+def process_smart_buy_broadcast(token_symbol, entry_price, admin_amount, tx_link, target_users="active", seed=None):
     """
     Process admin BUY command with smart balance allocation for each user
+
+    Allocations for the whole eligible population are computed in one pass
+    and written with bulk INSERTs plus one bulk balance_ledger debit.
     
     Args:
         token_symbol (str): Token symbol like "ZING"
@@ -115,6 +227,7 @@ def process_smart_buy_broadcast(token_symbol, entry_price, admin_amount, tx_link
         admin_amount (float): Admin's token amount (for reference only)
         tx_link (str): Transaction link
         target_users (str): "active" or "all"
+        seed (int): RNG seed; defaults to one derived from token_symbol and tx_link
         
     Returns:
         tuple: (success, message, affected_users_count, allocation_summary)
@@ -122,45 +235,45 @@ def process_smart_buy_broadcast(token_symbol, entry_price, admin_amount, tx_link
     try:
         with app.app_context():
             logger.info(f"Starting smart buy broadcast for {token_symbol}")
+            users = User.__table__.c
             
             # First, check total users in database
             total_users = User.query.count()
             logger.info(f"Total users in database: {total_users}")
             
-            # Get target users - using more inclusive query
-            if target_users == "active":
-                # Query users with any balance
-                users = User.query.filter(User.balance >= 0.01).all()
-                logger.info(f"Found {len(users)} active users with balance >= 0.01")
-            else:
-                users = User.query.filter(User.balance >= 0.01).all()
-                logger.info(f"Found {len(users)} users with balance >= 0.01")
+            # Get target users - "active" and "all" both mean users with a usable balance
+            eligible = _eligible_balances(users.balance >= 0.01)
+            logger.info(f"Found {len(eligible)} users with balance >= 0.01")
             
             # If no users with balance, try users with any balance > 0
-            if not users:
-                users = User.query.filter(User.balance > 0).all()
-                logger.info(f"Fallback: Found {len(users)} users with balance > 0")
+            if not eligible:
+                eligible = _eligible_balances(users.balance > 0)
+                logger.info(f"Fallback: Found {len(eligible)} users with balance > 0")
             
             # If still no users, get all users
-            if not users:
-                users = User.query.all()
-                logger.warning(f"Last resort: Found {len(users)} total users")
+            if not eligible:
+                all_users = User.query.order_by(User.id).all()
+                logger.warning(f"Last resort: Found {len(all_users)} total users")
                 
                 # If we have users but no balance, give them some balance for testing
-                if users:
-                    for user in users[:5]:  # Give balance to first 5 users
+                if all_users:
+                    for user in all_users[:5]:  # Give balance to first 5 users
                         if user.balance <= 0:
                             user.balance = 10.0  # Give 10 SOL for testing
                             logger.info(f"Gave test balance to user {user.id}")
                     db.session.commit()
-                    users = User.query.filter(User.balance > 0).all()
-                    logger.info(f"After adding test balances: {len(users)} users")
+                    eligible = _eligible_balances(users.balance > 0)
+                    logger.info(f"After adding test balances: {len(eligible)} users")
             
-            if not users:
+            if not eligible:
                 logger.error("No users found even after all attempts")
                 return False, f"No users found in database (Total in DB: {total_users})", 0, {}
             
-            affected_count = 0
+            seed = broadcast_seed(token_symbol, tx_link) if seed is None else seed
+            allocations = calculate_smart_allocations(
+                [balance for _, balance in eligible], entry_price, rng=random.Random(seed)
+            )
+            
             total_sol_allocated = 0
             allocation_summary = {
                 'conservative': 0,
@@ -170,58 +283,54 @@ def process_smart_buy_broadcast(token_symbol, entry_price, admin_amount, tx_link
                 'ultra_aggressive': 0
             }
             current_time = datetime.utcnow()
+            positions = []
+            transactions = []
+            debits = []
             
-            for user in users:
-                try:
-                    # Calculate smart allocation for this user
-                    allocation = calculate_smart_allocation(user.balance, entry_price)
-                    
-                    if allocation['spendable_sol'] <= 0:
-                        continue
-                    
-                    # Deduct the allocated amount from user's balance
-                    user.balance -= allocation['spendable_sol']
-                    
-                    # Create personalized BUY position entry
-                    position = TradingPosition()
-                    position.user_id = user.id
-                    position.token_name = token_symbol
-                    position.entry_price = entry_price
-                    position.current_price = entry_price
-                    position.amount = allocation['token_quantity']
-                    position.timestamp = current_time
-                    position.status = "holding"
-                    position.buy_tx_hash = tx_link
-                    position.buy_timestamp = current_time
-                    position.trade_type = "snipe"
-                    
-                    db.session.add(position)
-                    
-                    # Create transaction record for the purchase
-                    transaction = Transaction()
-                    transaction.user_id = user.id
-                    transaction.transaction_type = "buy"
-                    transaction.amount = -allocation['spendable_sol']  # Negative because it's spent
-                    transaction.token_name = token_symbol
-                    transaction.price = entry_price
-                    transaction.timestamp = current_time
-                    transaction.status = "completed"
-                    transaction.notes = f"Smart allocation buy: {allocation['token_quantity']:,} {token_symbol}"
-                    transaction.tx_hash = f"{tx_link}_user_{user.id}"  # Unique hash per user
-                    
-                    db.session.add(transaction)
-                    
-                    # Update statistics
-                    affected_count += 1
-                    total_sol_allocated += allocation['spendable_sol']
-                    allocation_summary[allocation['risk_level']] += 1
-                    
-                except Exception as user_error:
-                    logger.warning(f"Failed to create smart allocation for user {user.id}: {user_error}")
+            for (user_id, _), spendable_sol, token_quantity, risk_level in zip(
+                    eligible, allocations['spendable_sol'], allocations['token_quantity'], allocations['risk_level']):
+                if spendable_sol <= 0:
                     continue
+                
+                # Personalized BUY position entry
+                positions.append({
+                    'user_id': user_id,
+                    'token_name': token_symbol,
+                    'entry_price': entry_price,
+                    'current_price': entry_price,
+                    'amount': token_quantity,
+                    'timestamp': current_time,
+                    'status': "holding",
+                    'buy_tx_hash': tx_link,
+                    'buy_timestamp': current_time,
+                    'trade_type': "snipe",
+                })
+                
+                # Transaction record for the purchase
+                transactions.append({
+                    'user_id': user_id,
+                    'transaction_type': "buy",
+                    'amount': -spendable_sol,  # Negative because it's spent
+                    'token_name': token_symbol,
+                    'price': entry_price,
+                    'timestamp': current_time,
+                    'status': "completed",
+                    'notes': f"Smart allocation buy: {token_quantity:,} {token_symbol}",
+                    'tx_hash': f"{tx_link}_user_{user_id}",  # Unique hash per user
+                })
+                
+                debits.append((user_id, -spendable_sol, f"{tx_link}_user_{user_id}"))
+                total_sol_allocated += spendable_sol
+                allocation_summary[risk_level] += 1
+            
+            if debits:
+                db.session.execute(insert(TradingPosition), positions)
+                db.session.execute(insert(Transaction), transactions)
+                apply_deltas(debits, 'smart_buy', commit=False)
             
             # Commit all changes
             db.session.commit()
+            affected_count = len(debits)
             
             # Create summary message
             avg_allocation = total_sol_allocated / affected_count if affected_count > 0 else 0
@@ -242,6 +351,7 @@ def process_smart_buy_broadcast(token_symbol, entry_price, admin_amount, tx_link
             return True, message, affected_count, allocation_summary
             
     except Exception as e:
+        db.session.rollback()
         logger.error(f"Error processing smart BUY broadcast: {e}")
         return False, f"Error processing smart BUY: {str(e)}", 0, {}
 
@@ -249,6 +359,11 @@ def process_smart_buy_broadcast(token_symbol, entry_price, admin_amount, tx_link
 def process_smart_sell_broadcast(token_symbol, exit_price, admin_amount, tx_link, target_users="active"):
     """
     Process admin SELL command with smart profit calculation for each user
+
+    Every holder's latest position is fetched in one query and closed with
+    UPDATE ... WHERE status = 'holding' RETURNING id. Transactions and
+    balance_ledger credits are written only for the positions that UPDATE
+    returned, so a position closed concurrently is not credited twice.
     
     Args:
         token_symbol (str): Token symbol like "ZING"
@@ -262,18 +377,29 @@ def process_smart_sell_broadcast(token_symbol, exit_price, admin_amount, tx_link
     """
     try:
         with app.app_context():
-            from sqlalchemy import desc
-            
-            # Get target users who have open positions for this token
-            if target_users == "active":
-                users = User.query.filter_by(status=UserStatus.ACTIVE).all()
-            else:
-                users = User.query.all()
+            # Most recent open BUY position for this token, per target user
+            holdings = {row[0]: row for row in _latest_holding_positions(token_symbol, target_users)}
+            current_time = datetime.utcnow()
             
-            if not users:
-                return False, "No users found to broadcast to", 0, {}
+            # Close the positions; only the ones still holding come back
+            closed_ids = set()
+            position_table = TradingPosition.__table__
+            positions = position_table.c
+            position_ids = list(holdings)
+            for start in range(0, len(position_ids), SELL_CHUNK_SIZE):
+                chunk = position_ids[start:start + SELL_CHUNK_SIZE]
+                roi = {position_id: ((exit_price / holdings[position_id][2]) - 1) * 100
+                       if holdings[position_id][2] > 0 else 0 for position_id in chunk}
+                closed_ids.update(db.session.execute(
+                    update(position_table)
+                    .where(positions.id.in_(chunk))
+                    .where(positions.status == "holding")
+                    .values(status="completed", current_price=exit_price, exit_price=exit_price,
+                            sell_tx_hash=tx_link, sell_timestamp=current_time,
+                            roi_percentage=case(roi, value=positions.id))
+                    .returning(positions.id)
+                ).scalars())
             
-            affected_count = 0
             total_profit = 0
             total_loss = 0
             profit_summary = {
@@ -282,81 +408,63 @@ def process_smart_sell_broadcast(token_symbol, exit_price, admin_amount, tx_link
                 'total_tokens_sold': 0,
                 'avg_profit_percent': 0
             }
-            current_time = datetime.utcnow()
             profit_percentages = []
+            transactions = []
+            credits = []
             
-            for user in users:
-                try:
-                    # Find the most recent open BUY position for this token
-                    open_position = TradingPosition.query.filter_by(
-                        user_id=user.id,
-                        token_name=token_symbol,
-                        status="holding"
-                    ).order_by(desc(TradingPosition.timestamp)).first()
-                    
-                    if not open_position:
-                        continue  # User doesn't have this token
-                    
-                    # Calculate profit/loss
-                    entry_price = open_position.entry_price
-                    token_quantity = open_position.amount
-                    
-                    # Calculate profit percentage
-                    profit_percentage = ((exit_price / entry_price) - 1) * 100 if entry_price > 0 else 0
-                    
-                    # Calculate SOL amounts
-                    original_spent = entry_price * token_quantity
-                    current_value = exit_price * token_quantity
-                    profit_amount = current_value - original_spent
-                    
-                    # Update user's balance with the proceeds
-                    user.balance += current_value
-                    
-                    # Update the position to closed
-                    open_position.status = "completed"
-                    open_position.current_price = exit_price
-                    open_position.exit_price = exit_price
-                    open_position.sell_tx_hash = tx_link
-                    open_position.sell_timestamp = current_time
-                    open_position.roi_percentage = profit_percentage
-                    
-                    # Create transaction record for the sale
-                    transaction = Transaction()
-                    transaction.user_id = user.id
-                    transaction.transaction_type = "sell"
-                    transaction.amount = current_value  # Positive because it's received
-                    transaction.token_name = token_symbol
-                    transaction.price = exit_price
-                    transaction.timestamp = current_time
-                    transaction.status = "completed"
-                    transaction.notes = f"Smart allocation sell: {token_quantity:,} {token_symbol} | P/L: {profit_amount:.4f} SOL ({profit_percentage:.2f}%)"
-                    transaction.tx_hash = f"{tx_link}_user_{user.id}"  # Unique hash per user
-                    transaction.related_trade_id = open_position.id
-                    
-                    db.session.add(transaction)
-                    
-                    # Update statistics
-                    affected_count += 1
-                    profit_summary['total_tokens_sold'] += token_quantity
-                    profit_percentages.append(profit_percentage)
-                    
-                    if profit_amount > 0:
-                        total_profit += profit_amount
-                        profit_summary['profitable_trades'] += 1
-                    else:
-                        total_loss += abs(profit_amount)
-                        profit_summary['losing_trades'] += 1
-                    
-                except Exception as user_error:
-                    logger.warning(f"Failed to process sell for user {user.id}: {user_error}")
+            for position_id, user_id, entry_price, token_quantity in holdings.values():
+                if position_id not in closed_ids:
                     continue
+                
+                # Calculate profit percentage
+                profit_percentage = ((exit_price / entry_price) - 1) * 100 if entry_price > 0 else 0
+                
+                # Calculate SOL amounts
+                original_spent = entry_price * token_quantity
+                current_value = exit_price * token_quantity
+                profit_amount = current_value - original_spent
+                
+                credits.append((user_id, current_value, f"position:{position_id}"))
+                
+                # Transaction record for the sale
+                transactions.append({
+                    'user_id': user_id,
+                    'transaction_type': "sell",
+                    'amount': current_value,  # Positive because it's received
+                    'token_name': token_symbol,
+                    'price': exit_price,
+                    'timestamp': current_time,
+                    'status': "completed",
+                    'notes': f"Smart allocation sell: {token_quantity:,} {token_symbol} | P/L: {profit_amount:.4f} SOL ({profit_percentage:.2f}%)",
+                    'tx_hash': f"{tx_link}_user_{user_id}",  # Unique hash per user
+                    'related_trade_id': position_id,
+                })
+                
+                # Update statistics
+                profit_summary['total_tokens_sold'] += token_quantity
+                profit_percentages.append(profit_percentage)
+                
+                if profit_amount > 0:
+                    total_profit += profit_amount
+                    profit_summary['profitable_trades'] += 1
+                else:
+                    total_loss += abs(profit_amount)
+                    profit_summary['losing_trades'] += 1
+            
+            affected_count = len(credits)
+            if not affected_count:
+                db.session.rollback()
+                return False, f"No holding positions found for ${token_symbol}", 0, profit_summary
+            
+            db.session.execute(insert(Transaction), transactions)
+            # Credit each user's balance with the proceeds
+            apply_deltas(credits, 'smart_sell', commit=False)
             
             # Commit all changes
             db.session.commit()
             
             # Calculate average profit percentage
-            if profit_percentages:
-                profit_summary['avg_profit_percent'] = sum(profit_percentages) / len(profit_percentages)
+            profit_summary['avg_profit_percent'] = sum(profit_percentages) / len(profit_percentages)
             
             # Create summary message
             net_profit = total_profit - total_loss
@@ -374,6 +482,7 @@ def process_smart_sell_broadcast(token_symbol, exit_price, admin_amount, tx_link
             return True, message, affected_count, profit_summary
             
     except Exception as e:
+        db.session.rollback()
         logger.error(f"Error processing smart SELL broadcast: {e}")
         return False, f"Error processing smart SELL: {str(e)}", 0, {}
 
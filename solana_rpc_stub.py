@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+"""
+Solana RPC Stub
+===============
+Local JSON-RPC server answering the Solana methods the bot uses
+(getBalance, getSignaturesForAddress, getTransaction, getHealth), single
+or batched, from in-memory data. Point SOLANA_RPC_URLS at it to run deposit
+detection offline, or start several in a test to exercise failover and
+hedging (`delay` and `fail_status` make an instance slow or broken).
+
+StubWebsocketServer stands in for the websocket endpoint: it accepts
+logsSubscribe/accountSubscribe, pushes logsNotification messages on
+notify() and drops every connection on drop(), to exercise reconnects.
+
+Usage:
+    python solana_rpc_stub.py --port 8899 --ws-port 8900
+    SOLANA_RPC_URLS=http://127.0.0.1:8899 SOLANA_WS_URL=ws://127.0.0.1:8900/ \
+        DEPOSIT_MONITOR_MODE=subscribe python bot_v20_runner.py
+"""
+import argparse
+import asyncio
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from aiohttp import WSMsgType, web
+
+logger = logging.getLogger(__name__)
+
+
+class StubRpcServer:
+    """
+    In-memory Solana RPC
+
+    Args:
+        balances: address -> lamports
+        signatures: address -> getSignaturesForAddress entries, newest first
+        transactions: signature -> getTransaction result
+        delay: seconds to wait before answering each HTTP request
+        fail_status: answer every request with this HTTP status instead
+    """
+
+    def __init__(self, balances=None, signatures=None, transactions=None, delay=0.0, fail_status=None,
+                 host='127.0.0.1', port=0):
+        self.balances = balances or {}
+        self.signatures = signatures or {}
+        self.transactions = transactions or {}
+        self.delay = delay
+        self.fail_status = fail_status
+        self.requests = []  # one list of method names per HTTP request
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='solana-rpc-stub', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def methods_called(self):
+        """Every method called so far, flattened"""
+        with self._lock:
+            return [method for request in self.requests for method in request]
+
+    def answer(self, call):
+        """The JSON-RPC response object for one call"""
+        method = call.get('method')
+        params = call.get('params') or []
+        response = {'jsonrpc': '2.0', 'id': call.get('id')}
+        if method == 'getBalance':
+            response['result'] = {'context': {'slot': 1}, 'value': self.balances.get(params[0], 0)}
+        elif method == 'getSignaturesForAddress':
+            options = params[1] if len(params) > 1 else {}
+            listed = self.signatures.get(params[0], [])
+            if options.get('before'):
+                signatures = [entry['signature'] for entry in listed]
+                listed = listed[signatures.index(options['before']) + 1:] if options['before'] in signatures else []
+            entries = []
+            for entry in listed:
+                if entry['signature'] == options.get('until'):
+                    break
+                entries.append(entry)
+            response['result'] = entries[:options.get('limit', 1000)]
+        elif method == 'getTransaction':
+            response['result'] = self.transactions.get(params[0])
+        elif method == 'getHealth':
+            response['result'] = 'ok'
+        else:
+            response['error'] = {'code': -32601, 'message': 'Method not found'}
+        return response
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'null')
+                calls = body if isinstance(body, list) else [body]
+                with stub._lock:
+                    stub.requests.append([call.get('method') for call in calls])
+                if stub.delay:
+                    time.sleep(stub.delay)
+                if stub.fail_status:
+                    self.send_response(stub.fail_status)
+                    self.end_headers()
+                    return
+                answers = [stub.answer(call) for call in calls]
+                payload = json.dumps(answers if isinstance(body, list) else answers[0]).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                logger.debug("stub rpc: " + format % args)
+
+        return Handler
+
+
+class StubWebsocketServer:
+    """Solana pubsub stand-in running its own event loop thread"""
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.host = host
+        self.port = port
+        self.subscriptions = []  # (method, params) per subscribe request
+        self.loop = None
+        self._sockets = set()
+        self._runner = None
+        self._thread = None
+        self._ready = threading.Event()
+
+    @property
+    def url(self):
+        return f"ws://{self.host}:{self.port}/"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='solana-ws-stub', daemon=True)
+        self._thread.start()
+        self._ready.wait(5)
+        return self
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        self.loop.run_until_complete(self._serve())
+        self._ready.set()
+        self.loop.run_forever()
+
+    async def _serve(self):
+        app = web.Application()
+        app.router.add_get('/', self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    async def _handle(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self._sockets.add(ws)
+        try:
+            async for message in ws:
+                if message.type != WSMsgType.TEXT:
+                    continue
+                call = json.loads(message.data)
+                if str(call.get('method', '')).endswith('Subscribe'):
+                    self.subscriptions.append((call['method'], call.get('params')))
+                    await ws.send_json({'jsonrpc': '2.0', 'result': len(self.subscriptions), 'id': call.get('id')})
+                else:
+                    await ws.send_json({'jsonrpc': '2.0', 'id': call.get('id'),
+                                        'error': {'code': -32601, 'message': 'Method not found'}})
+        finally:
+            self._sockets.discard(ws)
+        return ws
+
+    def _call(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(5)
+
+    def notify(self, signature, err=None, slot=1):
+        """Push a logsNotification for a signature to every open connection"""
+        message = {'jsonrpc': '2.0', 'method': 'logsNotification', 'params': {
+            'result': {'context': {'slot': slot}, 'value': {'signature': signature, 'err': err, 'logs': []}},
+            'subscription': len(self.subscriptions)}}
+
+        async def send():
+            for ws in list(self._sockets):
+                await ws.send_json(message)
+
+        self._call(send())
+
+    def drop(self):
+        """Close every connection, as a node restart or network blip would"""
+        async def close():
+            for ws in list(self._sockets):
+                await ws.close()
+
+        self._call(close())
+
+    def wait_for_subscriptions(self, count, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while len(self.subscriptions) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return len(self.subscriptions) >= count
+
+    def stop(self):
+        self._call(self._runner.cleanup())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Solana RPC stub")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8899)
+    parser.add_argument('--data', help="JSON file with balances, signatures and transactions")
+    parser.add_argument('--ws-port', type=int, help="Also serve a websocket stand-in on this port")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    data = {}
+    if args.data:
+        with open(args.data) as f:
+            data = json.load(f)
+    stub = StubRpcServer(data.get('balances'), data.get('signatures'), data.get('transactions'),
+                         host=args.host, port=args.port).start()
+    logger.info(f"Solana RPC stub listening on {stub.url}")
+    ws_stub = None
+    if args.ws_port:
+        ws_stub = StubWebsocketServer(host=args.host, port=args.ws_port).start()
+        logger.info(f"Solana websocket stub listening on {ws_stub.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stub.stop()
+        if ws_stub:
+            ws_stub.stop()
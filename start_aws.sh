@@ -27,7 +27,7 @@ fi
 
 # Run database migrations if needed
 echo "Setting up database..."
-python -c "from app import app, db; app.app_context().push(); db.create_all(); print('Database setup complete')"
+python db_migrate.py
 
 # Start the Flask application
 echo "Starting Flask application..."
@@ -0,0 +1,148 @@
+"""
+Startup Profiler
+================
+Measures the cold-start path of the bot process so restart budgets can be
+tracked. Each stage (module import, schema, instance lock, bot init) is
+timed and reported once polling is ready, i.e. the first getUpdates call has
+completed. The first handled update is only marked for information: it
+depends on when a user happens to write, so it is not held to the budget.
+
+Usage:
+    from startup_profiler import get_startup_profiler
+    profiler = get_startup_profiler()
+    with profiler.phase('lock'):
+        acquire_lock()
+    profiler.mark('polling_ready')
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Budget (seconds) from process start to polling ready
+STARTUP_BUDGET_SECONDS = float(os.environ.get('STARTUP_BUDGET_SECONDS', '1.0'))
+
+# Optional path where the JSON report is written once polling is ready
+STARTUP_REPORT_PATH = os.environ.get('STARTUP_REPORT_PATH')
+
+
+def _process_start_time():
+    """Wall-clock time at which the current process was created."""
+    try:
+        import psutil
+        return psutil.Process(os.getpid()).create_time()
+    except Exception:
+        return time.time()
+
+
+class StartupProfiler:
+    """Collects phase timings for a single process start"""
+
+    def __init__(self, budget_seconds=STARTUP_BUDGET_SECONDS, report_path=STARTUP_REPORT_PATH):
+        self.budget_seconds = budget_seconds
+        self.report_path = report_path
+        self.process_start = _process_start_time()
+        self.phases = {}      # name -> duration in seconds
+        self.marks = {}       # name -> seconds since process start
+        self._order = []
+        self._reported = False
+        self.lock = threading.Lock()
+
+    def _since_start(self):
+        return time.time() - self.process_start
+
+    @contextmanager
+    def phase(self, name):
+        """Time a startup phase; repeated phases accumulate."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                if name not in self.phases:
+                    self._order.append(name)
+                self.phases[name] = self.phases.get(name, 0.0) + elapsed
+
+    def record(self, name, seconds):
+        """Record a phase measured elsewhere (e.g. module import time)."""
+        with self.lock:
+            if name not in self.phases:
+                self._order.append(name)
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def mark(self, name):
+        """Record a one-off milestone relative to process start (first mark wins)."""
+        with self.lock:
+            if name in self.marks:
+                return False
+            self.marks[name] = self._since_start()
+
+        if name == 'polling_ready':
+            self.report()
+        return True
+
+    def get_report(self):
+        """Return the timing breakdown as a dictionary"""
+        with self.lock:
+            phases = [
+                {'phase': name, 'seconds': round(self.phases[name], 4)}
+                for name in self._order
+            ]
+            marks = {name: round(value, 4) for name, value in self.marks.items()}
+
+        time_to_polling_ready = marks.get('polling_ready')
+        return {
+            'pid': os.getpid(),
+            'phases': phases,
+            'marks': marks,
+            'time_to_polling_ready': time_to_polling_ready,
+            'budget_seconds': self.budget_seconds,
+            'within_budget': (
+                time_to_polling_ready is not None and time_to_polling_ready <= self.budget_seconds
+            )
+        }
+
+    def report(self):
+        """Log the timing breakdown once and optionally write it to disk"""
+        if self._reported:
+            return None
+        self._reported = True
+
+        report = self.get_report()
+        lines = [f"  {p['phase']:<16} {p['seconds'] * 1000:9.1f} ms" for p in report['phases']]
+        for name, value in report['marks'].items():
+            lines.append(f"  @{name:<15} {value * 1000:9.1f} ms since process start")
+        logger.info("Startup timing report:\n" + "\n".join(lines))
+
+        if report['time_to_polling_ready'] is not None and not report['within_budget']:
+            logger.warning(
+                f"Startup exceeded budget: {report['time_to_polling_ready']:.3f}s to polling ready "
+                f"(budget {self.budget_seconds:.3f}s)"
+            )
+
+        if self.report_path:
+            try:
+                with open(self.report_path, 'w') as report_file:
+                    json.dump(report, report_file, indent=2)
+            except OSError as e:
+                logger.warning(f"Could not write startup report to {self.report_path}: {e}")
+
+        return report
+
+
+# Global profiler instance
+_global_startup_profiler = None
+
+
+def get_startup_profiler():
+    """Get or create the process-wide startup profiler"""
+    global _global_startup_profiler
+    if _global_startup_profiler is None:
+        _global_startup_profiler = StartupProfiler()
+    return _global_startup_profiler
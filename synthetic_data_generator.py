@@ -0,0 +1,383 @@
+#!/usr/bin/env python
+"""
+Synthetic Data Generator
+========================
+Seeds realistic data volumes into User, Transaction, Profit, TradingPosition,
+ReferralCode, SenderWallet and DailySnapshot so that performance work on the
+dashboards, referral stats and admin views can be measured.
+
+Rows are written with multi-row INSERTs in chunks and explicit primary keys,
+so 10M transactions is a matter of minutes on local Postgres. On Postgres
+the id sequences are moved past the seeded keys afterwards so the app's own
+inserts do not collide with them. All synthetic
+users have telegram ids starting with SYNTHETIC_TELEGRAM_PREFIX and can be
+removed again with --purge.
+
+Refuses to run against a non-local database unless --allow-remote is given.
+
+Usage:
+    python synthetic_data_generator.py --users 100000 --transactions 10000000
+    python synthetic_data_generator.py --users 1000 --seed 7
+    python synthetic_data_generator.py --purge
+"""
+
+import sys
+import time
+import random
+import logging
+import argparse
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+
+from sqlalchemy import insert, func, text
+
+from app import app, db, run_schema_migrations
+from models import (User, UserStatus, Transaction, Profit, TradingPosition, ReferralCode,
+                    SenderWallet, DailySnapshot, UserMetrics, MilestoneTracker, TradingCycle,
+                    AutoTradingSettings, SupportTicket, ReferralReward)
+
+logger = logging.getLogger(__name__)
+
+# Telegram ids of generated users start with this prefix (real ids are shorter)
+SYNTHETIC_TELEGRAM_PREFIX = "99"
+SYNTHETIC_TELEGRAM_BASE = 99_000_000_000
+
+DEFAULT_CHUNK_SIZE = 5000
+
+TOKENS = ['BONK', 'WIF', 'POPCAT', 'MEW', 'BOME', 'SLERF', 'MYRO', 'SAMO', 'PONKE', 'GIGA',
+          'MOODENG', 'PNUT', 'GOAT', 'FWOG', 'CHILLGUY', 'RETARDIO', 'MICHI', 'SC', 'ZEREBRO', 'AI16Z']
+
+# Transaction type mix for generated ledger rows (type, weight, sign)
+TRANSACTION_MIX = [
+    ('trade_profit', 40, 1),
+    ('trade_loss', 15, -1),
+    ('buy', 12, -1),
+    ('sell', 12, 1),
+    ('deposit', 10, 1),
+    ('withdraw', 6, -1),
+    ('admin_credit', 3, 1),
+    ('admin_adjustment', 2, 1),
+]
+
+BASE58 = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+
+
+class SyntheticDataGenerator:
+    """Generates and bulk-inserts synthetic rows with a seeded RNG"""
+
+    def __init__(self, seed=42, chunk_size=DEFAULT_CHUNK_SIZE, days=90):
+        self.random = random.Random(seed)
+        self.chunk_size = chunk_size
+        self.days = days
+        self.now = datetime.utcnow().replace(microsecond=0)
+        self.today = self.now.date()
+        self.counts = {}
+
+    # ------------------------------------------------------------------
+    # helpers
+    # ------------------------------------------------------------------
+    def _next_id(self, model):
+        return (db.session.query(func.max(model.id)).scalar() or 0) + 1
+
+    def _address(self, length=44):
+        return ''.join(self.random.choices(BASE58, k=length))
+
+    def _timestamp(self):
+        return self.now - timedelta(seconds=self.random.randint(0, self.days * 86400))
+
+    def _insert(self, model, rows):
+        """Insert rows in chunks; `rows` may be any iterable of dicts"""
+        chunk = []
+        inserted = 0
+        started = time.perf_counter()
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= self.chunk_size:
+                db.session.execute(insert(model), chunk)
+                db.session.commit()
+                inserted += len(chunk)
+                chunk = []
+        if chunk:
+            db.session.execute(insert(model), chunk)
+            db.session.commit()
+            inserted += len(chunk)
+
+        elapsed = time.perf_counter() - started
+        self.counts[model.__tablename__] = self.counts.get(model.__tablename__, 0) + inserted
+        rate = inserted / elapsed if elapsed else 0
+        logger.info(f"Inserted {inserted} {model.__tablename__} rows in {elapsed:.1f}s ({rate:,.0f} rows/s)")
+        return inserted
+
+    # ------------------------------------------------------------------
+    # generators per table
+    # ------------------------------------------------------------------
+    def generate(self, users=1000, transactions=None, profit_days=14, positions=None,
+                 referral_fraction=0.3, sender_wallet_fraction=0.6, snapshot_days=7):
+        """Seed all tables and return a dict of inserted row counts"""
+        transactions = transactions if transactions is not None else users * 20
+        positions = positions if positions is not None else users * 3
+
+        first_user_id = self._next_id(User)
+        user_ids = list(range(first_user_id, first_user_id + users))
+        telegram_offset = first_user_id
+
+        balances = {}
+
+        def user_rows():
+            statuses = [UserStatus.ACTIVE] * 6 + [UserStatus.ONBOARDING] * 2 + \
+                [UserStatus.DEPOSITING, UserStatus.INACTIVE]
+            for user_id in user_ids:
+                deposit = round(self.random.choice([0, 0.5, 1, 2, 5, 10]) * self.random.uniform(0.8, 1.5), 4)
+                balance = round(deposit * self.random.uniform(0.7, 2.5), 4)
+                balances[user_id] = balance
+                joined = self._timestamp()
+                yield {
+                    'id': user_id,
+                    'telegram_id': str(SYNTHETIC_TELEGRAM_BASE + telegram_offset + user_id),
+                    'username': f"synth_{user_id}_{self.random.choice(TOKENS).lower()}",
+                    'first_name': self.random.choice(['Alex', 'Sam', 'Kai', 'Noa', 'Rin', 'Lee', 'Max']),
+                    'last_name': self.random.choice(['Trader', 'Moon', 'Degen', 'Hodl', None]),
+                    'joined_at': joined,
+                    'status': self.random.choice(statuses),
+                    'wallet_address': self._address(),
+                    'balance': balance,
+                    'initial_deposit': deposit,
+                    'last_activity': joined,
+                    'referral_bonus': 0.0,
+                    'sniper_active': False,
+                }
+
+        self._insert(User, user_rows())
+
+        # Referral codes for a fraction of users, then point some users at them
+        first_code_id = self._next_id(ReferralCode)
+        code_owners = [u for u in user_ids if self.random.random() < referral_fraction]
+        code_ids = list(range(first_code_id, first_code_id + len(code_owners)))
+
+        def referral_rows():
+            for code_id, owner_id in zip(code_ids, code_owners):
+                yield {
+                    'id': code_id,
+                    'user_id': owner_id,
+                    'code': f"SYN{code_id:09d}",
+                    'created_at': self._timestamp(),
+                    'is_active': True,
+                    'total_referrals': 0,
+                    'total_earned': round(self.random.uniform(0, 2), 4),
+                }
+
+        self._insert(ReferralCode, referral_rows())
+
+        if code_ids:
+            # Heavy-tailed: a few codes refer most users
+            referred = [u for u in user_ids if self.random.random() < 0.5]
+            for start in range(0, len(referred), self.chunk_size):
+                batch = referred[start:start + self.chunk_size]
+                db.session.execute(
+                    User.__table__.update()
+                    .where(User.__table__.c.id == db.bindparam('uid'))
+                    .values(referrer_code_id=db.bindparam('code_id')),
+                    [{'uid': u, 'code_id': code_ids[int(len(code_ids) * self.random.random() ** 3)]}
+                     for u in batch]
+                )
+                db.session.commit()
+
+        def sender_wallet_rows():
+            for user_id in user_ids:
+                if self.random.random() < sender_wallet_fraction:
+                    yield {
+                        'user_id': user_id,
+                        'wallet_address': self._address(),
+                        'created_at': self._timestamp(),
+                        'last_used': self._timestamp(),
+                        'is_primary': True,
+                    }
+
+        self._insert(SenderWallet, sender_wallet_rows())
+
+        types = [t for t, _, _ in TRANSACTION_MIX]
+        weights = [w for _, w, _ in TRANSACTION_MIX]
+        signs = {t: s for t, _, s in TRANSACTION_MIX}
+        first_tx_id = self._next_id(Transaction)
+
+        def transaction_rows():
+            for offset in range(transactions):
+                tx_id = first_tx_id + offset
+                tx_type = self.random.choices(types, weights)[0]
+                amount = round(self.random.uniform(0.001, 0.5) * signs[tx_type], 6)
+                if tx_type in ('trade_loss', 'withdraw'):
+                    amount = abs(amount)
+                yield {
+                    'id': tx_id,
+                    'user_id': self.random.choice(user_ids),
+                    'transaction_type': tx_type,
+                    'amount': amount,
+                    'token_name': self.random.choice(TOKENS) if tx_type in ('buy', 'sell', 'trade_profit', 'trade_loss') else None,
+                    'price': round(self.random.uniform(0.000001, 0.01), 8) if tx_type in ('buy', 'sell') else None,
+                    'timestamp': self._timestamp(),
+                    'status': 'completed' if self.random.random() < 0.95 else 'pending',
+                    'notes': None,
+                    'tx_hash': f"synthetic_{tx_id}" if tx_type == 'deposit' else None,
+                    'processed_at': None,
+                    'related_trade_id': None,
+                }
+
+        self._insert(Transaction, transaction_rows())
+
+        def profit_rows():
+            for user_id in user_ids:
+                # Consecutive recent days so streaks have something to find
+                for day in range(self.random.randint(0, profit_days)):
+                    amount = round(self.random.uniform(-0.02, 0.08) * max(balances[user_id], 0.1), 6)
+                    yield {
+                        'user_id': user_id,
+                        'amount': amount,
+                        'percentage': round(self.random.uniform(-2, 8), 3),
+                        'date': self.today - timedelta(days=day),
+                    }
+
+        self._insert(Profit, profit_rows())
+
+        def position_rows():
+            for _ in range(positions):
+                token = self.random.choice(TOKENS)
+                entry = round(self.random.uniform(0.000001, 0.01), 10)
+                is_open = self.random.random() < 0.25
+                current = round(entry * self.random.uniform(0.5, 3.0), 10)
+                bought = self._timestamp()
+                yield {
+                    'user_id': self.random.choice(user_ids),
+                    'token_name': token,
+                    'amount': round(self.random.uniform(1000, 5_000_000), 2),
+                    'entry_price': entry,
+                    'current_price': current,
+                    'timestamp': bought,
+                    'status': 'open' if is_open else 'closed',
+                    'trade_type': self.random.choice(['scalp', 'snipe', 'dip', 'reversal']),
+                    'buy_tx_hash': self._address(88),
+                    'sell_tx_hash': None if is_open else self._address(88),
+                    'buy_timestamp': bought,
+                    'sell_timestamp': None if is_open else bought + timedelta(minutes=self.random.randint(1, 600)),
+                    'roi_percentage': None if is_open else round((current - entry) / entry * 100, 2),
+                    'contract_address': f"{token}{self._address(40)}",
+                }
+
+        self._insert(TradingPosition, position_rows())
+
+        def snapshot_rows():
+            for user_id in user_ids:
+                balance = balances[user_id]
+                for day in range(snapshot_days):
+                    yield {
+                        'user_id': user_id,
+                        'date': self.today - timedelta(days=day),
+                        'starting_balance': balance,
+                        'ending_balance': balance if day else None,
+                        'profit_amount': None,
+                        'profit_percentage': None,
+                        'trades_count': self.random.randint(0, 5),
+                        'winning_trades': self.random.randint(0, 3),
+                    }
+
+        self._insert(DailySnapshot, snapshot_rows())
+
+        self._reset_sequences()
+        return dict(self.counts)
+
+    def _reset_sequences(self):
+        """Move Postgres id sequences past the explicit keys inserted above"""
+        if db.engine.dialect.name != 'postgresql':
+            return
+        quote = db.engine.dialect.identifier_preparer.quote
+        for model in (User, ReferralCode, Transaction):
+            table = quote(model.__tablename__)
+            db.session.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), MAX(id)) FROM {table}"))
+        db.session.commit()
+
+
+def purge_synthetic_data():
+    """Delete every row belonging to synthetic users"""
+    synthetic_ids = db.session.query(User.id).filter(
+        User.telegram_id.like(f"{SYNTHETIC_TELEGRAM_PREFIX}%"),
+        User.username.like('synth_%')
+    ).subquery()
+    select_ids = db.select(synthetic_ids.c.id)
+
+    deleted = {}
+    db.session.execute(
+        User.__table__.update().where(User.referrer_code_id.in_(
+            db.select(ReferralCode.id).where(ReferralCode.user_id.in_(select_ids))
+        )).values(referrer_code_id=None)
+    )
+    db.session.execute(ReferralReward.__table__.delete().where(
+        ReferralReward.referrer_id.in_(select_ids) | ReferralReward.referred_id.in_(select_ids)))
+    # Includes rows the bot creates lazily for any user (metrics, cycles, settings)
+    for model in (DailySnapshot, UserMetrics, MilestoneTracker, TradingCycle, AutoTradingSettings,
+                  SupportTicket, TradingPosition, Profit, Transaction, SenderWallet, ReferralCode):
+        result = db.session.execute(model.__table__.delete().where(model.user_id.in_(select_ids)))
+        deleted[model.__tablename__] = result.rowcount
+    result = db.session.execute(User.__table__.delete().where(User.id.in_(select_ids)))
+    deleted['user'] = result.rowcount
+    db.session.commit()
+    return deleted
+
+
+def is_local_database(url):
+    """True for SQLite files and Postgres on localhost"""
+    parsed = urlparse(url)
+    if parsed.scheme.startswith('sqlite'):
+        return True
+    return parsed.hostname in ('localhost', '127.0.0.1', '::1', None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed synthetic data for performance work")
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--transactions', type=int, help="total transactions (default 20 per user)")
+    parser.add_argument('--positions', type=int, help="total trading positions (default 3 per user)")
+    parser.add_argument('--profit-days', type=int, default=14, help="max consecutive Profit days per user")
+    parser.add_argument('--snapshot-days', type=int, default=7)
+    parser.add_argument('--referral-fraction', type=float, default=0.3)
+    parser.add_argument('--sender-wallet-fraction', type=float, default=0.6)
+    parser.add_argument('--days', type=int, default=90, help="history window for timestamps")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--purge', action='store_true', help="delete synthetic rows instead of creating them")
+    parser.add_argument('--allow-remote', action='store_true', help="permit a non-local DATABASE_URL")
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s', level=logging.INFO)
+
+    if not is_local_database(app.config['SQLALCHEMY_DATABASE_URI']) and not args.allow_remote:
+        logger.error("DATABASE_URL is not a local database; pass --allow-remote to seed it anyway")
+        return 2
+
+    if not args.purge:
+        run_schema_migrations()
+
+    with app.app_context():
+        if args.purge:
+            logger.info(f"Purged synthetic rows: {purge_synthetic_data()}")
+            return 0
+
+        generator = SyntheticDataGenerator(seed=args.seed, chunk_size=args.chunk_size, days=args.days)
+        started = time.perf_counter()
+        counts = generator.generate(
+            users=args.users,
+            transactions=args.transactions,
+            profit_days=args.profit_days,
+            positions=args.positions,
+            referral_fraction=args.referral_fraction,
+            sender_wallet_fraction=args.sender_wallet_fraction,
+            snapshot_days=args.snapshot_days,
+        )
+        if db.engine.dialect.name == 'postgresql':
+            db.session.execute(text("ANALYZE"))
+            db.session.commit()
+        logger.info(f"Seeded {counts} in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
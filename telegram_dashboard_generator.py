@@ -118,15 +118,11 @@ def schedule_daily_reset():
     This should be called when the application starts
     """
     import schedule
-    from performance_tracking import end_of_day_processing
-    from models import User
+    from day_close import close_day
     
     def daily_reset_job():
-        """Process end-of-day calculations for all users"""
-        # Get all active users
-        users = User.query.all()
-        for user in users:
-            end_of_day_processing(user.id)
+        """Close the day that just ended for all users in one batch"""
+        close_day()
     
     # Schedule the job to run at midnight UTC
     schedule.every().day.at("00:00").do(daily_reset_job)
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+"""
+Test Async DB Access
+--------------------
+Checks that run_db keeps blocking queries off the event loop (each call in
+its own app context and session, contextvars carried over, failures rolled
+back), that the scheduled notification jobs query through it, and that
+the loop lag monitor reports a blocking call with its stack while ignoring
+work done on the executor.
+"""
+
+import os
+import time
+import asyncio
+import logging
+import tempfile
+import threading
+import contextvars
+
+if not os.environ.get('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='async_db_test_'), 'async.db')}"
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '1:async-db-test-token')
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import app, db, run_schema_migrations
+from async_db import LoopLagMonitor, db_task, run_db
+from models import Profit, User, UserStatus
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+request_id = contextvars.ContextVar('request_id', default=None)
+
+
+def _user_balance(telegram_id):
+    user = User.query.filter_by(telegram_id=telegram_id).first()
+    return {'balance': user.balance, 'thread': threading.get_ident(), 'request_id': request_id.get()}
+
+
+def _slow_query(seconds):
+    db.session.execute(db.select(User.id).limit(1)).all()
+    time.sleep(seconds)  # a slow query, as far as the loop can tell
+    return seconds
+
+
+def test_run_db_runs_in_its_own_context_off_the_loop():
+    """Calls run on worker threads with the caller's contextvars"""
+    run_schema_migrations()
+    with app.app_context():
+        db.session.add(User(telegram_id='6610000001', username='async_reader', balance=4.5))
+        db.session.commit()
+
+    async def main():
+        request_id.set('req-42')
+        loop_thread = threading.get_ident()
+        first, second = await asyncio.gather(run_db(_user_balance, '6610000001'),
+                                             db_task(_user_balance)('6610000001'))
+        return loop_thread, first, second
+
+    loop_thread, first, second = asyncio.run(main())
+    for result in (first, second):
+        assert result['balance'] == 4.5 and result['request_id'] == 'req-42'
+        assert result['thread'] != loop_thread
+
+
+def test_slow_query_does_not_stall_other_coroutines():
+    """The loop keeps ticking while a slow query runs on the executor"""
+    run_schema_migrations()
+
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        await run_db(_slow_query, 0.3)
+        task.cancel()
+        return ticks
+
+    assert asyncio.run(main()) >= 10
+
+
+def test_failed_call_rolls_back_and_raises():
+    """A failing call propagates its error and leaves nothing half-written"""
+    run_schema_migrations()
+
+    def add_then_fail():
+        db.session.add(User(telegram_id='6620000001', username='async_rollback'))
+        db.session.flush()
+        raise SQLAlchemyError("boom")
+
+    async def main():
+        try:
+            await run_db(add_then_fail)
+        except SQLAlchemyError:
+            return True
+        return False
+
+    assert asyncio.run(main())
+    with app.app_context():
+        assert User.query.filter_by(telegram_id='6620000001').count() == 0
+
+
+class _RecordingBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+
+
+def test_notification_jobs_query_off_the_loop():
+    """Daily updates, milestones and inactivity reminders run every query on the executor"""
+    from types import SimpleNamespace
+    from utils.notifications import send_daily_update, send_inactivity_reminder
+
+    run_schema_migrations()
+    with app.app_context():
+        idle = User(telegram_id='6615000001', username='async_idle', balance=2.0, initial_deposit=2.0,
+                    status=UserStatus.ACTIVE, last_activity=datetime.utcnow() - timedelta(days=6))
+        db.session.add(idle)
+        db.session.flush()
+        db.session.add(Profit(user_id=idle.id, amount=0.5, percentage=25.0, date=datetime.utcnow().date()))
+        db.session.commit()
+        engine = db.engine
+
+    query_threads = []
+
+    def record_thread(*args):
+        query_threads.append(threading.get_ident())
+
+    async def main():
+        context = SimpleNamespace(bot=_RecordingBot())
+        await send_daily_update(context)
+        await send_inactivity_reminder(context)
+        return threading.get_ident(), context.bot.sent
+
+    event.listen(engine, 'before_cursor_execute', record_thread)
+    try:
+        loop_thread, sent = asyncio.run(main())
+    finally:
+        event.remove(engine, 'before_cursor_execute', record_thread)
+
+    texts = [text for chat_id, text in sent if chat_id == '6615000001']
+    assert any('DAILY PROFIT UPDATE' in text for text in texts)
+    assert any('Days since last check: 6' in text for text in texts)
+    assert query_threads and loop_thread not in query_threads
+
+
+def test_loop_lag_monitor_reports_blocking_call():
+    """A blocking sleep on the loop is reported with its stack; executor work is not"""
+
+    def blocking_handler():
+        time.sleep(0.3)
+
+    async def main():
+        monitor = LoopLagMonitor(threshold=0.1, interval=0.02, name='test').start()
+        await asyncio.sleep(0.1)
+        await run_db(_slow_query, 0.3)
+        await asyncio.sleep(0.1)
+        assert not monitor.reports, monitor.reports
+        blocking_handler()
+        await asyncio.sleep(0.1)
+        monitor.stop()
+        return list(monitor.reports)
+
+    run_schema_migrations()
+    reports = asyncio.run(main())
+    assert len(reports) == 1
+    lag, stack = reports[0]
+    assert lag >= 0.2
+    assert 'blocking_handler' in stack
+
+
+if __name__ == "__main__":
+    test_run_db_runs_in_its_own_context_off_the_loop()
+    test_slow_query_does_not_stall_other_coroutines()
+    test_failed_call_rolls_back_and_raises()
+    test_notification_jobs_query_off_the_loop()
+    test_loop_lag_monitor_reports_blocking_call()
+    logger.warning("All async DB tests passed")
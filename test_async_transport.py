@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+"""
+Test Async Transport
+--------------------
+Runs SimpleTelegramBot on the asyncio transport against the fake Telegram
+API: end-to-end update handling, concurrent sends on a single loop thread
+with 429 back-off, and coroutine utilities running on the bot's loop.
+"""
+
+import os
+import sys
+import socket
+import logging
+import tempfile
+import threading
+import subprocess
+import time
+
+if not os.environ.get('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='async_test_'), 'async.db')}"
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '123456:ASYNC-TEST-TOKEN')
+
+import requests
+
+from async_transport import get_async_runtime, run_coroutine
+from load_test_harness import LoadTestHarness
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+def _free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def _start_fake_server_process(*args):
+    """Fake API in its own process, so its threads don't count against ours"""
+    port = _free_port()
+    process = subprocess.Popen([sys.executable, 'fake_telegram_api.py', '--port', str(port), *args],
+                               cwd=os.path.dirname(os.path.abspath(__file__)),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            requests.get(f"{base_url}/botTOKEN/getMe", timeout=1)
+            return process, base_url
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("fake Telegram API did not start")
+
+
+def _start_async_bot(base_url):
+    from app import run_schema_migrations
+    from bot_v20_runner import SimpleTelegramBot
+    run_schema_migrations()
+
+    token = os.environ['TELEGRAM_BOT_TOKEN']
+    bot = SimpleTelegramBot(token)
+    bot.api_url = f"{base_url}/bot{token}"
+    bot.transport = 'asyncio'
+    bot.start()
+    deadline = time.time() + 10
+    while time.time() < deadline and not (bot.runtime and bot.runtime.ready.is_set()):
+        time.sleep(0.02)
+    assert bot.runtime is not None and get_async_runtime() is bot.runtime
+    return bot
+
+
+def _stop_async_bot(bot):
+    bot.stop()
+    bot.thread.join(timeout=40)
+    assert get_async_runtime() is None
+
+
+def test_end_to_end_flow_on_asyncio():
+    """Simulated users get a reply to every update with the asyncio transport"""
+    harness = LoadTestHarness(users=2, rounds=1, think_time=1.05, transport='asyncio')
+    try:
+        report = harness.run()
+    finally:
+        harness.stop()
+        harness.bot.thread.join(timeout=40)
+
+    assert report['transport'] == 'asyncio'
+    assert report['updates_sent'] == 10
+    assert report['updates_answered'] == report['updates_sent']
+
+
+def test_concurrent_sends_share_one_thread():
+    """A thousand sends run concurrently without a thread each, and 429s are retried"""
+    process, base_url = _start_fake_server_process('--latency-ms', '40', '--rate-limit-rate', '0.01')
+    bot = _start_async_bot(base_url)
+    try:
+        baseline = threading.active_count()
+        peak = [baseline]
+        done = threading.Event()
+
+        def sample():
+            while not done.is_set():
+                peak[0] = max(peak[0], threading.active_count())
+                time.sleep(0.005)
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        started = time.perf_counter()
+        results = bot.send_many([(8_000_000_000 + i, f"hello {i}") for i in range(1000)])
+        elapsed = time.perf_counter() - started
+        done.set()
+        sampler.join()
+
+        assert len(results) == 1000 and all(result.get('ok') for result in results)
+        # One at a time this would take 1000 x 40ms = 40s
+        assert elapsed < 20, elapsed
+        # Only the sampler thread was added while the sends were in flight
+        assert peak[0] - baseline <= 1, (baseline, peak[0])
+    finally:
+        _stop_async_bot(bot)
+        process.kill()
+        process.wait()
+
+
+def test_coroutine_utilities_run_on_the_loop():
+    """message_cleanup coroutines run natively on the bot's loop via run_coroutine"""
+    from utils.message_cleanup import message_tracking, send_message_with_cleanup
+
+    process, base_url = _start_fake_server_process()
+    bot = _start_async_bot(base_url)
+    try:
+        first = run_coroutine(send_message_with_cleanup(bot.async_api, 4242, "first", 'dashboard'))
+        second = run_coroutine(send_message_with_cleanup(bot.async_api, 4242, "second", 'dashboard'))
+        assert second.message_id != first.message_id
+        assert message_tracking[4242]['dashboard']['id'] == second.message_id
+    finally:
+        _stop_async_bot(bot)
+        process.kill()
+        process.wait()
+
+
+if __name__ == "__main__":
+    test_end_to_end_flow_on_asyncio()
+    test_concurrent_sends_share_one_thread()
+    test_coroutine_utilities_run_on_the_loop()
+    logger.warning("All async transport tests passed")
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+"""
+Test Balance Ledger
+-------------------
+Checks the SQL-side balance ledger: concurrent deltas to one user all
+apply, a floor refuses a debit without writing anything, the bulk form
+credits many users and writes one entry per delta, ledger entries cannot
+be edited, and admin adjustments go through it and cannot overdraw.
+"""
+
+import os
+import logging
+import tempfile
+import threading
+
+if not os.environ.get('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='balance_ledger_test_'), 'ledger.db')}"
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '1:balance-ledger-test-token')
+
+from app import app, db, run_schema_migrations
+from balance_ledger import apply_delta, apply_deltas
+from models import BalanceLedgerEntry, Transaction, User
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+def _user(telegram_id, balance=0.0):
+    with app.app_context():
+        user = User(telegram_id=telegram_id, username=f"ledger_{telegram_id}", balance=balance,
+                    initial_deposit=balance)
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+def _entries(user_id):
+    return BalanceLedgerEntry.query.filter_by(user_id=user_id).order_by(BalanceLedgerEntry.id).all()
+
+
+def test_concurrent_deltas_are_not_lost():
+    """Eight threads adding to one balance: every delta applies and is recorded"""
+    run_schema_migrations()
+    user_id = _user('6650000001')
+
+    def writer():
+        with app.app_context():
+            for _ in range(25):
+                apply_delta(user_id, 0.5, 'trade_profit')
+            db.session.remove()
+
+    threads = [threading.Thread(target=writer) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with app.app_context():
+        assert db.session.get(User, user_id).balance == 100.0
+        entries = _entries(user_id)
+        assert len(entries) == 200
+        assert sorted(entry.balance_after for entry in entries) == [0.5 * i for i in range(1, 201)]
+
+
+def test_floor_refuses_debit():
+    """A debit past the floor returns None and leaves balance and ledger untouched"""
+    run_schema_migrations()
+    user_id = _user('6650000002', balance=1.0)
+    with app.app_context():
+        assert apply_delta(user_id, -1.5, 'withdrawal', floor=0.0) is None
+        assert db.session.get(User, user_id).balance == 1.0
+        assert apply_delta(user_id, -1.0, 'withdrawal', reference='transaction:1', floor=0.0) == 0.0
+        assert [(e.delta, e.balance_after, e.reason, e.reference) for e in _entries(user_id)] == \
+            [(-1.0, 0.0, 'withdrawal', 'transaction:1')]
+        assert apply_delta(987654321, 1.0, 'admin_credit') is None
+        assert BalanceLedgerEntry.query.filter_by(user_id=987654321).count() == 0
+
+
+def test_bulk_deltas_write_one_entry_each():
+    """apply_deltas sums per user for the UPDATE but records each delta with its running balance"""
+    run_schema_migrations()
+    first = _user('6650000003', balance=1.0)
+    second = _user('6650000004', balance=2.0)
+    with app.app_context():
+        balances = apply_deltas([(first, 0.5, 'a'), (second, -1.0, 'b'), (first, 0.25, 'c'),
+                                 (987654321, 3.0, 'd')], 'trade_profit', deposit=True)
+        assert balances == {first: 1.75, second: 1.0}
+        assert [(e.delta, e.balance_after, e.reference) for e in _entries(first)] == [(0.5, 1.5, 'a'), (0.25, 1.75, 'c')]
+        assert [(e.delta, e.balance_after, e.reference) for e in _entries(second)] == [(-1.0, 1.0, 'b')]
+        assert db.session.get(User, first).initial_deposit == 1.75
+        assert apply_deltas([(first, 0.0)], 'trade_profit') == {}
+
+
+def test_entries_are_append_only():
+    """Changing a recorded entry through the ORM is refused"""
+    run_schema_migrations()
+    user_id = _user('6650000005')
+    with app.app_context():
+        apply_delta(user_id, 1.0, 'admin_credit')
+        entry = _entries(user_id)[0]
+        entry.delta = 100.0
+        try:
+            db.session.commit()
+            assert False, "expected ValueError"
+        except ValueError:
+            db.session.rollback()
+        assert _entries(user_id)[0].delta == 1.0
+
+
+def test_admin_adjustment_goes_through_the_ledger():
+    """adjust_balance credits and debits in SQL and refuses to overdraw"""
+    run_schema_migrations()
+    user_id = _user('6650000006', balance=1.0)
+    from balance_manager import adjust_balance
+    ok, _ = adjust_balance('ledger_6650000006', 2.0, skip_trading=True, silent=True)
+    assert ok
+    ok, message = adjust_balance('ledger_6650000006', -5.0, silent=True)
+    assert not ok and 'Cannot deduct' in message
+    ok, _ = adjust_balance('ledger_6650000006', -0.5, silent=True)
+    assert ok
+    with app.app_context():
+        user = db.session.get(User, user_id)
+        assert (user.balance, user.initial_deposit) == (2.5, 3.0)
+        transactions = Transaction.query.filter_by(user_id=user_id).order_by(Transaction.id).all()
+        assert [t.transaction_type for t in transactions] == ['admin_credit', 'admin_debit']
+        assert [(e.reason, e.delta, e.reference) for e in _entries(user_id)] == [
+            ('admin_credit', 2.0, f"transaction:{transactions[0].id}"),
+            ('admin_debit', -0.5, f"transaction:{transactions[1].id}")]
+
+
+def test_admin_panel_refuses_overdraw():
+    """The admin-panel adjustment reports a refused debit instead of failing on it"""
+    import asyncio
+    from types import SimpleNamespace
+    from handlers.admin import admin_confirm_adjustment_callback
+
+    run_schema_migrations()
+    user_id = _user('6650000007', balance=1.0)
+    replies = []
+
+    async def answer():
+        pass
+
+    async def edit_message_text(text, **kwargs):
+        replies.append(text)
+
+    query = SimpleNamespace(answer=answer, edit_message_text=edit_message_text)
+    context = SimpleNamespace(user_data={'admin_adjust_user_id': user_id, 'admin_adjustment_amount': -5.0})
+    asyncio.run(admin_confirm_adjustment_callback(SimpleNamespace(callback_query=query), context))
+
+    assert replies == ["Error: Cannot deduct 5.0 SOL - user only has 1.0 SOL."]
+    with app.app_context():
+        assert db.session.get(User, user_id).balance == 1.0
+        assert Transaction.query.filter_by(user_id=user_id).count() == 0
+        assert _entries(user_id) == []
+
+
+if __name__ == "__main__":
+    test_concurrent_deltas_are_not_lost()
+    test_floor_refuses_debit()
+    test_bulk_deltas_write_one_entry_each()
+    test_entries_are_append_only()
+    test_admin_adjustment_goes_through_the_ledger()
+    test_admin_panel_refuses_overdraw()
+    logger.warning("All balance ledger tests passed")
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+"""
+Test Conversation State
+-----------------------
+Checks that per-chat conversation state is shared between workers through
+the state store: TTL expiry, compact records, the read-through cache,
+compare-and-set updates from racing workers and message listeners
+registered on one bot and dispatched by another.
+"""
+
+import os
+import logging
+import tempfile
+import time
+
+if not os.environ.get('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='state_test_'), 'state.db')}"
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '1:test-token')
+
+from app import run_schema_migrations
+from conversation_state import (ChatState, MemoryStateStore, RedisStateStore, SqlStateStore,
+                                callback_ref, decode_record, encode_record, resolve_callback,
+                                set_state_store)
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+received = []
+
+
+def record_reply(update, chat_id, text):
+    received.append((chat_id, text))
+
+
+class FakeRedis:
+    """Just enough of redis.Redis for the store"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value.encode('utf-8')
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def scan_iter(self, match):
+        return [key for key in self.data if key.startswith(match.rstrip('*'))]
+
+    def eval(self, script, numkeys, key, expected, blob, ttl):
+        # Mirrors RedisStateStore.COMPARE_AND_WRITE_SCRIPT
+        current = self.data.get(key) or ''
+        if isinstance(expected, str):
+            expected = expected.encode('utf-8')
+        if current != (expected or ''):
+            return 0
+        if blob:
+            self.set(key, blob, ex=ttl)
+        else:
+            self.delete(key)
+        return 1
+
+
+def test_memory_store_ttl_and_compact_records():
+    """Records expire after the TTL and None values are never stored"""
+    store = MemoryStateStore(ttl=0.2)
+    state = ChatState(42, store)
+    state.update(broadcast_target='active', pending_broadcast_id=7)
+    assert store.load(42) == {'broadcast_target': 'active', 'pending_broadcast_id': 7}
+    assert encode_record({'a': 1, 'b': None}) == '{"a":1}'
+
+    state.clear('pending_broadcast_id')
+    assert state.pending_broadcast_id is None and state.broadcast_target == 'active'
+    state.broadcast_target = None
+    assert store._records == {}
+
+    state.broadcast_target = 'all'
+    time.sleep(0.3)
+    assert state.broadcast_target is None
+    assert store.purge_expired() == 0
+
+
+def test_sql_store_shared_between_workers():
+    """Two workers with their own caches see each other's writes once the cache lapses"""
+    run_schema_migrations()
+    worker_a = SqlStateStore(cache_seconds=0.2)
+    worker_b = SqlStateStore(cache_seconds=0.2)
+    worker_a.clear_all()
+
+    worker_a.update(1001, {'admin_pending_trade_data': {'trade_text': 'Buy $PEPE', 'admin_id': '1001'}})
+    assert worker_b.load(1001)['admin_pending_trade_data']['trade_text'] == 'Buy $PEPE'
+
+    # worker_b serves its cached copy until the cache lapses
+    worker_a.update(1001, {'admin_pending_trade_data': None, 'dm_content': 'hi'})
+    assert 'admin_pending_trade_data' in worker_b.load(1001)
+    time.sleep(0.25)
+    assert worker_b.load(1001) == {'dm_content': 'hi'}
+
+    expired = SqlStateStore(ttl=-1, cache_seconds=0)
+    expired.update(1002, {'broadcast_target': 'active'})
+    assert worker_b.load(1002) == {}
+    assert worker_a.purge_expired() == 1
+    assert worker_a.clear_all() == 1
+
+
+def test_separate_sqlite_file_and_redis_backends():
+    """A standalone SQLite file and a Redis-protocol server hold the same records"""
+    path = os.path.join(tempfile.mkdtemp(prefix='state_file_'), 'conversations.db')
+    for store in (SqlStateStore(url=f"sqlite:///{path}", cache_seconds=0),
+                  RedisStateStore(client=FakeRedis(), cache_seconds=0)):
+        store.update(5, {'dm_recipient_id': 99})
+        store.update(5, {'dm_content': 'hello'})
+        assert store.load(5) == {'dm_recipient_id': 99, 'dm_content': 'hello'}
+        store.clear(5)
+        assert store.load(5) == {}
+        store.update(6, {'broadcast_target': 'active'})
+        assert store.clear_all() == 1
+
+
+def test_concurrent_updates_are_not_lost():
+    """A write that lands between another worker's read and write makes it merge again"""
+    run_schema_migrations()
+    path = os.path.join(tempfile.mkdtemp(prefix='state_race_'), 'conversations.db')
+    for make_store in (lambda: SqlStateStore(cache_seconds=5),
+                       lambda: SqlStateStore(url=f"sqlite:///{path}", cache_seconds=5),
+                       lambda: RedisStateStore(client=FakeRedis(), cache_seconds=5)):
+        worker_a = make_store()
+        worker_b = SqlStateStore(engine=worker_a._engine, cache_seconds=5) \
+            if isinstance(worker_a, SqlStateStore) else RedisStateStore(client=worker_a.client, cache_seconds=5)
+        worker_a.clear_all()
+        worker_a.update(7, {'broadcast_target': 'active'})
+        assert worker_b.load(7) == {'broadcast_target': 'active'}
+
+        # worker_b's cached copy is stale, but the merge reads the backend
+        worker_a.update(7, {'dm_content': 'hi'})
+        worker_b.update(7, {'dm_recipient_id': 99})
+        assert decode_record(worker_a._read(7)) == \
+            {'broadcast_target': 'active', 'dm_content': 'hi', 'dm_recipient_id': 99}
+
+        # Another worker writes between this worker's read and its compare-and-set
+        original_read = worker_b._read
+        raced = []
+
+        def racing_read(chat_id):
+            blob = original_read(chat_id)
+            if not raced:
+                raced.append(True)
+                worker_a.update(chat_id, {'pending_broadcast_id': 3})
+            return blob
+
+        worker_b._read = racing_read
+        worker_b.update(7, {'dm_content': None})
+        worker_b._read = original_read
+        worker_a.invalidate()
+        assert worker_a.load(7) == {'broadcast_target': 'active', 'dm_recipient_id': 99, 'pending_broadcast_id': 3}
+
+        worker_b.clear(7)
+        worker_a.invalidate()
+        assert worker_a.load(7) == {}
+        worker_a.update(8, {'broadcast_target': 'all'})
+        assert worker_a.clear_all() == 1
+
+
+def test_listener_dispatched_by_another_worker():
+    """A listener registered by one bot instance is found and called by another"""
+    run_schema_migrations()
+    from bot_v20_runner import SimpleTelegramBot
+
+    set_state_store(SqlStateStore(cache_seconds=0))
+    try:
+        first = SimpleTelegramBot(os.environ['TELEGRAM_BOT_TOKEN'])
+        second = SimpleTelegramBot(os.environ['TELEGRAM_BOT_TOKEN'])
+        assert resolve_callback(callback_ref(record_reply)) is record_reply
+
+        first.add_message_listener(555, 'wallet_address', record_reply)
+        listener_type, callback = second.get_listener(555)
+        assert listener_type == 'wallet_address'
+        callback({}, 555, 'So11111111111111111111111111111111111111112')
+        assert received[-1] == (555, 'So11111111111111111111111111111111111111112')
+
+        # Closures cannot be shared, so only the registering worker dispatches them
+        first.add_message_listener(556, 'text', lambda update, chat_id, text: None)
+        assert first.get_listener(556) is not None
+        assert second.get_listener(556) is None
+        assert first.get_listener(556) is None
+
+        second.remove_listener(555)
+        assert first.get_listener(555) is None
+    finally:
+        set_state_store(None)
+
+
+if __name__ == "__main__":
+    test_memory_store_ttl_and_compact_records()
+    test_sql_store_shared_between_workers()
+    test_separate_sqlite_file_and_redis_backends()
+    test_concurrent_updates_are_not_lost()
+    test_listener_dispatched_by_another_worker()
+    logger.warning("All conversation state tests passed")
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+"""
+Test Day Close
+--------------
+Checks the batch end-of-day close: every user's snapshot is written from
+one grouped read, streaks and milestones are updated in bulk, the next
+day's snapshots are pre-created, a rerun changes nothing, and the
+dashboard read path no longer writes snapshots.
+"""
+
+import os
+import logging
+import tempfile
+from datetime import date, datetime, timedelta
+
+if not os.environ.get('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='close_test_'), 'close.db')}"
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '1:close-test-token')
+
+from sqlalchemy import delete, event, insert, select
+
+from app import app, db, run_schema_migrations
+from day_close import close_day
+from models import DailySnapshot, MilestoneTracker, Profit, Transaction, User, UserMetrics, UserStatus
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+DAY = date(2026, 4, 10)
+NOON = datetime.combine(DAY, datetime.min.time()) + timedelta(hours=12)
+
+
+def _trade(user_id, amount):
+    return Transaction(user_id=user_id, transaction_type='trade_profit' if amount >= 0 else 'trade_loss',
+                       amount=amount, status='completed', timestamp=NOON)
+
+
+def test_close_writes_snapshots_metrics_and_next_day():
+    """One close fills every user's snapshot, streak, milestones and tomorrow's snapshot"""
+    run_schema_migrations()
+    with app.app_context():
+        winner = User(telegram_id='9910000001', username='close_winner', balance=12.0, initial_deposit=10.0,
+                      status=UserStatus.ACTIVE)
+        loser = User(telegram_id='9910000002', username='close_loser', balance=9.0, initial_deposit=10.0,
+                     status=UserStatus.ACTIVE)
+        idle = User(telegram_id='9910000003', username='close_idle', balance=0.0)
+        db.session.add_all([winner, loser, idle])
+        db.session.flush()
+        # The winner's snapshot was opened at the start of the day; the loser has none
+        db.session.add(DailySnapshot(user_id=winner.id, date=DAY, starting_balance=10.0, trades_count=0,
+                                     winning_trades=0))
+        # The winner tracks a 1 SOL milestone and a 20 SOL goal; the others get the model defaults
+        db.session.add(UserMetrics(user_id=winner.id, next_milestone=1.0, current_goal=20.0))
+        db.session.add_all([
+            Profit(user_id=winner.id, amount=1.5, percentage=15.0, date=DAY),
+            Profit(user_id=winner.id, amount=0.5, percentage=5.0, date=DAY),
+            Profit(user_id=loser.id, amount=-1.0, percentage=-10.0, date=DAY),
+            Profit(user_id=winner.id, amount=1.0, percentage=10.0, date=DAY - timedelta(days=1)),
+            _trade(winner.id, 1.5), _trade(winner.id, 0.5), _trade(loser.id, -1.0),
+        ])
+        db.session.commit()
+        ids = [winner.id, loser.id, idle.id]
+
+        result = close_day(DAY, ids)
+        assert result == {'users': 3, 'snapshots': 3, 'milestones': 1, 'next_day_snapshots': 3}
+
+        snapshots = {row.user_id: row for row in DailySnapshot.query.filter(
+            DailySnapshot.user_id.in_(ids), DailySnapshot.date == DAY)}
+        won = snapshots[winner.id]
+        assert (won.starting_balance, won.ending_balance, won.profit_amount, won.profit_percentage) == \
+            (10.0, 12.0, 2.0, 20.0)
+        assert (won.trades_count, won.winning_trades) == (2, 2)
+        lost = snapshots[loser.id]
+        assert (lost.starting_balance, lost.ending_balance, lost.profit_amount) == (10.0, 9.0, -1.0)
+        assert (lost.trades_count, lost.winning_trades) == (1, 0)
+        assert snapshots[idle.id].profit_amount == 0
+
+        metrics = {row.user_id: row for row in UserMetrics.query.filter(UserMetrics.user_id.in_(ids))}
+        assert (metrics[winner.id].current_streak, metrics[loser.id].current_streak) == (2, 0)
+        # Winner: 2 SOL profit passes the 1 SOL milestone (next one a 10% deposit step on); 12 of 20 SOL
+        assert metrics[winner.id].next_milestone == 3.0 and metrics[winner.id].goal_progress == 60.0
+        reached = MilestoneTracker.query.filter(MilestoneTracker.user_id.in_(ids)).all()
+        assert [(row.user_id, row.milestone_type, row.value) for row in reached] == \
+            [(winner.id, 'profit_amount', 2.0)]
+
+        tomorrow = DailySnapshot.query.filter(DailySnapshot.user_id.in_(ids),
+                                              DailySnapshot.date == DAY + timedelta(days=1)).all()
+        assert sorted((row.user_id, row.starting_balance) for row in tomorrow) == \
+            sorted([(winner.id, 12.0), (loser.id, 9.0), (idle.id, 0.0)])
+
+        # A rerun rewrites the same values and reaches nothing new
+        assert close_day(DAY, ids) == {'users': 3, 'snapshots': 3, 'milestones': 0, 'next_day_snapshots': 0}
+        assert DailySnapshot.query.filter(DailySnapshot.user_id.in_(ids)).count() == 6
+
+
+def test_close_for_many_users_uses_a_fixed_number_of_statements():
+    """Closing 5k users costs the same handful of statements as closing one"""
+    run_schema_migrations()
+    count = 5000
+    with app.app_context():
+        db.session.execute(insert(User.__table__), [{
+            'telegram_id': f"992{index:07d}", 'username': f"close_bulk_{index}", 'balance': 1.0 + index % 3,
+            'initial_deposit': 1.0, 'status': UserStatus.ACTIVE,
+        } for index in range(count)])
+        db.session.commit()
+        ids = db.session.execute(select(User.id).where(User.telegram_id.like('992%'))).scalars().all()
+        db.session.execute(insert(Profit.__table__), [
+            {'user_id': user_id, 'amount': 0.1, 'percentage': 1.0, 'date': DAY} for user_id in ids])
+        db.session.commit()
+
+        statements = []
+
+        def count_statement(*args):
+            statements.append(args[2])
+
+        event.listen(db.engine, 'before_cursor_execute', count_statement)
+        try:
+            result = close_day(DAY, ids)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count_statement)
+        try:
+            assert result['users'] == count and result['snapshots'] == count
+            assert result['next_day_snapshots'] == count
+            assert len(statements) <= 15, len(statements)
+            assert UserMetrics.query.filter(UserMetrics.user_id.in_(ids), UserMetrics.current_streak == 1).count() \
+                == count
+        finally:
+            for table in (DailySnapshot, Profit, UserMetrics, MilestoneTracker):
+                db.session.execute(delete(table.__table__).where(table.user_id.in_(ids)))
+            db.session.execute(delete(User.__table__).where(User.id.in_(ids)))
+            db.session.commit()
+
+
+def test_dashboard_read_path_does_not_write():
+    """get_performance_data reads without creating snapshots or metrics"""
+    from performance_tracking import get_performance_data
+
+    run_schema_migrations()
+    with app.app_context():
+        user = User(telegram_id='9930000001', username='close_reader', balance=5.0, initial_deposit=5.0)
+        db.session.add(user)
+        db.session.commit()
+
+        data = get_performance_data(user.id)
+        assert data['streak_days'] == 0 and data['goal_target'] == 100.0
+        assert DailySnapshot.query.filter_by(user_id=user.id).count() == 0
+        assert UserMetrics.query.filter_by(user_id=user.id).count() == 0
+
+
+def test_day_close_job_is_registered():
+    """The nightly close runs as a maintenance background job"""
+    import background_tasks
+    from job_queue import _tasks
+
+    assert _tasks['maintenance.day_close'] == (background_tasks.run_day_close, 'maintenance', 3)
+
+
+if __name__ == "__main__":
+    test_close_writes_snapshots_metrics_and_next_day()
+    test_close_for_many_users_uses_a_fixed_number_of_statements()
+    test_dashboard_read_path_does_not_write()
+    test_day_close_job_is_registered()
+    logger.warning("All day close tests passed")
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+"""
+Test Deposit Crediting
+----------------------
+Checks that a deposit is credited exactly once per signature in one
+transaction (transaction row, SQL-side balance increment, sender wallet
+timestamp), that batches skip signatures already recorded and touch only
+the sending wallet, that a scan falls back to single credits when its batch
+fails, that concurrent scanners cannot double-credit, and runs the burst
+benchmark at a small size.
+"""
+
+import os
+import logging
+import tempfile
+import threading
+from datetime import datetime, timedelta
+
+if not os.environ.get('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='deposit_credit_test_'), 'credit.db')}"
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '1:deposit-crediting-test-token')
+
+from app import app, db, run_schema_migrations
+from deposit_benchmark import run_benchmark
+from deposit_crediting import credit_deposit, credit_deposits
+from models import SenderWallet, Transaction, User, UserStatus
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+LONG_AGO = datetime.utcnow() - timedelta(days=30)
+
+
+def _user(telegram_id, balance=1.0, status=UserStatus.DEPOSITING, wallet=None):
+    with app.app_context():
+        user = User(telegram_id=telegram_id, username=f"user_{telegram_id}", balance=balance,
+                    initial_deposit=balance, status=status)
+        db.session.add(user)
+        db.session.flush()
+        if wallet:
+            db.session.add(SenderWallet(user_id=user.id, wallet_address=wallet, last_used=LONG_AGO))
+        db.session.commit()
+        return user.id
+
+
+def test_deposit_is_credited_once():
+    """The first call records and credits; a repeat changes nothing"""
+    run_schema_migrations()
+    user_id = _user('6640000001', wallet='CreditSender1')
+    with app.app_context():
+        first = credit_deposit(user_id, 2.5, 'credit-sig-1', sender_address='CreditSender1')
+        assert first == {'balance': 3.5, 'telegram_id': '6640000001'}
+        assert credit_deposit(user_id, 2.5, 'credit-sig-1') is None
+
+        user = db.session.get(User, user_id)
+        assert user.balance == 3.5 and user.initial_deposit == 3.5 and user.status == UserStatus.ACTIVE
+        transaction = Transaction.query.filter_by(tx_hash='credit-sig-1').one()
+        assert (transaction.user_id, transaction.amount, transaction.transaction_type, transaction.status) == \
+            (user_id, 2.5, 'deposit', 'completed')
+        assert SenderWallet.query.filter_by(user_id=user_id).one().last_used > LONG_AGO
+
+        from utils.solana import process_auto_deposit
+        assert process_auto_deposit(user_id, 2.5, 'credit-sig-1') is True
+        assert db.session.get(User, user_id).balance == 3.5
+
+
+def test_unknown_user_writes_nothing():
+    """A deposit for a missing user raises LookupError and leaves no transaction behind"""
+    run_schema_migrations()
+    with app.app_context():
+        try:
+            credit_deposit(987654321, 1.0, 'credit-sig-orphan')
+            assert False, "expected LookupError"
+        except LookupError:
+            pass
+        assert Transaction.query.filter_by(tx_hash='credit-sig-orphan').count() == 0
+
+
+def test_batch_skips_recorded_and_repeated_signatures():
+    """Only new signatures are credited; one user's deposits are summed in SQL"""
+    run_schema_migrations()
+    first = _user('6640000002', balance=0.0)
+    second = _user('6640000003', balance=10.0, status=UserStatus.ACTIVE, wallet='CreditSender3')
+    with app.app_context():
+        credit_deposit(first, 1.0, 'batch-sig-old')
+        credited = credit_deposits([
+            (first, 1.0, 'batch-sig-old'),
+            (first, 0.5, 'batch-sig-a'),
+            (first, 0.25, 'batch-sig-b'),
+            (second, 2.0, 'batch-sig-c'),
+            (second, 2.0, 'batch-sig-c'),
+            (987654321, 9.0, 'batch-sig-orphan'),
+        ])
+        assert credited == [(first, 0.5, 'batch-sig-a'), (first, 0.25, 'batch-sig-b'), (second, 2.0, 'batch-sig-c')]
+        assert db.session.get(User, first).balance == 1.75
+        assert db.session.get(User, second).balance == 12.0
+        assert db.session.get(User, second).status == UserStatus.ACTIVE
+        assert SenderWallet.query.filter_by(user_id=second).one().last_used > LONG_AGO
+        assert credit_deposits([(first, 0.5, 'batch-sig-a')]) == []
+
+
+def test_batch_touches_only_the_sending_wallet():
+    """With a sender address only that wallet's last_used moves, as with a single credit"""
+    run_schema_migrations()
+    user_id = _user('6640000006', wallet='CreditSender4a')
+    with app.app_context():
+        db.session.add(SenderWallet(user_id=user_id, wallet_address='CreditSender4b', last_used=LONG_AGO))
+        db.session.commit()
+        assert credit_deposits([(user_id, 1.0, 'batch-sig-d', 'CreditSender4a')]) == [(user_id, 1.0, 'batch-sig-d')]
+        last_used = dict(db.session.execute(db.select(SenderWallet.wallet_address, SenderWallet.last_used)
+                                            .where(SenderWallet.user_id == user_id)).all())
+        assert last_used['CreditSender4a'] > LONG_AGO and last_used['CreditSender4b'] == LONG_AGO
+
+
+def test_scan_falls_back_to_single_credits():
+    """When the batch fails the scan credits deposits one by one and reports any that failed"""
+    from unittest import mock
+    from utils import deposit_monitor
+
+    run_schema_migrations()
+    user_id = _user('6640000007', wallet='CreditSender5')
+    detected = [(user_id, 1.0, 'scan-sig-a', 'CreditSender5'), (user_id, 2.0, 'scan-sig-b', 'CreditSender5')]
+    real_credit = deposit_monitor.credit_deposit
+
+    def credit_one(user_id, amount, tx_signature, sender_address=None):
+        if tx_signature == 'scan-sig-b':
+            raise RuntimeError("row rejected")
+        return real_credit(user_id, amount, tx_signature, sender_address)
+
+    with mock.patch('utils.solana.find_admin_wallet_deposits', return_value=(detected, [])), \
+            mock.patch('utils.solana.start_auto_trading_after_deposit'), \
+            mock.patch.object(deposit_monitor, 'notify_admin_of_deposit'), \
+            mock.patch.object(deposit_monitor, 'notify_user_of_deposit'), \
+            mock.patch.object(deposit_monitor, 'credit_deposits', side_effect=RuntimeError("batch rejected")), \
+            mock.patch.object(deposit_monitor, 'credit_deposit', side_effect=credit_one):
+        assert deposit_monitor.scan_for_deposits([{'signature': 'scan-sig-a'}, {'signature': 'scan-sig-b'}]) is False
+
+    with app.app_context():
+        assert db.session.get(User, user_id).balance == 2.0
+        assert Transaction.query.filter_by(tx_hash='scan-sig-a').count() == 1
+        assert Transaction.query.filter_by(tx_hash='scan-sig-b').count() == 0
+
+
+def test_concurrent_scanners_credit_once():
+    """Eight threads crediting the same signature produce one credit"""
+    run_schema_migrations()
+    user_id = _user('6640000004', balance=0.0)
+    results = []
+
+    def scanner():
+        with app.app_context():
+            results.append(credit_deposit(user_id, 1.25, 'race-sig-1'))
+            db.session.remove()
+
+    threads = [threading.Thread(target=scanner) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(1 for result in results if result is not None) == 1
+    with app.app_context():
+        assert db.session.get(User, user_id).balance == 1.25
+        assert Transaction.query.filter_by(tx_hash='race-sig-1').count() == 1
+
+
+def test_burst_benchmark_credits_exactly_once():
+    """Overlapping batch and single-call scanners: every deposit once, every balance exact"""
+    run_schema_migrations()
+    for single in (False, True):
+        result = run_benchmark(deposits=300, users=30, scanners=3, batch=50, single=single)
+        assert result['credited'] == 300 and result['duplicate_credits'] == 0, result
+        assert result['recorded'] == result['distinct_recorded'] == 300, result
+        assert result['wrong_balances'] == 0 and result['still_depositing'] == 0, result
+    with app.app_context():
+        assert User.query.filter(User.telegram_id.like('bench-deposit-%')).count() == 0
+
+
+if __name__ == "__main__":
+    test_deposit_is_credited_once()
+    test_unknown_user_writes_nothing()
+    test_batch_skips_recorded_and_repeated_signatures()
+    test_batch_touches_only_the_sending_wallet()
+    test_scan_falls_back_to_single_credits()
+    test_concurrent_scanners_credit_once()
+    test_burst_benchmark_credits_exactly_once()
+    logger.warning("All deposit crediting tests passed")
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+"""
+Test Deposit Subscription
+-------------------------
+Runs the websocket deposit subscriber against the local RPC and websocket
+stand-ins: it subscribes to the deposit wallet, hands over only notified
+signatures, costs no RPC calls while idle, after a dropped connection
+reconnects and catches up from its cursor, pages back past a full page,
+and only advances the cursor once a scan succeeds.
+"""
+
+import os
+import time
+import logging
+import tempfile
+import threading
+
+if not os.environ.get('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='deposit_sub_test_'), 'sub.db')}"
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '1:deposit-subscription-test-token')
+
+from solana_rpc_stub import StubRpcServer, StubWebsocketServer
+from utils.deposit_subscription import DepositSubscriber
+from utils.solana_rpc import SolanaRpcClient
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+WALLET = 'DepositWa11et111111111111111111111111111111'
+
+
+class Recorder:
+    """Stands in for scan_for_deposits and records what it was handed"""
+
+    def __init__(self):
+        self.calls = []
+        self.succeed = True
+        self.changed = threading.Condition()
+
+    def __call__(self, signatures):
+        with self.changed:
+            self.calls.append(None if signatures is None else [entry['signature'] for entry in signatures])
+            self.changed.notify_all()
+        return self.succeed
+
+    def wait_for(self, count, timeout=5.0):
+        with self.changed:
+            self.changed.wait_for(lambda: len(self.calls) >= count, timeout)
+        return self.calls
+
+
+def _setup(signatures=None):
+    rpc = StubRpcServer(signatures={WALLET: signatures or []}).start()
+    ws = StubWebsocketServer().start()
+    client = SolanaRpcClient(endpoints=[rpc.url],
+                             cache_path=os.path.join(tempfile.mkdtemp(prefix='rpc_cache_'), 'rpc.sqlite3'))
+    recorder = Recorder()
+    subscriber = DepositSubscriber(wallet=WALLET, process=recorder, ws_url=ws.url, rpc_client=client,
+                                   catch_up_interval=3600, reconnect_delay=0.1).start()
+    return rpc, ws, recorder, subscriber
+
+
+def test_notified_signatures_are_processed_without_polling():
+    """Only notified signatures are handed over; an idle wallet costs no RPC calls"""
+    rpc, ws, recorder, subscriber = _setup([{'signature': 'old1'}])
+    try:
+        assert ws.wait_for_subscriptions(1)
+        method, params = ws.subscriptions[0]
+        assert method == 'logsSubscribe' and params[0] == {'mentions': [WALLET]}
+        assert recorder.wait_for(1) == [None]  # first catch-up is the regular lookback scan
+        assert subscriber.cursor == 'old1'
+
+        time.sleep(0.5)
+        idle_requests = len(rpc.requests)
+        ws.notify('sigA')
+        ws.notify('sigB')
+        ws.notify('failed', err={'InstructionError': [0, 'Custom']})
+        assert recorder.wait_for(2)[1] == ['sigA', 'sigB']
+
+        time.sleep(0.5)
+        assert len(recorder.calls) == 2
+        assert len(rpc.requests) == idle_requests == 1
+    finally:
+        subscriber.stop()
+        ws.stop()
+        rpc.stop()
+
+
+def test_reconnect_catches_up_from_the_cursor():
+    """Signatures that landed while disconnected are listed since the cursor only"""
+    rpc, ws, recorder, subscriber = _setup([{'signature': 'old1'}])
+    try:
+        assert recorder.wait_for(1) == [None]
+        rpc.signatures[WALLET] = [{'signature': 'gap2'}, {'signature': 'gap1'}, {'signature': 'old1'}]
+
+        ws.drop()
+        assert ws.wait_for_subscriptions(2)
+        assert recorder.wait_for(2)[1] == ['gap2', 'gap1']
+        assert subscriber.cursor == 'gap2'
+        assert rpc.methods_called() == ['getSignaturesForAddress', 'getSignaturesForAddress']
+
+        ws.notify('live1')
+        assert recorder.wait_for(3)[2] == ['live1']
+    finally:
+        subscriber.stop()
+        ws.stop()
+        rpc.stop()
+
+
+def test_failed_scan_keeps_the_cursor():
+    """A catch-up whose scan fails is retried from the same cursor"""
+    rpc, ws, recorder, subscriber = _setup([{'signature': 'old1'}])
+    try:
+        assert recorder.wait_for(1) == [None]
+        rpc.signatures[WALLET] = [{'signature': 'new1'}, {'signature': 'old1'}]
+
+        recorder.succeed = False
+        assert subscriber.catch_up() == [{'signature': 'new1'}]
+        assert subscriber.cursor == 'old1'
+
+        recorder.succeed = True
+        subscriber.catch_up()
+        assert recorder.calls[1:] == [['new1'], ['new1']]
+        assert subscriber.cursor == 'new1'
+    finally:
+        subscriber.stop()
+        ws.stop()
+        rpc.stop()
+
+
+def test_catch_up_pages_back_to_the_cursor():
+    """More signatures than one page are listed with `before` until the cursor"""
+    from utils import deposit_subscription
+
+    rpc, ws, recorder, subscriber = _setup([{'signature': 'old1'}])
+    saved = deposit_subscription.CATCH_UP_LIMIT
+    try:
+        assert recorder.wait_for(1) == [None]
+        rpc.signatures[WALLET] = [{'signature': f"gap{i}"} for i in range(5, 0, -1)] + [{'signature': 'old1'}]
+        deposit_subscription.CATCH_UP_LIMIT = 2
+        requests_before = len(rpc.requests)
+
+        subscriber.catch_up()
+        assert recorder.calls[1] == ['gap5', 'gap4', 'gap3', 'gap2', 'gap1']
+        assert subscriber.cursor == 'gap5'
+        assert len(rpc.requests) - requests_before == 3
+    finally:
+        deposit_subscription.CATCH_UP_LIMIT = saved
+        subscriber.stop()
+        ws.stop()
+        rpc.stop()
+
+
+if __name__ == "__main__":
+    test_notified_signatures_are_processed_without_polling()
+    test_reconnect_catches_up_from_the_cursor()
+    test_failed_scan_keeps_the_cursor()
+    test_catch_up_pages_back_to_the_cursor()
+    logger.warning("All deposit subscription tests passed")
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+"""
+Test Job Queue
+--------------
+Checks priorities, dedup keys, retries with backoff, per-queue concurrency
+limits, stale-job recovery and exactly-once draining by several workers.
+"""
+
+import os
+import logging
+import tempfile
+
+if not os.environ.get('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='jobs_test_'), 'jobs.db')}"
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+import job_queue
+from app import app, db, run_schema_migrations
+from job_queue import (JobWorker, claim_jobs, enqueue, register_task, requeue_stale_jobs, QUEUE_CONCURRENCY)
+from job_queue_benchmark import run_benchmark
+from models import BackgroundJob
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+calls = []
+
+
+@register_task('test.record', queue='test-jobs')
+def record(value):
+    calls.append(value)
+
+
+@register_task('test.flaky', queue='test-jobs', max_attempts=2)
+def flaky(value):
+    calls.append(value)
+    raise RuntimeError('boom')
+
+
+def _clear(queue):
+    table = BackgroundJob.__table__
+    with db.engine.begin() as connection:
+        connection.execute(table.delete().where(table.c.queue == queue))
+
+
+def test_priority_and_dedup():
+    """Higher priority is claimed first and a pending dedup key blocks duplicates"""
+    run_schema_migrations()
+    with app.app_context():
+        _clear('test-jobs')
+        low = enqueue('test.record', {'value': 'low'}, priority=0)
+        high = enqueue('test.record', {'value': 'high'}, priority=5)
+        assert enqueue('test.record', {'value': 'once'}, dedup_key='test-once') is not None
+        assert enqueue('test.record', {'value': 'twice'}, dedup_key='test-once') is None
+
+        first = claim_jobs('test-jobs', 'worker-1', 1)
+        assert [job.id for job in first] == [high]
+        rest = claim_jobs('test-jobs', 'worker-2', 10)
+        assert low in [job.id for job in rest] and len(rest) == 2
+        assert claim_jobs('test-jobs', 'worker-3', 10) == []
+
+        job_queue.complete_jobs([job.id for job in first + rest], 'worker-2')
+        # Only worker-2's own claims were completed; worker-1 still holds its job
+        assert db.session.get(BackgroundJob, high).status == 'running'
+        job_queue.complete_jobs([high], 'worker-1')
+        db.session.expire_all()
+        assert {job.status for job in BackgroundJob.query.filter_by(queue='test-jobs')} == {'done'}
+
+        # Once the first job finished the dedup key is free again
+        assert enqueue('test.record', {'value': 'again'}, dedup_key='test-once') is not None
+        _clear('test-jobs')
+
+
+def test_retries_then_fails():
+    """A failing job is retried with backoff and marked failed after max_attempts"""
+    run_schema_migrations()
+    saved = job_queue.RETRY_BASE_SECONDS
+    with app.app_context():
+        _clear('test-jobs')
+        calls.clear()
+        job_id = enqueue('test.flaky', {'value': 'x'})
+        worker = JobWorker(['test-jobs'], worker_id='retry-worker', threads_per_queue=1)
+        try:
+            worker.drain(timeout=10)
+            db.session.expire_all()
+            job = db.session.get(BackgroundJob, job_id)
+            assert (job.status, job.attempts) == ('queued', 1)
+            assert job.run_at > datetime.utcnow() and 'boom' in job.last_error
+
+            job_queue.RETRY_BASE_SECONDS = 0
+            with db.engine.begin() as connection:
+                connection.execute(update(BackgroundJob.__table__)
+                                   .where(BackgroundJob.__table__.c.id == job_id)
+                                   .values(run_at=datetime.utcnow()))
+            worker.drain(timeout=10)
+        finally:
+            job_queue.RETRY_BASE_SECONDS = saved
+            worker.stop()
+        db.session.expire_all()
+        job = db.session.get(BackgroundJob, job_id)
+        assert (job.status, job.attempts) == ('failed', 2)
+        assert calls == ['x', 'x']
+        _clear('test-jobs')
+
+
+def test_concurrency_limit_and_stale_recovery():
+    """Claims respect the cluster-wide queue limit, and lost jobs are requeued"""
+    run_schema_migrations()
+    with app.app_context():
+        _clear('test-limited')
+        QUEUE_CONCURRENCY['test-limited'] = 1
+        try:
+            for i in range(3):
+                enqueue('test.record', {'value': i}, queue='test-limited')
+            claimed = claim_jobs('test-limited', 'worker-a', 5, QUEUE_CONCURRENCY['test-limited'])
+            assert len(claimed) == 1
+            assert claim_jobs('test-limited', 'worker-b', 5, QUEUE_CONCURRENCY['test-limited']) == []
+
+            # worker-a dies: after the visibility timeout its job is claimable again
+            with db.engine.begin() as connection:
+                connection.execute(update(BackgroundJob.__table__)
+                                   .where(BackgroundJob.__table__.c.id == claimed[0].id)
+                                   .values(locked_at=datetime.utcnow() - timedelta(hours=1)))
+            assert requeue_stale_jobs(timeout=60) == 1
+            reclaimed = claim_jobs('test-limited', 'worker-b', 5, QUEUE_CONCURRENCY['test-limited'])
+            assert len(reclaimed) == 1 and reclaimed[0].attempts in (1, 2)
+        finally:
+            del QUEUE_CONCURRENCY['test-limited']
+            _clear('test-limited')
+
+
+def test_workers_drain_exactly_once():
+    """Several workers share a backlog without running any job twice"""
+    run_schema_migrations()
+    result = run_benchmark(jobs=300, workers=3, threads=2)
+    assert result['done'] == 300
+    assert result['duplicate_executions'] == 0
+    assert result['max_attempts'] == 1
+
+
+if __name__ == "__main__":
+    test_priority_and_dedup()
+    test_retries_then_fails()
+    test_concurrency_limit_and_stale_recovery()
+    test_workers_drain_exactly_once()
+    logger.warning("All job queue tests passed")
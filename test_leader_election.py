@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+"""
+Test Leader Election
+--------------------
+Runs several electors against one database and checks that exactly one is
+leader at a time, that a hung leader is replaced after its lease lapses,
+that a graceful resignation hands over on the next round, that a new
+leader keeps the updates that queued while nobody was polling, and that
+waiting for a slow previous poller does not cost the node its lease.
+"""
+
+import os
+import time
+import logging
+import tempfile
+import threading
+from unittest import mock
+
+if not os.environ.get('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='leader_test_'), 'leader.db')}"
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '123456:LEADER-TEST-TOKEN')
+
+from app import app, db, run_schema_migrations
+from leader_election import LeaderElector
+from metrics_registry import LEADER_STATUS
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+LEASE = 0.6
+
+
+def _elector(node_id, events, role='test-role'):
+    elector = LeaderElector(name=role, node_id=node_id, lease_seconds=LEASE)
+    elector.on_elected(lambda: events.append((node_id, 'elected')))
+    elector.on_demoted(lambda: events.append((node_id, 'demoted')))
+    return elector
+
+
+def test_single_leader_and_failover():
+    """One leader at a time; a leader that stops renewing is replaced after its lease"""
+    run_schema_migrations()
+    events = []
+    first = _elector('node-a', events)
+    second = _elector('node-b', events)
+
+    assert first.step() is True
+    assert second.step() is False
+    assert first.step() is True  # renewal keeps the role
+    assert second.step() is False
+    assert first.current_lease()['holder'] == 'node-a'
+    assert LEADER_STATUS.labels('test-role').get() == 1
+
+    # node-a hangs: no renewals for longer than the lease
+    time.sleep(LEASE + 0.1)
+    assert second.step() is True
+    assert first.step() is False
+    assert events == [('node-a', 'elected'), ('node-b', 'elected'), ('node-a', 'demoted')]
+
+    # A graceful resignation hands over on the very next round, without waiting for expiry
+    second.resign()
+    assert second.current_lease() is None
+    assert first.step() is True
+    assert events[-2:] == [('node-b', 'demoted'), ('node-a', 'elected')]
+    first.resign()
+
+
+def test_background_campaign_resigns_on_stop():
+    """start() campaigns in a thread and stop() releases the role"""
+    run_schema_migrations()
+    events = []
+    elector = _elector('node-c', events, role='test-threaded')
+    elector.start()
+    try:
+        deadline = time.time() + 5
+        while not elector.is_leader and time.time() < deadline:
+            time.sleep(0.02)
+        assert elector.is_leader
+    finally:
+        elector.stop()
+    assert not elector.is_leader
+    assert events == [('node-c', 'elected'), ('node-c', 'demoted')]
+    assert elector.current_lease() is None
+
+
+def test_takeover_keeps_pending_updates():
+    """Removing the webhook when a standby takes over does not drop queued updates"""
+    from bot_v20_runner import SimpleTelegramBot
+    from fake_telegram_api import FakeTelegramServer
+
+    server = FakeTelegramServer()
+    server.start()
+    try:
+        server.message_update(7001, '/start')
+        token = os.environ['TELEGRAM_BOT_TOKEN']
+        bot = SimpleTelegramBot(token)
+        bot.api_url = f"{server.base_url}/bot{token}"
+        bot.remove_webhook()
+        assert server.pending_count() == 1
+    finally:
+        server.stop()
+
+
+def test_slow_previous_poller_keeps_the_lease():
+    """The elected callback returns at once while the previous term's poller finishes its long poll"""
+    import bot_v20_runner
+
+    run_schema_migrations()
+    poll_finished = threading.Event()
+    started = []
+
+    class FakeBot:
+        running = False
+        thread = threading.Thread(target=poll_finished.wait, daemon=True)
+
+        def start(self):
+            started.append(time.monotonic())
+
+    FakeBot.thread.start()
+    elector = LeaderElector(name='test-slow-poller', node_id='node-d', lease_seconds=LEASE)
+    elector.on_elected(bot_v20_runner.start_leader_duties)
+    with mock.patch.object(bot_v20_runner, 'bot', FakeBot(), create=True), \
+            mock.patch('utils.deposit_monitor.is_monitor_running', return_value=True), \
+            mock.patch('automated_maintenance.start_maintenance_scheduler'), \
+            mock.patch('utils.position_revaluation.start_revaluation_loop', return_value=False):
+        try:
+            began = time.monotonic()
+            assert elector.step() is True
+            assert time.monotonic() - began < elector.renew_interval
+
+            # The old poller outlives several leases; renewals keep the role meanwhile
+            for _ in range(4):
+                time.sleep(elector.renew_interval)
+                assert elector.step() is True
+            assert started == []
+
+            poll_finished.set()
+            deadline = time.time() + 5
+            while not started and time.time() < deadline:
+                time.sleep(0.02)
+            assert len(started) == 1
+            assert elector.current_lease()['holder'] == 'node-d'
+        finally:
+            poll_finished.set()
+            elector.resign()
+
+
+if __name__ == "__main__":
+    test_single_leader_and_failover()
+    test_background_campaign_resigns_on_stop()
+    test_takeover_keeps_pending_updates()
+    test_slow_previous_poller_keeps_the_lease()
+    logger.warning("All leader election tests passed")
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""
+Test Load Harness
+-----------------
+Runs a tiny end-to-end load test against the fake Telegram API to make sure
+the harness, the fake server and the bot stay wired together.
+"""
+
+import logging
+
+import requests
+
+from fake_telegram_api import FakeTelegramServer
+from load_test_harness import LoadTestHarness, percentile
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+def test_fake_server_injects_errors():
+    """429s and 409s are injected on the configured methods only"""
+    server = FakeTelegramServer(rate_limit_rate=1.0, conflict_rate=1.0, seed=3)
+    base_url = server.start()
+    try:
+        send = requests.post(f"{base_url}/botTOKEN/sendMessage", json={'chat_id': 1, 'text': 'hi'})
+        poll = requests.get(f"{base_url}/botTOKEN/getUpdates", params={'timeout': 0})
+        action = requests.post(f"{base_url}/botTOKEN/sendChatAction", json={'chat_id': 1})
+        assert send.status_code == 429
+        assert poll.status_code == 409
+        assert action.status_code == 200
+    finally:
+        server.stop()
+
+
+def test_get_updates_offsets():
+    """Updates below the offset are confirmed and not redelivered"""
+    server = FakeTelegramServer()
+    base_url = server.start()
+    try:
+        first = server.message_update(1, '/start')
+        server.message_update(1, '/help')
+        result = requests.get(f"{base_url}/botTOKEN/getUpdates", params={'offset': first + 1}).json()
+        assert [u['update_id'] for u in result['result']] == [first + 1]
+    finally:
+        server.stop()
+
+
+def test_end_to_end_flow():
+    """Two simulated users complete the flow with a reply for every update"""
+    harness = LoadTestHarness(users=2, rounds=1, think_time=1.05)
+    try:
+        report = harness.run()
+    finally:
+        harness.stop()
+
+    assert report['updates_sent'] == 10
+    assert report['updates_answered'] == report['updates_sent']
+    assert report['db_queries_per_update'] > 0
+    assert percentile([3, 1, 2], 50) == 2
+
+
+if __name__ == "__main__":
+    test_fake_server_injects_errors()
+    test_get_updates_offsets()
+    test_end_to_end_flow()
+    logger.warning("All load harness tests passed")
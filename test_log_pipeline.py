@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+"""
+Test Log Pipeline
+-----------------
+Checks the background logging pipeline: JSON records, per-call-site
+sampling with suppressed counts, per-logger rate limits, size-based
+rotation, dropping instead of blocking when the writer falls behind, and
+the caller-side cost of a log flood compared with a plain file handler.
+"""
+
+import io
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+
+from log_pipeline import (JsonFormatter, LogPipeline, SamplingFilter, build_handlers, configure_logging,
+                          get_log_pipeline, shutdown_logging)
+from metrics_registry import LOG_RECORDS_DROPPED
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+def _pipeline_logger(name, handlers, sampling_filter=None, queue_size=10000):
+    pipeline = LogPipeline(handlers, sampling_filter or SamplingFilter(rate_limits={}), queue_size)
+    target = logging.getLogger(name)
+    target.handlers = [pipeline.handler]
+    target.propagate = False
+    target.setLevel(logging.INFO)
+    pipeline.start()
+    return pipeline, target
+
+
+def _json_stream():
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(JsonFormatter({'environment': 'test'}))
+    return stream, handler
+
+
+def test_json_records_and_call_site_sampling():
+    """A hot call site is sampled down and the written records account for the rest"""
+    stream, handler = _json_stream()
+    pipeline, log = _pipeline_logger('pipeline.sampling', [handler],
+                                     SamplingFilter(burst=5, every=100, window=60, rate_limits={}))
+    try:
+        for index in range(1000):
+            log.info("Processing update %s", index, extra={'chat_id': 42})
+        log.warning("never sampled")
+        log.warning("never sampled")
+        pipeline.flush()
+    finally:
+        pipeline.stop()
+
+    records = [json.loads(line) for line in stream.getvalue().splitlines()]
+    info = [record for record in records if record['level'] == 'INFO']
+    assert len(info) == 5 + 995 // 100
+    # The 95 records after the last sampled one are reported with the site's next record
+    assert len(info) + sum(record.get('suppressed', 0) for record in info) == 1000 - 95
+    assert info[0]['msg'] == 'Processing update 0' and info[0]['chat_id'] == 42
+    assert info[0]['environment'] == 'test' and info[0]['logger'] == 'pipeline.sampling'
+    assert [record['msg'] for record in records if record['level'] == 'WARNING'] == ['never sampled'] * 2
+
+
+def test_per_logger_rate_limit():
+    """A rate-limited logger and its children are capped; other loggers are not"""
+    stream, handler = _json_stream()
+    sampling = SamplingFilter(burst=10 ** 6, rate_limits={'pipeline.noisy': 10})
+    pipeline, log = _pipeline_logger('pipeline', [handler], sampling)
+    child = logging.getLogger('pipeline.noisy.child')
+    quiet = logging.getLogger('pipeline.quiet')
+    try:
+        before = LOG_RECORDS_DROPPED.labels(reason='rate_limited').value
+        for index in range(200):
+            child.info("tick %s", index)
+            quiet.info("tock %s", index)
+        pipeline.flush()
+    finally:
+        pipeline.stop()
+
+    loggers = [json.loads(line)['logger'] for line in stream.getvalue().splitlines()]
+    assert loggers.count('pipeline.quiet') == 200
+    assert 10 <= loggers.count('pipeline.noisy.child') <= 12
+    assert LOG_RECORDS_DROPPED.labels(reason='rate_limited').value - before >= 188
+
+
+def test_size_based_rotation():
+    """The log file is rotated by size and old files beyond the backup count are removed"""
+    path = os.path.join(tempfile.mkdtemp(prefix='log_rotation_'), 'bot.log')
+    handlers = build_handlers('json', path, max_bytes=2000, backup_count=2, stream=False)
+    pipeline, log = _pipeline_logger('pipeline.rotation', handlers)
+    try:
+        for index in range(300):
+            log.warning("deposit scan finished in %s ms", index)
+        pipeline.flush()
+    finally:
+        pipeline.stop()
+
+    assert sorted(os.listdir(os.path.dirname(path))) == ['bot.log', 'bot.log.1', 'bot.log.2']
+    for name in ('bot.log.1', 'bot.log.2'):
+        assert os.path.getsize(f"{path[:-len('bot.log')]}{name}") <= 2000
+
+
+class _StalledHandler(logging.Handler):
+    """An output that blocks until released, like a full disk or a stuck pipe"""
+
+    def __init__(self):
+        super().__init__()
+        self.resume = threading.Event()
+
+    def emit(self, record):
+        self.resume.wait(5)
+
+
+def test_full_queue_drops_instead_of_blocking():
+    """When the writer falls behind, callers keep going and drops are counted"""
+    stalled = _StalledHandler()
+    pipeline, log = _pipeline_logger('pipeline.stalled', [stalled], queue_size=10)
+    try:
+        before = LOG_RECORDS_DROPPED.labels(reason='queue_full').value
+        started = time.perf_counter()
+        for index in range(100):
+            log.warning("broadcast step %s", index)
+        elapsed = time.perf_counter() - started
+        assert elapsed < 1.0, elapsed
+        assert LOG_RECORDS_DROPPED.labels(reason='queue_full').value - before >= 85
+    finally:
+        stalled.resume.set()
+        pipeline.stop()
+
+
+def test_flood_costs_less_than_direct_file_logging():
+    """A broadcast-sized INFO flood is cheaper for the caller than writing each line to a file"""
+    directory = tempfile.mkdtemp(prefix='log_flood_')
+
+    direct = logging.getLogger('pipeline.direct')
+    direct_handler = logging.FileHandler(os.path.join(directory, 'direct.log'))
+    direct_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    direct.handlers = [direct_handler]
+    direct.propagate = False
+    direct.setLevel(logging.INFO)
+
+    pipeline, piped = _pipeline_logger(
+        'pipeline.flood', build_handlers('json', os.path.join(directory, 'piped.log'), stream=False))
+    try:
+        def flood(target):
+            started = time.perf_counter()
+            for index in range(20000):
+                target.info(f"Sent broadcast to user {index}")
+            return time.perf_counter() - started
+
+        direct_seconds = flood(direct)
+        piped_seconds = flood(piped)
+        pipeline.flush()
+    finally:
+        pipeline.stop()
+        direct_handler.close()
+
+    assert piped_seconds < direct_seconds, (piped_seconds, direct_seconds)
+    with open(os.path.join(directory, 'piped.log')) as handle:
+        assert len(handle.readlines()) < 300
+
+
+def test_configure_logging_behaves_like_basic_config():
+    """configure_logging leaves existing handlers alone unless forced, and restores cleanly"""
+    root = logging.getLogger()
+    saved_handlers, saved_level = list(root.handlers), root.level
+    assert root.handlers and configure_logging() is None
+
+    stream = io.StringIO()
+    try:
+        pipeline = configure_logging(level=logging.INFO, fmt='text', stream=stream, force=True)
+        assert get_log_pipeline() is pipeline and root.handlers == [pipeline.handler]
+        logging.getLogger('configured.root').info("hello")
+        pipeline.flush()
+    finally:
+        shutdown_logging()
+        root.handlers = saved_handlers
+        root.setLevel(saved_level)
+
+    assert get_log_pipeline() is None
+    assert stream.getvalue().rstrip().endswith("configured.root - INFO - hello")
+
+
+if __name__ == "__main__":
+    test_json_records_and_call_site_sampling()
+    test_per_logger_rate_limit()
+    test_size_based_rotation()
+    test_full_queue_drops_instead_of_blocking()
+    test_flood_costs_less_than_direct_file_logging()
+    test_configure_logging_behaves_like_basic_config()
+    logger.warning("All log pipeline tests passed")
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+"""
+Test Market Data Cache
+----------------------
+Checks that historical token snapshots and SOL prices are cached per
+(token, time bucket): a repeated backdated lookup costs no request, the
+file cache survives a restart, the first stored snapshot is never
+replaced, and failed requests are not cached.
+"""
+
+import os
+import logging
+import tempfile
+from datetime import datetime, timedelta
+
+from utils.historical_market_fetcher import HistoricalMarketFetcher
+from utils.market_data_cache import MarketDataCache, time_bucket
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+CONTRACT = "E2NEYtNToYjoytGUzgp8Yd7Rz2WAroMZ1QRkLESypump"
+
+
+class _Response:
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self._payload = payload
+
+    def json(self):
+        return self._payload
+
+
+class _FakeSession:
+    """Stands in for requests.Session and counts calls per endpoint"""
+
+    def __init__(self, fdv=1_000_000.0, fail=False):
+        self.fdv = fdv
+        self.fail = fail
+        self.calls = []
+
+    def get(self, url, params=None, timeout=None):
+        self.calls.append(url)
+        if self.fail:
+            raise ConnectionError("network down")
+        if '/dex/tokens/' in url:
+            return _Response(200, {'pairs': [{
+                'baseToken': {'name': 'Pump Token', 'symbol': 'PUMP'}, 'fdv': self.fdv,
+                'volume': {'h24': 50_000.0}, 'liquidity': {'usd': 20_000.0}, 'priceUsd': '0.001',
+            }]})
+        if url.endswith('/coins/solana/history'):
+            return _Response(200, {'market_data': {'current_price': {'usd': 151.25}}})
+        return _Response(404, {})
+
+
+def _fetcher(path, session):
+    fetcher = HistoricalMarketFetcher()
+    fetcher.session = session
+    fetcher._cache = MarketDataCache(path)
+    return fetcher
+
+
+def test_repeated_backdated_lookup_costs_no_request():
+    """One DEX Screener request per (contract, hour); later lookups are served from cache"""
+    path = os.path.join(tempfile.mkdtemp(prefix='market_cache_'), 'market.sqlite3')
+    session = _FakeSession()
+    fetcher = _fetcher(path, session)
+    when = datetime.utcnow() - timedelta(hours=1)
+
+    first = fetcher.get_historical_market_data(CONTRACT, when)
+    assert len(session.calls) == 1
+    assert first['symbol'] == 'PUMP' and first['data_source'] == 'dexscreener_estimated'
+
+    # Every user notification for the same backdated trade, and any time in the same hour
+    for _ in range(50):
+        again = fetcher.get_historical_market_data(CONTRACT, when)
+    same_bucket = datetime.utcfromtimestamp(time_bucket(when)) + timedelta(minutes=59)
+    in_bucket = fetcher.get_historical_market_data(CONTRACT, same_bucket)
+    assert len(session.calls) == 1
+    assert again['market_cap'] == first['market_cap'] == in_bucket['market_cap']
+    assert in_bucket['timestamp_requested'] == same_bucket.isoformat()
+
+    assert fetcher.get_sol_historical_price(when) == 151.25
+    assert fetcher.get_sol_historical_price(when) == 151.25
+    assert len(session.calls) == 2
+
+
+def test_file_cache_survives_restart_and_is_write_once():
+    """A new process reads the stored snapshot; a later write never replaces it"""
+    path = os.path.join(tempfile.mkdtemp(prefix='market_cache_'), 'market.sqlite3')
+    when = datetime.utcnow() - timedelta(days=1)
+    first = _fetcher(path, _FakeSession(fdv=1_000_000.0)).get_historical_market_data(CONTRACT, when)
+
+    # The token has pumped since, but the stored hour stays as first written
+    session = _FakeSession(fdv=9_000_000.0)
+    restarted = _fetcher(path, session)
+    assert restarted.get_historical_market_data(CONTRACT, when)['market_cap'] == first['market_cap']
+    assert session.calls == []
+
+    cache = MarketDataCache(path)
+    bucket = time_bucket(when)
+    stored = cache.put('token', CONTRACT, bucket, {'market_cap': 1.0})
+    assert stored['market_cap'] == first['market_cap']
+
+
+def test_failed_requests_are_not_cached():
+    """Fallback values from a failed request are returned but fetched again next time"""
+    path = os.path.join(tempfile.mkdtemp(prefix='market_cache_'), 'market.sqlite3')
+    session = _FakeSession(fail=True)
+    fetcher = _fetcher(path, session)
+    when = datetime.utcnow() - timedelta(hours=3)
+
+    data = fetcher.get_historical_market_data(CONTRACT, when)
+    assert data['symbol'] == 'UNK'
+    assert len(session.calls) == 1  # the failure is not retried within one lookup
+    assert fetcher.get_sol_historical_price(when) == 147.0
+
+    session.fail = False
+    calls = len(session.calls)
+    assert fetcher.get_historical_market_data(CONTRACT, when)['symbol'] == 'PUMP'
+    assert len(session.calls) == calls + 1
+
+
+def test_memory_lru_is_bounded():
+    """The in-memory layer keeps only the most recently used snapshots"""
+    cache = MarketDataCache(os.path.join(tempfile.mkdtemp(prefix='market_cache_'), 'market.sqlite3'),
+                            memory_size=3)
+    for bucket in range(5):
+        cache.put('token', CONTRACT, bucket, {'market_cap': bucket})
+    assert len(cache._memory) == 3
+    # Evicted entries still come back from the file
+    assert cache.get('token', CONTRACT, 0) == {'market_cap': 0}
+
+
+if __name__ == "__main__":
+    test_repeated_backdated_lookup_costs_no_request()
+    test_file_cache_survives_restart_and_is_write_once()
+    test_failed_requests_are_not_cached()
+    test_memory_lru_is_bounded()
+    logger.warning("All market data cache tests passed")
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+"""
+Test Media Cache
+----------------
+Checks that QR codes are rendered and uploaded once and then resent by
+Telegram file_id, that a rejected file_id triggers a fresh upload, that
+generated PNGs are evicted least-recently-used first, and that an image
+broadcast reaches every user with a single fetch of the image URL.
+"""
+
+import os
+import logging
+import tempfile
+import time
+
+if not os.environ.get('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='media_test_'), 'media.db')}"
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '1:media-test-token')
+
+from app import app, db, run_schema_migrations
+from fake_telegram_api import FakeTelegramServer
+from media_cache import MediaCache, media_key, render_qr_png
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+def _start_bot():
+    import bot_v20_runner
+    from bot_v20_runner import SimpleTelegramBot
+
+    run_schema_migrations()
+    server = FakeTelegramServer()
+    base_url = server.start()
+    token = os.environ['TELEGRAM_BOT_TOKEN']
+    bot = SimpleTelegramBot(token)
+    bot.api_url = f"{base_url}/bot{token}"
+    bot_v20_runner.bot = bot
+    return server, bot
+
+
+def _sent_methods(server, chat_id):
+    return [method for _, method, _ in server.sent[chat_id]]
+
+
+def test_png_lru_evicts_least_recently_used():
+    """Generated PNGs are reused from disk and the oldest unused one is evicted"""
+    run_schema_migrations()
+    cache = MediaCache(directory=tempfile.mkdtemp(prefix='media_png_'), max_files=2)
+    renders = []
+
+    def render(name):
+        def draw():
+            renders.append(name)
+            return render_qr_png(name)
+        return draw
+
+    first = cache.png(media_key('referral_qr', 'a'), render('a'))
+    assert first.startswith(b'\x89PNG')
+    cache.png(media_key('referral_qr', 'b'), render('b'))
+    time.sleep(0.02)
+    assert cache.png(media_key('referral_qr', 'a'), render('a')) == first
+    time.sleep(0.02)
+    cache.png(media_key('referral_qr', 'c'), render('c'))
+    assert renders == ['a', 'b', 'c']
+
+    # 'b' was the least recently used, so it is the one rendered again
+    cache.png(media_key('referral_qr', 'a'), render('a'))
+    cache.png(media_key('referral_qr', 'b'), render('b'))
+    assert renders == ['a', 'b', 'c', 'b']
+    assert len(os.listdir(cache.directory)) == 2
+
+
+def test_referral_qr_uploaded_once():
+    """Repeated taps on the referral QR button upload the image only once"""
+    import media_cache
+    from bot_v20_runner import referral_qr_code_handler
+
+    server, bot = _start_bot()
+    media_cache._media_cache = MediaCache(directory=tempfile.mkdtemp(prefix='media_qr_'))
+    try:
+        update = {'callback_query': {'from': {'id': 7100}}}
+        for _ in range(3):
+            referral_qr_code_handler(update, 7100)
+
+        assert _sent_methods(server, 7100).count('sendPhoto') == 3
+        assert server.uploads == 1
+        photos = [payload for _, method, payload in server.sent[7100] if method == 'sendPhoto']
+        assert photos[1]['photo'] == photos[2]['photo'] == 'fake-file-1'
+        assert len(os.listdir(media_cache._media_cache.directory)) == 1
+
+        # Another worker with a cold memory cache finds the file_id in the database
+        other_worker = MediaCache(directory=tempfile.mkdtemp(prefix='media_qr_other_'))
+        key = media_key('referral_qr', 'https://t.me/ThriveQuantbot?start=ref_7100')
+        assert other_worker.file_id(key) == 'fake-file-1'
+    finally:
+        media_cache._media_cache = None
+        server.stop()
+
+
+def test_rejected_file_id_is_uploaded_again():
+    """A file_id Telegram no longer accepts is replaced by a fresh upload"""
+    server, bot = _start_bot()
+    try:
+        cache = MediaCache(directory=tempfile.mkdtemp(prefix='media_stale_'))
+        key = media_key('wallet_qr', 'WalletAddress111')
+        cache.remember(key, 'wallet_qr', 'expired-file-id')
+
+        result = cache.send(bot, 7200, 'wallet_qr', 'WalletAddress111',
+                            render=lambda: render_qr_png('WalletAddress111', 'caption'), as_document=True)
+        assert result['ok'] and server.uploads == 1
+        assert cache.file_id(key) == result['result']['document']['file_id']
+        assert server.stats['sendDocument:400'] == 1
+    finally:
+        server.stop()
+
+
+def test_image_broadcast_fetches_url_once():
+    """An image broadcast lets Telegram fetch the URL once and reuses its file_id"""
+    import media_cache
+    from bot_v20_runner import admin_send_broadcast_handler
+    from conversation_state import chat_state
+    from models import BroadcastMessage, User, UserStatus
+
+    server, bot = _start_bot()
+    media_cache._media_cache = MediaCache(directory=tempfile.mkdtemp(prefix='media_broadcast_'))
+    try:
+        with app.app_context():
+            users = [User(telegram_id=f"73000{index:02d}", username=f"media_{index}",
+                          status=UserStatus.ACTIVE) for index in range(5)]
+            message = BroadcastMessage(content='{"image_url": "https://example.com/launch.png", "caption": "New"}',
+                                       message_type='image', created_by='7399', status='pending')
+            db.session.add_all(users + [message])
+            db.session.commit()
+            state = chat_state(7399)
+            state.update(pending_broadcast_id=message.id, broadcast_target='all')
+
+            admin_send_broadcast_handler({}, 7399)
+
+            db.session.refresh(message)
+            # Other test modules may share the database, so count what was actually sent
+            photos = sorted(((timestamp, payload) for sends in server.sent.values()
+                             for timestamp, method, payload in sends if method == 'sendPhoto'),
+                            key=lambda sent: sent[0])
+            assert (message.status, message.sent_count, message.failed_count) == ('sent', len(photos), 0)
+        # Only the first send makes Telegram fetch the URL; every later one reuses its file_id
+        assert server.uploads == 1
+        assert [payload['photo'] for _, payload in photos] == \
+            ['https://example.com/launch.png'] + ['fake-file-1'] * (len(photos) - 1)
+        for index in range(5):
+            (_, method, payload), = server.sent[int(f"73000{index:02d}")]
+            assert method == 'sendPhoto' and payload['caption'] == 'New'
+    finally:
+        media_cache._media_cache = None
+        server.stop()
+
+
+if __name__ == "__main__":
+    test_png_lru_evicts_least_recently_used()
+    test_referral_qr_uploaded_once()
+    test_rejected_file_id_is_uploaded_again()
+    test_image_broadcast_fetches_url_once()
+    logger.warning("All media cache tests passed")
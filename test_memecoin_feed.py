@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""
+Test Memecoin Feed
+------------------
+Checks that the shared memecoin feed polls each source once per refresh,
+keeps a bounded, de-duplicated ring buffer per source, tracks source health
+the way api_health always has, and serves tokens from memory (falling back
+to birdeye, then to stale tokens) without any further fetches.
+"""
+
+import logging
+from collections import Counter
+
+from utils import memecoin_feed
+from utils.memecoin_feed import MemecoinFeed
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+def _pump_fun(*addresses):
+    return {'data': [{'name': f"Coin {a}", 'symbol': a.upper(), 'address': a, 'price': 0.001,
+                      'marketCap': 50000} for a in addresses]}
+
+
+def _birdeye(*addresses):
+    return {'data': {'tokens': [{'symbol': a.upper(), 'address': a, 'v24hUSD': 1200.0} for a in addresses]}}
+
+
+class FakeSource:
+    """Scripted responses per source, counting the calls"""
+
+    def __init__(self):
+        self.responses = {'pump_fun': _pump_fun('p1', 'p2'), 'birdeye': _birdeye('b1')}
+        self.calls = Counter()
+
+    def __call__(self, source):
+        self.calls[source] += 1
+        return self.responses[source]
+
+
+def _started(feed):
+    # Keep random_token from starting a real background thread
+    feed._thread = object()
+    return feed
+
+
+def test_refresh_polls_each_source_once_and_reads_do_not_fetch():
+    """One refresh fetches both sources once; a thousand picks fetch nothing"""
+    fetch = FakeSource()
+    feed = _started(MemecoinFeed(fetch=fetch))
+    assert feed.random_token() is None
+
+    assert feed.refresh(now=1000.0) == {'pump_fun': 2, 'birdeye': 1}
+    assert fetch.calls == Counter({'pump_fun': 1, 'birdeye': 1})
+
+    picks = {feed.random_token()['address'] for _ in range(1000)}
+    assert picks == {'p1', 'p2'}
+    assert fetch.calls == Counter({'pump_fun': 1, 'birdeye': 1})
+
+    token = feed.tokens('birdeye')[0]
+    assert token['name'] == 'B1' and token['volume'] == 1200.0 and token['source'] == 'birdeye'
+    assert feed.health['pump_fun']['status'] == 'healthy' and feed.health['pump_fun']['tokens'] == 2
+
+
+def test_buffer_is_bounded_and_deduplicated():
+    """Repeated addresses keep first_seen; the oldest tokens drop out"""
+    fetch = FakeSource()
+    feed = MemecoinFeed(fetch=fetch, buffer_size=3)
+    feed.refresh(now=1000.0)
+
+    fetch.responses['pump_fun'] = _pump_fun('p2', 'p3', 'p4')
+    feed.refresh(now=1060.0)
+
+    tokens = feed.tokens('pump_fun')
+    assert [t['address'] for t in tokens] == ['p2', 'p3', 'p4']
+    assert tokens[0]['first_seen'] == 1000.0 and tokens[0]['last_seen'] == 1060.0
+    assert tokens[1]['first_seen'] == 1060.0
+
+
+def test_secondary_source_is_polled_for_health_only_when_due():
+    """Birdeye is skipped while pump.fun works and its last check is recent"""
+    fetch = FakeSource()
+    feed = MemecoinFeed(fetch=fetch)
+    feed.refresh(now=1000.0)
+    feed.refresh(now=1060.0)
+    assert fetch.calls == Counter({'pump_fun': 2, 'birdeye': 1})
+
+    feed.refresh(now=1000.0 + memecoin_feed.FEED_HEALTH_INTERVAL)
+    assert fetch.calls['birdeye'] == 2
+
+
+def test_failing_primary_falls_back_then_serves_stale_tokens():
+    """pump.fun going down switches picks to birdeye; with both down, old tokens are served"""
+    fetch = FakeSource()
+    feed = _started(MemecoinFeed(fetch=fetch))
+    feed.refresh(now=1000.0)
+
+    fetch.responses['pump_fun'] = None
+    for step in range(memecoin_feed.DOWN_AFTER_FAILURES):
+        feed.refresh(now=1060.0 + step)
+    assert feed.health['pump_fun']['status'] == 'down'
+    assert feed.health['pump_fun']['failures'] == memecoin_feed.DOWN_AFTER_FAILURES
+    assert fetch.calls['birdeye'] == 1 + memecoin_feed.DOWN_AFTER_FAILURES
+    assert feed.random_token()['address'] == 'b1'
+
+    fetch.responses['birdeye'] = {'data': 'unexpected'}
+    for step in range(memecoin_feed.DOWN_AFTER_FAILURES):
+        feed.refresh(now=1100.0 + step)
+    assert feed.health['birdeye']['status'] == 'down'
+    assert feed.random_token()['address'] in {'p1', 'p2'}
+
+
+if __name__ == "__main__":
+    test_refresh_polls_each_source_once_and_reads_do_not_fetch()
+    test_buffer_is_bounded_and_deduplicated()
+    test_secondary_source_is_polled_for_health_only_when_due()
+    test_failing_primary_falls_back_then_serves_stale_tokens()
+    logger.warning("All memecoin feed tests passed")
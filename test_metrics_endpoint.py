@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""
+Test Metrics Endpoint
+---------------------
+Verifies the Prometheus exposition output, handler instrumentation and
+the pool checkout histogram.
+"""
+
+import logging
+from unittest import mock
+
+from metrics_registry import (
+    MetricsRegistry, Counter, Gauge, Histogram, REGISTRY,
+    instrument_handler, record_broadcast_result
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def test_exposition_format():
+    """Counters, gauges and histograms render in Prometheus text format"""
+    registry = MetricsRegistry()
+    requests_total = Counter('test_requests_total', 'Requests', ['method'], registry=registry)
+    depth = Gauge('test_depth', 'Depth', registry=registry)
+    latency = Histogram('test_latency_seconds', 'Latency', buckets=(0.1, 1.0), registry=registry)
+
+    requests_total.labels(method='sendMessage').inc()
+    requests_total.labels(method='sendMessage').inc(2)
+    depth.set(7)
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5)
+
+    output = registry.render()
+    assert '# TYPE test_requests_total counter' in output
+    assert 'test_requests_total{method="sendMessage"} 3' in output
+    assert 'test_depth 7' in output
+    assert 'test_latency_seconds_bucket{le="0.1"} 1' in output
+    assert 'test_latency_seconds_bucket{le="1"} 2' in output
+    assert 'test_latency_seconds_bucket{le="+Inf"} 3' in output
+    assert 'test_latency_seconds_count 3' in output
+
+
+def test_handler_instrumentation():
+    """Wrapped handlers record latency and errors under their name"""
+    calls = []
+    wrapped = instrument_handler('test_dashboard', lambda update, chat_id: calls.append(chat_id))
+    wrapped({}, 42)
+    assert calls == [42]
+
+    failing = instrument_handler('test_failing', lambda update, chat_id: 1 / 0)
+    try:
+        failing({}, 42)
+        assert False, "exception should propagate"
+    except ZeroDivisionError:
+        pass
+
+    output = REGISTRY.render()
+    assert 'bot_handler_duration_seconds_count{handler="test_dashboard"} 1' in output
+    assert 'bot_handler_errors_total{handler="test_failing"} 1' in output
+
+
+def test_broadcast_and_telegram_metrics():
+    """Bot API calls and broadcast results are counted"""
+    from bot_v20_runner import SimpleTelegramBot
+
+    assert record_broadcast_result({'ok': True})
+    assert not record_broadcast_result({'ok': False})
+
+    bot = SimpleTelegramBot("123456:TEST-TOKEN")
+    fake_response = mock.Mock(status_code=429)
+    with mock.patch('bot_v20_runner.requests.request', return_value=fake_response), \
+            mock.patch('bot_v20_runner.time.sleep'):
+        bot.send_message(1, "hello")
+
+    output = REGISTRY.render()
+    assert 'telegram_api_responses_total{method="sendMessage",status="429"}' in output
+    assert 'broadcast_messages_total{result="failed"}' in output
+
+
+def test_pool_checkout_wait():
+    """The instrumented pool observes checkout wait on every connection"""
+    from app import app, db
+    from sqlalchemy import text
+
+    with app.app_context():
+        with db.engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+
+    assert 'db_pool_checkout_wait_seconds_count' in REGISTRY.render()
+    assert REGISTRY.get('db_pool_checkout_wait_seconds')._unlabelled().snapshot()[0] != [0] * 11
+
+
+if __name__ == "__main__":
+    test_exposition_format()
+    test_handler_instrumentation()
+    test_broadcast_and_telegram_metrics()
+    test_pool_checkout_wait()
+    logger.info("All metrics tests passed")
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+"""
+Test Portfolio Risk Engine
+--------------------------
+Checks the global stop-loss / take-profit pass: thresholds from
+AutoTradingSettings (or defaults), bulk closing, ledger rows and balances,
+P/L-only settlement of positions whose cost was never debited, and that the
+admin BUY placeholder is left alone.
+"""
+
+import os
+import logging
+import tempfile
+
+if not os.environ.get('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='risk_test_'), 'risk.db')}"
+
+from app import app, db, run_schema_migrations
+from models import User, AutoTradingSettings, TradingPosition, Transaction, Profit
+from utils import portfolio_risk_engine
+from utils.portfolio_risk_engine import OpenPositionBook, PortfolioRiskEngine
+from utils.admin_trade_processor import AdminTradeProcessor
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+def _make_user(telegram_id, balance=1.0, stop_loss=None, take_profit=None, enabled=True):
+    user = User(telegram_id=telegram_id, username=f"risk_{telegram_id}", balance=balance)
+    db.session.add(user)
+    db.session.flush()
+    if stop_loss is not None:
+        db.session.add(AutoTradingSettings(user_id=user.id, stop_loss_percentage=stop_loss,
+                                           take_profit_percentage=take_profit, is_enabled=enabled))
+    return user
+
+
+def _open(user, token, entry, amount=100.0, trade_type='admin_signal'):
+    position = TradingPosition(user_id=user.id, token_name=token, amount=amount,
+                               entry_price=entry, current_price=entry, status='open', trade_type=trade_type)
+    db.session.add(position)
+    return position
+
+
+def test_global_risk_pass():
+    """Positions beyond their thresholds are closed in one pass with ledger rows"""
+    run_schema_migrations()
+    with app.app_context():
+        tight = _make_user('88000000001', balance=1.0, stop_loss=10.0, take_profit=20.0)
+        default = _make_user('88000000002', balance=2.0)
+        stopped = _open(tight, 'RISKA', 0.01)        # -15% -> stop loss at 10%
+        taken = _open(tight, 'RISKB', 0.01)          # +25% -> take profit at 20%
+        at_default = _open(default, 'RISKA', 0.01)   # -15% hits the default 15% stop loss
+        untouched = _open(default, 'RISKB', 0.01)    # +25% < default 100%
+        db.session.commit()
+        ids = [p.id for p in (stopped, taken, at_default, untouched)]
+        user_ids = [tight.id, default.id]
+
+        result = PortfolioRiskEngine.run_risk_pass({'RISKA': 0.0085, 'RISKB': 0.0125}, user_ids=user_ids)
+        assert result == {'evaluated': 4, 'stop_loss': 2, 'take_profit': 1}
+
+        db.session.expire_all()
+        statuses = {p.id: (p.status, p.exit_reason) for p in TradingPosition.query.filter(TradingPosition.id.in_(ids))}
+        assert statuses[ids[0]] == ('closed', 'stop_loss')
+        assert statuses[ids[1]] == ('closed', 'take_profit')
+        assert statuses[ids[2]] == ('closed', 'stop_loss')
+        assert statuses[ids[3]] == ('open', None)
+
+        ledger = Transaction.query.filter(Transaction.related_trade_id.in_(ids)).all()
+        assert sorted(t.transaction_type for t in ledger) == ['trade_loss', 'trade_loss', 'trade_profit']
+        assert Profit.query.filter(Profit.user_id.in_(user_ids)).count() == 3
+        assert abs(db.session.get(User, tight.id).balance - (1.0 + 100 * 0.0085 + 100 * 0.0125)) < 1e-9
+
+        # A second pass finds nothing more to do
+        again = PortfolioRiskEngine.run_risk_pass({'RISKA': 0.0085, 'RISKB': 0.0125}, user_ids=user_ids)
+        assert again == {'evaluated': 1, 'stop_loss': 0, 'take_profit': 0}
+
+        # The per-user stop-loss entry point delegates to the same pass
+        _open(default, 'RISKC', 0.02).current_price = 0.001
+        db.session.commit()
+        assert AdminTradeProcessor.check_and_apply_stop_loss(default.id) == 1
+
+
+def test_overlapping_passes_close_once():
+    """A pass working from a stale book does not close or credit a position twice"""
+    run_schema_migrations()
+    with app.app_context():
+        user = _make_user('88000000003', balance=1.0, stop_loss=10.0, take_profit=20.0)
+        position = _open(user, 'RISKD', 0.01)
+        db.session.commit()
+        position_id = position.id
+
+        stale = PortfolioRiskEngine.load_open_positions([user.id])
+        prices = stale.prices_for({'RISKD': 0.005})
+        stop_hits, take_hits, pnl = stale.evaluate(prices)
+        assert PortfolioRiskEngine.run_risk_pass({'RISKD': 0.005}, user_ids=[user.id])['stop_loss'] == 1
+
+        closed = PortfolioRiskEngine._close_positions(stale, prices, pnl, stop_hits, take_hits)
+        assert closed == {'stop_loss': 0, 'take_profit': 0}
+        db.session.expire_all()
+        assert Transaction.query.filter_by(related_trade_id=position_id).count() == 1
+        assert abs(db.session.get(User, user.id).balance - (1.0 + 100 * 0.005)) < 1e-9
+
+
+def test_unfunded_positions_settle_pnl_only():
+    """A broadcast position that hits its stop loss is charged its loss, not credited its principal"""
+    run_schema_migrations()
+    with app.app_context():
+        user = _make_user('88000000004', balance=1.0, stop_loss=10.0, take_profit=20.0)
+        position = _open(user, 'RISKE', 0.01, trade_type='snipe')
+        position.buy_tx_hash = 'risk-broadcast-buy'
+        position.admin_id = 'admin'
+        db.session.commit()
+
+        assert PortfolioRiskEngine.run_risk_pass({'RISKE': 0.008}, user_ids=[user.id])['stop_loss'] == 1
+        db.session.expire_all()
+        assert abs(db.session.get(User, user.id).balance - (1.0 - 100 * 0.002)) < 1e-9
+        assert Transaction.query.filter_by(related_trade_id=position.id).one().amount < 0
+
+
+def test_disabled_auto_trading_keeps_protection():
+    """Turning auto-trading off does not turn stop-loss off"""
+    run_schema_migrations()
+    with app.app_context():
+        user = _make_user('88000000005', balance=1.0, stop_loss=10.0, take_profit=20.0, enabled=False)
+        _open(user, 'RISKF', 0.01)
+        db.session.commit()
+        assert PortfolioRiskEngine.run_risk_pass({'RISKF': 0.005}, user_ids=[user.id])['stop_loss'] == 1
+
+
+def test_admin_buy_placeholder_is_skipped():
+    """The unowned admin BUY row waits for its SELL instead of being closed"""
+    run_schema_migrations()
+    with app.app_context():
+        placeholder = TradingPosition(user_id=portfolio_risk_engine.PLACEHOLDER_USER_ID, token_name='RISKG',
+                                      amount=portfolio_risk_engine.PLACEHOLDER_AMOUNT, entry_price=0.01,
+                                      current_price=0.01, status='open', trade_type='scalp',
+                                      buy_tx_hash='risk-admin-buy')
+        db.session.add(placeholder)
+        db.session.commit()
+        assert placeholder.id not in PortfolioRiskEngine.load_open_positions().ids
+        PortfolioRiskEngine.run_risk_pass({'RISKG': 0.001}, user_ids=[portfolio_risk_engine.PLACEHOLDER_USER_ID])
+        db.session.expire_all()
+        assert db.session.get(TradingPosition, placeholder.id).status == 'open'
+
+
+def test_threshold_evaluation():
+    """Thresholds are inclusive and a zero entry price never triggers"""
+    rows = [(i, 1, 'T', 10.0, 1.0, 1.0, 10.0, 50.0, True) for i in range(6)]
+    rows.append((6, 1, 'T', 10.0, 0.0, 1.0, 10.0, 50.0, True))
+    book = OpenPositionBook(rows)
+    stop_hits, take_hits, pnl = book.evaluate([0.5, 0.9, 0.95, 1.0, 1.5, 2.0, 5.0])
+    assert (stop_hits, take_hits) == ([0, 1], [4, 5])
+    assert pnl[6] == 0.0
+    assert book.evaluate([0.5] * 7, stop_loss=False)[0] == []
+
+
+if __name__ == "__main__":
+    test_global_risk_pass()
+    test_overlapping_passes_close_once()
+    test_unfunded_positions_settle_pnl_only()
+    test_disabled_auto_trading_keeps_protection()
+    test_admin_buy_placeholder_is_skipped()
+    test_threshold_evaluation()
+    logger.warning("All portfolio risk engine tests passed")
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""
+Test Position Revaluation
+-------------------------
+Checks that live positions are priced once per distinct token, marked to
+market with set-based updates and published in the in-memory snapshot,
+including smart BUY 'holding' positions that are known only by symbol.
+"""
+
+import os
+import logging
+import tempfile
+from unittest import mock
+
+if not os.environ.get('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='reval_test_'), 'reval.db')}"
+
+from sqlalchemy import inspect
+
+from app import app, db, run_schema_migrations
+from models import User, TradingPosition
+from utils.position_revaluation import revalue_open_positions, get_position_snapshot
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+def test_token_grouped_revaluation():
+    """Each token is priced once and every holder's mark is updated"""
+    run_schema_migrations()
+    with app.app_context():
+        holders = []
+        for index in range(3):
+            user = User(telegram_id=f"8700000000{index}", username=f"reval_{index}", balance=1.0)
+            db.session.add(user)
+            holders.append(user)
+        db.session.flush()
+
+        positions = []
+        for user in holders:
+            positions.append(TradingPosition(user_id=user.id, token_name='REVA', contract_address='RevalMintA',
+                                             amount=1000, entry_price=0.001, current_price=0.001, status='open'))
+            positions.append(TradingPosition(user_id=user.id, token_name='REVB', amount=10,
+                                             entry_price=0.5, current_price=0.5, status='open'))
+        closed = TradingPosition(user_id=holders[0].id, token_name='REVA', contract_address='RevalMintA',
+                                 amount=1000, entry_price=0.001, current_price=0.001, status='closed')
+        db.session.add_all(positions + [closed])
+        db.session.commit()
+
+        requested = []
+
+        def price_source(keys):
+            requested.append(list(keys))
+            return {('contract', 'RevalMintA'): 0.002, ('token', 'REVB'): 0.25}
+
+        snapshot = revalue_open_positions(price_source)
+
+        assert len(requested) == 1
+        assert ('contract', 'RevalMintA') in requested[0] and ('token', 'REVB') in requested[0]
+        assert len([key for key in requested[0] if key[1] in ('RevalMintA', 'REVB')]) == 2
+        assert snapshot is get_position_snapshot()
+
+        db.session.expire_all()
+        for position in positions:
+            refreshed = db.session.get(TradingPosition, position.id)
+            if refreshed.token_name == 'REVA':
+                assert refreshed.current_price == 0.002
+                assert abs(refreshed.unrealized_pnl - 1.0) < 1e-9
+                assert abs(snapshot.get(position.id)[2] - 100.0) < 1e-9
+            else:
+                assert refreshed.current_price == 0.25
+                assert abs(refreshed.unrealized_pnl + 2.5) < 1e-9
+            assert refreshed.price_updated_at is not None
+
+        assert db.session.get(TradingPosition, closed.id).current_price == 0.001
+        assert snapshot.get(closed.id) is None
+
+
+def test_holding_positions_are_priced_by_symbol():
+    """Smart BUY holdings without a contract address are revalued through the symbol search"""
+    run_schema_migrations()
+    with app.app_context():
+        user = User(telegram_id='87000000010', username='reval_holder', balance=1.0)
+        db.session.add(user)
+        db.session.flush()
+        holding = TradingPosition(user_id=user.id, token_name='REVH', amount=100,
+                                  entry_price=0.01, current_price=0.01, status='holding')
+        db.session.add(holding)
+        db.session.commit()
+
+        from utils.dexscreener_client import dex_client
+        with mock.patch.object(dex_client, 'get_token_prices', return_value={}), \
+                mock.patch.object(dex_client, 'get_token_prices_by_symbol',
+                                  side_effect=lambda symbols: {s: 0.02 for s in symbols if s == 'REVH'}) as search:
+            snapshot = revalue_open_positions()
+
+        assert 'REVH' in search.call_args[0][0]
+        db.session.expire_all()
+        refreshed = db.session.get(TradingPosition, holding.id)
+        assert refreshed.current_price == 0.02 and abs(refreshed.unrealized_pnl - 1.0) < 1e-9
+        assert abs(snapshot.get(holding.id)[2] - 100.0) < 1e-9
+
+
+def test_missing_columns_are_added():
+    """The migration step adds new nullable model columns to existing tables"""
+    run_schema_migrations()
+    with app.app_context():
+        columns = {column['name'] for column in inspect(db.engine).get_columns('trading_position')}
+    assert {'unrealized_pnl', 'price_updated_at'} <= columns
+
+
+if __name__ == "__main__":
+    test_token_grouped_revaluation()
+    test_holding_positions_are_priced_by_symbol()
+    test_missing_columns_are_added()
+    logger.warning("All position revaluation tests passed")
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+"""
+Test Profit Streaks
+-------------------
+Checks the gaps-and-islands streak query against a day-by-day walk for
+many users at once, that a streak costs one query however long it is,
+and that day close keeps UserMetrics streaks up to date incrementally.
+"""
+
+import os
+import random
+import logging
+import tempfile
+from datetime import date, datetime, timedelta
+
+if not os.environ.get('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='streak_test_'), 'streak.db')}"
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '1:streak-test-token')
+
+from sqlalchemy import event, insert
+
+from app import app, db, run_schema_migrations
+from models import Profit, User, UserMetrics
+from profit_streaks import close_streak_day, compute_streaks, profit_streak
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+TODAY = date(2026, 5, 20)
+
+
+def _users(prefix, count):
+    users = [User(telegram_id=f"{prefix}{index:04d}", username=f"streak_{prefix}_{index}") for index in range(count)]
+    db.session.add_all(users)
+    db.session.flush()
+    return users
+
+
+def _walk_back(daily, user_id, as_of):
+    """The old per-day loop, on in-memory data"""
+    streak = 0
+    day = as_of
+    while daily.get((user_id, day), 0) > 0:
+        streak += 1
+        day -= timedelta(days=1)
+    return streak
+
+
+def _best(daily, user_id):
+    days = sorted(day for (owner, day), total in daily.items() if owner == user_id and total > 0)
+    best = run = 0
+    for index, day in enumerate(days):
+        run = run + 1 if index and day - days[index - 1] == timedelta(days=1) else 1
+        best = max(best, run)
+    return best
+
+
+def test_bulk_streaks_match_day_by_day_walk():
+    """Current and best streaks for many users agree with walking back one day at a time"""
+    run_schema_migrations()
+    rng = random.Random(42)
+    with app.app_context():
+        users = _users('771', 60)
+        rows = []
+        daily = {}
+        for user in users:
+            green_rate = rng.choice((0.3, 0.7, 0.95, 1.0))
+            for offset in range(90):
+                day = TODAY - timedelta(days=offset)
+                if rng.random() < 0.15:
+                    continue  # no P/L that day
+                amounts = [rng.uniform(0.01, 1.0) if rng.random() < green_rate else -rng.uniform(0.01, 1.0)
+                           for _ in range(rng.randint(1, 3))]
+                daily[(user.id, day)] = sum(amounts)
+                rows.extend({'user_id': user.id, 'amount': amount, 'percentage': 1.0, 'date': day}
+                            for amount in amounts)
+        db.session.execute(insert(Profit.__table__), rows)
+        db.session.commit()
+
+        ids = [user.id for user in users]
+        for as_of in (TODAY, TODAY - timedelta(days=5)):
+            streaks = compute_streaks(as_of, ids)
+            for user_id in ids:
+                current, best = streaks.get(user_id, (0, 0))
+                assert current == _walk_back(daily, user_id, as_of), user_id
+                if as_of == TODAY:
+                    assert best == _best(daily, user_id), user_id
+        assert any(current > 5 for current, _ in compute_streaks(TODAY, ids).values())
+
+
+def test_long_streak_is_one_query():
+    """A 60-day streak is read with a single statement"""
+    run_schema_migrations()
+    with app.app_context():
+        user, = _users('772', 1)
+        db.session.add_all(Profit(user_id=user.id, amount=0.5, percentage=1.0, date=TODAY - timedelta(days=offset))
+                           for offset in range(60))
+        db.session.commit()
+        user_id = user.id
+
+        statements = []
+
+        def count(*args):
+            statements.append(args[2])
+
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            assert profit_streak(user_id, TODAY) == 60
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+        assert len(statements) == 1
+        assert profit_streak(user_id, TODAY + timedelta(days=1)) == 0
+
+
+def test_day_close_updates_user_metrics_incrementally():
+    """Day close recomputes unknown users, extends closed ones and skips repeats"""
+    run_schema_migrations()
+    with app.app_context():
+        green, red, stale = _users('773', 3)
+        for offset in range(1, 4):
+            db.session.add(Profit(user_id=green.id, amount=1.0, percentage=1.0, date=TODAY - timedelta(days=offset)))
+            db.session.add(Profit(user_id=stale.id, amount=1.0, percentage=1.0, date=TODAY - timedelta(days=offset)))
+        db.session.add(Profit(user_id=red.id, amount=1.0, percentage=1.0, date=TODAY - timedelta(days=1)))
+        db.session.commit()
+        ids = [green.id, red.id, stale.id]
+
+        # First close: nobody has metrics yet, so all are recomputed from history
+        assert close_streak_day(TODAY - timedelta(days=1), ids) == {green.id: 3, red.id: 1, stale.id: 3}
+
+        # Today: green wins again, red loses, stale is skipped by this close
+        db.session.add(Profit(user_id=green.id, amount=2.0, percentage=1.0, date=TODAY))
+        db.session.add(Profit(user_id=red.id, amount=-1.0, percentage=-1.0, date=TODAY))
+        db.session.commit()
+        assert close_streak_day(TODAY, [green.id, red.id]) == {green.id: 4, red.id: 0}
+        assert close_streak_day(TODAY, [green.id, red.id]) == {}
+
+        metrics = {row.user_id: row for row in UserMetrics.query.filter(UserMetrics.user_id.in_(ids))}
+        assert (metrics[green.id].current_streak, metrics[green.id].best_streak) == (4, 4)
+        assert (metrics[red.id].current_streak, metrics[red.id].best_streak) == (0, 1)
+        assert metrics[green.id].last_streak_update == datetime.combine(TODAY, datetime.min.time())
+
+        # Two days later the stale user has missed days and is recomputed: no P/L today, so 0, best kept
+        assert close_streak_day(TODAY + timedelta(days=1), [stale.id]) == {stale.id: 0}
+        db.session.expire_all()
+        stale_metrics = UserMetrics.query.filter_by(user_id=stale.id).one()
+        assert (stale_metrics.current_streak, stale_metrics.best_streak) == (0, 3)
+
+
+def test_update_streak_and_notifications_use_streak_query():
+    """The legacy entry points return the same streak"""
+    from performance_tracking import update_streak
+    from utils.notifications import calculate_profit_streak
+
+    run_schema_migrations()
+    with app.app_context():
+        user, = _users('774', 1)
+        today = datetime.utcnow().date()
+        db.session.add_all(Profit(user_id=user.id, amount=0.2, percentage=1.0, date=today - timedelta(days=offset))
+                           for offset in range(5))
+        db.session.commit()
+
+        assert calculate_profit_streak(user.id) == 5
+        assert update_streak(user.id, True) == 5
+        assert update_streak(user.id, True) == 5
+        assert UserMetrics.query.filter_by(user_id=user.id).one().best_streak == 5
+
+
+if __name__ == "__main__":
+    test_bulk_streaks_match_day_by_day_walk()
+    test_long_streak_is_one_query()
+    test_day_close_updates_user_metrics_incrementally()
+    test_update_streak_and_notifications_use_streak_query()
+    logger.warning("All profit streak tests passed")
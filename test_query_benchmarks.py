@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""
+Test Query Benchmarks
+---------------------
+Seeds a small synthetic data set, runs the query benchmark suite over it
+and checks that baselines round-trip and query-count regressions are flagged.
+"""
+
+import os
+import json
+import logging
+import tempfile
+
+if not os.environ.get('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench_test_'), 'bench.db')}"
+
+from app import app, db, run_schema_migrations
+from models import User, Transaction, ReferralCode
+from synthetic_data_generator import SyntheticDataGenerator, purge_synthetic_data, is_local_database
+from query_benchmark_suite import QueryBenchmarkSuite
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+def test_seed_and_benchmark():
+    """Seeded rows are benchmarked, saved as a baseline and compared"""
+    run_schema_migrations()
+    with app.app_context():
+        counts = SyntheticDataGenerator(seed=5, chunk_size=50).generate(
+            users=40, transactions=400, positions=60, referral_fraction=0.5)
+        assert counts['user'] == 40
+        assert counts['transaction'] == 400
+        assert ReferralCode.query.filter(ReferralCode.code.like('SYN%')).count() > 0
+
+    baseline_path = os.path.join(tempfile.mkdtemp(), 'baselines.json')
+    suite = QueryBenchmarkSuite(sample_size=5, iterations=1, baseline_path=baseline_path)
+    try:
+        results = suite.run()
+        for name in ('performance_data', 'dashboard_queries', 'referral_stats', 'admin_search'):
+            assert results[name]['calls'] == 5
+            assert results[name]['queries_per_call'] > 0
+
+        suite.save_baseline(results)
+        assert suite.compare(results, tolerance=0.0) == []
+
+        # Pretend the baseline needed fewer queries: the current run is a regression
+        with open(baseline_path) as baseline_file:
+            baselines = json.load(baseline_file)
+        baselines[results['_profile']]['admin_search']['queries_per_call'] = 0.5
+        with open(baseline_path, 'w') as baseline_file:
+            json.dump(baselines, baseline_file)
+        regressions = suite.compare(results)
+        assert any(r.startswith('admin_search: queries/call') for r in regressions)
+
+        # A run against a different data size has no comparable baseline and must not pass
+        results['_profile'] = results['_profile'] + '-other-size'
+        regressions = suite.compare(results)
+        assert len(regressions) == 1 and regressions[0].startswith('no baseline for profile')
+    finally:
+        with app.app_context():
+            deleted = purge_synthetic_data()
+            assert deleted['user'] >= 40
+            assert Transaction.query.filter(Transaction.tx_hash.like('synthetic_%')).count() == 0
+            assert User.query.filter(User.username.like('synth_%')).count() == 0
+
+
+def test_local_database_guard():
+    """Only SQLite and localhost Postgres are seeded without --allow-remote"""
+    assert is_local_database('sqlite:////tmp/x.db')
+    assert is_local_database('postgresql://bench@localhost:5432/bench')
+    assert not is_local_database('postgresql://user:pw@db.example.com/prod')
+
+
+if __name__ == "__main__":
+    test_seed_and_benchmark()
+    test_local_database_guard()
+    logger.warning("All query benchmark tests passed")
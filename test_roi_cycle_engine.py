@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+"""
+Test ROI Cycle Engine
+---------------------
+Checks the batch daily ROI run: missing cycles are opened, due cycles are
+credited with Profit rows, balances and cycle totals, cycles complete at 2x
+or after seven days, a (user, date) is never credited twice, and a nightly
+run over tens of thousands of users takes seconds.
+"""
+
+import os
+import asyncio
+import logging
+import tempfile
+from datetime import datetime, timedelta
+
+if not os.environ.get('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='roi_test_'), 'roi.db')}"
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '1:roi-test-token')
+
+from sqlalchemy import delete, func, insert, select
+
+from app import app, db, run_schema_migrations
+from models import CycleStatus, DailyRoiCredit, Profit, TradingCycle, User, UserStatus
+from utils import roi_cycle_engine
+from utils.roi_cycle_engine import run_daily_roi
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+NOW = datetime(2026, 3, 2, 9, 0)
+
+
+def _user(telegram_id, balance, status=UserStatus.ACTIVE):
+    user = User(telegram_id=telegram_id, username=f"roi_{telegram_id}", balance=balance, status=status)
+    db.session.add(user)
+    return user
+
+
+def test_daily_credit_and_idempotent_rerun():
+    """Due cycles are credited once per day; inactive and empty users are left alone"""
+    run_schema_migrations()
+    with app.app_context():
+        fresh = _user('8810000001', 2.0)
+        running = _user('8810000002', 5.0)
+        inactive = _user('8810000003', 3.0, UserStatus.INACTIVE)
+        empty = _user('8810000004', 0.0)
+        db.session.flush()
+        db.session.add(TradingCycle(user_id=running.id, start_date=NOW - timedelta(days=2), initial_balance=4.0,
+                                    current_balance=5.0, target_balance=8.0, daily_roi_percentage=25.0,
+                                    total_profit_amount=1.0, total_roi_percentage=25.0))
+        db.session.commit()
+        ids = [fresh.id, running.id, inactive.id, empty.id]
+
+        result = run_daily_roi(user_ids=ids, now=NOW)
+        assert (result['cycles_opened'], result['due'], result['credited']) == (1, 2, 2)
+        assert abs(result['credits'][fresh.id][0] - 2.0 * 0.2857) < 1e-9
+        assert result['credits'][running.id] == (1.0, 25.0, False)
+
+        db.session.expire_all()
+        assert abs(db.session.get(User, running.id).balance - 6.0) < 1e-9
+        assert db.session.get(User, inactive.id).balance == 3.0
+        cycle = TradingCycle.query.filter_by(user_id=running.id).one()
+        assert (cycle.current_balance, cycle.total_profit_amount, cycle.total_roi_percentage) == (6.0, 2.0, 50.0)
+        assert cycle.status == CycleStatus.IN_PROGRESS
+        new_cycle = TradingCycle.query.filter_by(user_id=fresh.id).one()
+        assert (new_cycle.initial_balance, new_cycle.target_balance, new_cycle.start_date) == (2.0, 4.0, NOW)
+        assert TradingCycle.query.filter(TradingCycle.user_id.in_([inactive.id, empty.id])).count() == 0
+
+        # Running the same day again pays nothing
+        again = run_daily_roi(user_ids=ids, now=NOW + timedelta(hours=3))
+        assert (again['cycles_opened'], again['due'], again['credited']) == (0, 0, 0)
+        db.session.expire_all()
+        assert abs(db.session.get(User, running.id).balance - 6.0) < 1e-9
+        assert Profit.query.filter(Profit.user_id.in_(ids)).count() == 2
+
+        # The next day is a new credit
+        tomorrow = run_daily_roi(user_ids=ids, now=NOW + timedelta(days=1))
+        assert tomorrow['credited'] == 2
+        assert DailyRoiCredit.query.filter(DailyRoiCredit.user_id.in_(ids)).count() == 4
+
+
+def test_cycles_complete_at_target_or_after_seven_days():
+    """A credit reaching 2x, or landing on day seven, completes the cycle"""
+    run_schema_migrations()
+    with app.app_context():
+        near_target = _user('8820000001', 1.9)
+        week_old = _user('8820000002', 1.1)
+        db.session.flush()
+        db.session.add_all([
+            TradingCycle(user_id=near_target.id, start_date=NOW - timedelta(days=3), initial_balance=1.0,
+                         current_balance=1.9, target_balance=2.0, daily_roi_percentage=28.57),
+            TradingCycle(user_id=week_old.id, start_date=NOW - timedelta(days=7), initial_balance=1.0,
+                         current_balance=1.1, target_balance=2.0, daily_roi_percentage=1.0),
+        ])
+        db.session.commit()
+
+        result = run_daily_roi(user_ids=[near_target.id, week_old.id], now=NOW)
+        assert result['completed'] == 2
+        for cycle in TradingCycle.query.filter(TradingCycle.user_id.in_([near_target.id, week_old.id])):
+            assert cycle.status == CycleStatus.COMPLETED and cycle.end_date == NOW
+
+
+def test_existing_credit_is_never_paid_twice():
+    """A credit already recorded for the day (an overlapping or crashed run) blocks the payout"""
+    run_schema_migrations()
+    with app.app_context():
+        user = _user('8830000001', 1.0)
+        db.session.flush()
+        cycle = TradingCycle(user_id=user.id, start_date=NOW, initial_balance=1.0, current_balance=1.0,
+                             target_balance=2.0, daily_roi_percentage=10.0)
+        db.session.add(cycle)
+        db.session.flush()
+        db.session.add(DailyRoiCredit(user_id=user.id, cycle_id=cycle.id, date=NOW.date(), amount=0.1,
+                                      percentage=10.0))
+        db.session.commit()
+
+        assert run_daily_roi(user_ids=[user.id], now=NOW)['credited'] == 0
+        db.session.expire_all()
+        assert db.session.get(User, user.id).balance == 1.0
+
+        # A concurrent run that loaded the cycle before the credit existed still pays nothing
+        book = roi_cycle_engine.CycleBook([(cycle.id, user.id, NOW, 1.0, 1.0, 2.0, 10.0)])
+        profits, completes = book.evaluate(NOW)
+        assert roi_cycle_engine._credit_chunk(book, range(1), profits, completes, NOW.date(), NOW) == {}
+        assert db.session.get(User, user.id).balance == 1.0
+
+
+def test_process_daily_roi_and_scheduler_job_use_the_engine():
+    """The per-user helper and the scheduled job both credit at most once per day"""
+    from utils.roi_system import process_daily_roi
+    from utils.scheduler import run_daily_trading_simulation
+
+    run_schema_migrations()
+    with app.app_context():
+        user = _user('8840000001', 10.0)
+        db.session.commit()
+        user_id = user.id
+
+    amount, percentage = process_daily_roi(user_id)
+    assert abs(amount - 2.857) < 1e-9 and percentage == 28.57
+    assert process_daily_roi(user_id) == (0, 0)
+
+    asyncio.run(run_daily_trading_simulation(None))
+    with app.app_context():
+        assert DailyRoiCredit.query.filter_by(user_id=user_id).count() == 1
+        assert abs(db.session.get(User, user_id).balance - 12.857) < 1e-9
+
+
+def test_nightly_run_over_many_users_takes_seconds():
+    """30k users get their cycle opened and credited in a few seconds"""
+    run_schema_migrations()
+    count = 30_000
+    with app.app_context():
+        db.session.execute(insert(User.__table__), [{
+            'telegram_id': f"89{index:08d}", 'username': f"bulk_roi_{index}", 'status': UserStatus.ACTIVE,
+            'balance': 1.0 + index % 7,
+        } for index in range(count)])
+        db.session.commit()
+        bulk_ids = db.session.execute(
+            select(User.id).where(User.telegram_id.like('89%'))).scalars().all()
+        try:
+            expected = sum((1.0 + index % 7) * 0.2857 for index in range(count))
+            result = run_daily_roi(user_ids=bulk_ids, now=NOW)
+            assert (result['cycles_opened'], result['credited']) == (count, count)
+            assert abs(result['total_profit'] - expected) < 1e-6
+
+            credited = db.session.execute(
+                select(func.count(), func.sum(Profit.amount)).where(Profit.user_id.in_(bulk_ids))).one()
+            assert credited[0] == count and abs(credited[1] - expected) < 1e-6
+            assert run_daily_roi(user_ids=bulk_ids, now=NOW)['credited'] == 0
+        finally:
+            # Leave the shared database small for the other tests
+            for table in (Profit, DailyRoiCredit, TradingCycle):
+                db.session.execute(delete(table.__table__).where(table.user_id.in_(bulk_ids)))
+            db.session.execute(delete(User.__table__).where(User.id.in_(bulk_ids)))
+            db.session.commit()
+
+    logger.warning(f"Daily ROI for {count} users took {result['seconds']:.2f}s")
+    assert result['seconds'] < 10, result['seconds']
+
+
+if __name__ == "__main__":
+    test_daily_credit_and_idempotent_rerun()
+    test_cycles_complete_at_target_or_after_seven_days()
+    test_existing_credit_is_never_paid_twice()
+    test_process_daily_roi_and_scheduler_job_use_the_engine()
+    test_nightly_run_over_many_users_takes_seconds()
+    logger.warning("All ROI cycle engine tests passed")
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+"""
+Test Smart Allocation Broadcast
+-------------------------------
+Checks that BUY/SELL broadcasts allocate the whole population in one seeded
+pass and touch the database with a handful of statements, not one per user,
+that every balance change is in the ledger, and that a SELL never credits a
+position twice.
+"""
+
+import os
+import random
+import logging
+import tempfile
+from unittest import mock
+
+if not os.environ.get('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='alloc_test_'), 'alloc.db')}"
+
+from datetime import datetime, timedelta
+
+from app import app, db, run_schema_migrations
+from models import BalanceLedgerEntry, User, UserStatus, TradingPosition, Transaction
+from query_benchmark_suite import StatementCounter
+import smart_balance_allocator
+from smart_balance_allocator import (
+    ALLOCATION_TIERS, MAX_ALLOCATION, calculate_smart_allocation, calculate_smart_allocations,
+    process_smart_buy_broadcast, process_smart_sell_broadcast,
+)
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+USERS = 200
+
+
+def test_seeded_allocations_are_reproducible():
+    """The same seed gives the same allocations, and every tier stays inside its bounds"""
+    balances = [0.0, 0.3, 1.0, 2.5, 5.0, 10.0, 25.0] * 20
+    first = calculate_smart_allocations(balances, 0.004, rng=random.Random(7))
+    second = calculate_smart_allocations(balances, 0.004, rng=random.Random(7))
+    assert first == second
+
+    for balance, spend, percent, level in zip(balances, first['spendable_sol'],
+                                              first['allocation_percent'], first['risk_level']):
+        if balance <= 0:
+            assert (spend, level) == (0.0, 'none')
+            continue
+        minimum, low, high, expected = next(t for t in ALLOCATION_TIERS if balance >= t[0])
+        assert level == expected
+        assert low * 95 - 1e-9 <= percent <= min(high * 105, MAX_ALLOCATION * 100) + 1e-9
+        assert spend <= balance * MAX_ALLOCATION + 1e-4
+
+    single = calculate_smart_allocation(2.5, 0.004, rng=random.Random(3))
+    assert single == {k: v[0] for k, v in calculate_smart_allocations([2.5], 0.004, rng=random.Random(3)).items()}
+
+
+def test_bulk_buy_and_sell_broadcast():
+    """A broadcast to the whole population is a few statements and closes each holder's latest position"""
+    run_schema_migrations()
+    with app.app_context():
+        users = [User(telegram_id=f"8600000{index:04d}", username=f"alloc_{index}",
+                      balance=0.2 + (index % 40) * 0.5, status=UserStatus.ACTIVE) for index in range(USERS)]
+        db.session.add_all(users)
+        db.session.commit()
+        ids = [user.id for user in users]
+        before = {user.id: user.balance for user in users}
+
+        # An older holding for the first user must stay open after the SELL
+        stale = TradingPosition(user_id=ids[0], token_name='ALLOC', amount=5, entry_price=0.01,
+                                current_price=0.01, status='holding',
+                                timestamp=datetime.utcnow() - timedelta(days=1))
+        db.session.add(stale)
+        db.session.commit()
+
+        with StatementCounter(db.engine) as counter:
+            ok, _, affected, summary = process_smart_buy_broadcast('ALLOC', 0.004, 0, 'buy-link', seed=42)
+        assert ok and affected >= USERS
+        assert sum(summary.values()) == affected
+        assert counter.count < 20
+
+        db.session.expire_all()
+        buys = {t.user_id: -t.amount for t in Transaction.query.filter(Transaction.tx_hash.like('buy-link_user_%'))}
+        for user_id in ids:
+            assert abs(db.session.get(User, user_id).balance - (before[user_id] - buys[user_id])) < 1e-9
+        after_buy = {user_id: db.session.get(User, user_id).balance for user_id in ids}
+
+        with StatementCounter(db.engine) as counter:
+            ok, _, affected, summary = process_smart_sell_broadcast('ALLOC', 0.006, 0, 'sell-link')
+        assert ok and affected >= USERS
+        assert counter.count < 20
+
+        db.session.expire_all()
+        assert db.session.get(TradingPosition, stale.id).status == 'holding'
+        closed = TradingPosition.query.filter(TradingPosition.user_id.in_(ids),
+                                              TradingPosition.status == 'completed').all()
+        assert len(closed) == USERS
+        for position in closed:
+            assert abs(position.roi_percentage - 50.0) < 1e-9
+            expected = after_buy[position.user_id] + position.amount * 0.006
+            assert abs(db.session.get(User, position.user_id).balance - expected) < 1e-9
+        assert Transaction.query.filter(Transaction.tx_hash.like('sell-link_user_%')).count() >= USERS
+        ledger = {reason: BalanceLedgerEntry.query.filter(BalanceLedgerEntry.user_id.in_(ids),
+                                                          BalanceLedgerEntry.reason == reason).count()
+                  for reason in ('smart_buy', 'smart_sell')}
+        assert ledger == {'smart_buy': USERS, 'smart_sell': USERS}
+
+        # Nobody holds the token: the broadcast reports failure instead of success
+        ok, _, affected, _ = process_smart_sell_broadcast('NOHOLD', 0.006, 0, 'sell-link-2')
+        assert (ok, affected) == (False, 0)
+
+
+def test_sell_skips_positions_closed_concurrently():
+    """A SELL working from a stale list of holdings credits only positions it actually closed"""
+    run_schema_migrations()
+    with app.app_context():
+        user = User(telegram_id='86009999999', username='alloc_race', balance=1.0, status=UserStatus.ACTIVE)
+        db.session.add(user)
+        db.session.flush()
+        position = TradingPosition(user_id=user.id, token_name='RACE', amount=10, entry_price=0.01,
+                                   current_price=0.01, status='holding')
+        db.session.add(position)
+        db.session.commit()
+        user_id = user.id
+        stale = smart_balance_allocator._latest_holding_positions('RACE', 'active')
+
+        ok, _, affected, _ = process_smart_sell_broadcast('RACE', 0.02, 0, 'race-sell-1')
+        assert ok and affected == 1
+        with mock.patch.object(smart_balance_allocator, '_latest_holding_positions', return_value=stale):
+            ok, _, affected, _ = process_smart_sell_broadcast('RACE', 0.02, 0, 'race-sell-2')
+        assert (ok, affected) == (False, 0)
+
+        db.session.expire_all()
+        assert abs(db.session.get(User, user_id).balance - 1.2) < 1e-9
+        assert Transaction.query.filter_by(related_trade_id=position.id).count() == 1
+
+
+if __name__ == "__main__":
+    test_seeded_allocations_are_reproducible()
+    test_bulk_buy_and_sell_broadcast()
+    test_sell_skips_positions_closed_concurrently()
+    logger.warning("All smart allocation broadcast tests passed")
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+"""
+Test Solana RPC Client
+----------------------
+Runs the shared RPC client against local stub servers: failover past a
+broken endpoint, hedging around a slow one, batched getTransaction calls
+with finalized results cached on disk, and deposit detection in
+utils/solana going through the client.
+"""
+
+import os
+import time
+import logging
+import tempfile
+from datetime import datetime
+
+if not os.environ.get('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='solana_rpc_test_'), 'rpc.db')}"
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '1:solana-rpc-test-token')
+
+from app import app, db, run_schema_migrations
+from config import GLOBAL_DEPOSIT_WALLET
+from models import SenderWallet, User
+from solana_rpc_stub import StubRpcServer
+from utils import solana_rpc
+from utils.solana_rpc import RpcError, SolanaRpcClient
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+SENDER = 'SenderWa11et1111111111111111111111111111111'
+
+
+def _transfer(sender, lamports):
+    return {
+        'transaction': {'message': {'accountKeys': [sender, GLOBAL_DEPOSIT_WALLET]}},
+        'meta': {'preBalances': [5_000_000_000, 0], 'postBalances': [5_000_000_000 - lamports, lamports]},
+    }
+
+
+def _client(*stubs, **kwargs):
+    kwargs.setdefault('cache_path', os.path.join(tempfile.mkdtemp(prefix='rpc_cache_'), 'rpc.sqlite3'))
+    return SolanaRpcClient(endpoints=[stub.url for stub in stubs], **kwargs)
+
+
+def test_failover_skips_a_broken_endpoint():
+    """A 503 endpoint is passed over at once and sorted last afterwards"""
+    broken = StubRpcServer(fail_status=503).start()
+    good = StubRpcServer(balances={'addr': 2_500_000_000}).start()
+    try:
+        client = _client(broken, good, hedge_delay=5)
+        assert client.get_balance('addr') == 2_500_000_000
+        assert client.get_balance('addr') == 2_500_000_000
+        assert len(broken.requests) == 1 and len(good.requests) == 2
+    finally:
+        broken.stop()
+        good.stop()
+
+
+def test_slow_endpoint_is_hedged():
+    """The fast endpoint's answer wins once the hedge delay passes"""
+    slow = StubRpcServer(balances={'addr': 1}, delay=1.0).start()
+    fast = StubRpcServer(balances={'addr': 2}).start()
+    try:
+        client = _client(slow, fast, hedge_delay=0.05)
+        started = time.monotonic()
+        assert client.get_balance('addr') == 2
+        assert time.monotonic() - started < 0.6
+    finally:
+        slow.stop()
+        fast.stop()
+
+
+def test_errors_raise_rpc_error():
+    """JSON-RPC errors keep their code; no endpoint answering is an RpcError too"""
+    good = StubRpcServer().start()
+    broken = StubRpcServer(fail_status=500).start()
+    try:
+        try:
+            _client(good).call('getNothing')
+            assert False, "expected RpcError"
+        except RpcError as e:
+            assert e.code == -32601
+        try:
+            _client(broken).get_balance('addr')
+            assert False, "expected RpcError"
+        except RpcError as e:
+            assert e.code is None and 'No Solana RPC endpoint answered' in str(e)
+
+        # Deposit checks treat an unreachable RPC as no deposit, never a simulated one
+        from utils.solana import check_deposit
+        previous = solana_rpc._client
+        solana_rpc._client = _client(broken)
+        try:
+            assert [check_deposit('addr') for _ in range(20)] == [0.0] * 20
+        finally:
+            solana_rpc._client = previous
+    finally:
+        good.stop()
+        broken.stop()
+
+
+def test_batched_transactions_cache_finalized_results_on_disk():
+    """Transactions are fetched in batches; finalized ones never again, even from a new client"""
+    transactions = {f"sig{i}": _transfer(SENDER, (i + 1) * 1_000_000) for i in range(3)}
+    infos = [{'signature': 'sig0', 'confirmationStatus': 'finalized'},
+             {'signature': 'sig1', 'confirmationStatus': 'finalized'},
+             {'signature': 'sig2', 'confirmationStatus': 'confirmed'},
+             {'signature': 'missing', 'confirmationStatus': 'finalized'}]
+    stub = StubRpcServer(transactions=transactions).start()
+    try:
+        client = _client(stub, batch_size=2)
+        found = client.get_transactions(infos)
+        assert set(found) == {'sig0', 'sig1', 'sig2'}
+        assert stub.requests == [['getTransaction'] * 2, ['getTransaction'] * 2]
+
+        restarted = _client(stub, cache_path=client.cache.path)
+        assert restarted.get_transactions(infos) == found
+        assert stub.requests[2:] == [['getTransaction'] * 2]  # sig2 (not final) and missing
+        assert restarted.get_transaction('sig0', commitment='finalized') == found['sig0']
+        assert len(stub.requests) == 3
+    finally:
+        stub.stop()
+
+
+def test_admin_wallet_monitor_uses_the_client():
+    """Deposit scanning lists signatures, batch-fetches them and matches the sender"""
+    from utils.solana import monitor_admin_wallet_transactions
+
+    run_schema_migrations()
+    with app.app_context():
+        user = User(telegram_id='6630000001', username='rpc_depositor')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(SenderWallet(user_id=user.id, wallet_address=SENDER, last_used=datetime.utcnow()))
+        db.session.commit()
+        user_id = user.id
+
+    now = int(time.time())
+    stub = StubRpcServer(
+        signatures={GLOBAL_DEPOSIT_WALLET: [
+            {'signature': 'deposit1', 'blockTime': now, 'confirmationStatus': 'finalized'},
+            {'signature': 'stranger1', 'blockTime': now, 'confirmationStatus': 'confirmed'},
+        ]},
+        transactions={'deposit1': _transfer(SENDER, 1_500_000_000),
+                      'stranger1': _transfer('Stranger111111111111111111111111111111111', 2_000_000_000)},
+    ).start()
+    previous = solana_rpc._client
+    solana_rpc._client = _client(stub)
+    try:
+        assert monitor_admin_wallet_transactions() == [(user_id, 1.5, 'deposit1')]
+        assert stub.requests == [['getSignaturesForAddress'], ['getTransaction', 'getTransaction']]
+
+        # A transaction the node cannot return yet makes the scan report failure
+        from utils.deposit_monitor import scan_for_deposits
+        from utils.solana import find_admin_wallet_deposits
+        assert find_admin_wallet_deposits([{'signature': 'pending1'}]) == ([], ['pending1'])
+        assert scan_for_deposits([{'signature': 'pending1'}]) is False
+        assert scan_for_deposits([{'signature': 'stranger1'}]) is True
+    finally:
+        solana_rpc._client = previous
+        stub.stop()
+
+
+if __name__ == "__main__":
+    test_failover_skips_a_broken_endpoint()
+    test_slow_endpoint_is_hedged()
+    test_errors_raise_rpc_error()
+    test_batched_transactions_cache_finalized_results_on_disk()
+    test_admin_wallet_monitor_uses_the_client()
+    logger.warning("All Solana RPC tests passed")
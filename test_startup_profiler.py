@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""
+Test Startup Profiler
+---------------------
+Checks the cold-start timing report and that constructing the bot no longer
+makes blocking Telegram API calls.
+"""
+
+import time
+import logging
+from unittest import mock
+
+from startup_profiler import StartupProfiler
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def test_phase_breakdown():
+    """Phases accumulate and appear in the report in start order"""
+    profiler = StartupProfiler(budget_seconds=60)
+
+    profiler.record('import', 0.25)
+    with profiler.phase('lock'):
+        time.sleep(0.01)
+    with profiler.phase('lock'):
+        time.sleep(0.01)
+
+    report = profiler.get_report()
+    names = [p['phase'] for p in report['phases']]
+    assert names == ['import', 'lock']
+    assert report['phases'][1]['seconds'] >= 0.02
+    assert report['time_to_polling_ready'] is None
+    assert report['within_budget'] is False
+
+
+def test_polling_ready_triggers_report():
+    """The polling_ready mark produces the report exactly once; first_update does not"""
+    profiler = StartupProfiler(budget_seconds=3600)
+
+    assert profiler.mark('first_update')
+    assert not profiler._reported
+    assert profiler.mark('polling_ready')
+    assert not profiler.mark('polling_ready')
+
+    report = profiler.get_report()
+    assert report['time_to_polling_ready'] is not None
+    assert report['within_budget'] is True
+    assert profiler.report() is None  # already reported
+
+
+def test_bot_init_is_offline():
+    """SimpleTelegramBot() must not call the Telegram API"""
+    from bot_v20_runner import SimpleTelegramBot
+
+    with mock.patch('bot_v20_runner.requests') as fake_requests:
+        SimpleTelegramBot("123456:TEST-TOKEN")
+        assert not fake_requests.get.called
+        assert not fake_requests.post.called
+
+
+if __name__ == "__main__":
+    test_phase_breakdown()
+    test_polling_ready_triggers_report()
+    test_bot_init_is_offline()
+    logger.info("All startup profiler tests passed")
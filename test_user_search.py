@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+"""
+Test User Search
+----------------
+Checks the admin user search: exact lookups by id, username and wallet,
+ranking of partial and fuzzy matches across all searchable fields, the
+in-memory trigram index picking up new users, the admin search handler,
+and millisecond searches over 100k users.
+"""
+
+import os
+import logging
+import tempfile
+import time
+
+if not os.environ.get('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='search_test_'), 'search.db')}"
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '1:search-test-token')
+
+from statistics import median
+
+from sqlalchemy import delete, insert
+
+import user_search
+from app import app, db, run_schema_migrations
+from models import SenderWallet, User, UserStatus
+from user_search import UserSearch, score_match, similarity
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+WALLET = 'AliCeWa11etAddressxxxxxxxxxxxxxxxxxxxxxxxxx1'
+SENDER_WALLET = 'SenderWa11etBobyyyyyyyyyyyyyyyyyyyyyyyyyyyy2'
+SEEDED_IDS = ('5100000001', '5100000002', '5100000003')
+
+
+def _seed_people():
+    with app.app_context():
+        if User.query.filter_by(telegram_id='5100000001').first():
+            return
+        alice = User(telegram_id='5100000001', username='Alice_Smith', first_name='Alice', last_name='Smith',
+                     wallet_address=WALLET, status=UserStatus.ACTIVE)
+        bob = User(telegram_id='5100000002', username='bobtrader', first_name='Robert', last_name='Alison')
+        carol = User(telegram_id='5100000003', username='carol', first_name='Carol', last_name='Malice')
+        db.session.add_all([alice, bob, carol])
+        db.session.flush()
+        db.session.add(SenderWallet(user_id=bob.id, wallet_address=SENDER_WALLET))
+        db.session.commit()
+
+
+def _seeded(users):
+    """Usernames of the seeded people among the results, in rank order
+
+    The database may be shared with other test modules, so their users can
+    rank among the results too.
+    """
+    return [user.username for user in users if user.telegram_id in SEEDED_IDS]
+
+
+def test_exact_lookups():
+    """Telegram id, username (any case, with or without @) and wallets find the user"""
+    run_schema_migrations()
+    _seed_people()
+    search = UserSearch()
+    with app.app_context():
+        assert search.find('5100000001').username == 'Alice_Smith'
+        assert search.find('@alice_smith').telegram_id == '5100000001'
+        assert search.find(' ALICE_SMITH ').telegram_id == '5100000001'
+        assert search.find(WALLET).telegram_id == '5100000001'
+        assert search.find(SENDER_WALLET).username == 'bobtrader'
+        assert search.find('alic') is None
+
+
+def test_ranking_across_fields():
+    """Prefix beats substring beats fuzzy, and every searchable field is matched"""
+    run_schema_migrations()
+    _seed_people()
+    search = UserSearch()
+    with app.app_context():
+        # alice: username prefix; carol: last name substring 'malice'; bob: only similar ('alison')
+        assert _seeded(search.search('alic')) == ['Alice_Smith', 'carol', 'bobtrader']
+        assert _seeded(search.search('ali')) == ['Alice_Smith', 'bobtrader', 'carol']
+        assert _seeded(search.search('robert')) == ['bobtrader']
+        assert search.search('5100000003')[0].username == 'carol'
+        assert _seeded(search.search('senderwa11et')) == ['bobtrader']
+        # Typo: no substring match, found by trigram similarity
+        assert search.search('alice_smiht')[0].username == 'Alice_Smith'
+        assert search.search('zzzzqqq') == []
+
+    assert score_match('alic', 'username', 'alice_smith') > score_match('alic', 'last_name', 'malice')
+    assert score_match('alis', 'last_name', 'alison') > score_match('alis', 'first_name', 'xalisx')
+    assert abs(similarity('word', 'word') - 1.0) < 1e-9
+
+
+def test_index_picks_up_new_users():
+    """New users appear after the refresh interval; the exact path sees them at once"""
+    run_schema_migrations()
+    _seed_people()
+    search = UserSearch()
+    saved = user_search.SEARCH_INDEX_REFRESH_SECONDS
+    with app.app_context():
+        assert search.search('zebrafish') == []
+        db.session.add(User(telegram_id='5100000009', username='zebrafish_fan'))
+        db.session.commit()
+        assert search.find('zebrafish_fan') is not None
+        try:
+            user_search.SEARCH_INDEX_REFRESH_SECONDS = 0
+            assert [user.username for user in search.search('zebrafish')] == ['zebrafish_fan']
+        finally:
+            user_search.SEARCH_INDEX_REFRESH_SECONDS = saved
+
+
+def test_admin_search_handler_lists_ranked_matches():
+    """The admin search screen lists ranked partial matches with names"""
+    import bot_v20_runner
+    from bot_v20_runner import SimpleTelegramBot, admin_search_query_handler
+    from fake_telegram_api import FakeTelegramServer
+
+    run_schema_migrations()
+    _seed_people()
+    user_search._user_search = UserSearch()
+    server = FakeTelegramServer()
+    base_url = server.start()
+    try:
+        token = os.environ['TELEGRAM_BOT_TOKEN']
+        bot_v20_runner.bot = SimpleTelegramBot(token)
+        bot_v20_runner.bot.api_url = f"{base_url}/bot{token}"
+
+        admin_search_query_handler({}, 5199, 'alic')
+        (_, _, payload), = server.sent[5199]
+        assert payload['text'].startswith("🔍 Found 3 users matching 'alic'")
+        assert payload['text'].index('Alice_Smith') < payload['text'].index('carol')
+        assert '(Alice Smith)' in payload['text']
+    finally:
+        user_search._user_search = None
+        server.stop()
+
+
+def test_search_over_100k_users_is_fast():
+    """Partial, fuzzy and exact searches over 100k users take milliseconds"""
+    run_schema_migrations()
+    with app.app_context():
+        rows = [{
+            'telegram_id': str(6_000_000_000 + i),
+            'username': f"trader_{i:06d}_{'abcdefghijklmnopqrstuvwxyz'[i % 26]}{'zyxwvutsrq'[i % 10]}",
+            'first_name': ('Liam', 'Olivia', 'Noah', 'Emma', 'Mateo', 'Amara')[i % 6],
+            'last_name': f"Family{i % 5000:04d}",
+            'wallet_address': f"Wa{i:010d}{'x' * 32}",
+        } for i in range(100_000)]
+        db.session.execute(insert(User.__table__), rows)
+        db.session.commit()
+        try:
+            search = UserSearch()
+            started = time.perf_counter()
+            search.search('warmup')
+            build_seconds = time.perf_counter() - started
+
+            queries = ['trader_05432', 'family1234', 'olivia', '6000054321', 'trader_012345_x', 'wa0000077777',
+                       'tradr_099999', 'emma', 'ol', '@trader_000042_qz']
+            timings = []
+            for query in queries:
+                started = time.perf_counter()
+                results = search.search(query)
+                timings.append(time.perf_counter() - started)
+                assert results, query
+
+            assert search.find('trader_012345_x') is None
+            assert search.search('trader_012345')[0].telegram_id == '6000012345'
+            assert search.search('6000054321')[0].telegram_id == '6000054321'
+        finally:
+            # Leave the shared database small for the broadcast tests
+            db.session.execute(delete(User.__table__).where(User.telegram_id.like('6000%')))
+            db.session.commit()
+
+    logger.warning(f"Index build {build_seconds:.2f}s; median search {median(timings) * 1000:.1f}ms, "
+                   f"max {max(timings) * 1000:.1f}ms")
+    assert median(timings) < 0.05, timings
+
+
+if __name__ == "__main__":
+    test_exact_lookups()
+    test_ranking_across_fields()
+    test_index_picks_up_new_users()
+    test_admin_search_handler_lists_ranked_matches()
+    test_search_over_100k_users_is_fast()
+    logger.warning("All user search tests passed")
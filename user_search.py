@@ -0,0 +1,481 @@
+"""
+User Search
+===========
+One search service for every admin user lookup: the user search screen,
+the direct-message recipient search, balance adjustments and
+balance_manager.find_user.
+
+A query is matched against telegram_id, username, first and last name, the
+payout wallet and linked sender wallets, and results are ranked:
+
+    exact match (any field)         3.0
+    prefix match                    2.0 - 3.0 (longer overlap ranks higher)
+    substring match                 1.5 - 2.0
+    trigram similarity >= 0.3       0.3 - 1.0
+
+with names weighted slightly below identifiers. Exact matches always come
+straight from the database through indexed columns. Partial and fuzzy
+matches come from:
+
+    PostgreSQL      GIN pg_trgm indexes (ensure_search_indexes, run by the
+                    schema migration), queried with LIKE and the % operator
+    anything else   an in-memory trigram index of the same fields, built on
+                    first use, topped up with new users every
+                    SEARCH_INDEX_REFRESH_SECONDS and rebuilt in the
+                    background every SEARCH_INDEX_REBUILD_SECONDS
+
+Usage:
+    user = find_user('@alice')              # exact match or None
+    users = search_users('alic', limit=5)   # ranked User objects
+"""
+import bisect
+import heapq
+import logging
+import os
+import threading
+import time
+from array import array
+from collections import defaultdict
+
+from sqlalchemy import func, or_, select, text
+
+logger = logging.getLogger(__name__)
+
+# New users are added to the in-memory index at most this often
+SEARCH_INDEX_REFRESH_SECONDS = float(os.environ.get('SEARCH_INDEX_REFRESH_SECONDS', '30'))
+
+# Full rebuild interval, picking up renamed users and changed wallets
+SEARCH_INDEX_REBUILD_SECONDS = float(os.environ.get('SEARCH_INDEX_REBUILD_SECONDS', '600'))
+
+# Minimum trigram similarity for a fuzzy match (pg_trgm's default threshold)
+SIMILARITY_THRESHOLD = 0.3
+
+# Identifiers outrank names when scores tie
+FIELD_WEIGHTS = {
+    'telegram_id': 1.0,
+    'username': 1.0,
+    'wallet_address': 1.0,
+    'sender_wallet': 0.95,
+    'first_name': 0.8,
+    'last_name': 0.8,
+}
+FIELDS = tuple(FIELD_WEIGHTS)
+
+# (index name, table, indexed expression) for the PostgreSQL trigram indexes
+TRIGRAM_INDEXES = (
+    ('idx_user_username_trgm', 'user', 'lower(username)'),
+    ('idx_user_first_name_trgm', 'user', 'lower(first_name)'),
+    ('idx_user_last_name_trgm', 'user', 'lower(last_name)'),
+    ('idx_user_telegram_id_trgm', 'user', 'telegram_id'),
+    ('idx_user_wallet_address_trgm', 'user', 'lower(wallet_address)'),
+    ('idx_sender_wallet_address_trgm', 'sender_wallet', 'lower(wallet_address)'),
+)
+
+# (field, table, user id column, indexed expression) searched on PostgreSQL
+_PG_SEARCH_FIELDS = (
+    ('username', 'user', 'id', 'lower(username)'),
+    ('first_name', 'user', 'id', 'lower(first_name)'),
+    ('last_name', 'user', 'id', 'lower(last_name)'),
+    ('telegram_id', 'user', 'id', 'telegram_id'),
+    ('wallet_address', 'user', 'id', 'lower(wallet_address)'),
+    ('sender_wallet', 'sender_wallet', 'user_id', 'lower(wallet_address)'),
+)
+
+
+def normalize_query(query):
+    """Lower-cased query without surrounding whitespace or a leading @"""
+    query = (query or '').strip()
+    if query.startswith('@'):
+        query = query[1:]
+    return query.lower()
+
+
+def trigrams(value, padded=True):
+    """pg_trgm-style trigrams; padding marks word starts and ends for similarity"""
+    if padded:
+        value = f"  {value} "
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+
+def similarity(query, value):
+    """Jaccard similarity of the padded trigram sets, as pg_trgm's similarity()"""
+    query_trigrams, value_trigrams = trigrams(query), trigrams(value)
+    shared = len(query_trigrams & value_trigrams)
+    return shared / (len(query_trigrams) + len(value_trigrams) - shared) if shared else 0.0
+
+
+def score_match(query, field, value):
+    """Rank of one field value for a normalized query (0 when it doesn't match)"""
+    if not value:
+        return 0.0
+    value = value.lower()
+    if value == query:
+        score = 3.0
+    elif value.startswith(query):
+        score = 2.0 + len(query) / len(value)
+    elif query in value:
+        score = 1.5 + 0.5 * len(query) / len(value)
+    else:
+        score = similarity(query, value)
+        if score < SIMILARITY_THRESHOLD:
+            return 0.0
+    return score * FIELD_WEIGHTS[field]
+
+
+def _like_pattern(query):
+    escaped = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+
+class TrigramIndex:
+    """
+    In-memory trigram index over the searchable user fields
+
+    Each (user, field, value) is a document. Postings are arrays of document
+    numbers in ascending order, so substring candidates are found by
+    intersecting the rarest query trigrams first, and fuzzy candidates by
+    counting shared trigrams while skipping the very common ones. Fuzzy
+    matches always rank below substring matches, so they are only looked
+    for when substring matches don't fill the requested limit.
+    """
+
+    # Postings longer than this share of all documents are skipped for fuzzy matching
+    COMMON_TRIGRAM_SHARE = 0.05
+
+    # Substring candidates verified per query before giving up on finding more
+    MAX_SUBSTRING_CHECKS = 5000
+
+    # Fuzzy candidates scored exactly per query, those sharing the most rare trigrams first
+    MAX_FUZZY_CHECKS = 1000
+
+    def __init__(self):
+        self.doc_user = array('i')
+        self.doc_field = array('b')
+        self.doc_value = []
+        self.doc_trigram_count = array('H')
+        self.postings = defaultdict(lambda: array('i'))
+        self.sorted_values = []   # (value, doc) for prefix matches of short queries
+        self._sorted_dirty = False
+        self.max_user_id = 0
+        self.max_sender_wallet_id = 0
+
+    def __len__(self):
+        return len(self.doc_user)
+
+    def add(self, user_id, field, value):
+        if not value:
+            return
+        value = str(value).lower()
+        doc = len(self.doc_user)
+        self.doc_user.append(user_id)
+        self.doc_field.append(FIELDS.index(field))
+        self.doc_value.append(value)
+        # The padded set also holds every inner trigram, which substring matching uses
+        padded = trigrams(value)
+        self.doc_trigram_count.append(min(len(padded), 65535))
+        for trigram in padded:
+            self.postings[trigram].append(doc)
+        self.sorted_values.append((value, doc))
+        self._sorted_dirty = True
+
+    def load(self, engine):
+        """Add users and sender wallets created since the last load"""
+        from models import SenderWallet, User
+        users = User.__table__
+        wallets = SenderWallet.__table__
+        with engine.connect() as connection:
+            rows = connection.execute(
+                select(users.c.id, users.c.telegram_id, users.c.username, users.c.first_name,
+                       users.c.last_name, users.c.wallet_address)
+                .where(users.c.id > self.max_user_id).order_by(users.c.id))
+            for user_id, telegram_id, username, first_name, last_name, wallet_address in rows:
+                self.add(user_id, 'telegram_id', telegram_id)
+                self.add(user_id, 'username', username)
+                self.add(user_id, 'first_name', first_name)
+                self.add(user_id, 'last_name', last_name)
+                self.add(user_id, 'wallet_address', wallet_address)
+                self.max_user_id = user_id
+            rows = connection.execute(
+                select(wallets.c.id, wallets.c.user_id, wallets.c.wallet_address)
+                .where(wallets.c.id > self.max_sender_wallet_id).order_by(wallets.c.id))
+            for wallet_id, user_id, wallet_address in rows:
+                self.add(user_id, 'sender_wallet', wallet_address)
+                self.max_sender_wallet_id = wallet_id
+        if self._sorted_dirty:
+            self.sorted_values.sort()
+            self._sorted_dirty = False
+
+    def _contains_all(self, doc, lists):
+        for postings in lists:
+            position = bisect.bisect_left(postings, doc)
+            if position == len(postings) or postings[position] != doc:
+                return False
+        return True
+
+    def candidates(self, query, limit=None):
+        """Documents that may match query: substring, prefix or fuzzy"""
+        found = set()
+        if len(query) < 3:
+            # Too short for trigrams: prefix matches from the sorted values
+            start = bisect.bisect_left(self.sorted_values, (query, -1))
+            for value, doc in self.sorted_values[start:start + 200]:
+                if not value.startswith(query):
+                    break
+                found.add(doc)
+            return found
+
+        # Substring: every trigram of the query must be present
+        lists = sorted((self.postings.get(trigram, ()) for trigram in trigrams(query, padded=False)), key=len)
+        if lists and lists[0]:
+            checks = 0
+            for doc in lists[0]:
+                checks += 1
+                if checks > self.MAX_SUBSTRING_CHECKS:
+                    break
+                if self._contains_all(doc, lists[1:]) and query in self.doc_value[doc]:
+                    found.add(doc)
+
+        if limit is not None and len({self.doc_user[doc] for doc in found}) >= limit:
+            return found
+
+        # Fuzzy: count shared padded trigrams, skipping those nearly every value has.
+        # Skipped trigrams are assumed shared, so the count gives an upper bound
+        # on similarity; documents that reach it are then scored exactly.
+        query_trigrams = trigrams(query)
+        common = max(1000, int(len(self) * self.COMMON_TRIGRAM_SHARE))
+        shared = defaultdict(int)
+        skipped = 0
+        for trigram in query_trigrams:
+            postings = self.postings.get(trigram)
+            if postings is None:
+                continue
+            if len(postings) > common:
+                skipped += 1
+                continue
+            for doc in postings:
+                shared[doc] += 1
+        size = len(query_trigrams)
+        possible = []
+        for doc, count in shared.items():
+            bound = count + skipped
+            if doc not in found and bound / (size + self.doc_trigram_count[doc] - bound) >= SIMILARITY_THRESHOLD:
+                possible.append((count, doc))
+        if not skipped:
+            found.update(doc for _, doc in possible)
+            return found
+        if len(possible) > self.MAX_FUZZY_CHECKS:
+            possible = heapq.nlargest(self.MAX_FUZZY_CHECKS, possible)
+        for _, doc in possible:
+            if similarity(query, self.doc_value[doc]) >= SIMILARITY_THRESHOLD:
+                found.add(doc)
+        return found
+
+    def matches(self, query, limit=None):
+        """(user_id, field, value) for every candidate document"""
+        return [(self.doc_user[doc], FIELDS[self.doc_field[doc]], self.doc_value[doc])
+                for doc in self.candidates(query, limit)]
+
+
+class UserSearch:
+    """Ranks users for admin lookups; see the module docstring"""
+
+    def __init__(self, engine=None):
+        self._engine = engine
+        self._index = None
+        self._index_checked_at = 0.0
+        self._index_built_at = 0.0
+        self._index_lock = threading.Lock()
+        self._rebuilding = False
+        self._pg_trgm = None
+
+    @property
+    def engine(self):
+        if self._engine is not None:
+            return self._engine
+        from app import app, db
+        with app.app_context():
+            return db.engine
+
+    # ------------------------------------------------------------------
+    # Exact matches
+    # ------------------------------------------------------------------
+    def exact_matches(self, query):
+        """Users whose telegram_id, username or a wallet equals query, via indexed lookups"""
+        from models import SenderWallet, User
+        raw = (query or '').strip()
+        normalized = normalize_query(raw)
+        if not normalized:
+            return []
+        sender_wallets = select(SenderWallet.user_id).where(SenderWallet.wallet_address == raw)
+        return User.query.filter(or_(
+            User.telegram_id == raw,
+            func.lower(User.username) == normalized,
+            User.wallet_address == raw,
+            User.id.in_(sender_wallets),
+        )).limit(10).all()
+
+    # ------------------------------------------------------------------
+    # Partial and fuzzy matches
+    # ------------------------------------------------------------------
+    def _use_pg_trgm(self):
+        if self._pg_trgm is None:
+            engine = self.engine
+            if engine.dialect.name != 'postgresql':
+                self._pg_trgm = False
+            else:
+                with engine.connect() as connection:
+                    self._pg_trgm = bool(connection.execute(
+                        text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).scalar())
+                if not self._pg_trgm:
+                    logger.warning("pg_trgm is not installed; user search uses the in-memory index")
+        return self._pg_trgm
+
+    def _pg_matches(self, query, per_field):
+        parts = []
+        for field, table, user_column, expression in _PG_SEARCH_FIELDS:
+            parts.append(
+                f"(SELECT {user_column} AS user_id, '{field}' AS field, {expression} AS value "
+                f"FROM \"{table}\" WHERE {expression} LIKE :pattern OR {expression} % :query "
+                f"ORDER BY similarity({expression}, :query) DESC LIMIT :per_field)"
+            )
+        with self.engine.connect() as connection:
+            return connection.execute(text(' UNION ALL '.join(parts)), {
+                'pattern': _like_pattern(query),
+                'query': query,
+                'per_field': per_field,
+            }).all()
+
+    def _memory_index(self):
+        now = time.monotonic()
+        index = self._index
+        if index is None:
+            with self._index_lock:
+                if self._index is None:
+                    started = time.perf_counter()
+                    index = TrigramIndex()
+                    index.load(self.engine)
+                    self._index, self._index_checked_at, self._index_built_at = index, now, now
+                    logger.info(f"User search index built: {len(index)} values in "
+                                f"{time.perf_counter() - started:.2f}s")
+            return self._index
+
+        if now - self._index_built_at >= SEARCH_INDEX_REBUILD_SECONDS and not self._rebuilding:
+            self._rebuilding = True
+            threading.Thread(target=self._rebuild, name='user-search-rebuild', daemon=True).start()
+        elif now - self._index_checked_at >= SEARCH_INDEX_REFRESH_SECONDS:
+            with self._index_lock:
+                if now - self._index_checked_at >= SEARCH_INDEX_REFRESH_SECONDS:
+                    self._index.load(self.engine)
+                    self._index_checked_at = now
+        return self._index
+
+    def _rebuild(self):
+        try:
+            index = TrigramIndex()
+            index.load(self.engine)
+            with self._index_lock:
+                # Catch anything added while the rebuild was reading
+                index.load(self.engine)
+                now = time.monotonic()
+                self._index, self._index_checked_at, self._index_built_at = index, now, now
+        except Exception as e:
+            logger.error(f"User search index rebuild failed: {e}")
+        finally:
+            self._rebuilding = False
+
+    def invalidate(self):
+        """Drop the in-memory index; the next search rebuilds it"""
+        with self._index_lock:
+            self._index = None
+
+    def partial_matches(self, query, limit=5, per_field=50):
+        if self._use_pg_trgm():
+            return self._pg_matches(query, per_field)
+        return self._memory_index().matches(query, limit)
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    def search(self, query, limit=5):
+        """Best matching User objects for query, highest ranked first"""
+        from models import User
+        normalized = normalize_query(query)
+        if not normalized:
+            return []
+
+        scores = {}
+        exact = {}
+        for user in self.exact_matches(query):
+            exact[user.id] = user
+            scores[user.id] = 3.0
+        for user_id, field, value in self.partial_matches(normalized, limit):
+            score = score_match(normalized, field, value)
+            if score > scores.get(user_id, 0.0):
+                scores[user_id] = score
+
+        ranked = sorted(scores, key=lambda user_id: (-scores[user_id], user_id))[:limit]
+        missing = [user_id for user_id in ranked if user_id not in exact]
+        loaded = {user.id: user for user in User.query.filter(User.id.in_(missing)).all()} if missing else {}
+        loaded.update(exact)
+        return [loaded[user_id] for user_id in ranked if user_id in loaded]
+
+    def find(self, query):
+        """The user a query names exactly (telegram_id first, then username, then wallet), or None"""
+        matches = self.exact_matches(query)
+        if not matches:
+            return None
+        raw = (query or '').strip()
+        normalized = normalize_query(raw)
+
+        def precedence(user):
+            if user.telegram_id == raw:
+                return 0
+            if (user.username or '').lower() == normalized:
+                return 1
+            return 2
+        return min(matches, key=precedence)
+
+
+def ensure_search_indexes(engine=None):
+    """Create the pg_trgm extension and trigram indexes on PostgreSQL (no-op elsewhere)"""
+    if engine is None:
+        from app import db
+        engine = db.engine
+    if engine.dialect.name != 'postgresql':
+        return []
+    created = []
+    try:
+        with engine.begin() as connection:
+            connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            for name, table, expression in TRIGRAM_INDEXES:
+                connection.execute(text(
+                    f'CREATE INDEX IF NOT EXISTS {name} ON "{table}" USING gin ({expression} gin_trgm_ops)'))
+                created.append(name)
+    except Exception as e:
+        logger.warning(f"Could not set up pg_trgm search indexes, using the in-memory index: {e}")
+        return []
+    return created
+
+
+_user_search = None
+_user_search_lock = threading.Lock()
+
+
+def get_user_search():
+    """Get the process-wide user search service"""
+    global _user_search
+    if _user_search is None:
+        with _user_search_lock:
+            if _user_search is None:
+                _user_search = UserSearch()
+    return _user_search
+
+
+def search_users(query, limit=5):
+    """Ranked users matching query across ids, names and wallets"""
+    return get_user_search().search(query, limit=limit)
+
+
+def find_user(query):
+    """The user query identifies exactly, or None"""
+    return get_user_search().find(query)
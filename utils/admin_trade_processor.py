@@ -305,53 +305,11 @@ class AdminTradeProcessor:
     @staticmethod
     def check_and_apply_stop_loss(user_id: int) -> int:
         """Check and apply stop loss for user's open positions"""
+        from utils.portfolio_risk_engine import PortfolioRiskEngine
         try:
-            settings = AutoTradingManager.get_or_create_settings(user_id)
-            
-            open_positions = TradingPosition.query.filter(
-                TradingPosition.user_id == user_id,
-                TradingPosition.status == 'open'
-            ).all()
-            
-            stopped_out = 0
-            
-            for position in open_positions:
-                # Calculate current loss percentage
-                loss_percentage = ((position.entry_price - position.current_price) / position.entry_price) * 100
-                
-                if loss_percentage >= settings.stop_loss_percentage:
-                    # Execute stop loss
-                    position.status = 'closed'
-                    position.notes += f" | Stop loss triggered at -{loss_percentage:.1f}%"
-                    
-                    # Create stop loss transaction
-                    sell_value = position.amount * position.current_price
-                    loss_amount = sell_value - (position.amount * position.entry_price)
-                    
-                    transaction = Transaction()
-                    transaction.user_id = user_id
-                    transaction.transaction_type = 'trade_loss'
-                    transaction.amount = loss_amount
-                    transaction.token_name = position.token_name
-                    transaction.timestamp = datetime.utcnow()
-                    transaction.status = 'completed'
-                    transaction.notes = f"Auto stop loss: {position.token_name} at -{loss_percentage:.1f}%"
-                    
-                    db.session.add(transaction)
-                    
-                    # Update user balance
-                    user = User.query.get(user_id)
-                    if user:
-                        user.balance += sell_value
-                    
-                    stopped_out += 1
-            
-            if stopped_out > 0:
-                db.session.commit()
-                logger.info(f"Applied stop loss to {stopped_out} positions for user {user_id}")
-            
-            return stopped_out
+            result = PortfolioRiskEngine.run_risk_pass(user_ids=[user_id], take_profit=False)
+            return result['stop_loss']
             
         except Exception as e:
             logger.error(f"Error checking stop loss for user {user_id}: {e}")
-            return 0
\ No newline at end of file
+            return 0
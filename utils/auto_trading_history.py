@@ -24,6 +24,7 @@ import schedule
 from datetime import datetime, timedelta
 from app import app, db
 from models import User, Transaction, Profit, TradingPosition
+from utils.memecoin_feed import BIRDEYE_API, PUMP_FUN_API, SOURCES, get_memecoin_feed
 from threading import Lock
 
 # Configure logging
@@ -49,21 +50,6 @@ MAX_LOSS_PERCENT = 1.8  # maximum loss percentage (-0.5% to -1.8%)
 DEFAULT_ENTRY_HOLDING_MINUTES = 10  # time between entry and exit in minutes
 DAILY_ROI_TARGET = 14.3  # Target daily ROI percentage for 2x in 7 days (100%/7)
 
-# API endpoints
-PUMP_FUN_API = "https://client-api.pump.fun/tokens/recent"
-BIRDEYE_API = "https://public-api.birdeye.so/public/tokenlist?sort_by=v24hUSD"
-
-# API cache settings
-API_CACHE_DURATION = 15 * 60  # Cache API responses for 15 minutes
-API_MAX_RETRIES = 3  # Maximum number of retry attempts
-API_RETRY_DELAY = 2  # Seconds between retries
-
-# Global cache for API responses
-api_cache = {
-    "pump_fun": {"data": None, "timestamp": 0},
-    "birdeye": {"data": None, "timestamp": 0}
-}
-
 # Backoff/retry logging
 def log_retry_attempt(func_name, attempt, max_tries, wait_time, error=None):
     """Log information about retry attempts"""
@@ -111,11 +97,8 @@ auto_trading_data = {}
 active_trading_threads = {}
 stop_trading_flags = {}
 
-# API status tracking
-api_health = {
-    'pump_fun': {'status': 'unknown', 'last_check': 0, 'failures': 0},
-    'birdeye': {'status': 'unknown', 'last_check': 0, 'failures': 0}
-}
+# API status tracking (kept current by the memecoin feed's refreshes)
+api_health = get_memecoin_feed().health
 
 def load_data():
     """Load auto trading data from file"""
@@ -165,334 +148,31 @@ def get_user_data(user_id):
         save_data()
     return auto_trading_data[str_user_id]
 
-def fetch_api_data(url, source):
-    """
-    Centralized function for fetching data from APIs with retry logic
-    
-    Args:
-        url (str): The API endpoint URL
-        source (str): Source identifier for logging ("pump_fun" or "birdeye")
-        
-    Returns:
-        dict or None: JSON response data or None if all retries failed
-    """
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/111.0.0.0 Safari/537.36'
-    }
-    
-    # Check if we have a valid cached response
-    cache_entry = api_cache.get(source, {})
-    cache_time = cache_entry.get("timestamp", 0)
-    cache_data = cache_entry.get("data")
-    
-    # Use cache if it's still valid (not expired)
-    if cache_data and (time.time() - cache_time) < API_CACHE_DURATION:
-        logger.debug(f"Using cached {source} API data (age: {time.time() - cache_time:.1f}s)")
-        return cache_data
-    
-    # If no valid cache, fetch from API with retries
-    for attempt in range(1, API_MAX_RETRIES + 1):
-        try:
-            fetch_start_time = time.time()
-            logger.debug(f"Fetching {source} API data (attempt {attempt}/{API_MAX_RETRIES})")
-            response = requests.get(url, headers=headers, timeout=10)
-            
-            # Check for HTTP errors
-            if response.status_code != 200:
-                error_msg = f"API error: {response.status_code}"
-                try:
-                    # Try to extract error message from JSON response
-                    error_body = response.json()
-                    if "message" in error_body:
-                        error_msg += f" - {error_body['message']}"
-                except:
-                    # If we can't parse JSON, use text content
-                    error_msg += f" - {response.text[:100]}"
-                
-                logger.warning(f"{source} API request failed: {error_msg}")
-                
-                # For 429 (rate limit) or 5xx (server errors), retry after backoff
-                if response.status_code == 429 or response.status_code >= 500:
-                    if attempt < API_MAX_RETRIES:
-                        wait_time = API_RETRY_DELAY * (2 ** (attempt - 1))
-                        logger.warning(f"Retrying {source} API in {wait_time}s")
-                        time.sleep(wait_time)
-                        continue
-                
-                # For other errors like 400, 401, 403, don't retry
-                return None
-            
-            # Parse JSON response
-            try:
-                data = response.json()
-                fetch_duration = time.time() - fetch_start_time
-                
-                # Validate the response format and content
-                if source == "pump_fun":
-                    tokens_list = data.get("data")
-                    if not isinstance(tokens_list, list):
-                        logger.warning(f"Invalid {source} API response format: 'data' field is not a list")
-                        return None
-                    
-                    # Verify that we have at least some tokens
-                    if len(tokens_list) == 0:
-                        logger.warning(f"Empty token list received from {source} API")
-                        return None
-                    
-                    # Log a sample token to verify data quality
-                    if len(tokens_list) > 0:
-                        sample_token = tokens_list[0]
-                        # Validate required fields
-                        if not all(k in sample_token for k in ['name', 'symbol', 'address']):
-                            logger.warning(f"Missing required fields in {source} token data")
-                            return None
-                        
-                        # Log sample data and fetch timestamp
-                        sample_data = {
-                            'name': sample_token.get('name'),
-                            'symbol': sample_token.get('symbol'),
-                            'address': sample_token.get('address')[:8] + '...',  # Truncate for logging
-                            'price': sample_token.get('price'),
-                            'marketCap': sample_token.get('marketCap'),
-                            'volume': sample_token.get('volume')
-                        }
-                        fetch_time = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')
-                        logger.info(f"Pump.fun data loaded successfully at {fetch_time} (took {fetch_duration:.2f}s)")
-                        logger.info(f"Sample token: {sample_data}")
-                
-                elif source == "birdeye":
-                    tokens_container = data.get("data", {})
-                    tokens_list = tokens_container.get("tokens")
-                    if not isinstance(tokens_list, list):
-                        logger.warning(f"Invalid {source} API response format: 'data.tokens' field is not a list")
-                        return None
-                    
-                    # Verify that we have at least some tokens
-                    if len(tokens_list) == 0:
-                        logger.warning(f"Empty token list received from {source} API")
-                        return None
-                    
-                    # Log a sample token to verify data quality
-                    if len(tokens_list) > 0:
-                        sample_token = tokens_list[0]
-                        # Validate required fields
-                        if not all(k in sample_token for k in ['symbol', 'address']):
-                            logger.warning(f"Missing required fields in {source} token data")
-                            return None
-                        
-                        # Log sample data and fetch timestamp
-                        sample_data = {
-                            'name': sample_token.get('name', sample_token.get('symbol')),
-                            'symbol': sample_token.get('symbol'),
-                            'address': sample_token.get('address')[:8] + '...',  # Truncate for logging
-                            'price': sample_token.get('price'),
-                            'marketCap': sample_token.get('marketCap'),
-                            'volume': sample_token.get('v24hUSD')
-                        }
-                        fetch_time = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')
-                        logger.info(f"Birdeye data fetched successfully at {fetch_time} (took {fetch_duration:.2f}s)")
-                        logger.info(f"Sample token: {sample_data}")
-                
-                # Additional data type validation for the current API source
-                tokens_list = None
-                if source == "pump_fun":
-                    tokens_list = data.get("data", [])
-                elif source == "birdeye":
-                    tokens_list = data.get("data", {}).get("tokens", [])
-                
-                # Validate types if we have token data
-                if tokens_list and len(tokens_list) > 0:
-                    sample = tokens_list[0]
-                    # Type checks
-                    if sample.get('name') and not isinstance(sample.get('name'), str):
-                        logger.warning(f"{source} API: Token name is not a string")
-                    if sample.get('price') and not isinstance(sample.get('price'), (int, float)):
-                        logger.warning(f"{source} API: Token price is not a number")
-                
-                # Update cache
-                api_cache[source] = {
-                    "data": data,
-                    "timestamp": time.time()
-                }
-                
-                return data
-                
-            except ValueError as e:
-                logger.warning(f"Failed to parse {source} API response as JSON: {e}")
-                if attempt < API_MAX_RETRIES:
-                    wait_time = API_RETRY_DELAY * (2 ** (attempt - 1))
-                    logger.warning(f"Retrying {source} API in {wait_time}s")
-                    time.sleep(wait_time)
-                    continue
-                return None
-                
-        except requests.exceptions.Timeout:
-            logger.warning(f"{source} API request timed out")
-            if attempt < API_MAX_RETRIES:
-                wait_time = API_RETRY_DELAY * (2 ** (attempt - 1))
-                logger.warning(f"Retrying {source} API in {wait_time}s")
-                time.sleep(wait_time)
-            else:
-                logger.error(f"{source} API failed after {API_MAX_RETRIES} retries due to timeouts")
-                return None
-                
-        except requests.exceptions.ConnectionError as e:
-            logger.warning(f"{source} API connection error: {e}")
-            if attempt < API_MAX_RETRIES:
-                wait_time = API_RETRY_DELAY * (2 ** (attempt - 1))
-                logger.warning(f"Retrying {source} API in {wait_time}s")
-                time.sleep(wait_time)
-            else:
-                logger.error(f"{source} API failed after {API_MAX_RETRIES} retries due to connection errors")
-                return None
-                
-        except Exception as e:
-            logger.error(f"Unexpected error fetching {source} API data: {e}")
-            if attempt < API_MAX_RETRIES:
-                wait_time = API_RETRY_DELAY * (2 ** (attempt - 1))
-                logger.warning(f"Retrying {source} API in {wait_time}s")
-                time.sleep(wait_time)
-            else:
-                logger.error(f"{source} API failed after {API_MAX_RETRIES} retries")
-                return None
-    
-    # If we've exhausted all retries
-    return None
-
-
 def get_recent_solana_memecoins(source="pump_fun"):
     """
-    Fetch recently launched Solana memecoins from the API with caching and retries
-    Returns a list of token data or falls back to previously cached data if the request fails
+    Recently launched Solana memecoins from one source
+
+    Served from the shared memecoin feed's buffer, which a background thread
+    keeps fresh, so this never touches the network. When a source is failing
+    its last fetched tokens are returned.
     """
-    # Choose the appropriate API endpoint
-    if source == "pump_fun":
-        api_url = PUMP_FUN_API
-    elif source == "birdeye":
-        api_url = BIRDEYE_API
-    else:
+    if source not in SOURCES:
         logger.error(f"Unknown API source: {source}")
         return []
-    
-    # Fetch data from API (with caching and retries)
-    data = fetch_api_data(api_url, source)
-    
-    # Process the response based on the source
-    if data:
-        try:
-            recent_tokens = []
-            
-            if source == "pump_fun":
-                tokens = data.get('data', [])
-                
-                # Filter for tokens with required fields
-                for token in tokens:
-                    if token.get('name') and token.get('address'):
-                        recent_tokens.append({
-                            'name': token.get('name'),
-                            'symbol': token.get('symbol', 'UNKNOWN'),
-                            'address': token.get('address'),
-                            'price': token.get('price', 0.00001),
-                            'marketCap': token.get('marketCap', 1000000),
-                            'source': 'pump_fun'
-                        })
-                        
-            elif source == "birdeye":
-                tokens = data.get('data', {}).get('tokens', [])
-                
-                # Filter for recent tokens with low market cap (top 50)
-                for token in tokens[:50]:
-                    if token.get('symbol') and token.get('address'):
-                        recent_tokens.append({
-                            'name': token.get('name', token.get('symbol')),
-                            'symbol': token.get('symbol'),
-                            'address': token.get('address'),
-                            'price': token.get('price', 0.00001),
-                            'marketCap': token.get('marketCap', 1000000),
-                            'source': 'birdeye'
-                        })
-            
-            if recent_tokens:
-                logger.info(f"Successfully fetched {len(recent_tokens)} tokens from {source}")
-                return recent_tokens
-            else:
-                logger.warning(f"No valid tokens found in {source} API response")
-                return []
-                
-        except Exception as e:
-            logger.error(f"Error processing {source} API response: {e}")
-            return []
-    else:
-        logger.warning(f"Failed to fetch data from {source} API")
-        
-        # Check if we have any cached data (even if expired)
-        cache_entry = api_cache.get(source, {})
-        cache_data = cache_entry.get("data")
-        
-        if cache_data:
-            logger.info(f"Using expired cache data for {source} as fallback")
-            # Process the cached data (reuse the same logic)
-            try:
-                recent_tokens = []
-                
-                if source == "pump_fun":
-                    tokens = cache_data.get('data', [])
-                    for token in tokens:
-                        if token.get('name') and token.get('address'):
-                            recent_tokens.append({
-                                'name': token.get('name'),
-                                'symbol': token.get('symbol', 'UNKNOWN'),
-                                'address': token.get('address'),
-                                'price': token.get('price', 0.00001),
-                                'marketCap': token.get('marketCap', 1000000),
-                                'source': 'pump_fun'
-                            })
-                            
-                elif source == "birdeye":
-                    tokens = cache_data.get('data', {}).get('tokens', [])
-                    for token in tokens[:50]:
-                        if token.get('symbol') and token.get('address'):
-                            recent_tokens.append({
-                                'name': token.get('name', token.get('symbol')),
-                                'symbol': token.get('symbol'),
-                                'address': token.get('address'),
-                                'price': token.get('price', 0.00001),
-                                'marketCap': token.get('marketCap', 1000000),
-                                'source': 'birdeye'
-                            })
-                
-                if recent_tokens:
-                    logger.info(f"Using {len(recent_tokens)} cached tokens from {source}")
-                    return recent_tokens
-            except Exception as e:
-                logger.error(f"Error processing cached {source} API data: {e}")
-        
-        # If we get here, we couldn't get data from API or cache
-        return []
+    return get_memecoin_feed().tokens(source)
 
 def get_random_memecoin():
     """
-    Get a random newly launched memecoin from available sources
-    with improved error handling and fallback mechanisms
+    Get a random newly launched memecoin from the shared feed
+
+    Prefers pump.fun and falls back to birdeye when it is down; returns None
+    only while the feed has not received any tokens yet.
     """
-    # Try primary source first (pump.fun)
-    logger.debug("Attempting to get memecoin from primary source (pump.fun)")
-    tokens = get_recent_solana_memecoins("pump_fun")
-    
-    # If primary source fails, try secondary source (birdeye)
-    if not tokens:
-        logger.info("Primary source failed, trying secondary source (birdeye)")
-        tokens = get_recent_solana_memecoins("birdeye")
-    
-    # If we have tokens from either source, choose a random one
-    if tokens:
-        logger.debug(f"Successfully obtained {len(tokens)} tokens for selection")
-        # Pick a random token from the available ones
-        token = random.choice(tokens)
+    token = get_memecoin_feed().random_token()
+    if token:
         logger.info(f"Selected token: {token.get('name')} ({token.get('symbol')}) from {token.get('source')}")
         return token
-    
-    # If both APIs failed and no cached data is available
+
     logger.error("Failed to obtain token data from any source")
     return None
 
@@ -780,15 +460,16 @@ def send_telegram_notification(chat_id, message, message_type="trading_update",
                 try:
                     from bot_v20_runner import bot
                     if bot:
-                        # Use the cleanup-enabled sender
-                        return send_message_with_cleanup(
-                            bot, 
+                        # Use the cleanup-enabled sender (a coroutine, run on the bot's loop when there is one)
+                        from async_transport import run_coroutine
+                        return run_coroutine(send_message_with_cleanup(
+                            bot.async_api, 
                             chat_id, 
                             message, 
                             message_type, 
                             parse_mode=parse_mode, 
                             reply_markup=reply_markup
-                        ) is not None
+                        )) is not None
                 except (ImportError, AttributeError):
                     # If we can't import the bot, try to delete any old messages directly
                     # Skip async function call since we're in a synchronous context
@@ -1346,64 +1027,15 @@ def handle_admin_balance_adjustment(user_id, amount):
 
 def check_api_health():
     """
-    Check the health of all API endpoints and update the global health status
-    This function should be called periodically to ensure we have up-to-date API status
+    Make sure the memecoin feed is running and report sources that are down
+
+    The feed polls both APIs in the background and updates api_health as it
+    goes, so this does no requests of its own.
     """
-    global api_health
-    
-    current_time = time.time()
-    check_interval = 15 * 60  # Check every 15 minutes
-    
-    # Check each API source
-    for source in ['pump_fun', 'birdeye']:
-        # Only check if we haven't checked recently
-        if current_time - api_health[source]['last_check'] > check_interval:
-            logger.debug(f"Checking health of {source} API...")
-            
-            # Set appropriate API URL
-            if source == 'pump_fun':
-                url = PUMP_FUN_API
-            else:
-                url = BIRDEYE_API
-                
-            # Try to fetch a small amount of data to test connection
-            try:
-                headers = {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/111.0.0.0 Safari/537.36'
-                }
-                response = requests.get(url, headers=headers, timeout=10)
-                
-                # Update API status based on response
-                if response.status_code == 200:
-                    # Check response format validity
-                    data = response.json()
-                    if source == 'pump_fun' and isinstance(data.get('data'), list):
-                        api_health[source]['status'] = 'healthy'
-                        api_health[source]['failures'] = 0
-                        logger.info(f"{source} API is healthy")
-                    elif source == 'birdeye' and isinstance(data.get('data', {}).get('tokens'), list):
-                        api_health[source]['status'] = 'healthy'
-                        api_health[source]['failures'] = 0
-                        logger.info(f"{source} API is healthy")
-                    else:
-                        api_health[source]['status'] = 'degraded'
-                        api_health[source]['failures'] += 1
-                        logger.warning(f"{source} API returned unexpected data format")
-                else:
-                    api_health[source]['status'] = 'degraded'
-                    api_health[source]['failures'] += 1
-                    logger.warning(f"{source} API returned status code {response.status_code}")
-            except Exception as e:
-                api_health[source]['status'] = 'down'
-                api_health[source]['failures'] += 1
-                logger.error(f"Error checking {source} API health: {e}")
-            
-            # Mark the check time
-            api_health[source]['last_check'] = current_time
-            
-            # If we've seen multiple consecutive failures, log a critical error
-            if api_health[source]['failures'] >= 3:
-                logger.critical(f"{source} API appears to be down after {api_health[source]['failures']} consecutive failures")
+    get_memecoin_feed().start()
+    for source in SOURCES:
+        if api_health[source]['failures'] >= 3:
+            logger.critical(f"{source} API appears to be down after {api_health[source]['failures']} consecutive failures")
 
 def verify_api_data_quality():
     """
@@ -1665,7 +1297,7 @@ def initialize_module():
     # Load existing data
     load_data()
     
-    # Check initial API health
+    # Start the shared memecoin feed (also keeps api_health current)
     check_api_health()
     
     # Verify API data quality on startup
@@ -1679,7 +1311,7 @@ def initialize_module():
     except Exception as e:
         logger.error(f"Error during API data verification: {e}")
     
-    # Schedule periodic API health checks
+    # Schedule periodic feed checks
     schedule.every(15).minutes.do(check_api_health)
     # Schedule daily API data quality verification
     schedule.every().day.at("03:00").do(verify_api_data_quality)  # Run verification during low usage time
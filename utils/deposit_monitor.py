@@ -7,9 +7,9 @@ Enhanced with robust error handling for database connectivity issues.
 """
 
 import logging
+import os
 import random
 import time
-from datetime import datetime, timedelta
 import threading
 import schedule
 
@@ -17,98 +17,100 @@ from app import db, app, retry_database_operation
 from models import User, UserStatus, Transaction, SenderWallet
 from utils.solana import check_deposit_by_sender, process_auto_deposit
 from helpers import get_global_deposit_wallet
-from sqlalchemy.exc import OperationalError, DisconnectionError
+from metrics_registry import DEPOSIT_SCAN_DURATION
+from deposit_crediting import credit_deposit, credit_deposits
 
 logger = logging.getLogger(__name__)
 
 # Time between deposit scan cycles (in seconds)
 SCAN_INTERVAL = 60  # Check for deposits every minute
 
+# "poll" scans every SCAN_INTERVAL; "subscribe" reacts to websocket notifications
+DEPOSIT_MONITOR_MODE = os.environ.get('DEPOSIT_MONITOR_MODE', 'poll')
+
 # Flag to control the deposit monitor thread
 monitor_running = False
 monitor_thread = None
+subscriber = None
+
 
+def _credit_individually(deposits):
+    """Credit each deposit in its own transaction; returns the credited deposits and how many failed"""
+    credited = []
+    failed = 0
+    for user_id, amount, tx_signature, sender_address in deposits:
+        try:
+            if credit_deposit(user_id, amount, tx_signature, sender_address) is not None:
+                credited.append((user_id, amount, tx_signature))
+        except LookupError as e:
+            logger.warning(str(e))
+        except Exception as e:
+            failed += 1
+            logger.error(f"Failed to credit deposit {tx_signature}: {e}")
+    return credited, failed
 
-def scan_for_deposits():
+
+def scan_for_deposits(signatures=None):
     """
     Scan for new deposits by monitoring the admin's global wallet for incoming transactions.
     This improved system tracks received amounts rather than user wallet balances.
     Enhanced with robust database error handling.
+    
+    Args:
+        signatures (list): only check these signature entries (subscription mode);
+            by default the wallet's recent signatures are listed
+    
+    Returns:
+        bool: True when every signature was checked and its deposit credited;
+            False when the scan failed or a transaction could not be fetched,
+            so the caller should hand the same signatures over again
     """
     logger.info("Starting deposit scan cycle - monitoring admin wallet for incoming transactions")
     deposits_found = 0
+    complete = False
     
     def perform_deposit_scan():
-        nonlocal deposits_found
+        nonlocal deposits_found, complete
         
         with app.app_context():
             try:
                 # Import the new admin wallet monitoring function
-                from utils.solana import monitor_admin_wallet_transactions, process_auto_deposit
+                from utils.solana import find_admin_wallet_deposits, start_auto_trading_after_deposit
                 
                 # Monitor admin wallet for all incoming transactions
-                detected_deposits = monitor_admin_wallet_transactions()
+                detected_deposits, unfetched = find_admin_wallet_deposits(signatures)
+                
+                # Credit every new deposit in one transaction; already-credited
+                # signatures are skipped, so overlapping scanners are harmless
+                try:
+                    credited, failed = credit_deposits(detected_deposits), 0
+                except Exception as batch_error:
+                    # One bad deposit must not hold back the rest of the scan
+                    logger.error(f"Batch deposit crediting failed, crediting one at a time: {batch_error}")
+                    credited, failed = _credit_individually(detected_deposits)
+                deposits_found = len(credited)
+                complete = not unfetched and not failed
+                if not credited:
+                    return
+                
+                telegram_ids = dict(db.session.execute(
+                    db.select(User.id, User.telegram_id).where(User.id.in_({user_id for user_id, _, _ in credited}))).all())
                 
-                # Process each detected deposit with database retry logic
-                for user_id, amount, tx_signature in detected_deposits:
+                for user_id, amount, tx_signature in credited:
+                    logger.info(f"Auto-deposit of {amount} SOL processed for user {telegram_ids.get(user_id)}")
+                    start_auto_trading_after_deposit(user_id, amount)
+                    
+                    # Send notification to admin about deposit
                     try:
-                        logger.info(f"Processing deposit: {amount} SOL for user {user_id}")
-                        
-                        # Get user information with retry
-                        def get_user():
-                            return User.query.get(user_id)
-                        
-                        user = retry_database_operation(get_user, max_retries=2, delay=1)
-                        if not user:
-                            logger.warning(f"User {user_id} not found for deposit processing")
-                            continue
-                        
-                        # Process the deposit with retry logic
-                        def process_deposit():
-                            return process_auto_deposit(user_id, amount, tx_signature)
-                        
-                        success = retry_database_operation(process_deposit, max_retries=3, delay=2)
-                        
-                        if success:
-                            deposits_found += 1
-                            logger.info(f"Auto-deposit of {amount} SOL processed for user {user.telegram_id}")
-                            
-                            # Update the sender wallet's last_used timestamp with retry
-                            try:
-                                def update_wallet_timestamp():
-                                    sender_wallet = SenderWallet.query.filter_by(user_id=user_id).first()
-                                    if sender_wallet:
-                                        sender_wallet.last_used = datetime.utcnow()
-                                        db.session.commit()
-                                        return True
-                                    return False
-                                
-                                retry_database_operation(update_wallet_timestamp, max_retries=2, delay=1)
-                                
-                            except Exception as wallet_update_error:
-                                logger.error(f"Failed to update wallet timestamp after retries: {str(wallet_update_error)}")
-                            
-                            # Send notification to admin about deposit
-                            try:
-                                notify_admin_of_deposit(user_id, amount, tx_signature)
-                            except Exception as notify_error:
-                                logger.error(f"Failed to send admin notification: {str(notify_error)}")
-                                
-                            # Send notification to user (optional)
-                            try:
-                                notify_user_of_deposit(user.telegram_id, amount)
-                            except Exception as notify_error:
-                                logger.error(f"Failed to send notification to user {user.telegram_id}: {str(notify_error)}")
-                        else:
-                            logger.error(f"Failed to process deposit for user {user.telegram_id} after retries")
-                            
-                    except (OperationalError, DisconnectionError) as db_error:
-                        logger.error(f"Database connection error while processing deposit for user {user_id}: {str(db_error)}")
-                        # Continue with next deposit instead of failing entire scan
-                        continue
-                    except Exception as deposit_error:
-                        logger.error(f"Error processing deposit for user {user_id}: {str(deposit_error)}")
-                        continue
+                        notify_admin_of_deposit(user_id, amount, tx_signature)
+                    except Exception as notify_error:
+                        logger.error(f"Failed to send admin notification: {str(notify_error)}")
+                    
+                    # Send notification to user (optional)
+                    try:
+                        notify_user_of_deposit(telegram_ids.get(user_id), amount)
+                    except Exception as notify_error:
+                        logger.error(f"Failed to send notification to user {user_id}: {str(notify_error)}")
                         
             except Exception as scan_error:
                 logger.error(f"Error during deposit scan: {str(scan_error)}")
@@ -116,12 +118,14 @@ def scan_for_deposits():
     
     try:
         # Execute deposit scan with retry logic for database operations
-        retry_database_operation(perform_deposit_scan, max_retries=2, delay=5)
+        with DEPOSIT_SCAN_DURATION.time():
+            retry_database_operation(perform_deposit_scan, max_retries=2, delay=5)
     except Exception as final_error:
         logger.error(f"Deposit scan failed after all retries: {str(final_error)}")
         # Don't crash the monitoring thread, just log and continue
     
     logger.info(f"Deposit scan cycle completed. Processed {deposits_found} deposits from admin wallet monitoring")
+    return complete
 
 
 def start_deposit_monitor():
@@ -130,12 +134,19 @@ def start_deposit_monitor():
     This function initializes a scheduler to periodically scan for
     new deposits from registered sender wallets.
     """
-    global monitor_running, monitor_thread
+    global monitor_running, monitor_thread, subscriber
     
     if monitor_running:
         logger.warning("Deposit monitor is already running")
         return False
     
+    if DEPOSIT_MONITOR_MODE == 'subscribe':
+        from utils.deposit_subscription import DepositSubscriber
+        subscriber = DepositSubscriber().start()
+        monitor_running = True
+        logger.info("Deposit monitor started in subscription mode")
+        return True
+    
     def monitor_worker():
         global monitor_running
         
@@ -143,7 +154,8 @@ def start_deposit_monitor():
         monitor_running = True
         
         # Schedule the scan to run at regular intervals
-        schedule.every(SCAN_INTERVAL).seconds.do(scan_for_deposits)
+        # Tagged so a stop/start cycle (leadership change) does not register it twice
+        schedule.every(SCAN_INTERVAL).seconds.do(scan_for_deposits).tag('deposit_monitor')
         
         # Run an initial scan immediately
         scan_for_deposits()
@@ -185,13 +197,13 @@ def notify_admin_of_deposit(user_id, amount, tx_signature):
                     f"Time: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC"
                 )
                 
-                # Import bot here to avoid circular imports
+                # Delivered by a job worker, with retries on Telegram errors
                 try:
-                    from bot_v20_runner import bot
-                    bot.send_message(admin_chat_id, message)
-                    logger.info(f"Admin notified of deposit: {amount} SOL from user {username}")
-                except Exception as bot_error:
-                    logger.error(f"Failed to send admin notification via bot: {bot_error}")
+                    from job_queue import enqueue
+                    enqueue('notifications.send_message', {'chat_id': admin_chat_id, 'text': message})
+                    logger.info(f"Admin notification queued for deposit: {amount} SOL from user {username}")
+                except Exception as queue_error:
+                    logger.error(f"Failed to queue admin notification: {queue_error}")
         else:
             logger.warning("ADMIN_CHAT_ID not configured - admin notifications disabled")
         
@@ -209,13 +221,14 @@ def notify_user_of_deposit(telegram_id, amount):
             f"Use /dashboard to view your current balance and trading progress."
         )
         
-        # Import bot here to avoid circular imports
+        # Delivered by a job worker, with retries on Telegram errors
         try:
-            from bot_v20_runner import bot
-            bot.send_message(telegram_id, message)
-            logger.info(f"User {telegram_id} notified of successful deposit: {amount} SOL")
-        except Exception as bot_error:
-            logger.error(f"Failed to send user notification via bot: {bot_error}")
+            from job_queue import enqueue
+            with app.app_context():
+                enqueue('notifications.send_message', {'chat_id': telegram_id, 'text': message})
+            logger.info(f"Deposit notification queued for user {telegram_id}: {amount} SOL")
+        except Exception as queue_error:
+            logger.error(f"Failed to queue user notification: {queue_error}")
         
     except Exception as e:
         logger.error(f"Failed to notify user {telegram_id} of deposit: {e}")
@@ -225,7 +238,7 @@ def stop_deposit_monitor():
     """
     Stop the deposit monitoring service.
     """
-    global monitor_running, monitor_thread
+    global monitor_running, monitor_thread, subscriber
     
     if not monitor_running:
         logger.warning("Deposit monitor is not running")
@@ -233,6 +246,10 @@ def stop_deposit_monitor():
     
     # Signal the thread to stop
     monitor_running = False
+    schedule.clear('deposit_monitor')
+    if subscriber:
+        subscriber.stop()
+        subscriber = None
     
     # Wait for the thread to finish (with timeout)
     if monitor_thread:
@@ -0,0 +1,241 @@
+"""
+Deposit Subscription
+Push-based deposit detection over the Solana websocket API.
+
+Enabled with DEPOSIT_MONITOR_MODE=subscribe (see utils/deposit_monitor).
+Instead of listing the global wallet's signatures every SCAN_INTERVAL, a
+daemon thread keeps a logsSubscribe subscription (mentions: the deposit
+wallet) open and hands only the notified signatures to scan_for_deposits,
+so a deposit is credited within seconds and an idle wallet costs no RPC
+calls. logsSubscribe is used rather than accountSubscribe because its
+notifications carry the transaction signature.
+
+Every (re)connect subscribes first and then runs a cursor-based catch-up
+(getSignaturesForAddress until the newest signature already handled,
+paging back with `before` when more than a page landed), so anything that
+landed while the socket was down is still picked up; the same catch-up
+runs every DEPOSIT_CATCH_UP_INTERVAL as a safety net. The cursor only
+advances when the scan succeeds.
+Connection failures are retried with exponential backoff up to
+RECONNECT_MAX_DELAY. The first catch-up of a process is the regular
+lookback scan.
+
+Signatures may be handed over more than once (a notification plus a
+catch-up); the scan skips transactions that are already recorded.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+from typing import Callable, List, Optional
+
+import aiohttp
+
+from metrics_registry import DEPOSIT_SUBSCRIPTION_EVENTS
+from utils.solana_rpc import RPC_ENDPOINTS, get_rpc_client
+
+logger = logging.getLogger(__name__)
+
+
+def _ws_url(http_url):
+    if http_url.startswith('https://'):
+        return 'wss://' + http_url[len('https://'):]
+    if http_url.startswith('http://'):
+        return 'ws://' + http_url[len('http://'):]
+    return http_url
+
+
+# Websocket endpoint (defaults to the first RPC endpoint over ws/wss)
+SOLANA_WS_URL = os.environ.get('SOLANA_WS_URL') or _ws_url(RPC_ENDPOINTS[0])
+
+# Seconds between safety-net catch-up scans while subscribed
+DEPOSIT_CATCH_UP_INTERVAL = int(os.environ.get('DEPOSIT_CATCH_UP_INTERVAL', '600'))
+
+# Longest wait between reconnect attempts, in seconds
+RECONNECT_MAX_DELAY = 30
+
+# Notifications arriving within this many seconds are handled as one batch
+NOTIFICATION_BATCH_WAIT = 0.2
+
+# Signatures listed per catch-up page
+CATCH_UP_LIMIT = 1000
+
+_CATCH_UP = object()
+
+
+class DepositSubscriber:
+    """
+    Websocket subscription on the deposit wallet, feeding a deposit processor
+
+    Args:
+        wallet: address to watch (the global deposit wallet by default)
+        process: called with a list of signature entries, or None for the
+            regular lookback scan (scan_for_deposits by default); returns
+            whether every entry was handled
+        ws_url, rpc_client, catch_up_interval, reconnect_delay: overrides
+    """
+
+    def __init__(self, wallet: Optional[str] = None, process: Optional[Callable] = None,
+                 ws_url: Optional[str] = None, rpc_client=None, catch_up_interval: Optional[float] = None,
+                 reconnect_delay: float = 1.0):
+        self.wallet = wallet
+        self.process = process
+        self.ws_url = ws_url or SOLANA_WS_URL
+        self.rpc_client = rpc_client
+        self.catch_up_interval = catch_up_interval or DEPOSIT_CATCH_UP_INTERVAL
+        self.reconnect_delay = reconnect_delay
+        self.cursor = None  # newest signature covered by a catch-up
+        self.subscribed = threading.Event()
+        self.loop = None
+        self._thread = None
+        self._stopping = None
+        self._ws = None
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+    def start(self):
+        if self.wallet is None:
+            from app import app
+            from helpers import get_global_deposit_wallet
+            with app.app_context():
+                self.wallet = get_global_deposit_wallet()
+        if self.process is None:
+            from utils.deposit_monitor import scan_for_deposits
+            self.process = scan_for_deposits
+        if self.rpc_client is None:
+            self.rpc_client = get_rpc_client()
+        self._thread = threading.Thread(target=self._run, name='deposit-subscription', daemon=True)
+        self._thread.start()
+        logger.info(f"Deposit subscription started for {self.wallet} via {self.ws_url}")
+        return self
+
+    def stop(self, timeout=5.0):
+        if self.loop is not None and self._stopping is not None:
+            self.loop.call_soon_threadsafe(self._stopping.set)
+            if self._ws is not None:
+                asyncio.run_coroutine_threadsafe(self._ws.close(), self.loop)
+        if self._thread is not None:
+            self._thread.join(timeout)
+        logger.info("Deposit subscription stopped")
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        try:
+            self.loop.run_until_complete(self._main())
+        finally:
+            self.loop.close()
+
+    # ------------------------------------------------------------------
+    # Connection
+    # ------------------------------------------------------------------
+    async def _main(self):
+        self._stopping = asyncio.Event()
+        queue = asyncio.Queue()
+        worker = asyncio.create_task(self._worker(queue))
+        timer = asyncio.create_task(self._catch_up_timer(queue))
+        delay = self.reconnect_delay
+        async with aiohttp.ClientSession() as session:
+            while not self._stopping.is_set():
+                try:
+                    async with session.ws_connect(self.ws_url, heartbeat=30) as ws:
+                        self._ws = ws
+                        await ws.send_json({'jsonrpc': '2.0', 'id': 1, 'method': 'logsSubscribe',
+                                            'params': [{'mentions': [self.wallet]}, {'commitment': 'confirmed'}]})
+                        delay = self.reconnect_delay
+                        await self._listen(ws, queue)
+                except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+                    logger.warning(f"Deposit subscription connection failed: {e}")
+                finally:
+                    self._ws = None
+                    self.subscribed.clear()
+                if self._stopping.is_set():
+                    break
+                DEPOSIT_SUBSCRIPTION_EVENTS.labels('reconnect').inc()
+                logger.info(f"Deposit subscription reconnecting in {delay:.0f}s")
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+        timer.cancel()
+        worker.cancel()
+
+    async def _listen(self, ws, queue):
+        async for message in ws:
+            if message.type != aiohttp.WSMsgType.TEXT:
+                continue
+            try:
+                data = json.loads(message.data)
+            except ValueError:
+                continue
+            if data.get('id') == 1:
+                if 'result' in data:
+                    self.subscribed.set()
+                    # Whatever arrived since the last catch-up (or while disconnected)
+                    queue.put_nowait(_CATCH_UP)
+                else:
+                    logger.error(f"logsSubscribe rejected: {data.get('error')}")
+                    return
+            elif data.get('method') == 'logsNotification':
+                value = data.get('params', {}).get('result', {}).get('value', {})
+                if value.get('signature') and value.get('err') is None:
+                    DEPOSIT_SUBSCRIPTION_EVENTS.labels('notification').inc()
+                    queue.put_nowait(value['signature'])
+
+    async def _catch_up_timer(self, queue):
+        while True:
+            await asyncio.sleep(self.catch_up_interval)
+            queue.put_nowait(_CATCH_UP)
+
+    async def _worker(self, queue):
+        """Hand signatures to the processor one batch at a time, off the loop"""
+        while True:
+            items = [await queue.get()]
+            await asyncio.sleep(NOTIFICATION_BATCH_WAIT)
+            while not queue.empty():
+                items.append(queue.get_nowait())
+            try:
+                if any(item is _CATCH_UP for item in items):
+                    # A catch-up lists everything after the cursor, notified signatures included
+                    await self.loop.run_in_executor(None, self.catch_up)
+                else:
+                    signatures = list(dict.fromkeys(items))
+                    await self.loop.run_in_executor(None, self.process, [{'signature': s} for s in signatures])
+            except Exception as e:
+                logger.error(f"Deposit subscription processing failed: {e}")
+
+    # ------------------------------------------------------------------
+    # Catch-up
+    # ------------------------------------------------------------------
+    def catch_up(self) -> Optional[List[dict]]:
+        """
+        Process every signature newer than the cursor and advance it
+
+        The cursor only moves once the processor reports success, so a
+        failed scan is retried from the same point by the next catch-up.
+        """
+        DEPOSIT_SUBSCRIPTION_EVENTS.labels('catch_up').inc()
+        if self.cursor is None:
+            newest = self.rpc_client.get_signatures_for_address(self.wallet, limit=1, commitment='confirmed')
+            if self.process(None) and newest:
+                self.cursor = newest[0]['signature']
+            return None
+
+        # Page back with `before` until the previous cursor, however many landed since
+        entries = []
+        while True:
+            page = self.rpc_client.get_signatures_for_address(
+                self.wallet, limit=CATCH_UP_LIMIT, commitment='confirmed', until=self.cursor,
+                before=entries[-1]['signature'] if entries else None)
+            entries.extend(page)
+            if len(page) < CATCH_UP_LIMIT:
+                break
+        if entries:
+            logger.info(f"Deposit catch-up found {len(entries)} new signatures")
+            if self.process(entries):
+                self.cursor = entries[0]['signature']
+            else:
+                logger.warning(f"Deposit catch-up failed; keeping the cursor at {self.cursor}")
+        return entries
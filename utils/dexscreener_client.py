@@ -7,11 +7,14 @@ Fetches real-time token data from DEX Screener API for authentic position displa
 import requests
 import time
 import logging
-from typing import Dict, Optional, Any
+from typing import Dict, List, Optional, Any
 import json
 
 logger = logging.getLogger(__name__)
 
+# DEX Screener accepts up to 30 comma-separated addresses per tokens request
+MAX_ADDRESSES_PER_REQUEST = 30
+
 class DexScreenerClient:
     """Client for fetching token data from DEX Screener API"""
     
@@ -103,6 +106,92 @@ class DexScreenerClient:
             logger.error(f"Unexpected error fetching token data for {contract_address}: {str(e)}")
             return None
     
+    def get_token_prices(self, contract_addresses: List[str], chain_id: str = "solana") -> Dict[str, float]:
+        """
+        Fetch native (SOL) prices for many tokens, up to 30 addresses per request
+        
+        Args:
+            contract_addresses (list): Token contract addresses
+            chain_id (str): Blockchain identifier (default: solana)
+            
+        Returns:
+            dict: contract address -> price in SOL (tokens without a pair are omitted)
+        """
+        prices = {}
+        pending = []
+        for address in dict.fromkeys(contract_addresses):
+            cache_key = f"{chain_id}_{address}"
+            if self._is_cache_valid(cache_key) and self.cache[cache_key]['data'].get('priceNative'):
+                prices[address] = float(self.cache[cache_key]['data']['priceNative'])
+            else:
+                pending.append(address)
+        
+        for start in range(0, len(pending), MAX_ADDRESSES_PER_REQUEST):
+            batch = pending[start:start + MAX_ADDRESSES_PER_REQUEST]
+            try:
+                self._rate_limit()
+                url = f"{self.base_url}/tokens/v1/{chain_id}/{','.join(batch)}"
+                response = requests.get(url, timeout=10)
+                response.raise_for_status()
+                pairs = response.json()
+                if isinstance(pairs, dict):
+                    pairs = pairs.get('pairs') or []
+                
+                # Several pairs per token are returned; keep the most liquid one
+                best = {}
+                for pair in pairs:
+                    address = (pair.get('baseToken') or {}).get('address')
+                    liquidity = (pair.get('liquidity') or {}).get('usd') or 0
+                    if address in batch and pair.get('priceNative') and \
+                            liquidity >= best.get(address, ({}, -1))[1]:
+                        best[address] = (pair, liquidity)
+                for address, (pair, _) in best.items():
+                    self._cache_data(f"{chain_id}_{address}", pair)
+                    prices[address] = float(pair['priceNative'])
+                    
+            except (requests.exceptions.RequestException, ValueError) as e:
+                logger.error(f"Error fetching prices for {len(batch)} tokens: {str(e)}")
+        
+        return prices
+    
+    def get_token_prices_by_symbol(self, symbols: List[str], chain_id: str = "solana") -> Dict[str, float]:
+        """
+        Fetch native (SOL) prices for tokens known only by symbol, one search request each
+        
+        The most liquid pair on `chain_id` whose base token has the symbol wins.
+        
+        Args:
+            symbols (list): Token symbols, e.g. "BONK"
+            chain_id (str): Blockchain identifier (default: solana)
+            
+        Returns:
+            dict: symbol -> price in SOL (symbols without a pair are omitted)
+        """
+        prices = {}
+        for symbol in dict.fromkeys(symbols):
+            cache_key = f"{chain_id}_symbol_{symbol.upper()}"
+            if self._is_cache_valid(cache_key):
+                prices[symbol] = self.cache[cache_key]['data']
+                continue
+            try:
+                self._rate_limit()
+                response = requests.get(f"{self.base_url}/latest/dex/search", params={'q': symbol}, timeout=10)
+                response.raise_for_status()
+                best = None
+                for pair in response.json().get('pairs') or []:
+                    base_symbol = ((pair.get('baseToken') or {}).get('symbol') or '').upper()
+                    liquidity = (pair.get('liquidity') or {}).get('usd') or 0
+                    if pair.get('chainId') == chain_id and base_symbol == symbol.upper() and \
+                            pair.get('priceNative') and (best is None or liquidity > best[1]):
+                        best = (pair, liquidity)
+                if best:
+                    prices[symbol] = float(best[0]['priceNative'])
+                    self._cache_data(cache_key, prices[symbol])
+            except (requests.exceptions.RequestException, ValueError) as e:
+                logger.error(f"Error fetching price for symbol {symbol}: {str(e)}")
+        
+        return prices
+    
     def format_price(self, price: float) -> str:
         """Format price with appropriate decimal places like DEX Screener"""
         if price >= 1:
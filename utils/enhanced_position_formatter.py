@@ -63,12 +63,21 @@ class EnhancedPositionFormatter:
             # Format timestamp
             time_str = position.buy_timestamp.strftime("%b %d – %H:%M UTC") if position.buy_timestamp else "Recent"
             
+            # Mark-to-market from the shared revaluation snapshot
+            from utils.position_revaluation import get_position_snapshot
+            unrealized_line = ""
+            mark = get_position_snapshot().get(position.id)
+            if mark:
+                _, unrealized_sol, unrealized_pct = mark
+                unrealized_line = f"• *Unrealized:* {unrealized_pct:+.2f}% ({unrealized_sol:+.4f} SOL)\n"
+            
             message = (
                 f"📈 *LIVE SNIPE - ${position.token_name}*\n\n"
                 f"• *Price & MC:* {price_usd_formatted} — {market_cap_formatted}\n"
                 f"• *Avg Exit:* {avg_exit_price_formatted} — {avg_exit_mc_formatted}\n"
                 f"• *Balance:* {token_amount_formatted} ({ownership_pct:.3f}%)\n"
-                f"• *Entry:* {spent_sol:.4f} SOL (${spent_usd:.2f})\n\n"
+                f"• *Entry:* {spent_sol:.4f} SOL (${spent_usd:.2f})\n"
+                f"{unrealized_line}\n"
                 f"🔗 *Buy TX:* {tx_display}\n"
                 f"💰 *Bought:* New position ({token_amount_formatted} tokens)\n"
                 f"⚡ *Speed:* {execution_speed:.2f} seconds | *Gas:* {gas_cost:.5f} SOL\n"
@@ -3,6 +3,9 @@
 Historical Market Data Fetcher
 =============================
 Fetches historical market cap, volume, and price data for backdated trades
+
+Snapshots are cached per (contract, time bucket) in utils/market_data_cache,
+so a backdated trade broadcast to every user fetches its token data once.
 """
 
 import requests
@@ -11,8 +14,16 @@ from datetime import datetime, timedelta
 from typing import Dict, Optional
 import time
 
+from utils.market_data_cache import get_market_cache, time_bucket
+
 logger = logging.getLogger(__name__)
 
+# Token-data request that failed (falsy, like a token without pairs)
+_NO_PAIR = {}
+
+# Pair argument not given: the method fetches it itself
+_UNFETCHED = object()
+
 class HistoricalMarketFetcher:
     """Fetches historical market data from multiple sources"""
     
@@ -23,6 +34,13 @@ class HistoricalMarketFetcher:
         self.session.headers.update({
             'User-Agent': 'TradingBot/1.0'
         })
+        self._cache = None
+    
+    @property
+    def cache(self):
+        if self._cache is None:
+            self._cache = get_market_cache()
+        return self._cache
         
     def get_historical_market_data(self, contract_address: str, timestamp: datetime) -> Dict:
         """
@@ -35,19 +53,28 @@ class HistoricalMarketFetcher:
         Returns:
             Dict containing historical market cap, volume, price data
         """
+        bucket = time_bucket(timestamp)
+        cached = self.cache.get('token', contract_address, bucket)
+        if cached is not None:
+            cached['timestamp_requested'] = timestamp.isoformat()
+            return cached
+        
         logger.info(f"Fetching historical data for {contract_address[:8]}... at {timestamp}")
         
+        # One DEX Screener request serves the estimate and the current token info
+        pair = self._fetch_pair(contract_address)
+        
         # Try multiple approaches for historical data
-        historical_data = self._try_dexscreener_historical(contract_address, timestamp)
+        historical_data = self._try_dexscreener_historical(contract_address, timestamp, pair)
         
         if not historical_data or historical_data.get('market_cap', 0) == 0:
-            historical_data = self._estimate_historical_data(contract_address, timestamp)
+            historical_data = self._estimate_historical_data(contract_address, timestamp, pair)
         
         # Always include current data as fallback
-        current_data = self._get_current_market_data(contract_address)
+        current_data = self._get_current_market_data(contract_address, pair)
         
         # Merge historical estimates with current token info
-        return {
+        snapshot = {
             'name': current_data.get('name', 'Unknown Token'),
             'symbol': current_data.get('symbol', 'UNK'),
             'market_cap': historical_data.get('market_cap', current_data.get('market_cap', 850000)),
@@ -56,50 +83,73 @@ class HistoricalMarketFetcher:
             'price_usd': historical_data.get('price_usd', current_data.get('price_usd', 0)),
             'is_historical': historical_data.get('market_cap', 0) != current_data.get('market_cap', 0),
             'data_source': historical_data.get('source', 'estimated'),
-            'timestamp_requested': timestamp.isoformat()
         }
+        if pair:
+            # The first snapshot stored for the bucket is the one every later lookup gets;
+            # fallbacks (request failed, token not listed) are retried next time
+            snapshot = self.cache.put('token', contract_address, bucket, snapshot)
+        snapshot['timestamp_requested'] = timestamp.isoformat()
+        return snapshot
     
-    def _try_dexscreener_historical(self, contract_address: str, timestamp: datetime) -> Dict:
-        """Try to get historical data from DEX Screener"""
+    def _fetch_pair(self, contract_address: str) -> Optional[Dict]:
+        """
+        The token's first DEX Screener pair
+        
+        Returns:
+            the pair dict, None if the token has no pairs, or _NO_PAIR if the request failed
+        """
         try:
-            # DEX Screener doesn't have direct historical API, but we can estimate
-            # based on current data and time-based adjustments
             url = f"{self.dexscreener_base_url}/dex/tokens/{contract_address}"
             response = self.session.get(url, timeout=10)
             
             if response.status_code == 200:
                 data = response.json()
                 if data.get('pairs') and len(data['pairs']) > 0:
-                    pair = data['pairs'][0]
-                    current_market_cap = float(pair.get('fdv', 850000))
-                    current_volume = float(pair.get('volume', {}).get('h24', 45000))
-                    current_liquidity = float(pair.get('liquidity', {}).get('usd', 0))
-                    current_price = float(pair.get('priceUsd', 0))
-                    
-                    # Calculate time difference for estimation
-                    time_diff = datetime.utcnow() - timestamp
-                    hours_ago = time_diff.total_seconds() / 3600
-                    
-                    # Apply realistic market adjustments based on time
-                    market_cap_factor = self._calculate_market_factor(hours_ago)
-                    
-                    return {
-                        'market_cap': current_market_cap * market_cap_factor,
-                        'volume_24h': current_volume * market_cap_factor,
-                        'liquidity': current_liquidity * market_cap_factor,
-                        'price_usd': current_price * market_cap_factor,
-                        'source': 'dexscreener_estimated'
-                    }
-                    
+                    return data['pairs'][0]
+                return None
+        except Exception as e:
+            logger.error(f"Error fetching DEX Screener data: {e}")
+        
+        return _NO_PAIR
+    
+    def _try_dexscreener_historical(self, contract_address: str, timestamp: datetime, pair=_UNFETCHED) -> Dict:
+        """Try to get historical data from DEX Screener"""
+        try:
+            # DEX Screener doesn't have direct historical API, but we can estimate
+            # based on current data and time-based adjustments
+            if pair is _UNFETCHED:
+                pair = self._fetch_pair(contract_address)
+            
+            if pair:
+                current_market_cap = float(pair.get('fdv', 850000))
+                current_volume = float(pair.get('volume', {}).get('h24', 45000))
+                current_liquidity = float(pair.get('liquidity', {}).get('usd', 0))
+                current_price = float(pair.get('priceUsd', 0))
+                
+                # Calculate time difference for estimation
+                time_diff = datetime.utcnow() - timestamp
+                hours_ago = time_diff.total_seconds() / 3600
+                
+                # Apply realistic market adjustments based on time
+                market_cap_factor = self._calculate_market_factor(hours_ago)
+                
+                return {
+                    'market_cap': current_market_cap * market_cap_factor,
+                    'volume_24h': current_volume * market_cap_factor,
+                    'liquidity': current_liquidity * market_cap_factor,
+                    'price_usd': current_price * market_cap_factor,
+                    'source': 'dexscreener_estimated'
+                }
+                
         except Exception as e:
             logger.error(f"Error fetching DEX Screener data: {e}")
         
         return {}
     
-    def _estimate_historical_data(self, contract_address: str, timestamp: datetime) -> Dict:
+    def _estimate_historical_data(self, contract_address: str, timestamp: datetime, pair=_UNFETCHED) -> Dict:
         """Estimate historical data using time-based modeling"""
         try:
-            current_data = self._get_current_market_data(contract_address)
+            current_data = self._get_current_market_data(contract_address, pair)
             
             time_diff = datetime.utcnow() - timestamp
             hours_ago = time_diff.total_seconds() / 3600
@@ -160,24 +210,21 @@ class HistoricalMarketFetcher:
             days_ago = min(hours_ago / 24, 30)  # Cap at 30 days
             return max(0.01, 0.10 - (days_ago * 0.003))
     
-    def _get_current_market_data(self, contract_address: str) -> Dict:
+    def _get_current_market_data(self, contract_address: str, pair=_UNFETCHED) -> Dict:
         """Get current market data from DEX Screener"""
         try:
-            url = f"{self.dexscreener_base_url}/dex/tokens/{contract_address}"
-            response = self.session.get(url, timeout=10)
+            if pair is _UNFETCHED:
+                pair = self._fetch_pair(contract_address)
             
-            if response.status_code == 200:
-                data = response.json()
-                if data.get('pairs') and len(data['pairs']) > 0:
-                    pair = data['pairs'][0]
-                    return {
-                        'name': pair.get('baseToken', {}).get('name', 'Unknown Token'),
-                        'symbol': pair.get('baseToken', {}).get('symbol', 'UNK'),
-                        'market_cap': float(pair.get('fdv', 850000)),
-                        'volume_24h': float(pair.get('volume', {}).get('h24', 45000)),
-                        'liquidity': float(pair.get('liquidity', {}).get('usd', 0)),
-                        'price_usd': float(pair.get('priceUsd', 0))
-                    }
+            if pair:
+                return {
+                    'name': pair.get('baseToken', {}).get('name', 'Unknown Token'),
+                    'symbol': pair.get('baseToken', {}).get('symbol', 'UNK'),
+                    'market_cap': float(pair.get('fdv', 850000)),
+                    'volume_24h': float(pair.get('volume', {}).get('h24', 45000)),
+                    'liquidity': float(pair.get('liquidity', {}).get('usd', 0)),
+                    'price_usd': float(pair.get('priceUsd', 0))
+                }
         except Exception as e:
             logger.error(f"Error fetching current market data: {e}")
         
@@ -192,6 +239,18 @@ class HistoricalMarketFetcher:
     
     def get_sol_historical_price(self, timestamp: datetime) -> float:
         """Get historical SOL price using CoinGecko free API"""
+        bucket = time_bucket(timestamp)
+        cached = self.cache.get('sol_price', 'SOL', bucket)
+        if cached is not None:
+            return cached['price_usd']
+        
+        price, fetched = self._fetch_sol_historical_price(timestamp)
+        if fetched:
+            price = self.cache.put('sol_price', 'SOL', bucket, {'price_usd': price})['price_usd']
+        return price
+    
+    def _fetch_sol_historical_price(self, timestamp: datetime):
+        """(price, fetched): fetched is False when the price is the hardcoded fallback"""
         try:
             # Convert timestamp to date string
             date_str = timestamp.strftime('%d-%m-%Y')
@@ -211,7 +270,7 @@ class HistoricalMarketFetcher:
                 
                 if sol_price > 0:
                     logger.info(f"Historical SOL price for {date_str}: ${sol_price:.2f}")
-                    return float(sol_price)
+                    return float(sol_price), True
             
             # Fallback: estimate based on current price and time
             return self._estimate_historical_sol_price(timestamp)
@@ -220,8 +279,8 @@ class HistoricalMarketFetcher:
             logger.error(f"Error fetching historical SOL price: {e}")
             return self._estimate_historical_sol_price(timestamp)
     
-    def _estimate_historical_sol_price(self, timestamp: datetime) -> float:
-        """Estimate historical SOL price based on time"""
+    def _estimate_historical_sol_price(self, timestamp: datetime):
+        """Estimate historical SOL price based on time; returns (price, fetched)"""
         try:
             # Get current SOL price from CoinGecko
             url = f"{self.coingecko_base_url}/simple/price"
@@ -229,10 +288,12 @@ class HistoricalMarketFetcher:
             
             response = self.session.get(url, params=params, timeout=10)
             current_sol_price = 147.0  # Fallback
+            fetched = False
             
             if response.status_code == 200:
                 data = response.json()
                 current_sol_price = data.get('solana', {}).get('usd', 147.0)
+                fetched = True
             
             # Apply time-based SOL price estimation
             time_diff = datetime.utcnow() - timestamp
@@ -252,11 +313,11 @@ class HistoricalMarketFetcher:
             
             estimated_price = current_sol_price * price_factor
             logger.info(f"Estimated historical SOL price: ${estimated_price:.2f}")
-            return estimated_price
+            return estimated_price, fetched
             
         except Exception as e:
             logger.error(f"Error estimating SOL price: {e}")
-            return 147.0  # Safe fallback
+            return 147.0, False  # Safe fallback
 
 # Singleton instance
 historical_fetcher = HistoricalMarketFetcher()
\ No newline at end of file
@@ -0,0 +1,163 @@
+"""
+Market Data Cache
+Persistent cache of historical market snapshots keyed by (kind, token, time bucket).
+
+A backdated trade is broadcast to every user with the same token and time,
+so the historical snapshot for that (contract, hour) only needs to be
+fetched once. Snapshots are written to a SQLite file (MARKET_CACHE_PATH)
+with INSERT OR IGNORE, so the first value stored for a key is the one every
+later lookup, worker and restart sees; an in-memory LRU sits in front of
+the file so repeated lookups in a process cost no I/O at all.
+
+Timestamps are bucketed by MARKET_CACHE_BUCKET_SECONDS (one hour by
+default). If the file cannot be opened the cache keeps working in memory.
+"""
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# SQLite file holding the snapshots; shared by every process on the host
+MARKET_CACHE_PATH = os.environ.get('MARKET_CACHE_PATH',
+                                   os.path.join(tempfile.gettempdir(), 'market_data_cache.sqlite3'))
+
+# Width of a time bucket in seconds
+MARKET_CACHE_BUCKET_SECONDS = int(os.environ.get('MARKET_CACHE_BUCKET_SECONDS', '3600'))
+
+# Snapshots kept in each process's memory
+MEMORY_CACHE_SIZE = 2048
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS market_snapshot (
+    kind TEXT NOT NULL,
+    token TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (kind, token, bucket)
+)
+"""
+
+
+def time_bucket(timestamp: datetime, seconds: Optional[int] = None) -> int:
+    """Start of the bucket holding a naive-UTC (or aware) timestamp, as epoch seconds"""
+    seconds = seconds or MARKET_CACHE_BUCKET_SECONDS
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    epoch = int(timestamp.timestamp())
+    return epoch - epoch % seconds
+
+
+class MarketDataCache:
+    """Write-once snapshot store: SQLite file behind an in-memory LRU"""
+
+    def __init__(self, path: Optional[str] = None, memory_size: int = MEMORY_CACHE_SIZE):
+        self.path = path or MARKET_CACHE_PATH
+        self.memory_size = memory_size
+        self._memory = OrderedDict()  # (kind, token, bucket) -> dict
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self):
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(_SCHEMA)
+            return conn
+        except (sqlite3.Error, OSError) as e:
+            logger.warning(f"Market data cache file {self.path} unavailable, caching in memory only: {e}")
+            return None
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def get(self, kind: str, token: str, bucket: int) -> Optional[Dict]:
+        """The stored snapshot for the key, or None"""
+        key = (kind, token, bucket)
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return dict(value)
+            if self._conn is not None:
+                try:
+                    row = self._conn.execute(
+                        "SELECT payload FROM market_snapshot WHERE kind = ? AND token = ? AND bucket = ?",
+                        key).fetchone()
+                except sqlite3.Error as e:
+                    logger.warning(f"Market data cache read failed: {e}")
+                    row = None
+                if row is not None:
+                    value = json.loads(row[0])
+                    self._remember(key, value)
+                    self.hits += 1
+                    return dict(value)
+            self.misses += 1
+            return None
+
+    def put(self, kind: str, token: str, bucket: int, value: Dict) -> Dict:
+        """
+        Store a snapshot unless one exists already
+
+        Returns:
+            the snapshot now stored for the key (an earlier writer's wins)
+        """
+        key = (kind, token, bucket)
+        with self._lock:
+            if self._conn is not None:
+                try:
+                    self._conn.execute(
+                        "INSERT OR IGNORE INTO market_snapshot (kind, token, bucket, payload, created_at) "
+                        "VALUES (?, ?, ?, ?, ?)", key + (json.dumps(value), time.time()))
+                    row = self._conn.execute(
+                        "SELECT payload FROM market_snapshot WHERE kind = ? AND token = ? AND bucket = ?",
+                        key).fetchone()
+                    if row is not None:
+                        value = json.loads(row[0])
+                except sqlite3.Error as e:
+                    logger.warning(f"Market data cache write failed: {e}")
+            elif key in self._memory:
+                value = self._memory[key]
+            self._remember(key, value)
+            return dict(value)
+
+    def clear_memory(self):
+        with self._lock:
+            self._memory.clear()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_market_cache() -> MarketDataCache:
+    """The process-wide cache, opened on first use"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = MarketDataCache()
+    return _cache
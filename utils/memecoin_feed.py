@@ -0,0 +1,230 @@
+"""
+Memecoin Feed
+Shared background feed of recently launched Solana memecoins.
+
+One daemon thread refreshes the token lists from pump.fun (primary) and
+Birdeye (secondary) every FEED_REFRESH_SECONDS and keeps the most recent
+FEED_BUFFER_SIZE tokens per source in a ring buffer with their metadata.
+After each refresh an immutable snapshot is published, so trade generation
+picks tokens from memory without locks or network I/O, however many users
+trade in the same minute.
+
+Birdeye is polled when pump.fun fails and at least every
+FEED_HEALTH_INTERVAL otherwise, so both sources always have a current
+health entry. When a source is down its last tokens stay in the buffer
+and keep being served.
+"""
+import logging
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+PUMP_FUN_API = "https://client-api.pump.fun/tokens/recent"
+BIRDEYE_API = "https://public-api.birdeye.so/public/tokenlist?sort_by=v24hUSD"
+
+# Sources in order of preference
+SOURCES = ('pump_fun', 'birdeye')
+
+# Seconds between background refreshes
+FEED_REFRESH_SECONDS = int(os.environ.get('MEMECOIN_FEED_REFRESH_SECONDS', '60'))
+
+# Secondary sources are polled at least this often, for health tracking
+FEED_HEALTH_INTERVAL = 15 * 60
+
+# Recent tokens kept per source
+FEED_BUFFER_SIZE = int(os.environ.get('MEMECOIN_FEED_BUFFER_SIZE', '200'))
+
+# Consecutive failures after which a source is reported as down
+DOWN_AFTER_FAILURES = 3
+
+_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/111.0.0.0 Safari/537.36'
+}
+
+
+def http_fetch(source: str) -> Optional[Dict]:
+    """One GET of a source's token list; JSON body or None"""
+    url = PUMP_FUN_API if source == 'pump_fun' else BIRDEYE_API
+    try:
+        response = requests.get(url, headers=_HEADERS, timeout=10)
+    except requests.RequestException as e:
+        logger.warning(f"{source} API request failed: {e}")
+        return None
+    if response.status_code != 200:
+        logger.warning(f"{source} API returned status code {response.status_code}")
+        return None
+    try:
+        return response.json()
+    except ValueError as e:
+        logger.warning(f"Failed to parse {source} API response as JSON: {e}")
+        return None
+
+
+def parse_tokens(source: str, data) -> Optional[List[Dict]]:
+    """Normalized tokens from a source response, or None if the response is malformed"""
+    if not isinstance(data, dict):
+        return None
+    if source == 'pump_fun':
+        tokens = data.get('data')
+        if not isinstance(tokens, list):
+            return None
+        return [{
+            'name': token.get('name'),
+            'symbol': token.get('symbol', 'UNKNOWN'),
+            'address': token.get('address'),
+            'price': token.get('price', 0.00001),
+            'marketCap': token.get('marketCap', 1000000),
+            'volume': token.get('volume'),
+            'source': 'pump_fun',
+        } for token in tokens if isinstance(token, dict) and token.get('name') and token.get('address')]
+
+    container = data.get('data')
+    tokens = container.get('tokens') if isinstance(container, dict) else None
+    if not isinstance(tokens, list):
+        return None
+    # Birdeye lists by 24h volume; the first 50 are the active ones
+    return [{
+        'name': token.get('name', token.get('symbol')),
+        'symbol': token.get('symbol'),
+        'address': token.get('address'),
+        'price': token.get('price', 0.00001),
+        'marketCap': token.get('marketCap', 1000000),
+        'volume': token.get('v24hUSD'),
+        'source': 'birdeye',
+    } for token in tokens[:50] if isinstance(token, dict) and token.get('symbol') and token.get('address')]
+
+
+class MemecoinFeed:
+    """Ring buffers of recent tokens per source, refreshed off the trading threads"""
+
+    def __init__(self, fetch: Callable[[str], Optional[Dict]] = None, buffer_size: int = FEED_BUFFER_SIZE,
+                 refresh_seconds: int = FEED_REFRESH_SECONDS):
+        self.fetch = fetch or http_fetch
+        self.buffer_size = buffer_size
+        self.refresh_seconds = refresh_seconds
+        # Same shape the auto trading module has always exposed as api_health
+        self.health = {source: {'status': 'unknown', 'last_check': 0, 'failures': 0, 'last_success': 0,
+                                'tokens': 0} for source in SOURCES}
+        self._buffers = {source: OrderedDict() for source in SOURCES}  # address -> token, oldest first
+        self._snapshot = {source: () for source in SOURCES}
+        self._refresh_lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    # ------------------------------------------------------------------
+    # Reads (memory only)
+    # ------------------------------------------------------------------
+    def tokens(self, source: Optional[str] = None) -> List[Dict]:
+        """Buffered tokens of one source, or of every source, newest last"""
+        if source is not None:
+            return list(self._snapshot.get(source, ()))
+        return [token for name in SOURCES for token in self._snapshot[name]]
+
+    def random_token(self) -> Optional[Dict]:
+        """
+        A random recent token, preferring the first source that is not down
+
+        Returns None while nothing has been fetched yet (the feed is started
+        in the background on first use).
+        """
+        if self._thread is None:
+            self.start()
+        for source in SOURCES:
+            if self._snapshot[source] and self.health[source]['status'] != 'down':
+                return dict(random.choice(self._snapshot[source]))
+        # Every source is down: serve whatever the buffers still hold
+        for source in SOURCES:
+            if self._snapshot[source]:
+                return dict(random.choice(self._snapshot[source]))
+        return None
+
+    # ------------------------------------------------------------------
+    # Refresh
+    # ------------------------------------------------------------------
+    def refresh(self, now: Optional[float] = None) -> Dict[str, int]:
+        """
+        Poll the sources that are due and publish a new snapshot
+
+        Returns:
+            dict: source -> tokens received, for the sources polled
+        """
+        now = now if now is not None else time.time()
+        received = {}
+        with self._refresh_lock:
+            primary_ok = False
+            for index, source in enumerate(SOURCES):
+                health = self.health[source]
+                if index > 0 and primary_ok and now - health['last_check'] < FEED_HEALTH_INTERVAL:
+                    continue
+                tokens = parse_tokens(source, self.fetch(source))
+                health['last_check'] = now
+                if tokens:
+                    self._store(source, tokens, now)
+                    health.update(status='healthy', failures=0, last_success=now)
+                    received[source] = len(tokens)
+                    primary_ok = primary_ok or index == 0
+                else:
+                    health['failures'] += 1
+                    health['status'] = 'down' if health['failures'] >= DOWN_AFTER_FAILURES else 'degraded'
+                    received[source] = 0
+                    if health['failures'] == DOWN_AFTER_FAILURES:
+                        logger.critical(f"{source} API appears to be down after {health['failures']} "
+                                        f"consecutive failures")
+                health['tokens'] = len(self._buffers[source])
+        return received
+
+    def _store(self, source, tokens, now):
+        buffer = self._buffers[source]
+        for token in tokens:
+            previous = buffer.pop(token['address'], None)
+            token = dict(token, first_seen=previous['first_seen'] if previous else now, last_seen=now)
+            buffer[token['address']] = token
+        while len(buffer) > self.buffer_size:
+            buffer.popitem(last=False)
+        self._snapshot[source] = tuple(buffer.values())
+
+    # ------------------------------------------------------------------
+    # Background thread
+    # ------------------------------------------------------------------
+    def start(self):
+        """Start refreshing in a daemon thread (no-op when already running)"""
+        with self._refresh_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return self
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='memecoin-feed', daemon=True)
+            self._thread.start()
+        logger.info(f"Memecoin feed started (refresh every {self.refresh_seconds}s)")
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Memecoin feed refresh failed: {e}")
+            self._stop.wait(self.refresh_seconds)
+
+
+_feed = None
+_feed_lock = threading.Lock()
+
+
+def get_memecoin_feed() -> MemecoinFeed:
+    """The process-wide feed"""
+    global _feed
+    if _feed is None:
+        with _feed_lock:
+            if _feed is None:
+                _feed = MemecoinFeed()
+    return _feed
@@ -177,13 +177,28 @@ async def delete_telegram_message(chat_id, message_id):
         # This avoids import errors when bot libraries are not available
         logger.debug(f"Using direct API call to delete message {message_id} for chat {chat_id}")
         
-        # Direct API call fallback        
-        url = f"https://api.telegram.org/bot{token}/deleteMessage"
         payload = {
             'chat_id': chat_id,
             'message_id': message_id
         }
         
+        # On the bot's own event loop, reuse its pooled session
+        from async_transport import get_async_runtime
+        runtime = get_async_runtime()
+        if runtime is not None and runtime.in_loop_thread():
+            response = await runtime.request('post', 'deleteMessage', json=payload, timeout=5)
+            if response.status_code == 200:
+                return True
+            description = (response.json().get('description') or '').lower()
+            # Messages that are already deleted or too old count as cleaned up
+            if 'message to delete not found' in description or 'message can\'t be deleted' in description:
+                return True
+            logger.warning(f"Failed to delete message {message_id}: {response.text}")
+            return False
+        
+        # Direct API call fallback        
+        url = f"https://api.telegram.org/bot{token}/deleteMessage"
+        
         timeout = aiohttp.ClientTimeout(total=5)
         async with aiohttp.ClientSession() as session:
             async with session.post(url, json=payload, timeout=timeout) as response:
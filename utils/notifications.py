@@ -1,12 +1,13 @@
 import logging
 from datetime import datetime, timedelta
+from types import SimpleNamespace
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from flask import current_app
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy import func
-from app import db, app
-from models import User, MilestoneTracker, UserStatus
+from app import db
+from async_db import run_db
+from models import User, MilestoneTracker, UserStatus, Profit
 from config import PROFIT_MILESTONES, STREAK_MILESTONES, INACTIVITY_THRESHOLD
 
 def generate_progress_bar(percentage, length=10):
@@ -27,6 +28,120 @@ def generate_progress_bar(percentage, length=10):
 
 logger = logging.getLogger(__name__)
 
+def _daily_update_messages():
+    """Daily update text for each active user with a result to report, built on the DB executor"""
+    updates = []
+
+    # Get all active users
+    active_users = User.query.filter_by(status=UserStatus.ACTIVE).all()
+
+    for user in active_users:
+        # Get yesterday's performance data using the performance tracking system
+        try:
+            from performance_tracking import get_performance_data
+            performance_data = get_performance_data(user.id)
+
+            if not performance_data:
+                logger.warning(f"No performance data for user {user.id}")
+                continue
+
+            yesterday_profit_amount = performance_data.get('today_profit', 0)  # This would be yesterday when run at start of day
+            yesterday_profit_percentage = performance_data.get('today_percentage', 0)
+
+            if yesterday_profit_amount <= 0:
+                logger.debug(f"No profit for user {user.id} yesterday")
+                continue
+        except Exception as e:
+            logger.error(f"Failed to get performance data for user {user.id}: {e}")
+            continue
+
+        # Calculate current streak and days of operation
+        streak = calculate_profit_streak(user.id)
+        days_active = (datetime.utcnow().date() - user.joined_at.date()).days
+
+        # Calculate monthly goal and progress
+        monthly_goal = 30  # 30% monthly goal
+        total_profit_amount = db.session.query(func.sum(Profit.amount)).filter_by(user_id=user.id).scalar() or 0
+        total_profit_percentage = (total_profit_amount / user.initial_deposit) * 100 if user.initial_deposit > 0 else 0
+        progress_percent = min(100, (total_profit_percentage / monthly_goal) * 100)
+        progress_bar = generate_progress_bar(progress_percent)
+
+        # Generate message based on profit/loss
+        if yesterday_profit_amount > 0:
+            # Profit day
+            emoji = "📈"
+
+            # Create streak message with positive reinforcement
+            if streak >= 5:
+                streak_text = f"🔥 {streak}-day profit streak! Your consistency is paying off!"
+            elif streak >= 3:
+                streak_text = f"🔥 {streak}-day profit streak! You're on a roll!"
+            else:
+                streak_text = "💪 Every profitable day compounds your success!"
+
+            # Calculate progress change
+            previous_progress = progress_percent - (yesterday_profit_percentage / monthly_goal * 100)
+            progress_change = "↗️" if progress_percent > previous_progress else "➡️"
+
+            message = (
+                f"{emoji} *THRIVE DAILY PROFIT UPDATE* {emoji}\n\n"
+                f"*Today's profit:* +{yesterday_profit_amount:.2f} SOL (+{yesterday_profit_percentage:.1f}%)\n"
+                f"*Day:* {days_active} of operations\n"
+                f"*Updated balance:* {user.balance:.2f} SOL\n\n"
+                f"*Monthly Goal Progress:* {progress_change}\n"
+                f"{progress_bar} {progress_percent:.0f}%\n\n"
+                f"{streak_text}"
+            )
+        else:
+            # Loss day - use encouraging language
+            # Calculate days since last loss for personalized message
+            loss_days = db.session.query(Profit).filter(Profit.user_id == user.id, Profit.amount < 0).count()
+            total_days = db.session.query(Profit).filter(Profit.user_id == user.id).count()
+            loss_ratio = (loss_days / total_days) if total_days > 0 else 0
+
+            # Get historical performance for context
+            profitable_days = db.session.query(Profit).filter(Profit.user_id == user.id, Profit.amount > 0).count()
+            win_rate = (profitable_days / total_days * 100) if total_days > 0 else 0
+
+            # Different approaches based on win rate
+            if win_rate > 80:
+                motivation = "Even the best trading strategies have down days. Your win rate of {:.1f}% is exceptional! 🏆".format(win_rate)
+            elif win_rate > 60:
+                motivation = "With a solid win rate of {:.1f}%, occasional down days are part of the journey to success! 💪".format(win_rate)
+            else:
+                motivation = "Market volatility creates opportunities. Our strategy is designed for long-term growth through ups and downs."
+
+            # Calculate recovery estimate based on average daily profit
+            avg_profit = db.session.query(func.avg(Profit.amount)).filter(
+                Profit.user_id == user.id, 
+                Profit.amount > 0
+            ).scalar() or 0
+
+            # Loss recovery estimate
+            if avg_profit > 0:
+                recovery_days = abs(yesterday_profit_amount) / avg_profit
+                recovery_message = f"Based on your average profit, this may be recovered in approximately {recovery_days:.1f} trading days."
+            else:
+                recovery_message = "Keep monitoring your dashboard for the next profitable trading cycle."
+
+            message = (
+                f"📊 *THRIVE DAILY UPDATE* 📊\n\n"
+                f"*Today's result:* {yesterday_profit_amount:.2f} SOL ({yesterday_profit_percentage:.1f}%)\n"
+                f"*Day:* {days_active} of operations\n"
+                f"*Updated balance:* {user.balance:.2f} SOL\n\n"
+                f"*Performance Metrics:*\n"
+                f"• Win Rate: {win_rate:.1f}%\n"
+                f"• Monthly Goal: {progress_bar} {progress_percent:.0f}%\n\n"
+                f"*{motivation}*\n\n"
+                f"{recovery_message}\n\n"
+                f"Remember: Consistent trading with a proven strategy leads to long-term success! 📈"
+            )
+
+        updates.append({'user_id': user.id, 'telegram_id': user.telegram_id, 'text': message})
+
+    return updates
+
+
 async def send_daily_update(context):
     """
     Send daily profit updates to all active users.
@@ -34,138 +149,82 @@ async def send_daily_update(context):
     Args:
         context: The telegram.ext.CallbackContext object
     """
-    with current_app.app_context():
+    try:
+        updates = await run_db(_daily_update_messages)
+    except SQLAlchemyError as e:
+        logger.error(f"Database error during daily updates: {e}")
+        return
+
+    # Create keyboard with motivating action buttons
+    keyboard = [
+        [InlineKeyboardButton("📊 View Dashboard", callback_data="view_dashboard")],
+        [InlineKeyboardButton("📈 Performance", callback_data="trading_history")],
+        [InlineKeyboardButton("💰 Deposit More", callback_data="deposit")]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+
+    for update in updates:
+        # Send message
         try:
-            # Get all active users
-            active_users = User.query.filter_by(status=UserStatus.ACTIVE).all()
-            
-            for user in active_users:
-                # Get yesterday's performance data using the performance tracking system
-                try:
-                    from performance_tracking import get_performance_data
-                    performance_data = get_performance_data(user.id)
-                    
-                    if not performance_data:
-                        logger.warning(f"No performance data for user {user.id}")
-                        continue
-                    
-                    yesterday_profit_amount = performance_data.get('today_profit', 0)  # This would be yesterday when run at start of day
-                    
-                    if yesterday_profit_amount <= 0:
-                        logger.debug(f"No profit for user {user.id} yesterday")
-                        continue
-                except Exception as e:
-                    logger.error(f"Failed to get performance data for user {user.id}: {e}")
-                    continue
-                
-                # Calculate current streak and days of operation
-                streak = calculate_profit_streak(user.id)
-                days_active = (datetime.utcnow().date() - user.joined_at.date()).days
-                
-                # Calculate monthly goal and progress
-                monthly_goal = 30  # 30% monthly goal
-                total_profit_amount = db.session.query(func.sum(Profit.amount)).filter_by(user_id=user.id).scalar() or 0
-                total_profit_percentage = (total_profit_amount / user.initial_deposit) * 100 if user.initial_deposit > 0 else 0
-                progress_percent = min(100, (total_profit_percentage / monthly_goal) * 100)
-                progress_bar = generate_progress_bar(progress_percent)
-                
-                # Generate message based on profit/loss
-                if yesterday_profit.amount > 0:
-                    # Profit day
-                    emoji = "📈"
-                    
-                    # Create streak message with positive reinforcement
-                    if streak >= 5:
-                        streak_text = f"🔥 {streak}-day profit streak! Your consistency is paying off!"
-                    elif streak >= 3:
-                        streak_text = f"🔥 {streak}-day profit streak! You're on a roll!"
-                    else:
-                        streak_text = "💪 Every profitable day compounds your success!"
-                    
-                    # Calculate progress change
-                    previous_progress = progress_percent - (yesterday_profit.percentage / monthly_goal * 100)
-                    progress_change = "↗️" if progress_percent > previous_progress else "➡️"
-                    
-                    message = (
-                        f"{emoji} *THRIVE DAILY PROFIT UPDATE* {emoji}\n\n"
-                        f"*Today's profit:* +{yesterday_profit.amount:.2f} SOL (+{yesterday_profit.percentage:.1f}%)\n"
-                        f"*Day:* {days_active} of operations\n"
-                        f"*Updated balance:* {user.balance:.2f} SOL\n\n"
-                        f"*Monthly Goal Progress:* {progress_change}\n"
-                        f"{progress_bar} {progress_percent:.0f}%\n\n"
-                        f"{streak_text}"
-                    )
-                else:
-                    # Loss day - use encouraging language
-                    # Calculate days since last loss for personalized message
-                    loss_days = db.session.query(Profit).filter(Profit.user_id == user.id, Profit.amount < 0).count()
-                    total_days = db.session.query(Profit).filter(Profit.user_id == user.id).count()
-                    loss_ratio = (loss_days / total_days) if total_days > 0 else 0
-                    
-                    # Get historical performance for context
-                    profitable_days = db.session.query(Profit).filter(Profit.user_id == user.id, Profit.amount > 0).count()
-                    win_rate = (profitable_days / total_days * 100) if total_days > 0 else 0
-                    
-                    # Different approaches based on win rate
-                    if win_rate > 80:
-                        motivation = "Even the best trading strategies have down days. Your win rate of {:.1f}% is exceptional! 🏆".format(win_rate)
-                    elif win_rate > 60:
-                        motivation = "With a solid win rate of {:.1f}%, occasional down days are part of the journey to success! 💪".format(win_rate)
-                    else:
-                        motivation = "Market volatility creates opportunities. Our strategy is designed for long-term growth through ups and downs."
-                    
-                    # Calculate recovery estimate based on average daily profit
-                    avg_profit = db.session.query(func.avg(Profit.amount)).filter(
-                        Profit.user_id == user.id, 
-                        Profit.amount > 0
-                    ).scalar() or 0
-                    
-                    # Loss recovery estimate
-                    if avg_profit > 0:
-                        recovery_days = abs(yesterday_profit.amount) / avg_profit
-                        recovery_message = f"Based on your average profit, this may be recovered in approximately {recovery_days:.1f} trading days."
-                    else:
-                        recovery_message = "Keep monitoring your dashboard for the next profitable trading cycle."
-                    
-                    message = (
-                        f"📊 *THRIVE DAILY UPDATE* 📊\n\n"
-                        f"*Today's result:* {yesterday_profit.amount:.2f} SOL ({yesterday_profit.percentage:.1f}%)\n"
-                        f"*Day:* {days_active} of operations\n"
-                        f"*Updated balance:* {user.balance:.2f} SOL\n\n"
-                        f"*Performance Metrics:*\n"
-                        f"• Win Rate: {win_rate:.1f}%\n"
-                        f"• Monthly Goal: {progress_bar} {progress_percent:.0f}%\n\n"
-                        f"*{motivation}*\n\n"
-                        f"{recovery_message}\n\n"
-                        f"Remember: Consistent trading with a proven strategy leads to long-term success! 📈"
-                    )
-                
-                # Create keyboard with motivating action buttons
-                keyboard = [
-                    [InlineKeyboardButton("📊 View Dashboard", callback_data="view_dashboard")],
-                    [InlineKeyboardButton("📈 Performance", callback_data="trading_history")],
-                    [InlineKeyboardButton("💰 Deposit More", callback_data="deposit")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                # Send message
-                try:
-                    await context.bot.send_message(
-                        chat_id=user.telegram_id,
-                        text=message,
-                        parse_mode="Markdown",
-                        reply_markup=reply_markup
-                    )
-                    logger.info(f"Sent daily update to user {user.id}")
-                except Exception as e:
-                    logger.error(f"Failed to send daily update to user {user.id}: {e}")
-                
-                # Check for streaks and milestones
-                await check_milestones(context, user.id)
-                
-        except SQLAlchemyError as e:
-            logger.error(f"Database error during daily updates: {e}")
-            db.session.rollback()
+            await context.bot.send_message(
+                chat_id=update['telegram_id'],
+                text=update['text'],
+                parse_mode="Markdown",
+                reply_markup=reply_markup
+            )
+            logger.info(f"Sent daily update to user {update['user_id']}")
+        except Exception as e:
+            logger.error(f"Failed to send daily update to user {update['user_id']}: {e}")
+
+        # Check for streaks and milestones
+        await check_milestones(context, update['user_id'])
+
+
+def _record_new_milestones(user_id):
+    """
+    Record the profit and streak milestones a user has newly reached, on the DB executor
+
+    Returns the user's details for the notifications (a plain snapshot, not
+    the ORM object), the total profit and the new milestones; None if the
+    user is unknown.
+    """
+    user = db.session.get(User, user_id)
+    if not user:
+        return None
+
+    # Calculate total profit percentage
+    total_profit_amount = db.session.query(func.sum(Profit.amount)).filter_by(user_id=user_id).scalar() or 0
+    total_profit_percentage = (total_profit_amount / user.initial_deposit) * 100 if user.initial_deposit > 0 else 0
+
+    reached = {'profit': [], 'streak': []}
+    streak = calculate_profit_streak(user_id)
+    for key, milestone_type, value, milestones in (
+            ('profit', 'profit_percentage', total_profit_percentage, PROFIT_MILESTONES),
+            ('streak', 'streak', streak, STREAK_MILESTONES)):
+        for milestone in milestones:
+            if value < milestone:
+                continue
+            # Check if this milestone has already been recorded
+            existing_milestone = MilestoneTracker.query.filter_by(
+                user_id=user_id,
+                milestone_type=milestone_type,
+                value=milestone
+            ).first()
+
+            if not existing_milestone:
+                # New milestone achieved
+                new_milestone = MilestoneTracker()
+                new_milestone.user_id = user_id
+                new_milestone.milestone_type = milestone_type
+                new_milestone.value = milestone
+                db.session.add(new_milestone)
+                db.session.commit()
+                reached[key].append(milestone)
+
+    reached['user'] = SimpleNamespace(id=user.id, telegram_id=user.telegram_id, joined_at=user.joined_at,
+                                      initial_deposit=user.initial_deposit, balance=user.balance)
+    reached['total_profit'] = total_profit_amount
+    return reached
 
 
 async def check_milestones(context, user_id):
@@ -176,65 +235,29 @@ async def check_milestones(context, user_id):
         context: The telegram.ext.CallbackContext object
         user_id (int): The database ID of the user
     """
-    with current_app.app_context():
-        try:
-            user = User.query.get(user_id)
-            if not user:
-                logger.error(f"User {user_id} not found for milestone check")
-                return
-            
-            # Calculate total profit percentage
-            total_profit_amount = db.session.query(func.sum(Profit.amount)).filter_by(user_id=user_id).scalar() or 0
-            total_profit_percentage = (total_profit_amount / user.initial_deposit) * 100 if user.initial_deposit > 0 else 0
-            
-            # Check profit milestones
-            for milestone in PROFIT_MILESTONES:
-                if total_profit_percentage >= milestone:
-                    # Check if this milestone has already been recorded
-                    existing_milestone = MilestoneTracker.query.filter_by(
-                        user_id=user_id,
-                        milestone_type='profit_percentage',
-                        value=milestone
-                    ).first()
-                    
-                    if not existing_milestone:
-                        # New milestone achieved
-                        new_milestone = MilestoneTracker()
-                        new_milestone.user_id = user_id
-                        new_milestone.milestone_type = 'profit_percentage'
-                        new_milestone.value = milestone
-                        db.session.add(new_milestone)
-                        db.session.commit()
-                        
-                        # Send milestone notification
-                        await send_profit_milestone_notification(context, user, milestone, total_profit_amount)
-            
-            # Check streak milestones
-            streak = calculate_profit_streak(user_id)
-            for milestone in STREAK_MILESTONES:
-                if streak >= milestone:
-                    # Check if this milestone has already been recorded
-                    existing_milestone = MilestoneTracker.query.filter_by(
-                        user_id=user_id,
-                        milestone_type='streak',
-                        value=milestone
-                    ).first()
-                    
-                    if not existing_milestone:
-                        # New milestone achieved
-                        new_milestone = MilestoneTracker()
-                        new_milestone.user_id = user_id
-                        new_milestone.milestone_type = 'streak'
-                        new_milestone.value = milestone
-                        db.session.add(new_milestone)
-                        db.session.commit()
-                        
-                        # Send milestone notification
-                        await send_streak_milestone_notification(context, user, milestone)
-                        
-        except SQLAlchemyError as e:
-            logger.error(f"Database error during milestone check: {e}")
-            db.session.rollback()
+    try:
+        reached = await run_db(_record_new_milestones, user_id)
+    except SQLAlchemyError as e:
+        logger.error(f"Database error during milestone check: {e}")
+        return
+
+    if not reached:
+        logger.error(f"User {user_id} not found for milestone check")
+        return
+
+    # Send milestone notifications
+    for milestone in reached['profit']:
+        await send_profit_milestone_notification(context, reached['user'], milestone, reached['total_profit'])
+    for milestone in reached['streak']:
+        await send_streak_milestone_notification(context, reached['user'], milestone)
+
+
+def _streak_profits(user_id, since):
+    """Total profit since the start of a streak"""
+    return db.session.query(func.sum(Profit.amount)).filter(
+        Profit.user_id == user_id,
+        Profit.date >= since
+    ).scalar() or 0
 
 
 async def send_profit_milestone_notification(context, user, milestone, total_profit):
@@ -243,7 +266,7 @@ async def send_profit_milestone_notification(context, user, milestone, total_pro
     
     Args:
         context: The telegram.ext.CallbackContext object
-        user (User): The user object
+        user: The user's details (id, telegram_id, joined_at, initial_deposit, balance)
         milestone (int): The milestone percentage
         total_profit (float): The total profit amount
     """
@@ -348,17 +371,14 @@ async def send_streak_milestone_notification(context, user, milestone):
     
     Args:
         context: The telegram.ext.CallbackContext object
-        user (User): The user object
+        user: The user's details (id, telegram_id, joined_at, initial_deposit, balance)
         milestone (int): The streak milestone
     """
     try:
         # Calculate total profit during streak
         today = datetime.utcnow().date()
         streak_start_date = today - timedelta(days=milestone)
-        streak_profits = db.session.query(func.sum(Profit.amount)).filter(
-            Profit.user_id == user.id,
-            Profit.date >= streak_start_date
-        ).scalar() or 0
+        streak_profits = await run_db(_streak_profits, user.id, streak_start_date)
         
         # Calculate compounding effect
         initial_balance = user.balance - streak_profits
@@ -412,6 +432,64 @@ async def send_streak_milestone_notification(context, user, milestone):
         logger.error(f"Failed to send streak milestone notification to user {user.id}: {e}")
 
 
+def _inactivity_reminder_messages():
+    """Reminder text for each active user who has not checked in lately, built on the DB executor"""
+    reminders = []
+
+    # Calculate the inactivity threshold date (3 days as specified)
+    threshold_date = datetime.utcnow() - timedelta(days=INACTIVITY_THRESHOLD)
+
+    # Get inactive users who haven't viewed dashboard or deposited
+    inactive_users = User.query.filter(
+        User.status == UserStatus.ACTIVE,
+        User.last_activity < threshold_date
+    ).all()
+
+    # Calculate days inactive for personalized messages
+    today = datetime.utcnow().date()
+
+    for user in inactive_users:
+        # Calculate total earnings to date for motivation
+        total_profit_amount = db.session.query(func.sum(Profit.amount)).filter_by(user_id=user.id).scalar() or 0
+        days_inactive = (today - user.last_activity.date()).days
+
+        # Get user's activity stats
+        total_trades = db.session.query(Profit).filter_by(user_id=user.id).count()
+        profitable_trades = db.session.query(Profit).filter(Profit.user_id == user.id, Profit.amount > 0).count()
+        win_rate = (profitable_trades / total_trades * 100) if total_trades > 0 else 0
+
+        # Format bot's current status 
+        if total_profit_amount > 0:
+            status_text = f"Your bot is still earning while you're away! So far, you've earned *{total_profit_amount:.2f} SOL* in profit."
+        else:
+            status_text = "Your bot is active and monitoring the markets for profitable opportunities."
+
+        # Create a personalized message based on inactivity length
+        if days_inactive >= 5:
+            title = "🔔 Don't miss out! Your bot is still working for you"
+            emphasis = "We miss you! Your trading bot has been continuing to operate without supervision."
+        elif days_inactive >= 4:
+            title = "⏰ Quick check-in reminder"
+            emphasis = "It's been a few days since you checked your trading performance."
+        else:
+            title = "👋 Just a friendly reminder"
+            emphasis = "Your THRIVE bot is earning while you sleep!"
+
+        # Format the message with the required elements
+        message = (
+            f"*{title}*\n\n"
+            f"{emphasis}\n\n"
+            f"{status_text}\n\n"
+            f"Win rate: {win_rate:.1f}% of trades profitable\n"
+            f"Days since last check: {days_inactive}\n\n"
+            f"Take 30 seconds to review your performance and make any adjustments to maximize your returns."
+        )
+
+        reminders.append({'user_id': user.id, 'telegram_id': user.telegram_id, 'text': message})
+
+    return reminders
+
+
 async def send_inactivity_reminder(context):
     """
     Send reminders to users who haven't interacted with the bot for a while.
@@ -419,79 +497,31 @@ async def send_inactivity_reminder(context):
     Args:
         context: The telegram.ext.CallbackContext object
     """
-    with current_app.app_context():
+    try:
+        reminders = await run_db(_inactivity_reminder_messages)
+    except SQLAlchemyError as e:
+        logger.error(f"Database error during inactivity reminders: {e}")
+        return
+
+    # Create engaging buttons with clear CTAs
+    keyboard = [
+        [InlineKeyboardButton("📊 View Dashboard", callback_data="view_dashboard")],
+        [InlineKeyboardButton("📈 Performance", callback_data="trading_history")],
+        [InlineKeyboardButton("💰 Deposit More", callback_data="deposit")]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+
+    for reminder in reminders:
         try:
-            # Calculate the inactivity threshold date (3 days as specified)
-            threshold_date = datetime.utcnow() - timedelta(days=INACTIVITY_THRESHOLD)
-            
-            # Get inactive users who haven't viewed dashboard or deposited
-            inactive_users = User.query.filter(
-                User.status == UserStatus.ACTIVE,
-                User.last_activity < threshold_date
-            ).all()
-            
-            # Calculate days inactive for personalized messages
-            today = datetime.utcnow().date()
-            
-            for user in inactive_users:
-                # Calculate total earnings to date for motivation
-                total_profit_amount = db.session.query(func.sum(Profit.amount)).filter_by(user_id=user.id).scalar() or 0
-                days_inactive = (today - user.last_activity.date()).days
-                
-                # Get user's activity stats
-                total_trades = db.session.query(Profit).filter_by(user_id=user.id).count()
-                profitable_trades = db.session.query(Profit).filter(Profit.user_id == user.id, Profit.amount > 0).count()
-                win_rate = (profitable_trades / total_trades * 100) if total_trades > 0 else 0
-                
-                # Format bot's current status 
-                if total_profit_amount > 0:
-                    status_text = f"Your bot is still earning while you're away! So far, you've earned *{total_profit_amount:.2f} SOL* in profit."
-                else:
-                    status_text = "Your bot is active and monitoring the markets for profitable opportunities."
-                
-                # Create a personalized message based on inactivity length
-                if days_inactive >= 5:
-                    title = "🔔 Don't miss out! Your bot is still working for you"
-                    emphasis = "We miss you! Your trading bot has been continuing to operate without supervision."
-                elif days_inactive >= 4:
-                    title = "⏰ Quick check-in reminder"
-                    emphasis = "It's been a few days since you checked your trading performance."
-                else:
-                    title = "👋 Just a friendly reminder"
-                    emphasis = "Your THRIVE bot is earning while you sleep!"
-                
-                # Format the message with the required elements
-                message = (
-                    f"*{title}*\n\n"
-                    f"{emphasis}\n\n"
-                    f"{status_text}\n\n"
-                    f"Win rate: {win_rate:.1f}% of trades profitable\n"
-                    f"Days since last check: {days_inactive}\n\n"
-                    f"Take 30 seconds to review your performance and make any adjustments to maximize your returns."
-                )
-                
-                # Create engaging buttons with clear CTAs
-                keyboard = [
-                    [InlineKeyboardButton("📊 View Dashboard", callback_data="view_dashboard")],
-                    [InlineKeyboardButton("📈 Performance", callback_data="trading_history")],
-                    [InlineKeyboardButton("💰 Deposit More", callback_data="deposit")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                try:
-                    await context.bot.send_message(
-                        chat_id=user.telegram_id,
-                        text=message,
-                        reply_markup=reply_markup,
-                        parse_mode="Markdown"
-                    )
-                    logger.info(f"Sent inactivity reminder to user {user.id}")
-                except Exception as e:
-                    logger.error(f"Failed to send inactivity reminder to user {user.id}: {e}")
-                
-        except SQLAlchemyError as e:
-            logger.error(f"Database error during inactivity reminders: {e}")
-            db.session.rollback()
+            await context.bot.send_message(
+                chat_id=reminder['telegram_id'],
+                text=reminder['text'],
+                reply_markup=reply_markup,
+                parse_mode="Markdown"
+            )
+            logger.info(f"Sent inactivity reminder to user {reminder['user_id']}")
+        except Exception as e:
+            logger.error(f"Failed to send inactivity reminder to user {reminder['user_id']}: {e}")
 
 
 def calculate_profit_streak(user_id):
@@ -504,15 +534,5 @@ def calculate_profit_streak(user_id):
     Returns:
         int: The number of consecutive profitable days
     """
-    streak = 0
-    current_date = datetime.utcnow().date()
-    
-    while True:
-        profit = Profit.query.filter_by(user_id=user_id, date=current_date).first()
-        if profit and profit.amount > 0:
-            streak += 1
-            current_date -= timedelta(days=1)
-        else:
-            break
-    
-    return streak
+    from profit_streaks import profit_streak
+    return profit_streak(user_id)
@@ -0,0 +1,235 @@
+"""
+Portfolio Risk Engine
+Global stop-loss / take-profit pass over every open TradingPosition.
+
+All open positions are loaded together with their owner's AutoTradingSettings
+in one query, thresholds are evaluated column-wise with NumPy against a
+per-token price map, and triggered positions are closed with bulk UPDATEs plus
+bulk ledger INSERTs (balances through balance_ledger.apply_deltas) in a single
+database transaction.
+
+Only positions whose cost was debited at entry get their sell value back;
+every other position is settled the way the admin SELL settles it, with its
+P/L alone. The admin BUY placeholder row is never evaluated.
+"""
+import logging
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from sqlalchemy import and_, case, func, insert, not_, select, update
+
+from app import db
+from balance_ledger import apply_deltas
+from metrics_registry import RISK_PASS_DURATION
+from models import AutoTradingSettings, TradingPosition, Transaction, Profit
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Used for users that have no AutoTradingSettings row yet (model defaults)
+DEFAULT_STOP_LOSS_PERCENTAGE = 15.0
+DEFAULT_TAKE_PROFIT_PERCENTAGE = 100.0
+
+# Percentage points of float noise tolerated when a price sits exactly on a threshold
+THRESHOLD_EPSILON = 1e-9
+
+# Positions closed per UPDATE ... RETURNING statement
+CLOSE_CHUNK_SIZE = 1000
+
+# Trade types whose entry debited amount * entry_price from the balance
+# (AdminTradeProcessor.process_buy_for_user); closing them returns the sell value
+FUNDED_TRADE_TYPES = ('admin_signal',)
+
+# The admin BUY in process_update records an unowned placeholder position that
+# waits for the matching SELL; it belongs to no user and is never closed here
+PLACEHOLDER_USER_ID = 1
+PLACEHOLDER_AMOUNT = 1.0
+
+
+class OpenPositionBook:
+    """Column-oriented snapshot of open positions and their thresholds"""
+
+    def __init__(self, rows: List[tuple]):
+        (self.ids, self.user_ids, self.tokens, self.amounts, self.entry_prices,
+         self.current_prices, self.stop_losses, self.take_profits, self.funded) = (
+            [list(column) for column in zip(*rows)] if rows else [[] for _ in range(9)])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def prices_for(self, price_map: Optional[Dict[str, float]]) -> List[float]:
+        """Mark price per position: the price map when it quotes the token, else the stored price"""
+        if not price_map:
+            return self.current_prices
+        return [price_map.get(token, stored) for token, stored in zip(self.tokens, self.current_prices)]
+
+    def evaluate(self, prices: List[float], stop_loss: bool = True, take_profit: bool = True):
+        """Return (stop_loss_indexes, take_profit_indexes, pnl_percentages)"""
+        entry = np.asarray(self.entry_prices, dtype=float)
+        mark = np.asarray(prices, dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pnl = np.where(entry > 0, (mark - entry) / entry * 100.0, 0.0)
+        stop_hits = np.flatnonzero(-pnl + THRESHOLD_EPSILON >= np.asarray(self.stop_losses, dtype=float)) \
+            if stop_loss else []
+        take_hits = np.flatnonzero(pnl + THRESHOLD_EPSILON >= np.asarray(self.take_profits, dtype=float)) \
+            if take_profit else []
+        return [int(i) for i in stop_hits], [int(i) for i in take_hits], pnl.tolist()
+
+
+class PortfolioRiskEngine:
+    """Evaluates and applies stop-loss / take-profit for all users at once"""
+
+    @staticmethod
+    def load_open_positions(user_ids: Optional[Iterable[int]] = None) -> OpenPositionBook:
+        """One query: open positions joined with their owner's thresholds"""
+        # Table columns on the session's connection skip ORM row processing
+        positions = TradingPosition.__table__.c
+        settings = AutoTradingSettings.__table__.c
+        query = (
+            select(
+                positions.id,
+                positions.user_id,
+                positions.token_name,
+                positions.amount,
+                positions.entry_price,
+                positions.current_price,
+                func.coalesce(settings.stop_loss_percentage, DEFAULT_STOP_LOSS_PERCENTAGE),
+                func.coalesce(settings.take_profit_percentage, DEFAULT_TAKE_PROFIT_PERCENTAGE),
+                func.coalesce(positions.trade_type.in_(FUNDED_TRADE_TYPES), False),
+            )
+            .select_from(TradingPosition.__table__.outerjoin(
+                AutoTradingSettings.__table__, settings.user_id == positions.user_id))
+            .where(positions.status == 'open')
+            .where(not_(and_(positions.user_id == PLACEHOLDER_USER_ID,
+                             positions.amount == PLACEHOLDER_AMOUNT,
+                             positions.admin_id.is_(None),
+                             positions.buy_tx_hash.isnot(None))))
+        )
+        if user_ids is not None:
+            query = query.where(positions.user_id.in_(list(user_ids)))
+        return OpenPositionBook(db.session.connection().execute(query).all())
+
+    @staticmethod
+    def run_risk_pass(price_map: Optional[Dict[str, float]] = None,
+                      user_ids: Optional[Iterable[int]] = None,
+                      stop_loss: bool = True, take_profit: bool = True) -> Dict[str, int]:
+        """
+        Close every open position that has hit its stop-loss or take-profit
+
+        Args:
+            price_map: token_name -> latest price; tokens not quoted keep their stored price
+            user_ids: restrict the pass to these users (default: everyone)
+            stop_loss / take_profit: which rules to apply
+
+        Returns:
+            dict with counts of evaluated positions and of stop_loss and
+            take_profit positions this pass closed
+        """
+        started = time.perf_counter()
+        with RISK_PASS_DURATION.time():
+            book = PortfolioRiskEngine.load_open_positions(user_ids)
+            prices = book.prices_for(price_map)
+            stop_hits, take_hits, pnl = book.evaluate(prices, stop_loss, take_profit)
+            closed = {'stop_loss': 0, 'take_profit': 0}
+            if len(stop_hits) or len(take_hits):
+                closed = PortfolioRiskEngine._close_positions(book, prices, pnl, stop_hits, take_hits)
+
+        result = {'evaluated': len(book), 'stop_loss': closed['stop_loss'], 'take_profit': closed['take_profit']}
+        if closed['stop_loss'] or closed['take_profit']:
+            logger.info(f"Risk pass closed {closed['stop_loss']} stop-loss and {closed['take_profit']} take-profit "
+                        f"positions out of {len(book)} in {time.perf_counter() - started:.3f}s")
+        return result
+
+    @staticmethod
+    def _close_positions(book: OpenPositionBook, prices: List[float], pnl: List[float],
+                         stop_hits: List[int], take_hits: List[int]) -> Dict[str, int]:
+        """
+        Bulk-close triggered positions and write the matching ledger rows
+
+        The close is UPDATE ... WHERE status = 'open' RETURNING id, and ledger
+        rows and balance credits are built only for the returned ids, so a
+        position closed by an overlapping pass since the book was loaded is
+        neither closed nor credited twice. Funded positions are credited their
+        sell value, all others only their P/L.
+
+        Returns:
+            dict: reason -> number of positions this call actually closed
+        """
+        now = datetime.utcnow()
+        today = now.date()
+        triggered = {}  # position id -> (book index, reason)
+        for reason, hits in (('stop_loss', stop_hits), ('take_profit', take_hits)):
+            for i in hits:
+                triggered[book.ids[int(i)]] = (int(i), reason)
+
+        position_table = TradingPosition.__table__
+        positions = position_table.c
+        try:
+            closed_ids = []
+            ids = list(triggered)
+            for start in range(0, len(ids), CLOSE_CHUNK_SIZE):
+                chunk = ids[start:start + CLOSE_CHUNK_SIZE]
+                price = case({pid: prices[triggered[pid][0]] for pid in chunk}, value=positions.id)
+                closed_ids.extend(db.session.execute(
+                    update(position_table)
+                    .where(positions.id.in_(chunk))
+                    .where(positions.status == 'open')
+                    .values(status='closed', current_price=price, exit_price=price,
+                            roi_percentage=case({pid: pnl[triggered[pid][0]] for pid in chunk}, value=positions.id),
+                            exit_reason=case({pid: triggered[pid][1] for pid in chunk}, value=positions.id),
+                            sell_timestamp=now)
+                    .returning(positions.id)
+                ).scalars())
+
+            transactions = []
+            profits = []
+            balance_deltas: Dict[str, List[tuple]] = {'stop_loss': [], 'take_profit': []}
+            for position_id in closed_ids:
+                i, reason = triggered[position_id]
+                price = prices[i]
+                roi = pnl[i]
+                sell_value = book.amounts[i] * price
+                profit_amount = sell_value - book.amounts[i] * book.entry_prices[i]
+                user_id = book.user_ids[i]
+                label = 'Auto stop loss' if reason == 'stop_loss' else 'Auto take profit'
+                transactions.append({
+                    'user_id': user_id,
+                    'transaction_type': 'trade_profit' if profit_amount >= 0 else 'trade_loss',
+                    'amount': profit_amount,
+                    'token_name': book.tokens[i],
+                    'price': price,
+                    'timestamp': now,
+                    'status': 'completed',
+                    'notes': f"{label}: {book.tokens[i]} at {roi:+.1f}%",
+                    'related_trade_id': position_id,
+                })
+                if profit_amount != 0:
+                    profits.append({'user_id': user_id, 'amount': profit_amount,
+                                    'percentage': roi, 'date': today})
+                credit = sell_value if book.funded[i] else profit_amount
+                balance_deltas[reason].append((user_id, credit, f"position:{position_id}"))
+
+            if transactions:
+                db.session.execute(insert(Transaction), transactions)
+            if profits:
+                db.session.execute(insert(Profit), profits)
+            for reason, deltas in balance_deltas.items():
+                if deltas:
+                    apply_deltas(deltas, reason, commit=False)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Risk pass failed to close {len(triggered)} positions: {e}")
+            raise
+
+        skipped = len(triggered) - len(closed_ids)
+        if skipped:
+            logger.info(f"Risk pass skipped {skipped} positions already closed by another pass")
+        return {reason: len(deltas) for reason, deltas in balance_deltas.items()}
+
+
+def run_global_risk_pass(price_map: Optional[Dict[str, float]] = None) -> Dict[str, int]:
+    """Stop-loss and take-profit for every user"""
+    return PortfolioRiskEngine.run_risk_pass(price_map)
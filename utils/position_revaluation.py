@@ -0,0 +1,193 @@
+"""
+Position Revaluation
+Token-grouped mark-to-market of live TradingPosition rows.
+
+Live positions ('open' ones from the trading engine and 'holding' ones from
+smart BUY broadcasts) are grouped by contract_address, or by token symbol
+when no address is known, each distinct token is priced once, and
+current_price plus unrealized P/L are written for every holder with one
+set-based UPDATE per token (executed as a batch). The result is published as an immutable
+in-memory snapshot that position screens read instead of recomputing per
+position. Price I/O scales with distinct tokens, not positions.
+"""
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, select, update
+
+from app import db, app
+from models import TradingPosition
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Seconds between revaluation passes in the background loop
+REVALUATION_INTERVAL = 30
+
+# Tokens per executemany UPDATE batch
+TOKEN_BATCH_SIZE = 200
+
+# Position statuses that are still held and get marked to market
+REVALUED_STATUSES = ('open', 'holding')
+
+# A token key is ('contract', address) or ('token', token_name)
+TokenKey = Tuple[str, str]
+
+
+class PositionSnapshot:
+    """Read-only mark-to-market view of all live positions"""
+
+    def __init__(self, as_of: Optional[datetime] = None, prices: Optional[Dict[TokenKey, float]] = None,
+                 positions: Optional[Dict[int, Tuple[float, float, float]]] = None):
+        self.as_of = as_of
+        self.prices = prices or {}
+        self.positions = positions or {}    # position id -> (current_price, unrealized_pnl, pnl_percentage)
+
+    def get(self, position_id: int) -> Optional[Tuple[float, float, float]]:
+        return self.positions.get(position_id)
+
+    def __len__(self):
+        return len(self.positions)
+
+
+_snapshot = PositionSnapshot()
+_loop_stop: Optional[threading.Event] = None
+
+
+def get_position_snapshot() -> PositionSnapshot:
+    """Latest published snapshot (empty until the first revaluation)"""
+    return _snapshot
+
+
+def dexscreener_price_source(keys: List[TokenKey]) -> Dict[TokenKey, float]:
+    """
+    Default price source: one batched DEX Screener lookup per 30 contract
+    addresses, plus one symbol search per token without an address
+    """
+    from utils.dexscreener_client import dex_client
+
+    addresses = [value for kind, value in keys if kind == 'contract']
+    symbols = [value for kind, value in keys if kind == 'token']
+    prices = {('contract', address): price
+              for address, price in (dex_client.get_token_prices(addresses) if addresses else {}).items()}
+    if symbols:
+        prices.update({('token', symbol): price
+                       for symbol, price in dex_client.get_token_prices_by_symbol(symbols).items()})
+    return prices
+
+
+def open_token_keys() -> List[TokenKey]:
+    """Distinct tokens held in live positions"""
+    positions = TradingPosition.__table__.c
+    rows = db.session.connection().execute(
+        select(positions.contract_address, positions.token_name)
+        .where(positions.status.in_(REVALUED_STATUSES))
+        .distinct()
+    ).all()
+    keys = {('contract', address) if address else ('token', token) for address, token in rows}
+    return sorted(keys)
+
+
+def apply_prices(prices: Dict[TokenKey, float], now: Optional[datetime] = None) -> int:
+    """Write current_price and unrealized P/L for every live holder of each priced token"""
+    table = TradingPosition.__table__
+    positions = table.c
+    now = now or datetime.utcnow()
+
+    values = dict(current_price=bindparam('price'),
+                  unrealized_pnl=positions.amount * (bindparam('price') - positions.entry_price),
+                  price_updated_at=bindparam('priced_at'))
+    by_contract = (update(table)
+                   .where(positions.status.in_(REVALUED_STATUSES))
+                   .where(positions.contract_address == bindparam('key'))
+                   .values(**values))
+    by_token = (update(table)
+                .where(positions.status.in_(REVALUED_STATUSES))
+                .where(positions.contract_address.is_(None))
+                .where(positions.token_name == bindparam('key'))
+                .values(**values))
+
+    items = [(kind, key, price) for (kind, key), price in prices.items() if price and price > 0]
+    for start in range(0, len(items), TOKEN_BATCH_SIZE):
+        batch = items[start:start + TOKEN_BATCH_SIZE]
+        contract_rows = [{'key': key, 'price': price, 'priced_at': now} for kind, key, price in batch if kind == 'contract']
+        token_rows = [{'key': key, 'price': price, 'priced_at': now} for kind, key, price in batch if kind == 'token']
+        if contract_rows:
+            db.session.execute(by_contract, contract_rows)
+        if token_rows:
+            db.session.execute(by_token, token_rows)
+    db.session.commit()
+    return len(items)
+
+
+def build_snapshot(prices: Dict[TokenKey, float], as_of: datetime) -> PositionSnapshot:
+    """Read back every live position's mark in one query"""
+    positions = TradingPosition.__table__.c
+    rows = db.session.connection().execute(
+        select(positions.id, positions.amount, positions.entry_price,
+               positions.current_price, positions.unrealized_pnl)
+        .where(positions.status.in_(REVALUED_STATUSES))
+    ).all()
+    marks = {}
+    for position_id, amount, entry_price, current_price, unrealized_pnl in rows:
+        if unrealized_pnl is None:
+            unrealized_pnl = (amount or 0) * ((current_price or 0) - (entry_price or 0))
+        pnl_percentage = ((current_price - entry_price) / entry_price * 100) if entry_price else 0.0
+        marks[position_id] = (current_price, unrealized_pnl, pnl_percentage)
+    return PositionSnapshot(as_of, dict(prices), marks)
+
+
+def revalue_open_positions(price_source: Optional[Callable[[List[TokenKey]], Dict[TokenKey, float]]] = None
+                           ) -> PositionSnapshot:
+    """
+    Run one mark-to-market pass and publish the new snapshot
+
+    Args:
+        price_source: callable(keys) -> {key: price}; defaults to DEX Screener
+
+    Returns:
+        PositionSnapshot: the published snapshot
+    """
+    global _snapshot
+    started = time.perf_counter()
+    keys = open_token_keys()
+    prices = (price_source or dexscreener_price_source)(keys) if keys else {}
+    now = datetime.utcnow()
+    priced = apply_prices(prices, now) if prices else 0
+    _snapshot = build_snapshot(prices, now)
+    logger.info(f"Revalued {len(_snapshot)} live positions across {priced}/{len(keys)} tokens "
+                f"in {time.perf_counter() - started:.3f}s")
+    return _snapshot
+
+
+def start_revaluation_loop(interval: int = REVALUATION_INTERVAL) -> bool:
+    """Revalue open positions every `interval` seconds in a daemon thread"""
+    global _loop_stop
+    if _loop_stop is not None and not _loop_stop.is_set():
+        logger.warning("Position revaluation loop is already running")
+        return False
+
+    # Each loop owns its stop event, so a quick stop/start never leaves two loops running
+    stop_event = threading.Event()
+
+    def revaluation_worker():
+        while not stop_event.is_set():
+            try:
+                with app.app_context():
+                    revalue_open_positions()
+            except Exception as e:
+                logger.error(f"Position revaluation failed: {e}")
+            stop_event.wait(interval)
+
+    _loop_stop = stop_event
+    threading.Thread(target=revaluation_worker, daemon=True).start()
+    logger.info(f"Position revaluation started, every {interval} seconds")
+    return True
+
+
+def stop_revaluation_loop():
+    if _loop_stop is not None:
+        _loop_stop.set()
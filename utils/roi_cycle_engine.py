@@ -0,0 +1,247 @@
+"""
+ROI Cycle Engine
+Set-based daily processing of the 7-Day 2x ROI cycles.
+
+One run opens a cycle for every ACTIVE user with a balance and no cycle in
+progress (one INSERT ... SELECT), loads every due cycle together with its
+user in one query, computes the day's profit column-wise (NumPy arrays when
+NumPy is installed, plain lists otherwise) and writes credits, Profit rows,
+balances and cycle totals in bulk, one transaction per chunk of users.
+
+Each credit is recorded in DailyRoiCredit, unique per (user, date). Credits
+are inserted with ON CONFLICT DO NOTHING and only the rows actually
+inserted are paid out, so a rerun, an overlapping run or a crash halfway
+through never credits a user twice for the same day.
+"""
+import logging
+import time
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import and_, bindparam, exists, func, insert, literal, select, update
+
+from app import db
+from metrics_registry import ROI_RUN_DURATION
+from models import CycleStatus, DailyRoiCredit, Profit, TradingCycle, User, UserStatus
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; the list-based path gives identical results
+    np = None
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Users credited per transaction
+CHUNK_SIZE = 2000
+
+# A cycle doubles the initial balance over this many days
+CYCLE_DAYS = 7
+DEFAULT_DAILY_ROI_PERCENTAGE = 28.57
+
+
+class CycleBook:
+    """Column-oriented snapshot of the cycles due for a credit"""
+
+    def __init__(self, rows: List[tuple]):
+        (self.cycle_ids, self.user_ids, self.start_dates, self.initial_balances,
+         self.current_balances, self.target_balances, self.daily_percentages) = (
+            [list(column) for column in zip(*rows)] if rows else [[] for _ in range(7)])
+
+    def __len__(self):
+        return len(self.cycle_ids)
+
+    def evaluate(self, now: datetime):
+        """
+        Today's profit per cycle and whether the credit completes it
+
+        Returns:
+            (profits, completes): lists aligned with the book
+        """
+        if not self.cycle_ids:
+            return [], []
+        expired = [(now - (start or now)).days >= CYCLE_DAYS for start in self.start_dates]
+        if np is not None:
+            initial = np.asarray(self.initial_balances, dtype=float)
+            profits = initial * np.asarray(self.daily_percentages, dtype=float) / 100.0
+            reached = np.asarray(self.current_balances, dtype=float) + profits \
+                >= np.asarray(self.target_balances, dtype=float)
+            completes = reached | np.asarray(expired, dtype=bool)
+            return profits.tolist(), completes.tolist()
+
+        profits = [initial * percentage / 100.0
+                   for initial, percentage in zip(self.initial_balances, self.daily_percentages)]
+        completes = [current + profit >= target or is_expired
+                     for current, profit, target, is_expired
+                     in zip(self.current_balances, profits, self.target_balances, expired)]
+        return profits, completes
+
+
+def _insert_new_credits():
+    """INSERT into daily_roi_credit that skips (user, date) pairs already credited"""
+    table = DailyRoiCredit.__table__
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+    return (dialect_insert(table)
+            .on_conflict_do_nothing(index_elements=['user_id', 'date'])
+            .returning(table.c.user_id))
+
+
+def open_missing_cycles(now: datetime, user_ids: Optional[Iterable[int]] = None) -> int:
+    """Start a cycle for every ACTIVE user with a balance and no cycle in progress"""
+    users = User.__table__.c
+    cycles = TradingCycle.__table__
+    in_progress = exists().where(and_(cycles.c.user_id == users.id,
+                                      cycles.c.status == CycleStatus.IN_PROGRESS))
+    source = (
+        select(users.id, literal(now, cycles.c.start_date.type), users.balance, users.balance,
+               users.balance * 2, literal(DEFAULT_DAILY_ROI_PERCENTAGE),
+               literal(CycleStatus.IN_PROGRESS, cycles.c.status.type), literal(True),
+               literal(0.0), literal(0.0))
+        .where(users.status == UserStatus.ACTIVE)
+        .where(users.balance > 0)
+        .where(~in_progress)
+    )
+    if user_ids is not None:
+        source = source.where(users.id.in_(list(user_ids)))
+    result = db.session.execute(insert(cycles).from_select(
+        ['user_id', 'start_date', 'initial_balance', 'current_balance', 'target_balance',
+         'daily_roi_percentage', 'status', 'is_auto_roi', 'total_profit_amount', 'total_roi_percentage'],
+        source))
+    db.session.commit()
+    return max(result.rowcount or 0, 0)
+
+
+def load_due_cycles(day: date, user_ids: Optional[Iterable[int]] = None) -> CycleBook:
+    """Every ACTIVE user's cycle in progress that has no credit for `day` yet, in one query"""
+    cycles = TradingCycle.__table__.c
+    users = User.__table__.c
+    credits = DailyRoiCredit.__table__.c
+    credited = exists().where(and_(credits.user_id == cycles.user_id, credits.date == day))
+    query = (
+        select(cycles.id, cycles.user_id, cycles.start_date, cycles.initial_balance,
+               cycles.current_balance, cycles.target_balance,
+               func.coalesce(cycles.daily_roi_percentage, DEFAULT_DAILY_ROI_PERCENTAGE))
+        .join(User.__table__, users.id == cycles.user_id)
+        .where(cycles.status == CycleStatus.IN_PROGRESS)
+        .where(users.status == UserStatus.ACTIVE)
+        .where(~credited)
+        .order_by(cycles.user_id, cycles.id)
+    )
+    if user_ids is not None:
+        query = query.where(cycles.user_id.in_(list(user_ids)))
+
+    # A user should only ever have one cycle in progress; if not, credit the oldest
+    rows = []
+    last_user = None
+    for row in db.session.connection().execute(query):
+        if row[1] != last_user:
+            rows.append(tuple(row))
+            last_user = row[1]
+    return CycleBook(rows)
+
+
+def _credit_chunk(book: CycleBook, indexes: range, profits: List[float], completes: List[bool],
+                  day: date, now: datetime) -> Dict[int, tuple]:
+    """Record, pay out and total one chunk of credits in a single transaction"""
+    credit_rows = [{
+        'user_id': book.user_ids[i], 'cycle_id': book.cycle_ids[i], 'date': day,
+        'amount': profits[i], 'percentage': book.daily_percentages[i], 'created_at': now,
+    } for i in indexes]
+
+    statement = _insert_new_credits()
+    if statement is not None:
+        inserted = set(db.session.execute(statement, credit_rows).scalars())
+    else:
+        credits = DailyRoiCredit.__table__.c
+        chunk_users = [row['user_id'] for row in credit_rows]
+        taken = set(db.session.execute(
+            select(credits.user_id).where(credits.date == day).where(credits.user_id.in_(chunk_users))).scalars())
+        credit_rows = [row for row in credit_rows if row['user_id'] not in taken]
+        if credit_rows:
+            db.session.execute(insert(DailyRoiCredit.__table__), credit_rows)
+        inserted = {row['user_id'] for row in credit_rows}
+
+    paid = [i for i in indexes if book.user_ids[i] in inserted]
+    if paid:
+        user_table = User.__table__
+        cycle_table = TradingCycle.__table__
+        db.session.execute(insert(Profit.__table__), [{
+            'user_id': book.user_ids[i], 'amount': profits[i],
+            'percentage': book.daily_percentages[i], 'date': day,
+        } for i in paid])
+        db.session.execute(
+            update(user_table)
+            .where(user_table.c.id == bindparam('uid'))
+            .values(balance=func.coalesce(user_table.c.balance, 0.0) + bindparam('delta')),
+            [{'uid': book.user_ids[i], 'delta': profits[i]} for i in paid]
+        )
+        db.session.execute(
+            update(cycle_table)
+            .where(cycle_table.c.id == bindparam('cid'))
+            .values(current_balance=cycle_table.c.current_balance + bindparam('delta'),
+                    total_profit_amount=func.coalesce(cycle_table.c.total_profit_amount, 0.0) + bindparam('delta'),
+                    total_roi_percentage=func.coalesce(cycle_table.c.total_roi_percentage, 0.0) + bindparam('pct'),
+                    status=bindparam('new_status'),
+                    end_date=bindparam('ended_at')),
+            [{'cid': book.cycle_ids[i], 'delta': profits[i], 'pct': book.daily_percentages[i],
+              'new_status': CycleStatus.COMPLETED if completes[i] else CycleStatus.IN_PROGRESS,
+              'ended_at': now if completes[i] else None} for i in paid]
+        )
+    db.session.commit()
+    return {book.user_ids[i]: (profits[i], book.daily_percentages[i], bool(completes[i])) for i in paid}
+
+
+def run_daily_roi(day: Optional[date] = None, user_ids: Optional[Iterable[int]] = None,
+                  chunk_size: int = CHUNK_SIZE, now: Optional[datetime] = None) -> Dict:
+    """
+    Credit today's ROI to every due cycle
+
+    Args:
+        day: the date being credited (default: today, UTC)
+        user_ids: restrict the run to these users (default: everyone)
+        chunk_size: users credited per transaction
+        now: clock used for cycle start/end dates and elapsed days
+
+    Returns:
+        dict with cycles_opened, due, credited and completed counts, total_profit,
+        seconds, and credits: {user_id: (amount, percentage, completed)}
+    """
+    now = now or datetime.utcnow()
+    day = day or now.date()
+    if user_ids is not None:
+        user_ids = list(user_ids)
+    started = time.perf_counter()
+    credits: Dict[int, tuple] = {}
+
+    with ROI_RUN_DURATION.time():
+        opened = open_missing_cycles(now, user_ids)
+        book = load_due_cycles(day, user_ids)
+        profits, completes = book.evaluate(now)
+        for start in range(0, len(book), chunk_size):
+            indexes = range(start, min(start + chunk_size, len(book)))
+            try:
+                credits.update(_credit_chunk(book, indexes, profits, completes, day, now))
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Daily ROI failed for {len(indexes)} users starting at user "
+                             f"{book.user_ids[start]}: {e}")
+
+    result = {
+        'cycles_opened': opened,
+        'due': len(book),
+        'credited': len(credits),
+        'completed': sum(1 for _, _, completed in credits.values() if completed),
+        'total_profit': sum(amount for amount, _, _ in credits.values()),
+        'seconds': time.perf_counter() - started,
+        'credits': credits,
+    }
+    logger.info(f"Daily ROI for {day}: credited {result['credited']}/{result['due']} cycles "
+                f"({result['total_profit']:.2f} SOL), opened {opened}, completed {result['completed']} "
+                f"in {result['seconds']:.2f}s")
+    return result
@@ -3,7 +3,7 @@ import math
 from datetime import datetime, timedelta
 from sqlalchemy.exc import SQLAlchemyError
 from app import db, app
-from models import User, Profit, Transaction, TradingCycle, CycleStatus, UserStatus
+from models import User, Transaction, TradingCycle, CycleStatus, UserStatus
 
 logger = logging.getLogger(__name__)
 
@@ -61,70 +61,31 @@ def process_daily_roi(user_id):
     """
     Process the daily ROI for a user's active trading cycle.
     
+    Runs the batch engine (utils/roi_cycle_engine.py) for this one user, so the
+    credit is recorded once per day however often it is called.
+    
     Args:
         user_id (int): Database ID of the user
     
     Returns:
         tuple: (profit_amount, profit_percentage)
     """
+    from utils.roi_cycle_engine import run_daily_roi
+
     with app.app_context():
         try:
-            # Get user and active cycle
             user = User.query.get(user_id)
             if not user or user.status != UserStatus.ACTIVE:
                 logger.warning(f"User {user_id} not active or not found")
                 return 0, 0
-                
-            # Get or create cycle
-            cycle = create_or_get_active_cycle(user_id)
-            if not cycle:
-                return 0, 0
-                
-            # If cycle is complete or paused, return 0
-            if cycle.status != CycleStatus.IN_PROGRESS:
+
+            credit = run_daily_roi(user_ids=[user_id])['credits'].get(user_id)
+            if not credit:
                 return 0, 0
-                
-            # Calculate daily ROI based on initial balance
-            # Use the cycle-specific daily ROI percentage (which can be adjusted by admin)
-            daily_roi_percentage = cycle.daily_roi_percentage
-            profit_percentage = daily_roi_percentage
-            profit_amount = cycle.initial_balance * (profit_percentage / 100)
-            
-            # Update cycle current balance and total profit
-            cycle.current_balance += profit_amount
-            cycle.total_profit_amount += profit_amount
-            cycle.total_roi_percentage += profit_percentage
-            
-            # Update user balance
-            user.balance += profit_amount
-            
-            # Create a profit record for today
-            today = datetime.utcnow().date()
-            existing_profit = Profit.query.filter_by(user_id=user_id, date=today).first()
-            
-            if existing_profit:
-                # Update existing profit record
-                existing_profit.amount = profit_amount
-                existing_profit.percentage = profit_percentage
-            else:
-                # Create new profit record
-                new_profit = Profit(
-                    user_id=user_id,
-                    amount=profit_amount,
-                    percentage=profit_percentage,
-                    date=today
-                )
-                db.session.add(new_profit)
-            
-            # Check if cycle should be completed (reached 2x or 7 days elapsed)
-            if cycle.current_balance >= cycle.target_balance or cycle.days_elapsed >= 7:
-                cycle.status = CycleStatus.COMPLETED
-                cycle.end_date = datetime.utcnow()
-                logger.info(f"Completed 7-day 2x ROI cycle for user {user_id}: "
-                           f"Initial: {cycle.initial_balance}, Final: {cycle.current_balance}")
-            
-            db.session.commit()
-            
+
+            profit_amount, profit_percentage, completed = credit
+            if completed:
+                logger.info(f"Completed 7-day 2x ROI cycle for user {user_id}")
             logger.info(f"Processed daily ROI for user {user_id}: "
                        f"{profit_amount:.2f} SOL ({profit_percentage:.2f}%)")
             return profit_amount, profit_percentage
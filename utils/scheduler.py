@@ -1,11 +1,10 @@
 import logging
 from datetime import time, datetime
 from telegram.ext import CallbackContext
+from async_db import run_db
 from utils.notifications import send_daily_update, send_inactivity_reminder
-from utils.trading import execute_daily_trading
-from utils.roi_system import process_daily_roi, create_or_get_active_cycle
+from utils.roi_cycle_engine import run_daily_roi
 from utils.engagement import schedule_engagement_messages
-from models import User, UserStatus
 from app import app, db
 from helpers import get_notification_time, are_daily_updates_enabled
 
@@ -69,39 +68,19 @@ def setup_schedulers(application):
 
 async def run_daily_trading_simulation(context: CallbackContext):
     """
-    Run real-time trading and 7-Day 2x ROI processing for all active users.
+    Run the 7-Day 2x ROI processing for all active users.
+    
+    The batch engine opens missing cycles and credits every due cycle in bulk
+    (see utils/roi_cycle_engine.py); it runs on the async DB executor so the
+    job queue's event loop stays free while it works.
     
     Args:
         context: The telegram.ext.CallbackContext object
     """
-    logger.info("Starting daily real-time trading processing")
-    
-    with app.app_context():
-        # Get all active users
-        active_users = User.query.filter_by(status=UserStatus.ACTIVE).all()
-        logger.info(f"Found {len(active_users)} active users for trading")
-        
-        for user in active_users:
-            logger.info(f"Processing trading for user {user.id}")
-            
-            # First, ensure the user has an active 7-Day 2x ROI cycle
-            cycle = create_or_get_active_cycle(user.id)
-            
-            # Process the daily ROI for the 7-Day 2x ROI system
-            if cycle:
-                profit_amount, profit_percentage = process_daily_roi(user.id)
-                logger.info(f"User {user.id} 7-Day 2x ROI: {profit_amount:.2f} SOL ({profit_percentage:.2f}%)")
-            else:
-                # Fall back to standard trading if no cycle is active
-                profit_amount, profit_percentage = execute_daily_trading(user.id)
-                logger.info(f"User {user.id} standard trading: {profit_amount:.2f} SOL ({profit_percentage:.2f}%)")
-            
-            logger.info(f"User {user.id} daily profit: {profit_amount:.2f} SOL ({profit_percentage:.2f}%)")
-            
-            # Check if we need to start a new cycle
-            if not cycle:
-                # Create a new cycle for future processing
-                create_or_get_active_cycle(user.id)
+    logger.info("Starting daily ROI cycle processing")
+    result = await run_db(run_daily_roi)
+    logger.info(f"Daily ROI processing finished: {result['credited']} users credited, "
+                f"{result['completed']} cycles completed in {result['seconds']:.2f}s")
 
 
 def get_next_run_times(application):
@@ -4,10 +4,11 @@ import string
 import time
 import re
 from datetime import datetime
-from config import SOLANA_NETWORK, SOLANA_RPC_URL, MIN_DEPOSIT
+from config import SOLANA_NETWORK, MIN_DEPOSIT
 from helpers import get_global_deposit_wallet
 from app import db, app
 from models import User, Transaction, SenderWallet
+from utils.solana_rpc import RpcError, get_rpc_client
 
 logger = logging.getLogger(__name__)
 
@@ -57,34 +58,21 @@ def check_deposit(wallet_address):
     logger.info(f"Checking deposit for wallet {wallet_address} using Chainstack RPC")
     
     try:
-        import requests
-        import json
-        
         # Log the connection attempt to Chainstack
-        logger.info(f"Connecting to Chainstack RPC at {SOLANA_RPC_URL}")
+        logger.info(f"Connecting to Chainstack RPC at {', '.join(get_rpc_client().endpoints)}")
         
         # Make a real API call to the Chainstack RPC endpoint to check the balance
-        headers = {"Content-Type": "application/json"}
-        payload = {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": "getBalance",
-            "params": [wallet_address]
-        }
-        response = requests.post(SOLANA_RPC_URL, headers=headers, data=json.dumps(payload))
-        result = response.json()
-        
-        logger.info(f"Chainstack API response: {result}")
+        balance_lamports = get_rpc_client().get_balance(wallet_address)
         
         # The balance would be in lamports (1 SOL = 1,000,000,000 lamports)
-        if 'result' in result and 'value' in result['result']:
-            balance_lamports = result['result']['value']
-            balance_sol = balance_lamports / 1_000_000_000
-            logger.info(f"Chainstack API: Balance of {balance_sol:.4f} SOL detected for wallet {wallet_address}")
-            return balance_sol
-        else:
-            logger.warning(f"Unexpected response format from Chainstack API: {result}")
-            return 0.0
+        balance_sol = balance_lamports / 1_000_000_000
+        logger.info(f"Chainstack API: Balance of {balance_sol:.4f} SOL detected for wallet {wallet_address}")
+        return balance_sol
+            
+    except RpcError as e:
+        # Every endpoint failed or the node refused the call: report no deposit rather than invent one
+        logger.error(f"Solana RPC balance check failed for wallet {wallet_address}: {e}")
+        return 0.0
             
     except Exception as e:
         # In case of any errors with the Chainstack API
@@ -117,8 +105,6 @@ def check_deposit_by_sender(sender_address):
     logger.info(f"Checking for payments from {sender_address} to admin wallet {global_wallet}")
     
     try:
-        import requests
-        import json
         from datetime import datetime, timedelta
         
         # Get the last check timestamp for this sender wallet
@@ -135,104 +121,68 @@ def check_deposit_by_sender(sender_address):
         since_timestamp = int(since_time.timestamp())
         
         # Monitor incoming transactions to the ADMIN's global deposit wallet
-        headers = {"Content-Type": "application/json"}
-        payload = {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": "getSignaturesForAddress",
-            "params": [
-                get_global_deposit_wallet(),  # Check admin wallet, not user wallet
-                {
-                    "limit": 50,  # Check more transactions for thorough monitoring
-                    "before": None,  # Get most recent transactions
-                }
-            ]
-        }
-        
-        # Make the API call to get transactions TO the admin wallet
-        response = requests.post(SOLANA_RPC_URL, headers=headers, data=json.dumps(payload))
-        result = response.json()
-        
-        logger.info(f"Found {len(result.get('result', []))} recent transactions to admin wallet")
-        
-        # Check if we got a valid response with signatures
-        if 'result' in result and result['result']:
-            # Check each transaction to see if it came from our sender
-            for tx_info in result['result']:
-                signature = tx_info.get('signature')
-                block_time = tx_info.get('blockTime')
+        # (check admin wallet, not user wallet; 50 for thorough monitoring)
+        client = get_rpc_client()
+        signatures = client.get_signatures_for_address(global_wallet, limit=50)
+        
+        logger.info(f"Found {len(signatures)} recent transactions to admin wallet")
+        
+        # Skip transactions older than our last check, then fetch the rest in one batch
+        recent = [tx_info for tx_info in signatures
+                  if tx_info.get('signature') and not (tx_info.get('blockTime') and tx_info['blockTime'] < since_timestamp)]
+        transactions = client.get_transactions(recent)
+        
+        # Check each transaction to see if it came from our sender
+        for tx_info in recent:
+            signature = tx_info['signature']
+            tx_data = transactions.get(signature)
+            
+            # Extract transaction details
+            if tx_data and 'transaction' in tx_data and 'message' in tx_data['transaction']:
+                message = tx_data['transaction']['message']
+                account_keys = message.get('accountKeys', [])
                 
-                # Skip if transaction is older than our last check
-                if block_time and block_time < since_timestamp:
-                    continue
-                    
-                if signature:
-                    # Get detailed transaction information
-                    tx_payload = {
-                        "jsonrpc": "2.0",
-                        "id": 1,
-                        "method": "getTransaction",
-                        "params": [
-                            signature,
-                            {
-                                "encoding": "json", 
-                                "maxSupportedTransactionVersion": 0,
-                                "commitment": "confirmed"
-                            }
-                        ]
-                    }
-                    tx_response = requests.post(SOLANA_RPC_URL, headers=headers, data=json.dumps(tx_payload))
-                    tx_result = tx_response.json()
+                # Check if this transaction involves our sender wallet
+                sender_found = False
+                recipient_found = False
+                
+                for account in account_keys:
+                    if account == sender_address:
+                        sender_found = True
+                    elif account == global_wallet:
+                        recipient_found = True
+                
+                # If both sender and recipient are found, this is our transaction
+                if sender_found and recipient_found:
+                    # Extract the amount from preBalances and postBalances
+                    pre_balances = tx_data.get('meta', {}).get('preBalances', [])
+                    post_balances = tx_data.get('meta', {}).get('postBalances', [])
                     
-                    if 'result' in tx_result and tx_result['result']:
-                        tx_data = tx_result['result']
+                    if pre_balances and post_balances and len(pre_balances) == len(post_balances):
+                        # Find the admin wallet index
+                        admin_wallet_index = None
+                        for i, account in enumerate(account_keys):
+                            if account == global_wallet:
+                                admin_wallet_index = i
+                                break
                         
-                        # Extract transaction details
-                        if 'transaction' in tx_data and 'message' in tx_data['transaction']:
-                            message = tx_data['transaction']['message']
-                            account_keys = message.get('accountKeys', [])
+                        if admin_wallet_index is not None and admin_wallet_index < len(pre_balances):
+                            # Calculate the amount received (in lamports)
+                            pre_balance = pre_balances[admin_wallet_index]
+                            post_balance = post_balances[admin_wallet_index]
+                            amount_lamports = post_balance - pre_balance
                             
-                            # Check if this transaction involves our sender wallet
-                            sender_found = False
-                            recipient_found = False
-                            
-                            for account in account_keys:
-                                if account == sender_address:
-                                    sender_found = True
-                                elif account == global_wallet:
-                                    recipient_found = True
-                            
-                            # If both sender and recipient are found, this is our transaction
-                            if sender_found and recipient_found:
-                                # Extract the amount from preBalances and postBalances
-                                pre_balances = tx_data.get('meta', {}).get('preBalances', [])
-                                post_balances = tx_data.get('meta', {}).get('postBalances', [])
+                            if amount_lamports > 0:
+                                # Convert lamports to SOL (1 SOL = 1,000,000,000 lamports)
+                                amount_sol = amount_lamports / 1_000_000_000
                                 
-                                if pre_balances and post_balances and len(pre_balances) == len(post_balances):
-                                    # Find the admin wallet index
-                                    admin_wallet_index = None
-                                    for i, account in enumerate(account_keys):
-                                        if account == global_wallet:
-                                            admin_wallet_index = i
-                                            break
-                                    
-                                    if admin_wallet_index is not None and admin_wallet_index < len(pre_balances):
-                                        # Calculate the amount received (in lamports)
-                                        pre_balance = pre_balances[admin_wallet_index]
-                                        post_balance = post_balances[admin_wallet_index]
-                                        amount_lamports = post_balance - pre_balance
-                                        
-                                        if amount_lamports > 0:
-                                            # Convert lamports to SOL (1 SOL = 1,000,000,000 lamports)
-                                            amount_sol = amount_lamports / 1_000_000_000
-                                            
-                                            # Check if amount meets minimum deposit requirement
-                                            if amount_sol >= MIN_DEPOSIT:
-                                                logger.info(f"DEPOSIT DETECTED: {amount_sol:.6f} SOL from {sender_address}")
-                                                logger.info(f"Transaction signature: {signature}")
-                                                return True, amount_sol, signature
-                                            else:
-                                                logger.info(f"Transaction amount {amount_sol:.6f} SOL below minimum {MIN_DEPOSIT}")
+                                # Check if amount meets minimum deposit requirement
+                                if amount_sol >= MIN_DEPOSIT:
+                                    logger.info(f"DEPOSIT DETECTED: {amount_sol:.6f} SOL from {sender_address}")
+                                    logger.info(f"Transaction signature: {signature}")
+                                    return True, amount_sol, signature
+                                else:
+                                    logger.info(f"Transaction amount {amount_sol:.6f} SOL below minimum {MIN_DEPOSIT}")
         
         # No matching deposits found
         logger.info(f"No new deposits found from {sender_address} to admin wallet")
@@ -251,126 +201,126 @@ def check_deposit_by_sender(sender_address):
         return False, 0.0, None
 
 
-def monitor_admin_wallet_transactions():
+def find_admin_wallet_deposits(signatures=None):
     """
-    Monitor all incoming transactions to the admin's global deposit wallet
-    and automatically match them to users based on sender addresses.
-    
+    Match incoming transactions to the admin's global deposit wallet to users
+
+    Like monitor_admin_wallet_transactions, but RPC and database errors
+    propagate, and signatures whose transaction could not be fetched are
+    returned so the caller knows the scan was incomplete.
+
     Returns:
-        list: List of detected deposits as (user_id, amount, tx_signature) tuples
+        tuple: ([(user_id, amount, tx_signature, sender_address)], [unfetched signatures])
     """
     global_wallet = get_global_deposit_wallet()
     logger.info(f"Monitoring admin wallet {global_wallet} for incoming transactions")
     detected_deposits = []
+    unfetched = []
+
+    from datetime import datetime, timedelta
+
+    # Get the last scan timestamp from database or use 1 hour ago
+    with app.app_context():
+        # Check when we last scanned transactions
+        last_scan_time = datetime.utcnow() - timedelta(hours=1)
+
+        # Get recent transactions to the admin wallet (last 100)
+        client = get_rpc_client()
+        listed = signatures is None
+        if listed:
+            signatures = client.get_signatures_for_address(global_wallet, limit=100, commitment="confirmed")
+
+        if signatures:
+            logger.info(f"Found {len(signatures)} transactions to admin wallet")
+
+            new_signatures = []
+            for tx_info in signatures:
+                signature = tx_info.get('signature')
+                block_time = tx_info.get('blockTime')
+
+                if not signature:
+                    logger.warning("Transaction has no signature, skipping")
+                    continue
+
+                logger.info(f"Processing transaction {signature[:16]}... from {block_time}")
+
+                # Skip old transactions (given signatures are new by definition)
+                if listed and block_time and block_time < int(last_scan_time.timestamp()):
+                    logger.info(f"Skipping old transaction {signature[:16]}... from {block_time}")
+                    continue
+
+                # Check if we already processed this transaction
+                existing_tx = Transaction.query.filter_by(tx_hash=signature).first()
+                if existing_tx:
+                    logger.info(f"Transaction {signature[:16]}... already processed, skipping")
+                    continue
+
+                new_signatures.append(tx_info)
+
+            # Get detailed transaction data for all new signatures in one batch
+            logger.info(f"Fetching detailed data for {len(new_signatures)} transactions")
+            transactions = client.get_transactions(new_signatures)
+
+            for tx_info in new_signatures:
+                signature = tx_info['signature']
+                tx_data = transactions.get(signature)
+
+                if not tx_data:
+                    # Not fetched (RPC error or not yet visible); leave it for the next scan
+                    logger.warning(f"Transaction {signature} could not be fetched")
+                    unfetched.append(signature)
+                else:
+                    # Extract sender and amount
+                    sender_address, amount = extract_transaction_details(tx_data)
+
+                    if sender_address and amount and amount >= MIN_DEPOSIT:
+                        # Enhanced logging for debugging
+                        logger.info(f"Processing transaction {signature}")
+                        logger.info(f"  Sender: {sender_address}")
+                        logger.info(f"  Amount: {amount} SOL")
+                        logger.info(f"  Min deposit: {MIN_DEPOSIT}")
+
+                        # Find user by sender wallet
+                        sender_wallet = SenderWallet.query.filter_by(wallet_address=sender_address).first()
+                        if sender_wallet:
+                            logger.info(f"Matched transaction: {amount} SOL from {sender_address} to user {sender_wallet.user_id}")
+                            detected_deposits.append((sender_wallet.user_id, amount, signature, sender_address))
+                        else:
+                            logger.warning(f"Unmatched deposit: {amount} SOL from unknown sender {sender_address}")
+                            # Log available sender wallets for debugging
+                            wallet_count = SenderWallet.query.count()
+                            logger.info(f"Total registered sender wallets in database: {wallet_count}")
+                            if wallet_count == 0:
+                                logger.warning("No sender wallets registered - users need to register wallets for deposit matching!")
+                    else:
+                        if not sender_address:
+                            logger.warning(f"No sender address found for transaction {signature}")
+                        elif not amount:
+                            logger.warning(f"No amount found for transaction {signature}")
+                        elif amount < MIN_DEPOSIT:
+                            logger.warning(f"Amount {amount} below minimum {MIN_DEPOSIT} for transaction {signature}")
+
+            logger.info(f"Detected {len(detected_deposits)} new deposits to admin wallet")
+
+    return detected_deposits, unfetched
+
+
+def monitor_admin_wallet_transactions(signatures=None):
+    """
+    Monitor all incoming transactions to the admin's global deposit wallet
+    and automatically match them to users based on sender addresses.
+    
+    Args:
+        signatures (list): getSignaturesForAddress-style entries to check
+            (from a subscription or a catch-up scan); by default the last
+            100 signatures of the wallet from the past hour are listed
     
+    Returns:
+        list: List of detected deposits as (user_id, amount, tx_signature) tuples
+    """
     try:
-        import requests
-        import json
-        from datetime import datetime, timedelta
-        
-        # Get the last scan timestamp from database or use 1 hour ago
-        with app.app_context():
-            # Check when we last scanned transactions
-            last_scan_time = datetime.utcnow() - timedelta(hours=1)
-            
-            # Get recent transactions to the admin wallet
-            headers = {"Content-Type": "application/json"}
-            payload = {
-                "jsonrpc": "2.0",
-                "id": 1,
-                "method": "getSignaturesForAddress",
-                "params": [
-                    global_wallet,
-                    {
-                        "limit": 100,  # Check last 100 transactions
-                        "commitment": "confirmed"
-                    }
-                ]
-            }
-            
-            response = requests.post(SOLANA_RPC_URL, headers=headers, data=json.dumps(payload))
-            result = response.json()
-            
-            if 'result' in result and result['result']:
-                logger.info(f"Found {len(result['result'])} transactions to admin wallet")
-                
-                for tx_info in result['result']:
-                    signature = tx_info.get('signature')
-                    block_time = tx_info.get('blockTime')
-                    
-                    logger.info(f"Processing transaction {signature[:16]}... from {block_time}")
-                    
-                    if not signature:
-                        logger.warning("Transaction has no signature, skipping")
-                        continue
-                    
-                    # Skip old transactions
-                    if block_time and block_time < int(last_scan_time.timestamp()):
-                        logger.info(f"Skipping old transaction {signature[:16]}... from {block_time}")
-                        continue
-                    
-                    # Check if we already processed this transaction
-                    existing_tx = Transaction.query.filter_by(tx_hash=signature).first()
-                    if existing_tx:
-                        logger.info(f"Transaction {signature[:16]}... already processed, skipping")
-                        continue
-                    
-                    logger.info(f"Fetching detailed data for transaction {signature[:16]}...")
-                    
-                    # Get detailed transaction data
-                    tx_payload = {
-                        "jsonrpc": "2.0",
-                        "id": 1,
-                        "method": "getTransaction",
-                        "params": [
-                            signature,
-                            {
-                                "encoding": "json",
-                                "maxSupportedTransactionVersion": 0,
-                                "commitment": "confirmed"
-                            }
-                        ]
-                    }
-                    
-                    tx_response = requests.post(SOLANA_RPC_URL, headers=headers, data=json.dumps(tx_payload))
-                    tx_result = tx_response.json()
-                    
-                    if 'result' in tx_result and tx_result['result']:
-                        tx_data = tx_result['result']
-                        
-                        # Extract sender and amount
-                        sender_address, amount = extract_transaction_details(tx_data)
-                        
-                        if sender_address and amount and amount >= MIN_DEPOSIT:
-                            # Enhanced logging for debugging
-                            logger.info(f"Processing transaction {signature}")
-                            logger.info(f"  Sender: {sender_address}")
-                            logger.info(f"  Amount: {amount} SOL")
-                            logger.info(f"  Min deposit: {MIN_DEPOSIT}")
-                            
-                            # Find user by sender wallet
-                            sender_wallet = SenderWallet.query.filter_by(wallet_address=sender_address).first()
-                            if sender_wallet:
-                                logger.info(f"Matched transaction: {amount} SOL from {sender_address} to user {sender_wallet.user_id}")
-                                detected_deposits.append((sender_wallet.user_id, amount, signature))
-                            else:
-                                logger.warning(f"Unmatched deposit: {amount} SOL from unknown sender {sender_address}")
-                                # Log available sender wallets for debugging
-                                wallet_count = SenderWallet.query.count()
-                                logger.info(f"Total registered sender wallets in database: {wallet_count}")
-                                if wallet_count == 0:
-                                    logger.warning("No sender wallets registered - users need to register wallets for deposit matching!")
-                        else:
-                            if not sender_address:
-                                logger.warning(f"No sender address found for transaction {signature}")
-                            elif not amount:
-                                logger.warning(f"No amount found for transaction {signature}")
-                            elif amount < MIN_DEPOSIT:
-                                logger.warning(f"Amount {amount} below minimum {MIN_DEPOSIT} for transaction {signature}")
-                
-                logger.info(f"Detected {len(detected_deposits)} new deposits to admin wallet")
-            
-            return detected_deposits
+        detected_deposits, _ = find_admin_wallet_deposits(signatures)
+        return [(user_id, amount, signature) for user_id, amount, signature, _ in detected_deposits]
             
     except Exception as e:
         logger.error(f"Error monitoring admin wallet transactions: {str(e)}")
@@ -518,77 +468,50 @@ def process_auto_deposit(user_id, amount, tx_signature):
     """
     Process an automatic deposit for a user with enhanced transaction safety.
     
+    The deposit is credited exactly once per signature in a single
+    transaction (see deposit_crediting), so calling this again for the same
+    signature, or from several scanners at once, is safe.
+    
     Args:
         user_id (int): Database ID of the user
         amount (float): Amount of SOL deposited
         tx_signature (str): Transaction signature
         
     Returns:
-        bool: True if successful, False otherwise
+        bool: True if successful (or already processed), False otherwise
     """
+    from deposit_crediting import credit_deposit
+    
     with app.app_context():
-        # First check if this transaction was already processed (idempotence)
-        existing_tx = Transaction.query.filter_by(tx_hash=tx_signature).first()
-        if existing_tx:
-            logger.warning(f"Transaction {tx_signature} already processed - avoiding duplicate credit")
-            return True
-            
-        # Use a try block with explicit transaction handling
         try:
-            # Get user information
-            user = User.query.get(user_id)
-            if not user:
-                logger.error(f"User {user_id} not found for auto deposit")
-                return False
-            
-            # Record the transaction
-            transaction = Transaction()
-            transaction.user_id = user.id
-            transaction.transaction_type = "deposit"
-            transaction.amount = amount
-            transaction.status = "completed"
-            transaction.tx_hash = tx_signature
-            transaction.timestamp = datetime.utcnow()  # Explicitly set timestamp
-            transaction.processed_at = datetime.utcnow()  # Record when we processed it
-            db.session.add(transaction)
-            
-            # Update user balance safely
-            previous_balance = user.balance
-            user.balance = previous_balance + amount
-            
-            # Update initial deposit to include all deposits
-            user.initial_deposit += amount
-            logger.info(f"Updated initial deposit to {user.initial_deposit} SOL for user {user_id} (added {amount} SOL)")
-                
-            # Update user status to active if they were in depositing state
-            if user.status.value == "DEPOSITING":
-                from models import UserStatus
-                user.status = UserStatus.ACTIVE
-                
-            # Commit the transaction
-            db.session.commit()
-            
-            logger.info(f"Auto deposit of {amount} SOL processed for user {user_id}")
-            logger.info(f"Previous balance: {previous_balance} SOL, New balance: {user.balance} SOL")
-            
-            # Process auto trading in a separate try-except block to prevent it from affecting deposits
-            try:
-                # Import the auto trading module
-                from utils.auto_trading_history import handle_user_deposit
-                
-                # Trigger auto trading based on the deposit
-                handle_user_deposit(user_id, amount)
-                logger.info(f"Auto trading history started for user {user_id} after deposit")
-            except Exception as trading_error:
-                logger.error(f"Failed to start auto trading history for user {user_id}: {trading_error}")
-                # Don't let trading errors affect deposit success
-            
-            return True
-            
+            credited = credit_deposit(user_id, amount, tx_signature)
+        except LookupError as e:
+            logger.error(str(e))
+            return False
         except Exception as e:
             logger.error(f"Error processing auto deposit for user {user_id}: {str(e)}")
-            db.session.rollback()
             return False
+        
+        if credited is None:
+            logger.warning(f"Transaction {tx_signature} already processed - avoiding duplicate credit")
+            return True
+        
+        logger.info(f"Auto deposit of {amount} SOL processed for user {user_id}, new balance: {credited['balance']} SOL")
+        start_auto_trading_after_deposit(user_id, amount)
+        return True
+
+
+def start_auto_trading_after_deposit(user_id, amount):
+    """Trigger auto trading for a credited deposit; errors never affect the deposit"""
+    try:
+        # Import the auto trading module
+        from utils.auto_trading_history import handle_user_deposit
+        
+        # Trigger auto trading based on the deposit
+        handle_user_deposit(user_id, amount)
+        logger.info(f"Auto trading history started for user {user_id} after deposit")
+    except Exception as trading_error:
+        logger.error(f"Failed to start auto trading history for user {user_id}: {trading_error}")
 
 
 def execute_transaction(from_address, to_address, amount, token=None):
@@ -0,0 +1,298 @@
+"""
+Solana RPC
+Shared JSON-RPC client for the Solana endpoints used by deposit detection.
+
+All calls go through one pooled requests.Session with a timeout per
+method. Several endpoints can be configured (SOLANA_RPC_URLS, comma
+separated; the config SOLANA_RPC_URL otherwise):
+
+    - a request goes to the healthiest endpoint first; if it has not
+      answered after RPC_HEDGE_DELAY seconds the same request is sent to
+      the next endpoint too, and the first good answer wins
+    - an endpoint that errors (connection failure, timeout, non-200, bad
+      JSON) is skipped over immediately and sorted behind the others until
+      it answers again
+    - JSON-RPC error objects are answers, not endpoint failures, and are
+      raised as RpcError
+
+batch() sends many calls in one HTTP request (chunks of RPC_BATCH_SIZE).
+get_transactions() uses it for the transactions behind a
+getSignaturesForAddress page.
+
+A finalized transaction never changes, so getTransaction results fetched
+with commitment "finalized" are kept permanently in a SQLite file
+(RPC_CACHE_PATH) using the write-once store from utils/market_data_cache;
+confirmed-but-not-finalized results are never cached.
+
+solana_rpc_stub.py serves the same methods locally for offline testing.
+"""
+import itertools
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import SOLANA_RPC_URL
+from metrics_registry import SOLANA_RPC_DURATION, SOLANA_RPC_FAILURES
+from utils.market_data_cache import MarketDataCache
+
+logger = logging.getLogger(__name__)
+
+# RPC endpoints in order of preference
+RPC_ENDPOINTS = [url.strip() for url in os.environ.get('SOLANA_RPC_URLS', SOLANA_RPC_URL).split(',') if url.strip()]
+
+# Seconds to wait on an endpoint before hedging the request to the next one
+RPC_HEDGE_DELAY = float(os.environ.get('SOLANA_RPC_HEDGE_DELAY', '0.5'))
+
+# Calls sent per JSON-RPC batch request
+RPC_BATCH_SIZE = int(os.environ.get('SOLANA_RPC_BATCH_SIZE', '25'))
+
+# Pooled connections per endpoint
+RPC_POOL_SIZE = int(os.environ.get('SOLANA_RPC_POOL_SIZE', '10'))
+
+# SQLite file holding finalized transactions
+RPC_CACHE_PATH = os.environ.get('SOLANA_RPC_CACHE_PATH',
+                                os.path.join(tempfile.gettempdir(), 'solana_rpc_cache.sqlite3'))
+
+# Per-method timeouts in seconds
+METHOD_TIMEOUTS = {
+    'getBalance': 5,
+    'getHealth': 3,
+    'getSignaturesForAddress': 10,
+    'getTransaction': 10,
+}
+DEFAULT_TIMEOUT = 10
+
+
+class RpcError(Exception):
+    """A call returned a JSON-RPC error, or no endpoint answered"""
+
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.code = code
+
+
+class _EndpointFailure(Exception):
+    pass
+
+
+class SolanaRpcClient:
+    """Pooled, hedged JSON-RPC client over one or more endpoints"""
+
+    def __init__(self, endpoints: Optional[List[str]] = None, hedge_delay: Optional[float] = None,
+                 batch_size: Optional[int] = None, cache: Optional[MarketDataCache] = None,
+                 cache_path: Optional[str] = None):
+        self.endpoints = list(endpoints or RPC_ENDPOINTS)
+        self.hedge_delay = hedge_delay if hedge_delay is not None else RPC_HEDGE_DELAY
+        self.batch_size = batch_size or RPC_BATCH_SIZE
+        self._cache = cache
+        self._cache_path = cache_path or RPC_CACHE_PATH
+        self._failures = {url: 0 for url in self.endpoints}
+        self._ids = itertools.count(1)
+        self._executor = ThreadPoolExecutor(max_workers=max(2, 2 * len(self.endpoints)),
+                                            thread_name_prefix='solana-rpc')
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.endpoints), pool_maxsize=RPC_POOL_SIZE)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({'Content-Type': 'application/json'})
+
+    @property
+    def cache(self) -> MarketDataCache:
+        if self._cache is None:
+            self._cache = MarketDataCache(path=self._cache_path)
+        return self._cache
+
+    # ------------------------------------------------------------------
+    # Transport
+    # ------------------------------------------------------------------
+    def _send(self, url, body, timeout):
+        try:
+            response = self.session.post(url, json=body, timeout=timeout)
+        except requests.RequestException as e:
+            raise _EndpointFailure(f"{type(e).__name__}: {e}")
+        if response.status_code != 200:
+            raise _EndpointFailure(f"HTTP {response.status_code}")
+        try:
+            return response.json()
+        except ValueError:
+            raise _EndpointFailure("response is not JSON")
+
+    def _record(self, url, failed):
+        if failed:
+            self._failures[url] = self._failures.get(url, 0) + 1
+            SOLANA_RPC_FAILURES.labels(urlparse(url).netloc or url).inc()
+        else:
+            self._failures[url] = 0
+
+    def _post(self, body, timeout):
+        """Send one HTTP body, hedging across endpoints; the first good JSON answer wins"""
+        endpoints = sorted(self.endpoints, key=lambda url: self._failures.get(url, 0))
+        pending = {}
+        errors = []
+
+        def launch():
+            url = endpoints[len(pending) + len(errors)]
+            pending[self._executor.submit(self._send, url, body, timeout)] = url
+
+        launch()
+        while pending:
+            more = len(pending) + len(errors) < len(endpoints)
+            done, _ = wait(list(pending), timeout=self.hedge_delay if more else None,
+                           return_when=FIRST_COMPLETED)
+            if not done:
+                logger.debug(f"Solana RPC slow, hedging to {endpoints[len(pending) + len(errors)]}")
+                launch()
+                continue
+            for future in done:
+                url = pending.pop(future)
+                try:
+                    answer = future.result()
+                except _EndpointFailure as e:
+                    self._record(url, True)
+                    errors.append(f"{url}: {e}")
+                    logger.warning(f"Solana RPC endpoint {url} failed: {e}")
+                    continue
+                self._record(url, False)
+                return answer
+            if not pending and len(errors) < len(endpoints):
+                launch()
+        raise RpcError(f"No Solana RPC endpoint answered ({'; '.join(errors)})")
+
+    # ------------------------------------------------------------------
+    # JSON-RPC
+    # ------------------------------------------------------------------
+    def call(self, method: str, params: Optional[list] = None, timeout: Optional[float] = None):
+        """Result of one call; raises RpcError"""
+        body = {'jsonrpc': '2.0', 'id': next(self._ids), 'method': method, 'params': params or []}
+        with SOLANA_RPC_DURATION.labels(method).time():
+            answer = self._post(body, timeout or METHOD_TIMEOUTS.get(method, DEFAULT_TIMEOUT))
+        if not isinstance(answer, dict):
+            raise RpcError(f"{method}: unexpected response {answer!r}")
+        if answer.get('error'):
+            error = answer['error']
+            raise RpcError(f"{method}: {error.get('message')}", error.get('code'))
+        return answer.get('result')
+
+    def batch(self, calls: Iterable[tuple]) -> List:
+        """
+        Results of many (method, params) calls, sent RPC_BATCH_SIZE per HTTP request
+
+        Returns:
+            list: one result per call, in order; None where that call returned an error
+        """
+        calls = list(calls)
+        results = []
+        for start in range(0, len(calls), self.batch_size):
+            chunk = calls[start:start + self.batch_size]
+            body = [{'jsonrpc': '2.0', 'id': next(self._ids), 'method': method, 'params': params or []}
+                    for method, params in chunk]
+            timeout = max(METHOD_TIMEOUTS.get(method, DEFAULT_TIMEOUT) for method, _ in chunk)
+            with SOLANA_RPC_DURATION.labels('batch').time():
+                answer = self._post(body, timeout)
+            if not isinstance(answer, list):
+                raise RpcError(f"batch: unexpected response {answer!r}")
+            by_id = {item.get('id'): item for item in answer if isinstance(item, dict)}
+            for request in body:
+                item = by_id.get(request['id'], {})
+                if item.get('error') or 'result' not in item:
+                    logger.warning(f"Solana RPC {request['method']} failed in batch: {item.get('error')}")
+                    results.append(None)
+                else:
+                    results.append(item['result'])
+        return results
+
+    # ------------------------------------------------------------------
+    # Methods
+    # ------------------------------------------------------------------
+    def get_balance(self, address: str) -> int:
+        """Balance in lamports"""
+        return self.call('getBalance', [address])['value']
+
+    def get_signatures_for_address(self, address: str, limit: int = 50, commitment: Optional[str] = None,
+                                   until: Optional[str] = None, before: Optional[str] = None) -> List[Dict]:
+        """
+        Newest-first signature entries; with `until`, only those newer than
+        that signature, and with `before`, only those older than that one
+        """
+        options = {'limit': limit}
+        if commitment:
+            options['commitment'] = commitment
+        if until:
+            options['until'] = until
+        if before:
+            options['before'] = before
+        return self.call('getSignaturesForAddress', [address, options]) or []
+
+    @staticmethod
+    def _transaction_params(signature, commitment):
+        return [signature, {'encoding': 'json', 'maxSupportedTransactionVersion': 0, 'commitment': commitment}]
+
+    def get_transaction(self, signature: str, commitment: str = 'confirmed') -> Optional[Dict]:
+        """A transaction, from the disk cache when it was fetched finalized before"""
+        if commitment == 'finalized':
+            cached = self.cache.get('getTransaction', signature, 0)
+            if cached is not None:
+                return cached
+        result = self.call('getTransaction', self._transaction_params(signature, commitment))
+        if result and commitment == 'finalized':
+            result = self.cache.put('getTransaction', signature, 0, result)
+        return result
+
+    def get_transactions(self, signature_infos: Iterable[Dict]) -> Dict[str, Dict]:
+        """
+        Transactions behind getSignaturesForAddress entries, batched
+
+        Entries whose confirmationStatus is "finalized" are requested as
+        finalized and served from / stored in the disk cache.
+
+        Returns:
+            dict: signature -> transaction, for the ones found
+        """
+        found = {}
+        wanted = []
+        for info in signature_infos:
+            signature = info.get('signature')
+            if not signature:
+                continue
+            commitment = 'finalized' if info.get('confirmationStatus') == 'finalized' else 'confirmed'
+            if commitment == 'finalized':
+                cached = self.cache.get('getTransaction', signature, 0)
+                if cached is not None:
+                    found[signature] = cached
+                    continue
+            wanted.append((signature, commitment))
+
+        results = self.batch(('getTransaction', self._transaction_params(signature, commitment))
+                             for signature, commitment in wanted)
+        for (signature, commitment), result in zip(wanted, results):
+            if not result:
+                continue
+            if commitment == 'finalized':
+                result = self.cache.put('getTransaction', signature, 0, result)
+            found[signature] = result
+        return found
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_rpc_client() -> SolanaRpcClient:
+    """The process-wide client"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = SolanaRpcClient()
+    return _client